@@ -1,9 +1,129 @@
-import boto3
+import os
+import uuid
+import logging
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Dict, List
+from urllib.parse import unquote_plus
+from chunker import (
+    Chunker,
+    TemplateChunker,
+    TokenEstimator,
+    process_objects,
+    DEFAULT_TOKEN_BUDGET,
+    DEFAULT_OVERLAP_EVENTS,
+    DEFAULT_WINDOW_MS,
+    DEFAULT_MAX_PARALLEL_OBJECTS,
+)
+
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Clients of this execution environment, reused by its warm invocations
+_clients: Dict[str, Any] = {}
+
+
+def _client(service_name: str) -> Any:
+    """Return the cached boto3 client of a service, importing boto3 and creating the client on first use."""
+    client = _clients.get(service_name)
+    if client is None:
+        import boto3
+        client = _clients[service_name] = boto3.client(service_name)
+    return client
+
+
+def _input_keys(event: Dict[str, Any], client: Any) -> List[str]:
+    """Read the input keys from an S3 notification, an explicit key list or a prefix."""
+    if "Records" in event:
+        return [unquote_plus(record["s3"]["object"]["key"]) for record in event["Records"]]
+    if "keys" in event:
+        return list(event["keys"])
+    keys = []
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=event["bucket"], Prefix=event["prefix"]):
+        keys.extend(item["Key"] for item in page.get("Contents", []))
+    return keys
 
 
 def lambda_handler(event, context):
-    print(event)
+    """Chunk collected logs objects for the analyze-with-llm step.
+
+    The event is either an S3 notification, or
+    `{"bucket": ..., "keys": [...]}` or `{"bucket": ..., "prefix": ...}`.
+    Optional event fields override the environment: `output_bucket`,
+    `output_prefix`, `token_budget`, `overlap_events`, `window_ms`,
+    `max_parallel_objects`, `tokenizer_encoding`, `summarize_templates`,
+    `score_windows`, `top_k`, `sample_rate`, `bin_ms` and `state_prefix`.
+
+    With `summarize_templates` (the default), events are collapsed into
+    template summaries so the model sees each message template once with
+    its counts instead of every repetition. With `score_windows` (the
+    default), only the chunks of the `top_k` most anomalous windows of
+    each log group, plus a `sample_rate` share of the others, are listed
+    for analysis. Each invocation usually reads one object, so the scoring
+    state of every log group is kept under `state_prefix` in the output
+    bucket, and `top_k` applies to its recent windows rather than to one object.
+    """
+    client = _client("s3")
+    bucket = event["Records"][0]["s3"]["bucket"]["name"] if "Records" in event else event["bucket"]
+    keys = _input_keys(event, client)
+    output_bucket = event.get("output_bucket") or os.environ.get("OUTPUT_BUCKET") or bucket
+    # Notifications of objects closed together start concurrent invocations, so the time alone is not unique
+    run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    output_prefix = event.get("output_prefix") or f"{os.environ.get('OUTPUT_PREFIX', 'chunks')}/run={run_id}"
+
+    estimator = TokenEstimator(encoding=event.get("tokenizer_encoding") or os.environ.get("TOKENIZER_ENCODING"))
+    token_budget = int(event.get("token_budget") or os.environ.get("TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+    window_ms = int(event.get("window_ms") or os.environ.get("WINDOW_MS", DEFAULT_WINDOW_MS))
+    summarize_templates = event.get("summarize_templates", os.environ.get("SUMMARIZE_TEMPLATES", "true"))
+    if str(summarize_templates).lower() in ("true", "1", "yes"):
+        chunker_factory = partial(TemplateChunker, token_budget=token_budget, window_ms=window_ms, estimator=estimator)
+    else:
+        chunker_factory = partial(
+            Chunker,
+            token_budget=token_budget,
+            overlap_events=int(event.get("overlap_events", os.environ.get("OVERLAP_EVENTS", DEFAULT_OVERLAP_EVENTS))),
+            window_ms=window_ms,
+            estimator=estimator
+        )
+    scorer = None
+    score_windows = event.get("score_windows", os.environ.get("SCORE_WINDOWS", "true"))
+    if str(score_windows).lower() in ("true", "1", "yes"):
+        # Imported here as it imports numpy
+        from scoring import AnomalyScorer, S3ScorerStateStore, DEFAULT_BIN_MS, DEFAULT_SAMPLE_RATE, DEFAULT_TOP_K
+        state_prefix = event.get("state_prefix") or os.environ.get("STATE_PREFIX") or f"{os.environ.get('OUTPUT_PREFIX', 'chunks')}/scorer-state"
+        scorer = AnomalyScorer(
+            window_ms,
+            bin_ms=int(event.get("bin_ms") or os.environ.get("BIN_MS", DEFAULT_BIN_MS)),
+            top_k=int(event.get("top_k") or os.environ.get("TOP_K", DEFAULT_TOP_K)),
+            sample_rate=float(event.get("sample_rate", os.environ.get("SAMPLE_RATE", DEFAULT_SAMPLE_RATE))),
+            state_store=S3ScorerStateStore(client, output_bucket, state_prefix)
+        )
+    manifest = process_objects(
+        client,
+        bucket,
+        keys,
+        output_bucket,
+        output_prefix,
+        chunker_factory=chunker_factory,
+        max_parallel_objects=int(event.get("max_parallel_objects") or os.environ.get("MAX_PARALLEL_OBJECTS", DEFAULT_MAX_PARALLEL_OBJECTS)),
+        scorer=scorer
+    )
+    logger.info(
+        f"Wrote {manifest['chunk_count']} chunks ({manifest['token_count']} estimated tokens, "
+        f"{manifest['raw_token_count']} before summarizing) "
+        f"for {manifest['event_count']} events to s3://{output_bucket}/{manifest['key']}"
+    )
     return {
         'statusCode': 200,
-        'body': 'Hello, World!'
+        'body': {
+            'manifest_bucket': output_bucket,
+            'manifest_key': manifest['key'],
+            'chunk_count': manifest['chunk_count'],
+            'event_count': manifest['event_count'],
+            'token_count': manifest['token_count'],
+            'raw_token_count': manifest['raw_token_count'],
+            'skipped_chunk_count': manifest.get('skipped_chunk_count', 0),
+        }
     }
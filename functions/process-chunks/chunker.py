@@ -0,0 +1,741 @@
+import io
+import re
+import json
+import gzip
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote
+from drain import Template, TemplateMiner
+
+try:
+    import zstandard
+except ImportError:  # zstd input is optional
+    zstandard = None
+
+# pyarrow and tiktoken take hundreds of milliseconds to import, so they are only
+# imported when a Parquet object or an exact token count needs them; numpy, by scoring
+if TYPE_CHECKING:
+    from scoring import AnomalyScorer
+
+
+# Constants
+DEFAULT_TOKEN_BUDGET = 8000
+DEFAULT_OVERLAP_EVENTS = 5
+DEFAULT_OVERLAP_TOKENS = 400
+DEFAULT_WINDOW_MS = 15 * 60 * 1000
+DEFAULT_MAX_OPEN_STREAMS = 256
+DEFAULT_MAX_PARALLEL_OBJECTS = 4
+DEFAULT_MAX_PENDING_WRITES = 32
+DEFAULT_MAX_TEMPLATES = 2000
+DEFAULT_MAX_OPEN_WINDOWS = 4
+CHARS_PER_TOKEN = 3.5  # Logs have more digits and punctuation than prose, so fewer characters per token
+EVENT_OVERHEAD_TOKENS = 8  # Timestamp and separators added when an event is rendered in a prompt
+READ_BLOCK_SIZE = 8 * 1024 * 1024
+PARQUET_BATCH_SIZE = 10_000
+TRUNCATION_MARKER = " …[truncated]"
+
+LOG_GROUP_PATTERN = re.compile(r"(?:^|/)log_group=([^/]+)/")
+
+
+logger = logging.getLogger(__name__)
+
+
+class LogRecord(NamedTuple):
+    """One collected log event."""
+    timestamp: int
+    message: str
+    log_stream: str
+    event_id: Optional[str] = None
+
+
+class TokenEstimator:
+    """Estimates the number of LLM tokens of a text, without calling a tokenizer service.
+
+    With `encoding` set and tiktoken installed, texts are tokenized exactly.
+    Otherwise the estimate is the character count divided by
+    `chars_per_token`, which is orders of magnitude faster and close enough
+    to pack chunks below a budget with some headroom.
+    """
+
+    def __init__(self, chars_per_token: float = CHARS_PER_TOKEN, encoding: Optional[str] = None):
+        """Initialize the TokenEstimator.
+
+        Args:
+            chars_per_token: Average number of characters per token
+            encoding: tiktoken encoding name, e.g. "cl100k_base"
+        """
+        self.chars_per_token = chars_per_token
+        self._encoding = None
+        if encoding:
+            try:
+                import tiktoken
+            except ImportError:
+                raise ImportError("Exact token counts require the tiktoken package") from None
+            self._encoding = tiktoken.get_encoding(encoding)
+
+    def __call__(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return int(len(text) / self.chars_per_token) + 1
+
+    def truncate(self, text: str, tokens: int) -> str:
+        """Shorten a text to at most about `tokens` tokens, marking it as truncated."""
+        if self(text) <= tokens:
+            return text
+        keep = max(tokens - self(TRUNCATION_MARKER), 0)
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:keep]) + TRUNCATION_MARKER
+        return text[:int(keep * self.chars_per_token)] + TRUNCATION_MARKER
+
+
+@dataclass
+class Chunk:
+    """Consecutive events of one stream that fit a token budget.
+
+    `context` holds the last events of the stream's previous chunk. They
+    are shown to the model as context only, so an incident that straddles
+    two chunks is not cut off without warning.
+    """
+    chunk_id: str
+    log_group: str
+    log_stream: str
+    source_key: str
+    events: List[LogRecord]
+    context: List[LogRecord]
+    tokens: int
+
+    @property
+    def start(self) -> int:
+        return self.events[0].timestamp
+
+    @property
+    def end(self) -> int:
+        return self.events[-1].timestamp
+
+    def to_json(self) -> bytes:
+        document = {
+            "chunk_id": self.chunk_id,
+            "kind": "events",
+            "log_group": self.log_group,
+            "log_stream": self.log_stream,
+            "source_key": self.source_key,
+            "start": self.start,
+            "end": self.end,
+            "tokens": self.tokens,
+            "context": [[record.timestamp, record.message] for record in self.context],
+            "events": [[record.timestamp, record.message] for record in self.events],
+        }
+        return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def manifest_entry(self, key: str) -> Dict[str, Any]:
+        return {
+            "chunk_id": self.chunk_id,
+            "kind": "events",
+            "key": key,
+            "log_group": self.log_group,
+            "log_stream": self.log_stream,
+            "start": self.start,
+            "end": self.end,
+            "events": len(self.events),
+            "tokens": self.tokens,
+        }
+
+
+@dataclass
+class TemplateChunk:
+    """Template summaries of a log group's events in one time window that fit a token budget.
+
+    Each summary is a Drain template with its count, first and last seen
+    timestamps, sample parameter values and a few of its log streams.
+    `raw_tokens` is the estimated size of the events the summaries stand for.
+    """
+    chunk_id: str
+    log_group: str
+    source_key: str
+    templates: List[Dict[str, Any]]
+    tokens: int
+    event_count: int
+    raw_tokens: int
+
+    @property
+    def start(self) -> int:
+        return min(template["first_seen"] for template in self.templates)
+
+    @property
+    def end(self) -> int:
+        return max(template["last_seen"] for template in self.templates)
+
+    def to_json(self) -> bytes:
+        document = {
+            "chunk_id": self.chunk_id,
+            "kind": "templates",
+            "log_group": self.log_group,
+            "source_key": self.source_key,
+            "start": self.start,
+            "end": self.end,
+            "tokens": self.tokens,
+            "raw_tokens": self.raw_tokens,
+            "event_count": self.event_count,
+            "templates": self.templates,
+        }
+        return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def manifest_entry(self, key: str) -> Dict[str, Any]:
+        return {
+            "chunk_id": self.chunk_id,
+            "kind": "templates",
+            "key": key,
+            "log_group": self.log_group,
+            "log_stream": None,
+            "start": self.start,
+            "end": self.end,
+            "events": self.event_count,
+            "templates": len(self.templates),
+            "tokens": self.tokens,
+            "raw_tokens": self.raw_tokens,
+        }
+
+
+@dataclass
+class _OpenChunk:
+    window: int
+    context: List[LogRecord]
+    events: List[LogRecord] = field(default_factory=list)
+    tokens: int = 0
+
+
+class Chunker:
+    """Groups the events of one input object into chunks, streaming.
+
+    Events are appended to an open chunk per log stream, so chunks never mix
+    streams even though collected objects interleave them page by page. A
+    chunk is finished when the next event would exceed the token budget,
+    when the next event falls in another time window, or when more than
+    `max_open_streams` streams have an open chunk, in which case the least
+    recently written one is finished. Memory is bounded by
+    `max_open_streams` chunks, whatever the size of the input.
+
+    Usage:
+        chunker = Chunker(log_group, key)
+        for record in records:
+            for chunk in chunker.add(record):
+                write(chunk)
+        for chunk in chunker.flush():
+            write(chunk)
+    """
+
+    def __init__(
+        self,
+        log_group: str,
+        source_key: str,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        overlap_events: int = DEFAULT_OVERLAP_EVENTS,
+        overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+        window_ms: int = DEFAULT_WINDOW_MS,
+        max_open_streams: int = DEFAULT_MAX_OPEN_STREAMS,
+        estimator: Optional[TokenEstimator] = None
+    ):
+        """Initialize the Chunker.
+
+        Args:
+            log_group: Name of the log group the events belong to
+            source_key: Key of the input object, used in chunk ids
+            token_budget: Maximum estimated tokens per chunk, context included
+            overlap_events: Number of events of the previous chunk repeated as context
+            overlap_tokens: Maximum estimated tokens of the context
+            window_ms: Chunks never cross a multiple of this many milliseconds
+            max_open_streams: Maximum number of streams with an open chunk
+            estimator: Token estimator. Defaults to the character based estimate.
+        """
+        if token_budget <= EVENT_OVERHEAD_TOKENS + overlap_tokens:
+            raise ValueError("token_budget must leave room for events after the overlap")
+        self.log_group = log_group
+        self.source_key = source_key
+        self.token_budget = token_budget
+        self.overlap_events = overlap_events
+        self.overlap_tokens = overlap_tokens
+        self.window_ms = window_ms
+        self.max_open_streams = max(max_open_streams, 1)
+        self.estimator = estimator or TokenEstimator()
+        self._open: "OrderedDict[str, _OpenChunk]" = OrderedDict()
+        self._last_events: "OrderedDict[str, List[LogRecord]]" = OrderedDict()
+        self._prefix = hashlib.sha1(source_key.encode("utf-8")).hexdigest()[:12]
+        self._sequence = 0
+
+    def add(self, record: LogRecord) -> List[Chunk]:
+        """Add an event and return the chunks it caused to be finished."""
+        finished: List[Chunk] = []
+        tokens = self.estimator(record.message) + EVENT_OVERHEAD_TOKENS
+        window = record.timestamp // self.window_ms
+        state = self._open.get(record.log_stream)
+
+        if state is not None and (state.window != window or state.tokens + tokens > self.token_budget):
+            finished.append(self._finish(record.log_stream))
+            state = None
+        if state is None:
+            context, context_tokens = self._context(record.log_stream)
+            state = self._open[record.log_stream] = _OpenChunk(window, context, tokens=context_tokens)
+            if len(self._open) > self.max_open_streams:
+                finished.append(self._finish(next(iter(self._open))))
+
+        room = self.token_budget - state.tokens
+        if tokens > room:
+            # A single event larger than a whole chunk
+            record = record._replace(message=self.estimator.truncate(record.message, room - EVENT_OVERHEAD_TOKENS))
+            tokens = room
+        state.events.append(record)
+        state.tokens += tokens
+        self._open.move_to_end(record.log_stream)
+        return finished
+
+    def flush(self) -> List[Chunk]:
+        """Finish every open chunk."""
+        return [self._finish(stream) for stream in list(self._open)]
+
+    def _context(self, log_stream: str) -> Tuple[List[LogRecord], int]:
+        previous = self._last_events.pop(log_stream, None)
+        if not previous:
+            return [], 0
+        context: Deque[LogRecord] = deque()
+        tokens = 0
+        for record in reversed(previous):
+            cost = self.estimator(record.message) + EVENT_OVERHEAD_TOKENS
+            if tokens + cost > self.overlap_tokens:
+                break
+            context.appendleft(record)
+            tokens += cost
+        return list(context), tokens
+
+    def _finish(self, log_stream: str) -> Chunk:
+        state = self._open.pop(log_stream)
+        self._sequence += 1
+        if self.overlap_events:
+            self._last_events[log_stream] = state.events[-self.overlap_events:]
+            # Keep context only for streams that may still get events
+            while len(self._last_events) > self.max_open_streams:
+                self._last_events.pop(next(iter(self._last_events)))
+        return Chunk(
+            f"{self._prefix}-{self._sequence:06d}",
+            self.log_group,
+            log_stream,
+            self.source_key,
+            state.events,
+            state.context,
+            state.tokens
+        )
+
+
+@dataclass
+class _OpenWindow:
+    miner: TemplateMiner
+    events: int = 0
+    raw_tokens: int = 0
+
+
+class TemplateChunker:
+    """Collapses the events of one input object into template summaries, streaming.
+
+    Most log volume is a few hundred message templates with different ids
+    and numbers. Instead of the events themselves, this chunker mines the
+    templates of each time window of the log group with a `TemplateMiner`
+    and emits their summaries, packed into chunks up to the token budget,
+    when the window is finished. Windows are finished when more than
+    `max_open_windows` are open, the oldest first, when a window reaches
+    `max_templates` templates, and on `flush`. Memory is bounded by the
+    templates of the open windows, not by the number of events.
+
+    It has the same interface as `Chunker`, so either can be passed as the
+    `chunker_factory` of `process_objects`.
+    """
+
+    def __init__(
+        self,
+        log_group: str,
+        source_key: str,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        window_ms: int = DEFAULT_WINDOW_MS,
+        max_templates: int = DEFAULT_MAX_TEMPLATES,
+        max_open_windows: int = DEFAULT_MAX_OPEN_WINDOWS,
+        estimator: Optional[TokenEstimator] = None,
+        miner_factory: Callable[[], TemplateMiner] = TemplateMiner
+    ):
+        """Initialize the TemplateChunker.
+
+        Args:
+            log_group: Name of the log group the events belong to
+            source_key: Key of the input object, used in chunk ids
+            token_budget: Maximum estimated tokens per chunk
+            window_ms: Templates are mined separately for each multiple of this many milliseconds
+            max_templates: Maximum templates of a window before it is finished early
+            max_open_windows: Maximum number of windows mined at once, for out of order events
+            estimator: Token estimator. Defaults to the character based estimate.
+            miner_factory: Creates the template miner of a window
+        """
+        self.log_group = log_group
+        self.source_key = source_key
+        self.token_budget = token_budget
+        self.window_ms = window_ms
+        self.max_templates = max(max_templates, 1)
+        self.max_open_windows = max(max_open_windows, 1)
+        self.estimator = estimator or TokenEstimator()
+        self.miner_factory = miner_factory
+        self._open: Dict[int, _OpenWindow] = {}
+        self._prefix = hashlib.sha1(source_key.encode("utf-8")).hexdigest()[:12]
+        self._sequence = 0
+
+    def add(self, record: LogRecord) -> List[TemplateChunk]:
+        """Add an event and return the chunks it caused to be finished."""
+        finished: List[TemplateChunk] = []
+        window = record.timestamp // self.window_ms
+        state = self._open.get(window)
+        if state is None:
+            state = self._open[window] = _OpenWindow(self.miner_factory())
+            if len(self._open) > self.max_open_windows:
+                finished.extend(self._finish(min(open_window for open_window in self._open if open_window != window)))
+        state.miner.add(record.message, record.timestamp, record.log_stream)
+        state.events += 1
+        state.raw_tokens += self.estimator(record.message) + EVENT_OVERHEAD_TOKENS
+        if len(state.miner) >= self.max_templates and window in self._open:
+            finished.extend(self._finish(window))
+        return finished
+
+    def flush(self) -> List[TemplateChunk]:
+        """Finish every open window."""
+        return [chunk for window in sorted(self._open) for chunk in self._finish(window)]
+
+    def _summary(self, template: Template) -> Tuple[Dict[str, Any], int]:
+        summary = template.summary()
+        tokens = self.estimator(json.dumps(summary, ensure_ascii=False))
+        if tokens > self.token_budget:
+            # A template longer than a whole chunk; its parameters are dropped first
+            summary["parameters"] = []
+            room = self.token_budget - self.estimator(json.dumps(dict(summary, template=""), ensure_ascii=False))
+            summary["template"] = self.estimator.truncate(summary["template"], max(room, 1))
+            tokens = min(self.estimator(json.dumps(summary, ensure_ascii=False)), self.token_budget)
+        return summary, tokens
+
+    def _finish(self, window: int) -> List[TemplateChunk]:
+        state = self._open.pop(window)
+        groups: List[Tuple[List[Dict[str, Any]], int, int]] = []
+        templates: List[Dict[str, Any]] = []
+        tokens = events = 0
+        for template in sorted(state.miner.templates(), key=lambda template: template.first_seen):
+            summary, cost = self._summary(template)
+            if templates and tokens + cost > self.token_budget:
+                groups.append((templates, tokens, events))
+                templates, tokens, events = [], 0, 0
+            templates.append(summary)
+            tokens += cost
+            events += template.count
+        if templates:
+            groups.append((templates, tokens, events))
+
+        chunks = []
+        for templates, tokens, events in groups:
+            self._sequence += 1
+            chunks.append(TemplateChunk(
+                f"{self._prefix}-t{self._sequence:06d}",
+                self.log_group,
+                self.source_key,
+                templates,
+                tokens,
+                events,
+                # Attribute the raw size of the window to its chunks by event count
+                state.raw_tokens * events // max(state.events, 1)
+            ))
+        return chunks
+
+
+class S3RangeReader(io.RawIOBase):
+    """Seekable, read-only file over an S3 object, reading with ranged GETs.
+
+    Lets pyarrow read a Parquet footer and then one row group at a time
+    without downloading the whole object. Wrap it in `io.BufferedReader` to
+    turn small reads into block-sized requests.
+    """
+
+    def __init__(self, client: Any, bucket: str, key: str, size: Optional[int] = None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size if size is not None else client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def readinto(self, buffer: Any) -> int:
+        if self._position >= self.size or not len(buffer):
+            return 0
+        end = min(self._position + len(buffer), self.size) - 1
+        response = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={self._position}-{end}")
+        data = response["Body"].read()
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+def log_group_from_key(key: str) -> str:
+    """Read the log group from the `log_group=` partition of a collected logs key."""
+    match = LOG_GROUP_PATTERN.search(key)
+    return unquote(match.group(1)) if match else ""
+
+
+class _ReadableBody(io.RawIOBase):
+    """Adapts an object with a `read(size)` method, e.g. a botocore StreamingBody, to `io.RawIOBase`."""
+
+    def __init__(self, body: Any):
+        self.body = body
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        data = self.body.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _open_text_stream(body: Any, key: str) -> io.TextIOWrapper:
+    """Wrap an S3 body in a decompressing, decoding stream chosen from the key's extension."""
+    if key.endswith(".gz"):
+        # GzipFile reads every member of the concatenated, independently compressed chunks
+        raw = gzip.GzipFile(fileobj=body, mode="rb")
+    elif key.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("zstd input requires the zstandard package")
+        raw = zstandard.ZstdDecompressor().stream_reader(body, read_across_frames=True)
+    else:
+        raw = body
+    return io.TextIOWrapper(io.BufferedReader(_ReadableBody(raw), READ_BLOCK_SIZE), encoding="utf-8")
+
+
+def iter_records(client: Any, bucket: str, key: str) -> Iterator[LogRecord]:
+    """Stream the events of a collected logs object without downloading it in full.
+
+    NDJSON objects, optionally gzip or zstd compressed, are decompressed and
+    parsed line by line while they are read. Parquet objects are read one
+    row group at a time with ranged GETs.
+
+    Args:
+        client: boto3 S3 client
+        bucket: Bucket of the object
+        key: Key of the object
+
+    Yields:
+        Events in the order they are stored
+    """
+    if key.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet input requires the pyarrow package") from None
+        reader = io.BufferedReader(S3RangeReader(client, bucket, key), READ_BLOCK_SIZE)
+        parquet_file = pq.ParquetFile(reader)
+        for batch in parquet_file.iter_batches(PARQUET_BATCH_SIZE, columns=["timestamp", "message", "event_id", "log_stream"]):
+            columns = batch.to_pydict()
+            yield from map(LogRecord, columns["timestamp"], columns["message"], columns["log_stream"], columns["event_id"])
+        return
+
+    body = client.get_object(Bucket=bucket, Key=key)["Body"]
+    with _open_text_stream(body, key) as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            yield LogRecord(event["timestamp"], event["message"], event.get("log_stream") or "", event.get("event_id"))
+
+
+class ChunkWriter:
+    """Writes chunk objects to S3 from a thread pool, with a bounded number of pending writes."""
+
+    def __init__(self, client: Any, bucket: str, prefix: str, max_pending: int = DEFAULT_MAX_PENDING_WRITES):
+        """Initialize the ChunkWriter.
+
+        Args:
+            client: boto3 S3 client. boto3 clients are thread-safe.
+            bucket: Destination bucket
+            prefix: Key prefix of the run. Chunks are written under `{prefix}/chunks/`.
+            max_pending: Maximum number of chunks written or waiting to be written
+        """
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix="chunk-writer")
+
+    def key(self, chunk: Chunk) -> str:
+        return f"{self.prefix}/chunks/{chunk.chunk_id}.json"
+
+    def submit(self, chunk: Chunk) -> Future:
+        """Start writing a chunk, blocking while `max_pending` writes are in progress.
+
+        Returns:
+            Future resolving to the chunk's manifest entry
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._put, chunk)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _put(self, chunk: Chunk) -> Dict[str, Any]:
+        key = self.key(chunk)
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=chunk.to_json(), ContentType="application/json")
+        return chunk.manifest_entry(key)
+
+    def write_manifest(self, manifest: Dict[str, Any]) -> str:
+        key = f"{self.prefix}/manifest.json"
+        body = json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8")
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType="application/json")
+        return key
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def chunk_object(
+    client: Any,
+    bucket: str,
+    key: str,
+    writer: ChunkWriter,
+    chunker_factory: Callable[[str, str], Any] = Chunker,
+    scorer: Optional["AnomalyScorer"] = None
+) -> Dict[str, Any]:
+    """Chunk one collected logs object and write its chunks.
+
+    Args:
+        client: boto3 S3 client
+        bucket: Bucket of the object
+        key: Key of the object
+        writer: Writer of the chunk objects
+        chunker_factory: Creates the `Chunker` or `TemplateChunker` of a log group and source key
+        scorer: Counts every event for window selection. None skips scoring.
+
+    Returns:
+        Summary of the object with the manifest entries of its chunks
+    """
+    log_group = log_group_from_key(key)
+    chunker = chunker_factory(log_group, key)
+    futures: List[Future] = []
+    events = 0
+    for record in iter_records(client, bucket, key):
+        events += 1
+        if scorer is not None:
+            scorer.add(log_group, record)
+        futures.extend(writer.submit(chunk) for chunk in chunker.add(record))
+    futures.extend(writer.submit(chunk) for chunk in chunker.flush())
+    chunks = [future.result() for future in futures]
+    logger.info(f"Chunked {events} events of s3://{bucket}/{key} into {len(chunks)} chunks")
+    return {"key": key, "events": events, "chunks": chunks}
+
+
+def process_objects(
+    client: Any,
+    bucket: str,
+    keys: List[str],
+    output_bucket: str,
+    output_prefix: str,
+    chunker_factory: Callable[[str, str], Any] = Chunker,
+    max_parallel_objects: int = DEFAULT_MAX_PARALLEL_OBJECTS,
+    max_pending_writes: int = DEFAULT_MAX_PENDING_WRITES,
+    scorer: Optional["AnomalyScorer"] = None
+) -> Dict[str, Any]:
+    """Chunk collected logs objects in parallel and write a manifest of every chunk.
+
+    Objects are independent, so each one is read and chunked by its own
+    worker thread; decompression and S3 I/O release the GIL. Memory is
+    bounded by the open chunks of each worker and the pending writes,
+    whatever the size of the objects.
+
+    With a `scorer`, every event is also counted for anomaly scoring in
+    the same pass. Only the chunks of the windows it selects are listed
+    under `chunks`, the ones analyze-with-llm reads, each with its
+    window's score breakdown; the others are listed under `skipped_chunks`
+    and every window's score under `windows`.
+
+    Args:
+        client: boto3 S3 client
+        bucket: Bucket of the input objects
+        keys: Keys of the input objects
+        output_bucket: Bucket the chunks and manifest are written to
+        output_prefix: Key prefix of the chunks and manifest
+        chunker_factory: Creates the `Chunker` or `TemplateChunker` of a log group and source key
+        max_parallel_objects: Maximum number of objects processed at once
+        max_pending_writes: Maximum number of chunk writes in progress
+        scorer: Selects the windows whose chunks are analyzed. None analyzes every chunk.
+
+    Returns:
+        The manifest, also written to `{output_prefix}/manifest.json`
+    """
+    writer = ChunkWriter(client, output_bucket, output_prefix, max_pending_writes)
+    try:
+        with ThreadPoolExecutor(max_workers=max(max_parallel_objects, 1), thread_name_prefix="chunker") as executor:
+            inputs = list(executor.map(lambda key: chunk_object(client, bucket, key, writer, chunker_factory, scorer), keys))
+    finally:
+        writer.close()
+
+    chunks = [entry for summary in inputs for entry in summary["chunks"]]
+    skipped: List[Dict[str, Any]] = []
+    windows: List[Any] = []
+    if scorer is not None:
+        scores = scorer.select(keys)
+        windows = sorted(scores.values(), key=lambda window: (window.log_group, window.window))
+        selected = []
+        for entry in chunks:
+            window = scores.get((entry["log_group"], entry["start"] // scorer.window_ms))
+            if window is not None:
+                entry["score"] = {
+                    "window_score": window.score,
+                    "selected_by": window.selected_by,
+                    "robust_z": window.robust_z,
+                    "ewma_z": window.ewma_z,
+                    "spikes": window.spikes,
+                    "novel_templates": window.novel_templates,
+                    "top_series": window.top_series,
+                }
+            (selected if window is None or window.selected_by else skipped).append(entry)
+        chunks = selected
+        logger.info(f"Selected {len(chunks)} of {len(chunks) + len(skipped)} chunks by anomaly score")
+
+    manifest = {
+        "version": 1,
+        "bucket": output_bucket,
+        "inputs": [{"bucket": bucket, "key": summary["key"], "events": summary["events"]} for summary in inputs],
+        "chunk_count": len(chunks),
+        "event_count": sum(summary["events"] for summary in inputs),
+        "token_count": sum(entry["tokens"] for entry in chunks),
+        "raw_token_count": sum(entry.get("raw_tokens", entry["tokens"]) for entry in chunks),
+        "chunks": chunks,
+    }
+    if scorer is not None:
+        manifest["skipped_chunk_count"] = len(skipped)
+        manifest["skipped_chunks"] = skipped
+        manifest["windows"] = [window.to_dict() for window in windows]
+    manifest["key"] = writer.write_manifest(manifest)
+    return manifest
@@ -0,0 +1,236 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Constants
+WILDCARD = "<*>"
+DEFAULT_DEPTH = 4
+DEFAULT_SIMILARITY_THRESHOLD = 0.4
+DEFAULT_MAX_CHILDREN = 100
+DEFAULT_MAX_SAMPLES = 3
+DEFAULT_MATCH_CACHE_SIZE = 10_000
+MAX_SAMPLE_CHARS = 64
+
+# Tokens that are almost always parameters: numbers, hex, UUIDs, IP addresses, dates and times
+VARIABLE = (
+    r"[-+]?\d+(?:[.,:]\d+)*(?:[a-zA-Z%]{1,3})?"
+    r"|0x[0-9a-fA-F]+"
+    r"|(?=[a-fA-F]*\d)[0-9a-fA-F]{8,}"
+    r"|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+    r"|\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?"
+    r"|\d{4}-\d{2}-\d{2}(?:T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)?"
+)
+# A whole token, or the value of a `key=value` token, optionally quoted or bracketed
+MASK_PATTERN = re.compile(rf"(?<!\S)([^\s=]+=)?[\"'(\[{{]*(?:{VARIABLE})[\"')\]}},;]*(?!\S)")
+HAS_DIGIT = re.compile(r"\d").search
+
+
+def mask(message: str) -> List[str]:
+    """Split a message into tokens, replacing tokens and `key=value` values that look like parameters with the wildcard."""
+    # One substitution over the whole message is much faster than matching token by token
+    return MASK_PATTERN.sub(rf"\1{WILDCARD}", message).split()
+
+
+def _parameter(template_token: str, token: str) -> str:
+    # `key=<*>` positions take the value only
+    if template_token != WILDCARD and template_token.endswith(WILDCARD):
+        return token[len(template_token) - len(WILDCARD):]
+    return token
+
+
+@dataclass
+class Template:
+    """A message template with its occurrences.
+
+    `samples` holds a few distinct values seen at each parameter position,
+    keyed by token position.
+    """
+    template_id: int
+    tokens: List[str]
+    count: int = 0
+    first_seen: Optional[int] = None
+    last_seen: Optional[int] = None
+    samples: Dict[int, List[str]] = field(default_factory=dict)
+    log_streams: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+    @property
+    def parameters(self) -> List[List[str]]:
+        """Sample values of each parameter, in token order."""
+        return [self.samples.get(position, []) for position, token in enumerate(self.tokens) if WILDCARD in token]
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "template_id": self.template_id,
+            "template": self.text,
+            "count": self.count,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "parameters": self.parameters,
+            "log_streams": self.log_streams,
+        }
+
+
+@dataclass
+class _Node:
+    children: Dict[str, "_Node"] = field(default_factory=dict)
+    templates: List[Template] = field(default_factory=list)
+
+
+class TemplateMiner:
+    """Online log template miner using Drain's fixed-depth parse tree.
+
+    Messages are split into whitespace separated tokens, and tokens that
+    look like parameters are masked. The tree routes a message by its
+    token count, then by its first `depth - 2` tokens, to a leaf holding
+    a few candidate templates. The message joins the most similar one if
+    at least `similarity_threshold` of its tokens are equal, and the
+    positions that differ become wildcards; otherwise it starts a new
+    template. Each message is compared with one leaf only, so mining is
+    linear in the number of messages. Masked token sequences seen before
+    are looked up in a cache instead: templates only ever generalize, so
+    a sequence keeps matching the template it joined.
+
+    See He et al., "Drain: An Online Log Parsing Approach with Fixed Depth Tree", ICWS 2017.
+
+    Usage:
+        miner = TemplateMiner()
+        for record in records:
+            miner.add(record.message, record.timestamp, record.log_stream)
+        for template in miner.templates():
+            print(template.count, template.text)
+    """
+
+    def __init__(
+        self,
+        depth: int = DEFAULT_DEPTH,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        max_children: int = DEFAULT_MAX_CHILDREN,
+        max_samples: int = DEFAULT_MAX_SAMPLES,
+        match_cache_size: int = DEFAULT_MATCH_CACHE_SIZE
+    ):
+        """Initialize the TemplateMiner.
+
+        Args:
+            depth: Depth of the parse tree, at least 3. Messages are routed by their first `depth - 2` tokens.
+            similarity_threshold: Minimum share of equal tokens for a message to join a template
+            max_children: Maximum children of an inner node. Further tokens share a wildcard child.
+            max_samples: Maximum distinct sample values kept per parameter and log streams kept per template
+            match_cache_size: Maximum masked token sequences remembered with their template
+        """
+        if depth < 3:
+            raise ValueError("depth must be at least 3")
+        self.depth = depth
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.max_samples = max_samples
+        self.match_cache_size = match_cache_size
+        self._root = _Node()
+        self._templates: List[Template] = []
+        self._match_cache: Dict[Tuple[str, ...], Template] = {}
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def templates(self) -> Iterator[Template]:
+        """Templates in the order they were first seen."""
+        return iter(self._templates)
+
+    def add(self, message: str, timestamp: Optional[int] = None, log_stream: Optional[str] = None) -> Template:
+        """Add a message to its template, creating or generalizing the template as needed.
+
+        Args:
+            message: Log message
+            timestamp: Timestamp of the message in milliseconds
+            log_stream: Log stream of the message
+
+        Returns:
+            The template the message was added to
+        """
+        tokens = message.split()
+        masked = mask(message)
+        key = tuple(masked)
+        template = self._match_cache.get(key)
+        if template is None:
+            template = self._match(masked)
+            if len(self._match_cache) >= self.match_cache_size:
+                self._match_cache.clear()
+            self._match_cache[key] = template
+
+        template.count += 1
+        if timestamp is not None:
+            if template.first_seen is None or timestamp < template.first_seen:
+                template.first_seen = timestamp
+            if template.last_seen is None or timestamp > template.last_seen:
+                template.last_seen = timestamp
+        if log_stream and len(template.log_streams) < self.max_samples and log_stream not in template.log_streams:
+            template.log_streams.append(log_stream)
+        for position, template_token in enumerate(template.tokens):
+            if WILDCARD in template_token:
+                self._sample(template, position, _parameter(template_token, tokens[position]))
+        return template
+
+    def _match(self, masked: List[str]) -> Template:
+        leaf = self._leaf(masked)
+        template, similarity = max(
+            ((candidate, self._similarity(candidate.tokens, masked)) for candidate in leaf.templates),
+            key=lambda match: (match[1], match[0].tokens.count(WILDCARD)),
+            default=(None, 0.0)
+        )
+        if template is None or similarity < self.similarity_threshold:
+            template = Template(len(self._templates) + 1, list(masked))
+            leaf.templates.append(template)
+            self._templates.append(template)
+        else:
+            self._merge(template, masked)
+        return template
+
+    def _leaf(self, tokens: List[str]) -> _Node:
+        node = self._root.children.setdefault(str(len(tokens)), _Node())
+        for token in tokens[:self.depth - 2]:
+            if HAS_DIGIT(token):
+                token = WILDCARD
+            if token not in node.children and len(node.children) >= self.max_children - 1:
+                token = WILDCARD
+            node = node.children.setdefault(token, _Node())
+        return node
+
+    @staticmethod
+    def _similarity(template_tokens: List[str], tokens: List[str]) -> float:
+        if not tokens:
+            return 1.0
+        # Masked parameters match wildcards, so messages made of parameters still share a template
+        equal = sum(1 for template_token, token in zip(template_tokens, tokens) if template_token == token)
+        return equal / len(tokens)
+
+    def _merge(self, template: Template, tokens: List[str]) -> None:
+        for position, (template_token, token) in enumerate(zip(template.tokens, tokens)):
+            if template_token == token or template_token == WILDCARD:
+                continue
+            # `key=value` tokens with the same key keep the key
+            key, separator, value = template_token.partition("=")
+            generalized = f"{key}={WILDCARD}" if separator and token.startswith(f"{key}=") else WILDCARD
+            # A constant becomes a parameter; its value so far is the first sample
+            if WILDCARD not in template_token:
+                self._sample(template, position, value if generalized != WILDCARD else template_token)
+            template.tokens[position] = generalized
+
+    def _sample(self, template: Template, position: int, value: str) -> None:
+        samples = template.samples.setdefault(position, [])
+        if len(samples) >= self.max_samples:
+            return
+        value = value[:MAX_SAMPLE_CHARS]
+        if value not in samples:
+            samples.append(value)
+
+
+def mine_templates(messages: List[Tuple[int, str]], **kwargs) -> List[Template]:
+    """Mine the templates of `(timestamp, message)` pairs, most frequent first."""
+    miner = TemplateMiner(**kwargs)
+    for timestamp, message in messages:
+        miner.add(message, timestamp)
+    return sorted(miner.templates(), key=lambda template: -template.count)
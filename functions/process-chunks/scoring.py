@@ -0,0 +1,543 @@
+import re
+import json
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+import numpy as np
+from drain import TemplateMiner
+
+
+# Constants
+DEFAULT_BIN_MS = 60 * 1000
+DEFAULT_BASELINE_BINS = 30
+DEFAULT_MIN_HISTORY_BINS = 5
+DEFAULT_EWMA_ALPHA = 0.1
+DEFAULT_SPIKE_RATIO = 4.0
+DEFAULT_MIN_SPIKE_COUNT = 10
+DEFAULT_NOVELTY_WEIGHT = 2.0
+DEFAULT_SPIKE_WEIGHT = 1.0
+DEFAULT_TOP_K = 8
+DEFAULT_SAMPLE_RATE = 0.05
+DEFAULT_TOP_SERIES = 5
+DEFAULT_HISTORY_BINS = 3 * 60  # Bins kept in a log group's state, so objects read a few hours out of order still have a baseline
+DEFAULT_SELECTION_WINDOWS = 96  # A day of 15 minute windows
+DEFAULT_MAX_STATE_TEMPLATES = 5000
+MAX_STATE_SOURCES = 1000
+MAX_STATE_ATTEMPTS = 5
+STATE_VERSION = 1
+MAD_SCALE = 1.4826  # Scales the median absolute deviation of normal data to its standard deviation
+SCORE_BLOCK_ROWS = 64  # Series scored at once, bounding the memory of the rolling windows
+
+LEVEL_PATTERN = re.compile(r"\b(TRACE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR|FATAL|CRITICAL|PANIC)\b")
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WindowScore:
+    """How anomalous one time window of a log group is, and why.
+
+    `score` is the largest deviation of any series in the window from its
+    baseline, plus `novelty_weight` per template first seen in it and
+    `spike_weight` per series with a rate spike in it. `selected_by` is
+    "top_k" or "sample" if the window is forwarded to the model, None if
+    it is skipped.
+    """
+    log_group: str
+    window: int
+    start: int
+    end: int
+    events: int
+    score: float
+    robust_z: float
+    ewma_z: float
+    spikes: int
+    novel_templates: List[str] = field(default_factory=list)
+    top_series: List[Dict[str, Any]] = field(default_factory=list)
+    selected_by: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class _GroupCounts:
+    miner: TemplateMiner
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    series: Dict[Tuple[str, str], int] = field(default_factory=dict)
+    counts: Counter = field(default_factory=Counter)  # (series index, bin) -> events
+    history: Counter = field(default_factory=Counter)  # (series index, bin) -> events of earlier invocations
+    known_templates: Dict[int, str] = field(default_factory=dict)  # Template id -> text, of the templates in the state
+    state: Optional[Dict[str, Any]] = None
+    etag: Optional[str] = None
+
+    def index(self, kind: str, name: str) -> int:
+        key = (kind, name)
+        index = self.series.get(key)
+        if index is None:
+            index = self.series[key] = len(self.series)
+        return index
+
+
+def _error_code(error: Exception) -> Optional[str]:
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+
+class S3ScorerStateStore:
+    """Keeps the scoring state of each log group in an S3 object between invocations.
+
+    The state holds the recent bin counts of every series, the templates
+    seen so far and the scores of recent windows. Writes are conditional
+    on the ETag the state was read with, so concurrent invocations for
+    one log group do not overwrite each other's counts; the one that
+    loses reads the state again and merges its counts into it.
+    """
+
+    def __init__(self, client: Any, bucket: str, prefix: str):
+        """Initialize the S3ScorerStateStore.
+
+        Args:
+            client: boto3 S3 client
+            bucket: Bucket of the state objects
+            prefix: Key prefix of the state objects
+        """
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def key(self, log_group: str) -> str:
+        return f"{self.prefix}/log_group={quote(log_group, safe='')}.json"
+
+    def load(self, log_group: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Read the state of a log group.
+
+        Returns:
+            The state and its ETag, or None and None if the log group has no state yet
+        """
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key(log_group))
+        except Exception as e:
+            if _error_code(e) in ("NoSuchKey", "404"):
+                return None, None
+            raise
+        return json.loads(response["Body"].read()), response.get("ETag")
+
+    def save(self, log_group: str, state: Dict[str, Any], etag: Optional[str]) -> bool:
+        """Write the state of a log group, unless it changed since it was read with `etag`.
+
+        Returns:
+            Whether the state was written
+        """
+        conditions = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self.key(log_group),
+                Body=json.dumps(state, separators=(",", ":")).encode("utf-8"),
+                ContentType="application/json",
+                **conditions
+            )
+        except Exception as e:
+            if _error_code(e) in ("PreconditionFailed", "ConditionalRequestConflict"):
+                return False
+            raise
+        return True
+
+
+def robust_z(counts: np.ndarray, baseline_bins: int, min_history: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Score each bin against the median and MAD of the `baseline_bins` bins before it.
+
+    The deviation is floored at the Poisson deviation of the median, and at
+    one event, so a series that is flat at a few events per bin does not
+    score infinitely on its first change.
+
+    Args:
+        counts: Events per series and bin, series × bins
+        baseline_bins: Number of preceding bins in the baseline
+        min_history: Bins before this index are not scored
+
+    Returns:
+        The z-scores and the baseline medians, both series × bins. Unscored bins are 0.
+    """
+    series, bins = counts.shape
+    scores = np.zeros((series, bins))
+    medians = np.zeros((series, bins))
+    if bins <= min_history:
+        return scores, medians
+    # Bin t's window holds bins t - baseline_bins to t - 1, NaN before the first bin
+    history = np.concatenate([np.full((series, baseline_bins), np.nan), counts[:, :-1]], axis=1)
+    for row in range(0, series, SCORE_BLOCK_ROWS):
+        windows = np.lib.stride_tricks.sliding_window_view(history[row:row + SCORE_BLOCK_ROWS], baseline_bins, axis=1)
+        windows = windows[:, min_history:]
+        median = np.nanmedian(windows, axis=2)
+        mad = np.nanmedian(np.abs(windows - median[..., None]), axis=2)
+        scale = np.maximum(np.maximum(MAD_SCALE * mad, np.sqrt(median)), 1.0)
+        scores[row:row + SCORE_BLOCK_ROWS, min_history:] = (counts[row:row + SCORE_BLOCK_ROWS, min_history:] - median) / scale
+        medians[row:row + SCORE_BLOCK_ROWS, min_history:] = median
+    return scores, medians
+
+
+def ewma_z(counts: np.ndarray, alpha: float, min_history: int) -> np.ndarray:
+    """Score each bin against the exponentially weighted mean and variance of the bins before it.
+
+    Args:
+        counts: Events per series and bin, series × bins
+        alpha: Weight of the newest bin in the moving mean and variance
+        min_history: Bins before this index are not scored
+
+    Returns:
+        The z-scores, series × bins. Unscored bins are 0.
+    """
+    series, bins = counts.shape
+    scores = np.zeros((series, bins))
+    if not bins:
+        return scores
+    mean = counts[:, 0].astype(float)
+    variance = np.zeros(series)
+    for column in range(1, bins):
+        deviation = counts[:, column] - mean
+        if column >= min_history:
+            # The variance is floored at the Poisson variance of the mean, as in `robust_z`
+            scores[:, column] = deviation / np.maximum(np.sqrt(np.maximum(variance, mean)), 1.0)
+        mean += alpha * deviation
+        variance = (1 - alpha) * (variance + alpha * deviation ** 2)
+    return scores
+
+
+class AnomalyScorer:
+    """Scores the time windows of log groups by how far their event rates stray from a rolling baseline.
+
+    Most windows are uneventful, and sending all of them to the model is
+    the slowest and most expensive step of a run. Every event is counted
+    into fixed time bins of three kinds of series per log group: its log
+    stream, its Drain template and its level word. Once every object is
+    read, each bin of each series is scored against the bins before it,
+    with a robust z-score over the rolling median and MAD and with an EWMA
+    z-score, and bins far above their baseline median are flagged as
+    spikes; templates first seen after the baseline period are novel.
+    `select` then keeps the `top_k` highest scoring windows of each log
+    group, plus a `sample_rate` share of the others at random for
+    coverage.
+
+    An invocation often reads a single hourly object, which is too short
+    for a baseline and has fewer windows than `top_k`. With a
+    `state_store`, the counts of the last `history_bins` bins, the known
+    templates and the scores of the last `selection_windows` windows of
+    each log group are kept between invocations: bins are scored against
+    the bins of earlier objects, templates are only novel if no earlier
+    object had them, and `top_k` applies to the last `selection_windows`
+    windows rather than to each invocation.
+
+    Windows are the chunkers' windows, so pass the same `window_ms`, and
+    each chunk belongs to exactly one window. `add` is thread-safe.
+
+    Usage:
+        scorer = AnomalyScorer(window_ms=DEFAULT_WINDOW_MS, top_k=8)
+        for record in records:
+            scorer.add(log_group, record)
+        windows = scorer.select()
+    """
+
+    def __init__(
+        self,
+        window_ms: int,
+        bin_ms: int = DEFAULT_BIN_MS,
+        baseline_bins: int = DEFAULT_BASELINE_BINS,
+        min_history_bins: int = DEFAULT_MIN_HISTORY_BINS,
+        ewma_alpha: float = DEFAULT_EWMA_ALPHA,
+        spike_ratio: float = DEFAULT_SPIKE_RATIO,
+        min_spike_count: int = DEFAULT_MIN_SPIKE_COUNT,
+        novelty_weight: float = DEFAULT_NOVELTY_WEIGHT,
+        spike_weight: float = DEFAULT_SPIKE_WEIGHT,
+        top_k: int = DEFAULT_TOP_K,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        seed: Optional[int] = None,
+        state_store: Optional[S3ScorerStateStore] = None,
+        history_bins: int = DEFAULT_HISTORY_BINS,
+        selection_windows: int = DEFAULT_SELECTION_WINDOWS,
+        max_state_templates: int = DEFAULT_MAX_STATE_TEMPLATES
+    ):
+        """Initialize the AnomalyScorer.
+
+        Args:
+            window_ms: Length of the windows that are selected, the chunkers' `window_ms`
+            bin_ms: Length of the bins events are counted in
+            baseline_bins: Number of preceding bins each bin is compared with
+            min_history_bins: Bins at the start of a log group that only form the baseline and are not scored
+            ewma_alpha: Weight of the newest bin in the EWMA baseline
+            spike_ratio: A bin is a spike if it has this many times its baseline median...
+            min_spike_count: ...and at least this many events
+            novelty_weight: Score added per novel template of a window
+            spike_weight: Score added per series with a spike in a window
+            top_k: Number of highest scoring windows selected per log group, among its last `selection_windows` windows with a `state_store`
+            sample_rate: Share of the other windows selected at random
+            seed: Seed of the random sample. None samples differently on every run.
+            state_store: Keeps each log group's counts, templates and window scores between invocations. None scores every invocation on its own.
+            history_bins: Bins of counts kept in the state, at least `baseline_bins`
+            selection_windows: Window scores kept in the state, that `top_k` applies to
+            max_state_templates: Templates kept in the state, the most recently seen
+        """
+        if window_ms < bin_ms:
+            raise ValueError("window_ms must be at least bin_ms")
+        self.window_ms = window_ms
+        self.bin_ms = bin_ms
+        self.baseline_bins = max(baseline_bins, 1)
+        self.min_history_bins = max(min(min_history_bins, self.baseline_bins), 1)
+        self.ewma_alpha = ewma_alpha
+        self.spike_ratio = spike_ratio
+        self.min_spike_count = min_spike_count
+        self.novelty_weight = novelty_weight
+        self.spike_weight = spike_weight
+        self.top_k = top_k
+        self.sample_rate = sample_rate
+        self.seed = seed
+        self.state_store = state_store
+        self.history_bins = max(history_bins, self.baseline_bins)
+        self.selection_windows = max(selection_windows, 1)
+        self.max_state_templates = max_state_templates
+        self._groups: Dict[str, _GroupCounts] = {}
+        self._lock = threading.Lock()
+
+    def add(self, log_group: str, record: Any) -> None:
+        """Count an event, a `LogRecord`, into the bins of its stream, template and level."""
+        group = self._groups.get(log_group)
+        if group is None:
+            with self._lock:
+                group = self._groups.get(log_group)
+                if group is None:
+                    group = self._groups[log_group] = self._new_group(log_group)
+        level = LEVEL_PATTERN.search(record.message)
+        position = record.timestamp // self.bin_ms
+        with group.lock:
+            template = group.miner.add(record.message, record.timestamp, record.log_stream)
+            counts = group.counts
+            counts[group.index("stream", record.log_stream), position] += 1
+            # Templates of the state are named by their text there, new ones by id until the state is saved
+            name = group.known_templates.get(template.template_id) or str(template.template_id)
+            counts[group.index("template", name), position] += 1
+            counts[group.index("level", level.group(1) if level else "NONE"), position] += 1
+
+    def _new_group(self, log_group: str) -> _GroupCounts:
+        """Create the counts of a log group, seeded with its state if there is one."""
+        group = _GroupCounts(TemplateMiner())
+        if self.state_store is None:
+            return group
+        state, group.etag = self.state_store.load(log_group)
+        if state is None:
+            return group
+        if not self._compatible(state):
+            logger.warning(f"Ignoring the scoring state of {log_group}, it was kept with other bin or window lengths")
+            return group
+        group.state = state
+        for text, _ in state["templates"]:
+            template = group.miner.add(text)
+            group.known_templates.setdefault(template.template_id, text)
+        # Seeding the miner is not an occurrence of the templates
+        for template in group.miner.templates():
+            template.count, template.first_seen, template.last_seen = 0, None, None
+            template.samples.clear()
+            template.log_streams.clear()
+        indices = [group.index(kind, name) for kind, name in state["series"]]
+        for series, position, count in state["counts"]:
+            group.history[indices[series], position] += count
+        return group
+
+    def _compatible(self, state: Dict[str, Any]) -> bool:
+        return (
+            state.get("version") == STATE_VERSION
+            and state.get("bin_ms") == self.bin_ms
+            and state.get("window_ms") == self.window_ms
+        )
+
+    def score(self, log_group: str) -> List[WindowScore]:
+        """Score every window of a log group with events of this invocation, oldest first. None are selected yet."""
+        return self._score(log_group, replayed=False)
+
+    def _score(self, log_group: str, replayed: bool) -> List[WindowScore]:
+        """Score the windows of a log group. When `replayed`, its counts are already part of the history."""
+        group = self._groups.get(log_group)
+        if group is None or not group.counts:
+            return []
+        with group.lock:
+            combined = group.history if replayed else group.history + group.counts
+            keys = np.array(list(combined.keys()), dtype=np.int64).reshape(-1, 2)
+            values = np.fromiter(combined.values(), dtype=np.float64, count=len(combined))
+            fresh_keys = np.array(list(group.counts.keys()), dtype=np.int64).reshape(-1, 2)
+            fresh_values = np.fromiter(group.counts.values(), dtype=np.float64, count=len(group.counts))
+            names = sorted(group.series, key=group.series.get)
+            texts = {str(template.template_id): template.text for template in group.miner.templates()}
+            known = set(group.known_templates.values())
+        first_bin = int(min(keys[:, 1].min(), fresh_keys[:, 1].min()))
+        last_bin = int(max(keys[:, 1].max(), fresh_keys[:, 1].max()))
+        counts = np.zeros((len(names), last_bin - first_bin + 1))
+        counts[keys[:, 0], keys[:, 1] - first_bin] = values
+        fresh = np.zeros_like(counts)
+        fresh[fresh_keys[:, 0], fresh_keys[:, 1] - first_bin] = fresh_values
+
+        history = self.min_history_bins
+        robust, medians = robust_z(counts, self.baseline_bins, history)
+        ewma = ewma_z(counts, self.ewma_alpha, history)
+        deviation = np.maximum(np.maximum(robust, ewma), 0.0)
+        spikes = (counts >= self.min_spike_count) & (counts >= self.spike_ratio * np.maximum(medians, 1.0))
+        spikes[:, :history] = False
+        streams = np.array([kind == "stream" for kind, _ in names])
+        templates = [index for index, (kind, _) in enumerate(names) if kind == "template"]
+        first_seen = (counts[templates] > 0).argmax(axis=1) if templates else np.zeros(0, dtype=np.int64)
+        # Templates an earlier invocation saw are never novel
+        first_seen[[names[index][1] in known for index in templates]] = counts.shape[1]
+
+        # Bins are consecutive, so each window is a slice of them
+        bin_starts = (np.arange(counts.shape[1]) + first_bin) * self.bin_ms
+        windows = bin_starts // self.window_ms
+        bounds = np.flatnonzero(np.diff(windows)) + 1
+        scores = []
+        for low, high in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(windows)]])):
+            # Windows of earlier invocations only form the baseline
+            if not fresh[streams, low:high].any():
+                continue
+            events = int(counts[streams, low:high].sum())
+            peaks = deviation[:, low:high].max(axis=1)
+            novel = [names[templates[index]][1] for index in np.flatnonzero((first_seen >= max(low, history)) & (first_seen < high))]
+            spiking = int(spikes[:, low:high].any(axis=1).sum())
+            top_series = []
+            for index in np.argsort(-peaks, kind="stable")[:DEFAULT_TOP_SERIES]:
+                if peaks[index] <= 0:
+                    break
+                column = low + int(deviation[index, low:high].argmax())
+                kind, name = names[index]
+                top_series.append({
+                    "kind": kind,
+                    "name": texts.get(name, name) if kind == "template" else name,
+                    "bin_start": int(bin_starts[column]),
+                    "count": int(counts[index, column]),
+                    "baseline": float(medians[index, column]),
+                    "z": round(float(deviation[index, column]), 2),
+                })
+            window = int(windows[low])
+            scores.append(WindowScore(
+                log_group,
+                window,
+                window * self.window_ms,
+                (window + 1) * self.window_ms - 1,
+                events,
+                round(float(peaks.max()) + self.novelty_weight * len(novel) + self.spike_weight * spiking, 3),
+                round(float(robust[:, low:high].max()), 2),
+                round(float(ewma[:, low:high].max()), 2),
+                spiking,
+                [texts.get(name, name) for name in novel],
+                top_series
+            ))
+        return scores
+
+    def select(self, sources: Optional[List[str]] = None) -> Dict[Tuple[str, int], WindowScore]:
+        """Score the windows of every log group and select the ones forwarded to the model.
+
+        With a `state_store`, windows compete for `top_k` with the earlier
+        windows in the state, and the state is updated with this
+        invocation's counts, templates and scores.
+
+        Args:
+            sources: Keys of the objects the events were read from. Objects already counted in the state, e.g.
+                     of a redelivered notification, are not counted again.
+
+        Returns:
+            Every scored window by log group and window index, with `selected_by` set on the selected ones
+        """
+        rng = np.random.default_rng(self.seed)
+        selected: Dict[Tuple[str, int], WindowScore] = {}
+        for log_group in sorted(self._groups):
+            group = self._groups[log_group]
+            replayed = bool(sources) and group.state is not None and set(sources) <= set(group.state["sources"])
+            scores = self._score(log_group, replayed)
+            ranked = sorted(scores, key=lambda window: (-window.score, window.window))
+            current = {window.window for window in scores}
+            earlier = [] if group.state is None else [
+                (-score, window) for window, score in group.state["scores"] if window not in current
+            ]
+            top = set(window for _, window in sorted(earlier + [(-window.score, window.window) for window in ranked])[:self.top_k])
+            for window in ranked:
+                if window.window in top:
+                    window.selected_by = "top_k"
+            others = [window for window in ranked if window.selected_by is None]
+            for window, draw in zip(others, rng.random(len(others))):
+                if draw < self.sample_rate:
+                    window.selected_by = "sample"
+            selected.update(((log_group, window.window), window) for window in scores)
+            if self.state_store is not None and not replayed:
+                self._save_state(log_group, group, scores, sources or [])
+            logger.info(
+                f"Selected {sum(window.selected_by is not None for window in scores)} of {len(scores)} windows of {log_group}, "
+                f"top score {ranked[0].score if ranked else 0}"
+            )
+        return selected
+
+    def _save_state(self, log_group: str, group: _GroupCounts, scores: List[WindowScore], sources: List[str]) -> None:
+        """Merge this invocation's counts, templates and scores into the state of a log group."""
+        with group.lock:
+            texts = {str(template.template_id): template.text for template in group.miner.templates()}
+            names = sorted(group.series, key=group.series.get)
+            counts: Counter = Counter()
+            for (index, position), count in group.counts.items():
+                kind, name = names[index]
+                counts[kind, texts.get(name, name) if kind == "template" else name, position] += count
+            templates = {
+                group.known_templates.get(template.template_id) or template.text: template.last_seen // self.bin_ms
+                for template in group.miner.templates()
+                if template.count
+            }
+        window_scores = {window.window: window.score for window in scores}
+
+        state, etag = group.state, group.etag
+        for _ in range(MAX_STATE_ATTEMPTS):
+            if self.state_store.save(log_group, self._merge_state(state, counts, templates, window_scores, sources), etag):
+                return
+            # Another invocation updated the state since it was read
+            state, etag = self.state_store.load(log_group)
+            if state is not None and not self._compatible(state):
+                state = None
+        logger.warning(f"Could not save the scoring state of {log_group} after {MAX_STATE_ATTEMPTS} conflicting updates")
+
+    def _merge_state(
+        self,
+        state: Optional[Dict[str, Any]],
+        counts: Counter,
+        templates: Dict[str, int],
+        window_scores: Dict[int, float],
+        sources: List[str]
+    ) -> Dict[str, Any]:
+        """Merge counts keyed by (kind, name, bin), templates by their last bin and window scores into a state."""
+        merged: Counter = Counter()
+        seen: Dict[str, int] = {}
+        scores: Dict[int, float] = {}
+        known_sources: List[str] = []
+        if state is not None:
+            for series, position, count in state["counts"]:
+                kind, name = state["series"][series]
+                merged[kind, name, position] += count
+            seen = {text: last_bin for text, last_bin in state["templates"]}
+            scores = {window: score for window, score in state["scores"]}
+            known_sources = state["sources"]
+        if not sources or not set(sources) <= set(known_sources):
+            merged.update(counts)
+        for text, last_bin in templates.items():
+            seen[text] = max(last_bin, seen.get(text, last_bin))
+        scores.update(window_scores)
+
+        newest = max((position for _, _, position in merged), default=0)
+        kept = {key: count for key, count in merged.items() if key[2] > newest - self.history_bins}
+        series = sorted({(kind, name) for kind, name, _ in kept})
+        indices = {key: index for index, key in enumerate(series)}
+        return {
+            "version": STATE_VERSION,
+            "bin_ms": self.bin_ms,
+            "window_ms": self.window_ms,
+            "series": [list(key) for key in series],
+            "counts": [[indices[kind, name], position, count] for (kind, name, position), count in sorted(kept.items())],
+            "templates": sorted(seen.items(), key=lambda item: -item[1])[:self.max_state_templates],
+            "scores": sorted(scores.items())[-self.selection_windows:],
+            "sources": (known_sources + [source for source in sources if source not in known_sources])[-MAX_STATE_SOURCES:],
+        }
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List
+from .cache import CacheEntry, merge_key
+from .main import AnalysisResult, ShiroSightAnalyzer
+from .prompts import MERGE_PROMPT_VERSION, MERGE_SYSTEM_PROMPT, render_merge
+
+try:
+    from utilities.metrics import get_metrics
+except ImportError:  # For Local Development
+    from ..utilities.metrics import get_metrics
+
+
+# Constants
+DEFAULT_FAN_IN = 8
+SEVERITY_RANK = {"critical": 3, "error": 2, "warning": 1, "info": 0}
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Node:
+    key: str
+    analysis: Dict[str, Any]
+    chunks: int
+
+
+@dataclass
+class AggregateReport:
+    """Analysis of every chunk of a run, merged into one, with what merging cost."""
+    analysis: Dict[str, Any]
+    cache_key: str
+    model: str
+    chunk_count: int
+    levels: int = 0
+    merges: int = 0
+    cached_merges: int = 0
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ResultAggregator:
+    """Merges chunk analyses into one report by a tree reduce.
+
+    Each level merges groups of up to `fan_in` consecutive analyses with
+    one model call each, concurrently through the analyzer's scheduler,
+    until one analysis remains, so no prompt holds more than `fan_in`
+    analyses however many chunks there are. A merge is cached under a
+    hash of its children's keys, which are themselves content keys of
+    chunks or of lower merges: in an incremental run, only the merges
+    above chunks whose analysis changed are recomputed, and the rest of
+    the tree is read from the analyzer's cache. Group boundaries are
+    content-defined, a group ends after a key whose value is a multiple
+    of `fan_in`, so inserting or removing a chunk only regroups its
+    neighbours instead of shifting every later group. Keep chunks in a
+    stable order, e.g. manifest order, so unchanged chunks fall in the
+    same groups.
+
+    Usage:
+        results = await analyzer.analyze_manifest(bucket, manifest_key)
+        report = await ResultAggregator(analyzer, fan_in=8).aggregate(results)
+    """
+
+    def __init__(self, analyzer: ShiroSightAnalyzer, fan_in: int = DEFAULT_FAN_IN, prompt_version: str = MERGE_PROMPT_VERSION):
+        """Initialize the ResultAggregator.
+
+        Args:
+            analyzer: Analyzer whose provider, scheduler and cache merges go through
+            fan_in: Maximum number of analyses merged by one call. At least 2.
+            prompt_version: Version of the merge prompt, part of every merge's cache key
+        """
+        if fan_in < 2:
+            raise ValueError("fan_in must be at least 2")
+        self.analyzer = analyzer
+        self.fan_in = fan_in
+        self.prompt_version = prompt_version
+
+    async def aggregate(self, results: List[AnalysisResult]) -> AggregateReport:
+        """Merge chunk analyses into one.
+
+        Args:
+            results: Analyses of the chunks of a run, in a stable order
+
+        Returns:
+            The merged analysis
+        """
+        if not results:
+            raise ValueError("No analyses to aggregate")
+        nodes = [_Node(result.cache_key, result.analysis, 1) for result in results]
+        report = AggregateReport({}, "", self.analyzer.provider.model, len(results))
+        while len(nodes) > 1:
+            nodes = await self._merge_level(nodes, report)
+            report.levels += 1
+        report.analysis, report.cache_key = nodes[0].analysis, nodes[0].key
+        logger.info(
+            f"Aggregated {report.chunk_count} analyses in {report.levels} levels: "
+            f"{report.merges} merges, {report.cached_merges} from the cache"
+        )
+        return report
+
+    def _groups(self, nodes: List[_Node]) -> List[List[_Node]]:
+        """Split a level into groups ending after a key that is a multiple of `fan_in`, or at `fan_in` nodes.
+
+        Groups have at least two nodes unless the level ends, so every level shrinks.
+        """
+        groups: List[List[_Node]] = []
+        group: List[_Node] = []
+        for node in nodes:
+            group.append(node)
+            if len(group) == self.fan_in or (len(group) > 1 and int(node.key, 16) % self.fan_in == 0):
+                groups.append(group)
+                group = []
+        if group:
+            groups.append(group)
+        return groups
+
+    async def _merge_level(self, nodes: List[_Node], report: AggregateReport) -> List[_Node]:
+        """Merge one level of the tree, groups of one passing through unchanged."""
+        analyzer = self.analyzer
+        metrics = get_metrics()
+        model = analyzer.provider.model
+        groups = self._groups(nodes)
+        keys = [
+            merge_key([node.key for node in group], f"{analyzer.prompt_version}/{self.prompt_version}", model)
+            if len(group) > 1 else group[0].key
+            for group in groups
+        ]
+        merged = [_Node(key, group[0].analysis, sum(node.chunks for node in group)) for group, key in zip(groups, keys)]
+
+        # Read cached merges, and send each missing one once
+        pending: Dict[str, List[int]] = {}
+        lookups = [index for index, group in enumerate(groups) if len(group) > 1]
+        if analyzer.cache is not None:
+            entries = await asyncio.gather(*(analyzer.cache.get(keys[index]) for index in lookups))
+        else:
+            entries = [None] * len(lookups)
+        for index, entry in zip(lookups, entries):
+            report.merges += 1
+            if entry is not None:
+                merged[index].analysis = entry.value
+                report.cached_merges += 1
+                metrics.increment("analyzer_merges_total", model=model, result="cached")
+            else:
+                pending.setdefault(keys[index], []).append(index)
+        if not pending:
+            return merged
+
+        prompts = []
+        for indices in pending.values():
+            group = groups[indices[0]]
+            prompts.append((
+                render_merge([node.analysis for node in group], [node.chunks for node in group]),
+                # The merges over the most severe analyses come first
+                max(SEVERITY_RANK.get(node.analysis.get("severity"), 0) for node in group) / max(SEVERITY_RANK.values())
+            ))
+        # Merge prompts are not packed: each already holds up to `fan_in` analyses
+        answers = await analyzer.scheduler.run(prompts, system=MERGE_SYSTEM_PROMPT, batch_system=None)
+
+        writes = []
+        for (key, indices), answer in zip(pending.items(), answers):
+            for index in indices:
+                merged[index].analysis = answer.analysis
+            report.latency += answer.latency
+            report.input_tokens += answer.input_tokens
+            report.output_tokens += answer.output_tokens
+            metrics.increment("analyzer_merges_total", model=model, result="computed")
+            if analyzer.cache is not None:
+                writes.append(analyzer.cache.set(key, CacheEntry(
+                    answer.analysis,
+                    model,
+                    latency=answer.latency,
+                    input_tokens=answer.input_tokens,
+                    output_tokens=answer.output_tokens
+                )))
+        await asyncio.gather(*writes)
+        return merged
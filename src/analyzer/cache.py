@@ -0,0 +1,435 @@
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+try:
+    from utilities.metrics import get_metrics
+    from utilities.aws import client_config, get_session
+    from utilities.client_pool import ClientPool
+except ImportError:  # For Local Development
+    from ..utilities.metrics import get_metrics
+    from ..utilities.aws import client_config, get_session
+    from ..utilities.client_pool import ClientPool
+
+if TYPE_CHECKING:
+    import aioboto3
+
+
+# Constants
+DEFAULT_TTL = 7 * 24 * 60 * 60  # seconds
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_CONCURRENT_REQUESTS = 16
+
+# Fields of a chunk document that change between runs without changing what the model is shown
+VOLATILE_FIELDS = frozenset({"chunk_id", "key", "source_key", "start", "end", "tokens", "raw_tokens", "first_seen", "last_seen", "template_id", "score"})
+# Values that differ between otherwise identical log lines: timestamps, UUIDs, hex ids, IP addresses and long numbers
+VOLATILE_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+    r"|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+    r"|\b(?=[a-fA-F]*\d)[0-9a-fA-F]{12,}\b"
+    r"|\b\d{1,3}(?:\.\d{1,3}){3}\b"
+    r"|\d{4,}"
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items() if key not in VOLATILE_FIELDS}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    if isinstance(value, str):
+        return WHITESPACE_PATTERN.sub(" ", VOLATILE_PATTERN.sub("#", value)).strip()
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        # Counts only matter to the model by order of magnitude; event timestamps are masked
+        return f"~2^{value.bit_length()}" if value < 10 ** 12 else "#"
+    if isinstance(value, float):
+        return round(value, 2)
+    return str(value)
+
+
+def normalize_content(content: Union[str, Dict[str, Any]]) -> str:
+    """Reduce chunk content to what decides the analysis, so near-identical chunks share a cache key.
+
+    Ids, keys and time bounds of chunk documents are dropped. In every
+    string, timestamps, UUIDs, hex ids, IP addresses and numbers of four or
+    more digits are masked and whitespace is collapsed; shorter numbers
+    such as status codes are kept. Integers are reduced to their order of
+    magnitude, so a template seen 1000 or 1010 times hashes the same.
+
+    Args:
+        content: Prompt text or chunk document
+
+    Returns:
+        Canonical text of the content
+    """
+    if isinstance(content, str):
+        return _normalize(content)
+    return json.dumps(_normalize(content), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def content_key(content: Union[str, Dict[str, Any]], prompt_version: str, model: str) -> str:
+    """Cache key of an analysis: a hash of the normalized content, the prompt template version and the model id."""
+    digest = hashlib.sha256()
+    for part in (model, prompt_version, normalize_content(content)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def merge_key(child_keys: List[str], prompt_version: str, model: str) -> str:
+    """Cache key of a merge of analyses: a hash of the children's keys, in order, the merge prompt version and the model id."""
+    digest = hashlib.sha256()
+    for part in (model, "merge", prompt_version, *child_keys):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    """A cached analysis with what producing it cost."""
+    value: Dict[str, Any]
+    model: str
+    created_at: float = field(default_factory=time.time)
+    expires_at: Optional[float] = None
+    latency: float = 0.0  # Seconds the LLM call took
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.expires_at is not None and (now or time.time()) >= self.expires_at
+
+    def to_json(self) -> bytes:
+        return json.dumps(asdict(self), ensure_ascii=False).encode("utf-8")
+
+    @classmethod
+    def from_json(cls, data: Union[bytes, str]) -> "CacheEntry":
+        return cls(**json.loads(data))
+
+
+@dataclass
+class CacheStats:
+    """Hits and misses of a cache, and the LLM time and tokens the hits saved."""
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    expirations: int = 0
+    evictions: int = 0
+    saved_seconds: float = 0.0
+    saved_input_tokens: int = 0
+    saved_output_tokens: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "hit_ratio": round(self.hit_ratio, 4)}
+
+
+class ResultCache(ABC):
+    """Stores LLM analyses by content key, so identical chunks are analyzed once.
+
+    Backends implement `_get` and `_set`. Expiry, hit and miss accounting
+    and metrics are handled here: expired entries are treated as missing
+    and left to the backend's eviction, and every lookup is counted in
+    `stats` and in the `analyzer_cache_*` metrics, labelled with `name`.
+    """
+
+    name = "cache"
+
+    def __init__(self, ttl: Optional[float] = DEFAULT_TTL):
+        """Initialize the ResultCache.
+
+        Args:
+            ttl: Seconds an entry stays valid. None keeps entries until they are evicted.
+        """
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[CacheEntry]:
+        """Read an entry, expired or not, or None if there is none."""
+
+    @abstractmethod
+    async def _set(self, key: str, entry: CacheEntry) -> None:
+        """Insert or replace an entry, evicting others if the backend is full."""
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        """Look up an analysis.
+
+        Args:
+            key: Key from `content_key`
+
+        Returns:
+            The entry, or None if it is missing or expired
+        """
+        metrics = get_metrics()
+        try:
+            entry = await self._get(key)
+        except Exception as e:
+            # A broken cache must never fail the analysis
+            logger.warning(f"Failed to read {key} from the {self.name} cache: {str(e)}")
+            entry = None
+        if entry is not None and entry.expired():
+            self.stats.expirations += 1
+            metrics.increment("analyzer_cache_expirations_total", cache=self.name)
+            entry = None
+
+        if entry is None:
+            self.stats.misses += 1
+            metrics.increment("analyzer_cache_requests_total", cache=self.name, result="miss")
+            return None
+        self.stats.hits += 1
+        self.stats.saved_seconds += entry.latency
+        self.stats.saved_input_tokens += entry.input_tokens
+        self.stats.saved_output_tokens += entry.output_tokens
+        metrics.increment("analyzer_cache_requests_total", cache=self.name, result="hit")
+        metrics.increment("analyzer_cache_saved_seconds_total", entry.latency, cache=self.name)
+        metrics.increment("analyzer_cache_saved_tokens_total", entry.input_tokens + entry.output_tokens, cache=self.name)
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        """Store an analysis, expiring after the cache's TTL unless the entry sets its own."""
+        if entry.expires_at is None and self.ttl is not None:
+            entry.expires_at = entry.created_at + self.ttl
+        try:
+            await self._set(key, entry)
+        except Exception as e:
+            logger.warning(f"Failed to write {key} to the {self.name} cache: {str(e)}")
+            return
+        self.stats.writes += 1
+        get_metrics().increment("analyzer_cache_writes_total", cache=self.name)
+
+    def _evicted(self, count: int = 1) -> None:
+        self.stats.evictions += count
+        get_metrics().increment("analyzer_cache_evictions_total", count, cache=self.name)
+
+
+class LRUResultCache(ResultCache):
+    """In-process cache evicting the least recently used entries beyond a number of entries or bytes."""
+
+    name = "lru"
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = DEFAULT_TTL
+    ):
+        """Initialize the LRUResultCache.
+
+        Args:
+            max_entries: Maximum number of entries
+            max_bytes: Maximum total size of the serialized entries. None only limits the number of entries.
+            ttl: Seconds an entry stays valid. None keeps entries until they are evicted.
+        """
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def _get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    async def _set(self, key: str, entry: CacheEntry) -> None:
+        size = len(entry.to_json())
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (entry, size)
+            self.size += size
+            evicted = 0
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes)
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                evicted += 1
+        if evicted:
+            self._evicted(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteResultCache(ResultCache):
+    """Cache backed by a local SQLite file, shared by runs on the same host.
+
+    When the stored entries exceed `max_bytes`, expired entries are removed
+    first, then the least recently read ones.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_bytes: Optional[int] = DEFAULT_MAX_BYTES, ttl: Optional[float] = DEFAULT_TTL):
+        """Initialize the SQLiteResultCache.
+
+        Args:
+            path: Path of the SQLite database file. Created if it does not exist.
+            max_bytes: Maximum total size of the stored entries. None disables size-based eviction.
+            ttl: Seconds an entry stays valid. None keeps entries until they are evicted.
+        """
+        super().__init__(ttl)
+        self.path = path
+        self.max_bytes = max_bytes
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    entry BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+
+    def _read(self, key: str) -> Optional[CacheEntry]:
+        with sqlite3.connect(self.path) as connection:
+            row = connection.execute("SELECT entry FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return CacheEntry.from_json(row[0])
+
+    def _write(self, key: str, entry: CacheEntry) -> int:
+        data = entry.to_json()
+        now = time.time()
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results (key, entry, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), entry.expires_at, now)
+            )
+            if self.max_bytes is None:
+                return 0
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            evicted = connection.execute("DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)).rowcount
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            rows = connection.execute("SELECT key, size FROM results WHERE key != ? ORDER BY accessed_at", (key,))
+            stale = []
+            for stale_key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                stale.append((stale_key,))
+                total -= size
+            connection.executemany("DELETE FROM results WHERE key = ?", stale)
+        return evicted + len(stale)
+
+    async def _get(self, key: str) -> Optional[CacheEntry]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def _set(self, key: str, entry: CacheEntry) -> None:
+        evicted = await asyncio.to_thread(self._write, key, entry)
+        if evicted:
+            self._evicted(evicted)
+
+
+class S3ResultCache(ResultCache):
+    """Cache keeping one JSON object per entry in S3, shared by every run and host.
+
+    Every lookup and write goes through one pooled S3 client, and at most
+    `max_concurrent_requests` of them are in flight at once, so a manifest
+    of hundreds of chunks looked up together does not open hundreds of
+    connections. Call `close`, or use the cache as an async context
+    manager, to release the client.
+
+    Expiry is checked when an entry is read. S3 has no size-based
+    eviction; add a lifecycle rule expiring objects under `prefix` to bound
+    the bucket's size.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket_name: str,
+        prefix: str = "analysis-cache",
+        profile_name: Optional[str] = None,
+        session: Optional["aioboto3.Session"] = None,
+        ttl: Optional[float] = DEFAULT_TTL,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS
+    ):
+        """Initialize the S3ResultCache.
+
+        Args:
+            bucket_name: S3 bucket holding the entries
+            prefix: Key prefix for entry objects
+            profile_name: AWS profile name. Set to None to use the IAM Role or Instance Profile.
+            session: aioboto3 session to create clients from. Defaults to the shared session of `profile_name`.
+            ttl: Seconds an entry stays valid. None keeps entries until they are deleted.
+            max_concurrent_requests: Maximum number of S3 reads and writes in flight at once
+        """
+        super().__init__(ttl)
+        self.session = session or get_session(profile_name)
+        # A failed request is only a cache miss, so let botocore retry it first
+        self.client_pool = ClientPool(
+            self.session,
+            max_pool_connections=max_concurrent_requests,
+            config=client_config(retries={"mode": "standard", "total_max_attempts": 5})
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip("/")
+
+    async def __aenter__(self) -> "S3ResultCache":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the shared S3 client."""
+        await self.client_pool.close()
+
+    def _key(self, key: str) -> str:
+        # Spread entries over prefixes, so reads scale past the per-prefix request rate
+        return f"{self.prefix}/{key[:2]}/{key}.json"
+
+    async def _get(self, key: str) -> Optional[CacheEntry]:
+        async with self.semaphore:
+            client = await self.client_pool.get("s3")
+            try:
+                response = await client.get_object(Bucket=self.bucket_name, Key=self._key(key))
+            except client.exceptions.NoSuchKey:
+                return None
+            return CacheEntry.from_json(await response["Body"].read())
+
+    async def _set(self, key: str, entry: CacheEntry) -> None:
+        async with self.semaphore:
+            client = await self.client_pool.get("s3")
+            await client.put_object(
+                Bucket=self.bucket_name,
+                Key=self._key(key),
+                Body=entry.to_json(),
+                ContentType="application/json"
+            )
@@ -1,7 +1,231 @@
+import json
 import asyncio
-import 
+import logging
+from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from .cache import CacheEntry, CacheStats, ResultCache, content_key
+from .prompts import PROMPT_VERSION, render_prompt
+from .providers import LLMProvider, openai_provider
+from .scheduler import DEFAULT_MAX_CONCURRENT_REQUESTS, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from .scheduler import DEFAULT_MAX_BATCH_CHUNKS, DEFAULT_MAX_BATCH_TOKENS, LLMScheduler, severity_score
+
+try:
+    from utilities.metrics import get_metrics
+    from utilities.aws import get_session
+except ImportError:  # For Local Development
+    from ..utilities.metrics import get_metrics
+    from ..utilities.aws import get_session
+
+if TYPE_CHECKING:
+    import aioboto3
+
+
+# Constants
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_MAX_CONCURRENT_READS = 16
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnalysisResult:
+    """Analysis of one chunk, from the model or the cache."""
+    chunk_id: str
+    log_group: str
+    cache_key: str
+    model: str
+    prompt_version: str
+    analysis: Dict[str, Any]
+    cached: bool = False
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    score: Optional[Dict[str, Any]] = None  # Anomaly score breakdown of the chunk's window, if process-chunks scored it
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
 
 
 class ShiroSightAnalyzer:
-    def __init__(self, profile_name: str, openai_api_key: str):
-        self.profile_name = profile_name
\ No newline at end of file
+    """Analyzes chunks written by process-chunks with an LLM, reusing cached analyses.
+
+    Each chunk's cache key is a hash of its normalized content, the prompt
+    version and the model id, so chunks that repeat from one scheduled run
+    to the next, up to ids, timestamps and exact counts, are answered from
+    the cache instead of the model. Identical chunks of one call share one
+    analysis. The rest go through an `LLMScheduler`, which keeps the calls
+    within the provider's rate limits, packs small chunks into one request
+    and sends the chunks with the most errors first.
+
+    Usage:
+        analyzer = ShiroSightAnalyzer(cache=SQLiteResultCache("analysis-cache.db"))
+        results = await analyzer.analyze_manifest(bucket, manifest_key)
+        print(analyzer.cache_stats.to_dict())
+    """
+
+    def __init__(
+        self,
+        profile_name: Optional[str] = None,
+        openai_api_key: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        provider: Optional[LLMProvider] = None,
+        cache: Optional[ResultCache] = None,
+        prompt_version: str = PROMPT_VERSION,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+        max_batch_chunks: int = DEFAULT_MAX_BATCH_CHUNKS,
+        session: Optional["aioboto3.Session"] = None
+    ):
+        """Initialize the ShiroSightAnalyzer.
+
+        Args:
+            profile_name: AWS profile name for reading chunks from S3. Set to None to use the IAM Role or Instance Profile.
+            openai_api_key: OpenAI API key of the default provider. Defaults to the OPENAI_API_KEY environment variable.
+            model: OpenAI model id of the default provider
+            provider: Model to analyze chunks with. Defaults to the OpenAI `model`.
+            cache: Cache of analyses. None analyzes every chunk.
+            prompt_version: Version of the prompt, part of every cache key
+            max_concurrent_requests: Maximum number of model calls in flight
+            requests_per_minute: Request rate limit of the provider
+            tokens_per_minute: Token rate limit of the provider
+            max_batch_tokens: Maximum estimated input tokens of a request packing several chunks. 0 disables packing.
+            max_batch_chunks: Maximum number of chunks packed into one request
+            session: aioboto3 session to create clients from. Defaults to the shared session of `profile_name`.
+        """
+        self.profile_name = profile_name
+        self.session = session or get_session(profile_name)
+        self.provider = provider or openai_provider(model, openai_api_key)
+        self.cache = cache
+        self.prompt_version = prompt_version
+        self.scheduler = LLMScheduler(
+            self.provider,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_concurrent_requests=max_concurrent_requests,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_chunks=max_batch_chunks
+        )
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        return self.cache.stats if self.cache is not None else CacheStats()
+
+    async def analyze_chunk(self, chunk: Dict[str, Any]) -> AnalysisResult:
+        """Analyze one chunk document, from the cache if possible.
+
+        Args:
+            chunk: Chunk document written by process-chunks
+
+        Returns:
+            The analysis
+        """
+        return (await self.analyze_chunks([chunk]))[0]
+
+    async def analyze_chunks(self, chunks: List[Dict[str, Any]]) -> List[AnalysisResult]:
+        """Analyze chunk documents, from the cache if possible, and the rest through the scheduler.
+
+        Args:
+            chunks: Chunk documents written by process-chunks
+
+        Returns:
+            One analysis per chunk, in their order
+        """
+        model = self.provider.model
+        keys = [content_key(chunk, self.prompt_version, model) for chunk in chunks]
+        results = [
+            AnalysisResult(
+                chunk.get("chunk_id", key[:16]), chunk.get("log_group", ""), key, model, self.prompt_version, {},
+                score=chunk.get("score")
+            )
+            for chunk, key in zip(chunks, keys)
+        ]
+
+        if self.cache is not None:
+            entries = await asyncio.gather(*(self.cache.get(key) for key in keys))
+        else:
+            entries = [None] * len(chunks)
+
+        # Identical chunks are sent once; the others take its answer
+        pending: Dict[str, List[int]] = {}
+        for index, (key, entry) in enumerate(zip(keys, entries)):
+            if entry is not None:
+                results[index].analysis = entry.value
+                results[index].cached = True
+            else:
+                pending.setdefault(key, []).append(index)
+        if not pending:
+            return results
+
+        scheduled = await self.scheduler.run([
+            (render_prompt(chunks[indices[0]]), severity_score(chunks[indices[0]])) for indices in pending.values()
+        ])
+        metrics = get_metrics()
+        writes = []
+        for (key, indices), answer in zip(pending.items(), scheduled):
+            first = results[indices[0]]
+            first.analysis = answer.analysis
+            first.latency = answer.latency
+            first.input_tokens = answer.input_tokens
+            first.output_tokens = answer.output_tokens
+            for index in indices[1:]:
+                results[index].analysis, results[index].cached = answer.analysis, True
+                metrics.increment("analyzer_shared_calls_total", model=model)
+            if self.cache is not None:
+                writes.append(self.cache.set(key, CacheEntry(
+                    answer.analysis,
+                    model,
+                    latency=answer.latency,
+                    input_tokens=answer.input_tokens,
+                    output_tokens=answer.output_tokens
+                )))
+        await asyncio.gather(*writes)
+        return results
+
+    async def load_manifest(self, bucket: str, manifest_key: str) -> List[Dict[str, Any]]:
+        """Read the manifest written by process-chunks and every chunk it lists.
+
+        Args:
+            bucket: Bucket of the manifest
+            manifest_key: Key of the manifest
+
+        Returns:
+            Chunk documents in manifest order, with the anomaly score breakdown of their window if it was scored
+        """
+        async with self.session.client("s3") as client:
+            response = await client.get_object(Bucket=bucket, Key=manifest_key)
+            manifest = json.loads(await response["Body"].read())
+            chunks_bucket = manifest.get("bucket", bucket)
+            semaphore = asyncio.Semaphore(DEFAULT_MAX_CONCURRENT_READS)
+
+            async def load(entry: Dict[str, Any]) -> Dict[str, Any]:
+                async with semaphore:
+                    chunk_response = await client.get_object(Bucket=chunks_bucket, Key=entry["key"])
+                    chunk = json.loads(await chunk_response["Body"].read())
+                    if "score" in entry:
+                        chunk["score"] = entry["score"]
+                    return chunk
+
+            return list(await asyncio.gather(*(load(entry) for entry in manifest.get("chunks", []))))
+
+    async def analyze_manifest(self, bucket: str, manifest_key: str) -> List[AnalysisResult]:
+        """Analyze every chunk of a process-chunks manifest.
+
+        Args:
+            bucket: Bucket of the manifest
+            manifest_key: Key of the manifest
+
+        Returns:
+            One analysis per chunk, in manifest order
+        """
+        chunks = await self.load_manifest(bucket, manifest_key)
+        results = await self.analyze_chunks(chunks)
+        stats = self.cache_stats
+        logger.info(
+            f"Analyzed {len(results)} chunks of s3://{bucket}/{manifest_key}: "
+            f"{stats.hits} cache hits, {stats.misses} misses, "
+            f"{stats.saved_seconds:.1f}s and {stats.saved_input_tokens + stats.saved_output_tokens} tokens saved"
+        )
+        return results
@@ -0,0 +1,154 @@
+import re
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+
+# Constants
+PROMPT_VERSION = "1"  # Bump when the prompts or their rendering change, so cached analyses are not reused
+ANALYSIS_FORMAT = """  "summary": one or two sentences on what the logs show,
+  "severity": one of "info", "warning", "error", "critical",
+  "findings": a list of objects with "title", "evidence" (quoted log lines or templates) and "recommendation"."""
+SYSTEM_PROMPT = f"""You are a site reliability engineer reviewing application logs.
+Find errors, anomalies and signs of incidents in the logs you are given, and ignore routine noise.
+Answer with a JSON object only, with these fields:
+{ANALYSIS_FORMAT}
+Templates use <*> for parameters; their counts and sample values are given with them."""
+BATCH_SYSTEM_PROMPT = f"""You are a site reliability engineer reviewing application logs.
+You are given several independent log sections. Analyze each section on its own: find errors, anomalies
+and signs of incidents, and ignore routine noise.
+Answer with a JSON object only, of the form {{"results": [...]}}, holding one object per section in section
+order, each with a "section" number and these fields:
+{ANALYSIS_FORMAT}
+Templates use <*> for parameters; their counts and sample values are given with them."""
+MERGE_PROMPT_VERSION = "1"  # Bump when the merge prompt or its rendering change
+MERGE_SYSTEM_PROMPT = f"""You are a site reliability engineer writing an incident report.
+You are given analyses of disjoint parts of the same logs. Merge them into one analysis of all the logs:
+combine findings that describe the same problem, keep their strongest evidence, drop routine noise, and
+take the severity of the most severe part that still applies.
+Answer with a JSON object only, with these fields:
+{ANALYSIS_FORMAT}"""
+SECTION_HEADER = "### Section {number}"
+SECTION_PATTERN = re.compile(r"^### Section (\d+)$", re.MULTILINE)
+
+
+def _iso(timestamp: Optional[int]) -> str:
+    if timestamp is None:
+        return "?"
+    return datetime.fromtimestamp(timestamp / 1000, timezone.utc).isoformat(timespec="seconds")
+
+
+def render_prompt(chunk: Dict[str, Any]) -> str:
+    """Render a chunk document from process-chunks as the prompt shown to the model.
+
+    Args:
+        chunk: Chunk of events or of template summaries
+
+    Returns:
+        The prompt text
+    """
+    lines = [f"Log group: {chunk.get('log_group', '')}"]
+    if chunk.get("kind") == "templates":
+        templates = chunk.get("templates", [])
+        lines.append(f"Window: {_iso(chunk.get('start'))} to {_iso(chunk.get('end'))}")
+        lines.append(f"{chunk.get('event_count', 0)} events collapsed into {len(templates)} templates:")
+        for template in templates:
+            details = [f"{_iso(template.get('first_seen'))} to {_iso(template.get('last_seen'))}"]
+            if template.get("log_streams"):
+                details.append(f"streams {', '.join(template['log_streams'])}")
+            samples = [f"<{index + 1}>={'|'.join(values)}" for index, values in enumerate(template.get("parameters", [])) if values]
+            if samples:
+                details.append(f"samples {' '.join(samples)}")
+            lines.append(f"[{template['count']}x] {template['template']}  ({'; '.join(details)})")
+        return "\n".join(lines)
+
+    lines.append(f"Log stream: {chunk.get('log_stream', '')}")
+    if chunk.get("context"):
+        lines.append("Preceding events, for context only:")
+        lines.extend(f"{_iso(timestamp)} {message}" for timestamp, message in chunk["context"])
+    lines.append("Events:")
+    lines.extend(f"{_iso(timestamp)} {message}" for timestamp, message in chunk.get("events", []))
+    return "\n".join(lines)
+
+
+def render_merge(analyses: List[Dict[str, Any]], counts: Optional[List[int]] = None) -> str:
+    """Render analyses of parts of the logs as the prompt of `MERGE_SYSTEM_PROMPT`.
+
+    Args:
+        analyses: Analyses to merge, in log order
+        counts: Number of chunks each analysis covers. Defaults to 1 each.
+
+    Returns:
+        The prompt text
+    """
+    counts = counts or [1] * len(analyses)
+    parts = []
+    for number, (analysis, count) in enumerate(zip(analyses, counts), 1):
+        lines = [f"Part {number}, covering {count} chunks: [{analysis.get('severity', 'unknown')}] {analysis.get('summary', '')}"]
+        for finding in analysis.get("findings", []):
+            if not isinstance(finding, dict):
+                lines.append(f"- {finding}")
+                continue
+            lines.append(f"- {finding.get('title', '')}")
+            evidence = finding.get("evidence")
+            if evidence:
+                lines.append(f"  evidence: {json.dumps(evidence, ensure_ascii=False)}")
+            if finding.get("recommendation"):
+                lines.append(f"  recommendation: {finding['recommendation']}")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def render_batch(prompts: List[str]) -> str:
+    """Join the prompts of several chunks into one prompt of numbered sections, for `BATCH_SYSTEM_PROMPT`."""
+    return "\n\n".join(f"{SECTION_HEADER.format(number=number)}\n{prompt}" for number, prompt in enumerate(prompts, 1))
+
+
+def _load_json(text: str) -> Any:
+    body = text.strip()
+    if body.startswith("```"):
+        body = body.strip("`")
+        body = body[body.find("\n") + 1:] if "\n" in body else body
+    return json.loads(body)
+
+
+def parse_analysis(text: str) -> Dict[str, Any]:
+    """Parse the model's JSON answer, keeping the raw text as the summary if it is not valid JSON."""
+    try:
+        analysis = _load_json(text)
+    except json.JSONDecodeError:
+        analysis = None
+    if not isinstance(analysis, dict):
+        return {"summary": text.strip(), "severity": "unknown", "findings": []}
+    return analysis
+
+
+def parse_batch(text: str, count: int) -> Optional[List[Dict[str, Any]]]:
+    """Split the model's answer to a batch prompt into one analysis per section.
+
+    Args:
+        text: Answer to a `render_batch` prompt
+        count: Number of sections in the prompt
+
+    Returns:
+        Analyses in section order, or None if the answer does not hold exactly one valid analysis per section
+    """
+    try:
+        document = _load_json(text)
+    except json.JSONDecodeError:
+        return None
+    results = document.get("results") if isinstance(document, dict) else None
+    if not isinstance(results, list):
+        return None
+    analyses: Dict[int, Dict[str, Any]] = {}
+    for position, analysis in enumerate(results, 1):
+        if not isinstance(analysis, dict):
+            return None
+        analysis = dict(analysis)
+        section = analysis.pop("section", position)
+        if isinstance(section, str) and section.isdigit():
+            section = int(section)
+        analyses[section] = analysis
+    if sorted(analyses) != list(range(1, count + 1)):
+        return None
+    return [analyses[number] for number in range(1, count + 1)]
@@ -0,0 +1,224 @@
+import re
+import json
+import time
+import random
+import asyncio
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Optional
+from .prompts import SECTION_PATTERN
+
+try:
+    from autogen_core.models import SystemMessage, UserMessage
+except ImportError:  # autogen is only needed for the autogen providers
+    SystemMessage = UserMessage = None
+
+try:
+    from autogen_ext.models.openai import OpenAIChatCompletionClient
+except ImportError:  # The OpenAI client is optional
+    OpenAIChatCompletionClient = None
+
+
+# Constants
+DEFAULT_CHARS_PER_TOKEN = 4.0
+ERROR_PATTERN = re.compile(r"\b(?:ERROR|FATAL|CRITICAL|Exception|Traceback)\b", re.IGNORECASE)
+
+
+class RateLimitError(Exception):
+    """Raised by a provider when the model's rate limit is exceeded (HTTP 429)."""
+    def __init__(self, message: str = "Rate limit exceeded", retry_after: Optional[float] = None):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Check whether a provider error is a 429, from any SDK: `RateLimitError`, or an error with `status_code` 429."""
+    if isinstance(error, RateLimitError):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds a rate limited caller is asked to wait, from the error or its response's Retry-After header."""
+    if isinstance(error, RateLimitError):
+        return error.retry_after
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class Completion:
+    """Text returned by a model, with the tokens the call was billed for."""
+    text: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class LLMProvider(ABC):
+    """A chat model the analyzer sends prompts to."""
+
+    model: str
+
+    @abstractmethod
+    async def complete(self, system: str, prompt: str) -> Completion:
+        """Send one prompt.
+
+        Args:
+            system: System message
+            prompt: User message
+
+        Returns:
+            The model's reply
+        """
+
+
+class AutogenProvider(LLMProvider):
+    """Provider over an autogen `ChatCompletionClient`, e.g. for OpenAI, Gemini or Bedrock models."""
+
+    def __init__(self, model_client: Any, model: str):
+        """Initialize the AutogenProvider.
+
+        Args:
+            model_client: autogen `ChatCompletionClient`
+            model: Model id, part of every cache key
+        """
+        if SystemMessage is None:
+            raise ImportError("The autogen provider requires the analyzer extra (autogen-agentchat, autogen-ext)")
+        self.model_client = model_client
+        self.model = model
+
+    async def complete(self, system: str, prompt: str) -> Completion:
+        result = await self.model_client.create([SystemMessage(content=system), UserMessage(content=prompt, source="user")])
+        text = result.content if isinstance(result.content, str) else json.dumps(result.content, default=str)
+        return Completion(text, result.usage.prompt_tokens, result.usage.completion_tokens)
+
+
+def openai_provider(model: str, api_key: Optional[str] = None) -> AutogenProvider:
+    """Create a provider for an OpenAI model.
+
+    Args:
+        model: OpenAI model id, e.g. "gpt-4o-mini"
+        api_key: OpenAI API key. Defaults to the OPENAI_API_KEY environment variable.
+    """
+    if OpenAIChatCompletionClient is None:
+        raise ImportError("OpenAI models require the analyzer extra (autogen-ext[openai])")
+    options = {"api_key": api_key} if api_key else {}
+    return AutogenProvider(OpenAIChatCompletionClient(model=model, **options), model)
+
+
+class MockProvider(LLMProvider):
+    """Offline stand-in for a chat model, with latency and rate limits.
+
+    Requests and tokens are limited like a provider's quota: each budget
+    refills continuously at its per-minute rate, holds at most
+    `burst_seconds` of it, and a request exceeding either raises
+    `RateLimitError` with the time until it would fit. Answers are valid
+    analyses, one per section for batch prompts, so the scheduler and the
+    analyzer can be exercised and benchmarked without a model.
+
+    Usage:
+        provider = MockProvider(latency=0.2, requests_per_minute=600, tokens_per_minute=200_000)
+        analyzer = ShiroSightAnalyzer(provider=provider)
+    """
+
+    def __init__(
+        self,
+        model: str = "mock",
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        burst_seconds: float = 1.0,
+        output_tokens: int = 50,
+        seed: Optional[int] = None
+    ):
+        """Initialize the MockProvider.
+
+        Args:
+            model: Model id
+            latency: Seconds every call takes
+            jitter: Random extra latency, up to this many seconds
+            requests_per_minute: Request budget. None is unlimited.
+            tokens_per_minute: Input and output token budget. None is unlimited.
+            burst_seconds: Seconds of budget that can be used at once
+            output_tokens: Tokens of each answer, per section
+            seed: Seed of the latency jitter
+        """
+        self.model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self.output_tokens = output_tokens
+        self._rng = random.Random(seed)
+        self._budgets = {
+            "requests": [requests_per_minute * burst_seconds / 60 if requests_per_minute else 0.0, time.monotonic()],
+            "tokens": [tokens_per_minute * burst_seconds / 60 if tokens_per_minute else 0.0, time.monotonic()],
+        }
+        self.calls = 0
+        self.rate_limited = 0
+        self.input_tokens = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        return int(len(text) / DEFAULT_CHARS_PER_TOKEN) + 1
+
+    def _wait(self, name: str, per_minute: Optional[float], amount: float) -> float:
+        """Refill a budget and return the seconds until `amount` is available, 0 if it is."""
+        if not per_minute:
+            return 0.0
+        budget = self._budgets[name]
+        capacity = per_minute * self.burst_seconds / 60
+        now = time.monotonic()
+        budget[0] = min(budget[0] + (now - budget[1]) * per_minute / 60, capacity)
+        budget[1] = now
+        # A request larger than the burst is admitted once the budget is full, leaving it in debt
+        return max(min(amount, capacity) - budget[0], 0.0) * 60 / per_minute
+
+    async def complete(self, system: str, prompt: str) -> Completion:
+        sections = [int(number) for number in SECTION_PATTERN.findall(prompt)] or [0]
+        input_tokens = self.count_tokens(system) + self.count_tokens(prompt)
+        output_tokens = self.output_tokens * len(sections)
+        wait = max(
+            self._wait("requests", self.requests_per_minute, 1),
+            self._wait("tokens", self.tokens_per_minute, input_tokens + output_tokens)
+        )
+        if wait > 0:
+            self.rate_limited += 1
+            raise RateLimitError(f"Rate limit of {self.model} exceeded", retry_after=wait)
+        self._budgets["requests"][0] -= 1
+        self._budgets["tokens"][0] -= input_tokens + output_tokens
+
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + self._rng.uniform(0, self.jitter))
+        finally:
+            self.in_flight -= 1
+
+        parts = SECTION_PATTERN.split(prompt)
+        bodies = parts[2::2] if len(parts) > 1 else [prompt]
+        analyses = [
+            {
+                "section": number,
+                "summary": f"Mock analysis of {self.count_tokens(body)} tokens",
+                "severity": "error" if ERROR_PATTERN.search(body) else "info",
+                "findings": [],
+            }
+            for number, body in zip(sections, bodies)
+        ]
+        if sections == [0]:
+            analyses[0].pop("section")
+            text = json.dumps(analyses[0])
+        else:
+            text = json.dumps({"results": analyses})
+        return Completion(text, input_tokens, output_tokens)
@@ -0,0 +1,290 @@
+import re
+import time
+import heapq
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from .prompts import BATCH_SYSTEM_PROMPT, SYSTEM_PROMPT, parse_analysis, parse_batch, render_batch
+from .providers import Completion, LLMProvider, is_rate_limit_error, retry_after
+
+try:
+    from utilities.circuit_breaker import backoff_delay
+    from utilities.metrics import get_metrics
+    from utilities.rate_limit import TokenBucket
+except ImportError:  # For Local Development
+    from ..utilities.circuit_breaker import backoff_delay
+    from ..utilities.metrics import get_metrics
+    from ..utilities.rate_limit import TokenBucket
+
+
+# Constants
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200_000
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_MAX_BATCH_TOKENS = 4000
+DEFAULT_MAX_BATCH_CHUNKS = 8
+DEFAULT_OUTPUT_TOKENS = 600  # Reserved per chunk, since providers count the answer against the token budget
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+BURST_SECONDS = 10.0  # Share of the per-minute budgets that may be used at once
+CHARS_PER_TOKEN = 4.0
+WARNING_WEIGHT = 0.3
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, float("inf"))
+
+# Error words, and 5xx statuses of access logs ("GET / HTTP/1.1" 503) or key=value logs (status=503)
+ERROR_PATTERN = re.compile(r"\b(?:ERROR|FATAL|CRITICAL|PANIC|Traceback|error|fatal|panic)\b|\w*Exception\b|\b[A-Z]\w*Error\b|\" 5\d\d\b|\bstatus[=:]\s*5\d\d\b")
+WARNING_PATTERN = re.compile(r"\b(?:WARN(?:ING)?|warn(?:ing)?|timed? ?out|[Tt]imeout|retry(?:ing)?|[Dd]enied|[Rr]efused)\b")
+
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the tokens of a text from its length, without a tokenizer."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def severity_score(chunk: Dict[str, Any]) -> float:
+    """Share of a chunk's events that look like errors, with warnings counting `WARNING_WEIGHT`.
+
+    Template chunks weigh each template by its count, so a single error
+    template seen a thousand times outranks a thousand distinct info lines.
+
+    Args:
+        chunk: Chunk document written by process-chunks
+
+    Returns:
+        Error density between 0 and 1
+    """
+    if chunk.get("kind") == "templates":
+        lines = [(template["template"], template.get("count", 1)) for template in chunk.get("templates", [])]
+    else:
+        lines = [(message, 1) for _, message in chunk.get("events", [])]
+    total = sum(count for _, count in lines)
+    if not total:
+        return 0.0
+    score = 0.0
+    for message, count in lines:
+        if ERROR_PATTERN.search(message):
+            score += count
+        elif WARNING_PATTERN.search(message):
+            score += WARNING_WEIGHT * count
+    return score / total
+
+
+@dataclass
+class ScheduledResult:
+    """Analysis of one prompt, with its share of the request's latency and tokens."""
+    analysis: Dict[str, Any]
+    latency: float
+    input_tokens: int
+    output_tokens: int
+    batch_size: int = 1
+
+
+@dataclass(order=True)
+class _Job:
+    order: Tuple[float, int]
+    prompt: str = field(compare=False)
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    system: str = field(compare=False, default=SYSTEM_PROMPT)
+    batch_system: Optional[str] = field(compare=False, default=BATCH_SYSTEM_PROMPT)
+
+
+class LLMScheduler:
+    """Sends many prompts to one provider concurrently, within its rate limits.
+
+    Prompts are queued by priority, highest first, and served by up to
+    `max_concurrent_requests` requests at a time. Before each request the
+    scheduler takes one request from a requests-per-minute `TokenBucket`
+    and the estimated input and output tokens from a tokens-per-minute
+    bucket, then settles the difference with the tokens the provider
+    reports. Consecutive small prompts are packed into one request of
+    numbered sections while they fit `max_batch_tokens`; if the answer
+    cannot be split back into one analysis per section, each prompt is
+    sent on its own. Rate limited requests (HTTP 429) are retried with
+    exponential backoff and full jitter, honouring Retry-After, and pause
+    every other request of the scheduler for as long, since they share
+    the quota.
+
+    Usage:
+        scheduler = LLMScheduler(provider, requests_per_minute=500, tokens_per_minute=200_000)
+        results = await scheduler.run([(prompt, priority) for prompt, priority in prompts])
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+        max_batch_chunks: int = DEFAULT_MAX_BATCH_CHUNKS,
+        output_tokens: int = DEFAULT_OUTPUT_TOKENS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY
+    ):
+        """Initialize the LLMScheduler.
+
+        Args:
+            provider: Model the prompts are sent to
+            requests_per_minute: Request budget of the provider
+            tokens_per_minute: Input and output token budget of the provider
+            max_concurrent_requests: Maximum number of requests in flight
+            max_batch_tokens: Maximum estimated input tokens of a packed request. 0 disables packing.
+            max_batch_chunks: Maximum number of prompts packed into one request
+            output_tokens: Answer tokens reserved per prompt
+            max_attempts: Maximum attempts of a rate limited request
+            base_delay: Upper bound of the first backoff delay, in seconds
+            max_delay: Cap on backoff delays, in seconds
+        """
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute / 60, burst=requests_per_minute * BURST_SECONDS / 60)
+        self.tokens = TokenBucket(tokens_per_minute / 60, burst=tokens_per_minute * BURST_SECONDS / 60)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_chunks = max(max_batch_chunks, 1)
+        self.output_tokens = output_tokens
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._slots = asyncio.Semaphore(max(max_concurrent_requests, 1))
+        self._workers = max(max_concurrent_requests, 1)
+        self._paused_until = 0.0
+        self._sequence = 0
+
+    async def run(
+        self,
+        prompts: List[Tuple[str, float]],
+        system: str = SYSTEM_PROMPT,
+        batch_system: Optional[str] = BATCH_SYSTEM_PROMPT
+    ) -> List[ScheduledResult]:
+        """Analyze prompts, highest priority first.
+
+        Args:
+            prompts: Prompts with their priority
+            system: System message of a request with one prompt
+            batch_system: System message of a request packing several prompts. None disables packing.
+
+        Returns:
+            One result per prompt, in the order given. If any prompt failed, its error is raised
+            once every other prompt is done.
+        """
+        loop = asyncio.get_running_loop()
+        queue: List[_Job] = []
+        jobs = []
+        for prompt, priority in prompts:
+            self._sequence += 1
+            job = _Job((-priority, self._sequence), prompt, estimate_tokens(prompt), loop.create_future(), system, batch_system)
+            heapq.heappush(queue, job)
+            jobs.append(job)
+
+        async def worker() -> None:
+            while queue:
+                batch = self._take_batch(queue)
+                try:
+                    await self._send(batch)
+                except Exception as e:
+                    for job in batch:
+                        if not job.future.done():
+                            job.future.set_exception(e)
+
+        await asyncio.gather(*(worker() for _ in range(min(self._workers, len(jobs)))))
+        # Retrieve every failure, then raise the first one
+        errors = [job.future.exception() for job in jobs]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [job.future.result() for job in jobs]
+
+    def _take_batch(self, queue: List[_Job]) -> List[_Job]:
+        """Pop the next job, and the jobs after it while they fit in one packed request."""
+        batch = [heapq.heappop(queue)]
+        tokens = batch[0].tokens
+        while (
+            queue and batch[0].batch_system is not None and queue[0].batch_system == batch[0].batch_system
+            and len(batch) < self.max_batch_chunks
+            and tokens + queue[0].tokens <= self.max_batch_tokens
+        ):
+            job = heapq.heappop(queue)
+            batch.append(job)
+            tokens += job.tokens
+        return batch
+
+    async def _send(self, batch: List[_Job]) -> None:
+        metrics = get_metrics()
+        model = self.provider.model
+        if len(batch) == 1:
+            system, prompt = batch[0].system, batch[0].prompt
+        else:
+            system, prompt = batch[0].batch_system, render_batch([job.prompt for job in batch])
+        completion, latency = await self._complete(system, prompt, len(batch))
+        metrics.observe("llm_batch_chunks", len(batch), BATCH_BUCKETS, model=model)
+
+        if len(batch) == 1:
+            analyses = [parse_analysis(completion.text)]
+        else:
+            analyses = parse_batch(completion.text, len(batch))
+            if analyses is None:
+                # The answer could not be split per section; analyze each chunk on its own
+                metrics.increment("llm_batch_fallbacks_total", model=model)
+                logger.warning(f"Could not split the answer of {model} to {len(batch)} packed chunks, sending them one by one")
+                await asyncio.gather(*(self._send([job]) for job in batch))
+                return
+
+        # Split the request's usage by each chunk's share of the prompt, so the shares add up to it
+        prompt_tokens = sum(job.tokens for job in batch)
+        seen = used_input = used_output = 0
+        for position, (job, analysis) in enumerate(zip(batch, analyses), 1):
+            seen += job.tokens
+            input_tokens = round(completion.input_tokens * seen / prompt_tokens)
+            output_tokens = round(completion.output_tokens * position / len(batch))
+            job.future.set_result(ScheduledResult(
+                analysis,
+                latency,
+                input_tokens - used_input,
+                output_tokens - used_output,
+                len(batch)
+            ))
+            used_input, used_output = input_tokens, output_tokens
+
+    async def _complete(self, system: str, prompt: str, chunks: int) -> Tuple[Completion, float]:
+        """Send one request within the rate limits, retrying it while it is rate limited."""
+        metrics = get_metrics()
+        model = self.provider.model
+        reserved = min(estimate_tokens(system) + estimate_tokens(prompt) + self.output_tokens * chunks, self.tokens.burst)
+        attempt = 0
+        async with self._slots:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                await self.requests.acquire()
+                await self.tokens.acquire(reserved)
+                started = time.monotonic()
+                try:
+                    completion = await self.provider.complete(system, prompt)
+                except Exception as e:
+                    if not is_rate_limit_error(e):
+                        raise
+                    # A rejected request used none of the token budget
+                    self.tokens.adjust(reserved)
+                    attempt += 1
+                    metrics.increment("llm_throttles_total", model=model)
+                    if attempt >= self.max_attempts:
+                        raise
+                    delay = max(retry_after(e) or 0.0, backoff_delay(attempt - 1, self.base_delay, self.max_delay))
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    metrics.increment("llm_retries_total", model=model)
+                    logger.debug(f"{model} rate limited, retrying in {delay:.2f}s (attempt {attempt} of {self.max_attempts})")
+                    continue
+
+                latency = time.monotonic() - started
+                self.tokens.adjust(reserved - completion.input_tokens - completion.output_tokens)
+                metrics.observe("llm_call_seconds", latency, model=model)
+                metrics.increment("llm_tokens_total", completion.input_tokens, model=model, direction="input")
+                metrics.increment("llm_tokens_total", completion.output_tokens, model=model, direction="output")
+                return completion, latency
@@ -1,8 +1,144 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+import typer
 
+try:
+    from analyzer.aggregate import DEFAULT_FAN_IN, ResultAggregator
+    from analyzer.cache import SQLiteResultCache
+    from analyzer.main import DEFAULT_MODEL, ShiroSightAnalyzer
+    from analyzer.providers import MockProvider
+    from analyzer.scheduler import estimate_tokens
+    from collector.types import LogBatch
+    from store.main import DEFAULT_STORE_PATH, LogStore
+    from utilities.timestamps import parse_timestamp
+except ImportError:  # For Local Development
+    from ..analyzer.aggregate import DEFAULT_FAN_IN, ResultAggregator
+    from ..analyzer.cache import SQLiteResultCache
+    from ..analyzer.main import DEFAULT_MODEL, ShiroSightAnalyzer
+    from ..analyzer.providers import MockProvider
+    from ..analyzer.scheduler import estimate_tokens
+    from ..collector.types import LogBatch
+    from ..store.main import DEFAULT_STORE_PATH, LogStore
+    from ..utilities.timestamps import parse_timestamp
 
-def main():
-    print("Hello, World!")
 
+# Constants
+DEFAULT_CHUNK_TOKENS = 2000
+DEFAULT_WINDOW_MS = 15 * 60 * 1000  # Same windows as process-chunks
+CACHE_FILE = "analysis-cache.db"
 
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_pages(
+    pages: Iterable[LogBatch],
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    window_ms: int = DEFAULT_WINDOW_MS
+) -> List[Dict[str, Any]]:
+    """Split stored pages into chunk documents like process-chunks writes: consecutive events of one stream within a token budget and a time window.
+
+    Args:
+        pages: Pages read from the store
+        max_tokens: Estimated token budget of a chunk's events
+        window_ms: Chunks never cross a multiple of this many milliseconds
+
+    Returns:
+        Chunk documents, in the order their first event was read
+    """
+    chunks: List[Dict[str, Any]] = []
+    open_chunks: Dict[str, Dict[str, Any]] = {}
+    for page in pages:
+        for timestamp, message in zip(page.timestamps, page.messages):
+            tokens = estimate_tokens(message)
+            chunk = open_chunks.get(page.log_stream_name)
+            if (
+                chunk is None
+                or timestamp // window_ms != chunk["start"] // window_ms
+                or (chunk["events"] and chunk["tokens"] + tokens > max_tokens)
+            ):
+                chunk = open_chunks[page.log_stream_name] = {
+                    # The sequence number keeps ids unique when a split falls between events of the same millisecond
+                    "chunk_id": f"{page.log_stream_name}-{timestamp}-{len(chunks):06d}",
+                    "kind": "events",
+                    "log_group": page.log_group_name,
+                    "log_stream": page.log_stream_name,
+                    "start": timestamp,
+                    "end": timestamp,
+                    "tokens": 0,
+                    "events": [],
+                }
+                chunks.append(chunk)
+            chunk["events"].append([timestamp, message])
+            chunk["end"] = timestamp
+            chunk["tokens"] += tokens
+    return chunks
+
+
+async def analyze_store(
+    store: LogStore,
+    log_group_name: str,
+    start_ms: Optional[int],
+    end_ms: Optional[int],
+    analyzer: ShiroSightAnalyzer,
+    max_chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+    fan_in: int = DEFAULT_FAN_IN
+) -> Dict[str, Any]:
+    """Analyze the stored events of a time range and merge the analyses into one report.
+
+    Returns:
+        The report, with the per-chunk analyses
+    """
+    chunks = chunk_pages(store.read(log_group_name, start_ms, end_ms), max_chunk_tokens)
+    if not chunks:
+        raise ValueError(f"No stored events of {log_group_name} in the time range; scrape it first")
+    results = await analyzer.analyze_chunks(chunks)
+    report = await ResultAggregator(analyzer, fan_in).aggregate(results)
+    return {
+        "log_group": log_group_name,
+        "report": report.to_dict(),
+        "chunks": [result.to_dict() for result in results],
+        "cache": analyzer.cache_stats.to_dict(),
+    }
+
+
+def analyze(
+    log_group: str = typer.Argument(..., help="Stored log group to analyze"),
+    start: Optional[str] = typer.Option(None, help="Start time, e.g. 2025-01-01T00:00:00.000Z"),
+    end: Optional[str] = typer.Option(None, help="End time, e.g. 2025-01-01T06:00:00.000Z"),
+    store: str = typer.Option(DEFAULT_STORE_PATH, envvar="SHIROSIGHT_STORE", help="Directory of the local log store"),
+    model: str = typer.Option(DEFAULT_MODEL, help="OpenAI model id"),
+    mock: bool = typer.Option(False, help="Use an offline mock model, e.g. to try prompts' chunking"),
+    chunk_tokens: int = typer.Option(DEFAULT_CHUNK_TOKENS, help="Token budget of a chunk"),
+    fan_in: int = typer.Option(DEFAULT_FAN_IN, help="Analyses merged per call when aggregating"),
+    requests_per_minute: float = typer.Option(500, help="Request rate limit of the model"),
+    tokens_per_minute: float = typer.Option(200_000, help="Token rate limit of the model"),
+    output: Optional[str] = typer.Option(None, help="Write the report as JSON to this file")
+):
+    """Analyze a time range of a stored log group, without calling CloudWatch."""
+    log_store = LogStore(store)
+    analyzer = ShiroSightAnalyzer(
+        model=model,
+        provider=MockProvider() if mock else None,
+        cache=SQLiteResultCache(os.path.join(log_store.root, CACHE_FILE)),
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute
+    )
+    document = asyncio.run(analyze_store(
+        log_store,
+        log_group,
+        parse_timestamp(start) if start else None,
+        parse_timestamp(end) if end else None,
+        analyzer,
+        chunk_tokens,
+        fan_in
+    ))
+    text = json.dumps(document, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w") as file:
+            file.write(text)
+    else:
+        typer.echo(text)
@@ -0,0 +1,24 @@
+import logging
+import typer
+from .analyze import analyze
+from .scrape import scrape
+from .store import app as store_app
+
+
+app = typer.Typer(help="ShiroSight: collect CloudWatch logs into a local store and analyze them with LLMs.")
+app.command()(scrape)
+app.command()(analyze)
+app.add_typer(store_app, name="store")
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    app()
+
+
+if __name__ == "__main__":
+    main()
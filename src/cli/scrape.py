@@ -0,0 +1,92 @@
+import os
+import asyncio
+import logging
+from typing import Optional
+import typer
+
+try:
+    from collector.checkpoint import SQLiteCheckpointStore
+    from collector.cloudwatch import CloudwatchCollector
+    from collector.parsing import MessageParser
+    from collector.types import LogBatch
+    from store.main import DEFAULT_STORE_PATH, LogStore, StoreWriter
+except ImportError:  # For Local Development
+    from ..collector.checkpoint import SQLiteCheckpointStore
+    from ..collector.cloudwatch import CloudwatchCollector
+    from ..collector.parsing import MessageParser
+    from ..collector.types import LogBatch
+    from ..store.main import DEFAULT_STORE_PATH, LogStore, StoreWriter
+
+
+# Constants
+CHECKPOINTS_FILE = "checkpoints.db"
+
+
+logger = logging.getLogger(__name__)
+
+
+async def scrape_to_store(
+    store: LogStore,
+    log_group_name: str,
+    start_time: Optional[str],
+    end_time: Optional[str],
+    filter_pattern: Optional[str] = None,
+    incremental: bool = False,
+    profile_name: Optional[str] = None,
+    max_concurrent_requests: int = 10,
+    message_parser: Optional[MessageParser] = None
+) -> int:
+    """Collect a log group from CloudWatch into the local store.
+
+    Checkpoints are kept next to the segments, so an incremental scrape
+    only fetches events newer than the previous one stored. With a
+    `message_parser`, only the events its filter accepts are stored.
+
+    Returns:
+        Number of events stored
+    """
+    recovered = store.recover(log_group_name)
+    if recovered:
+        logger.info(f"Recovered {recovered} events of {log_group_name} left by an interrupted scrape")
+    checkpoint_store = SQLiteCheckpointStore(os.path.join(store.root, CHECKPOINTS_FILE))
+    async with CloudwatchCollector(
+        profile_name,
+        max_concurrent_requests,
+        checkpoint_store=checkpoint_store
+    ) as collector:
+        with store.writer(log_group_name) as writer:
+            async for page in collector.stream_logs(log_group_name, start_time, end_time, filter_pattern, incremental):
+                # Parsing and compression run in a thread, so pages keep arriving meanwhile
+                await asyncio.to_thread(_write, writer, page, message_parser)
+    return writer.events
+
+
+def _write(writer: StoreWriter, page: LogBatch, message_parser: Optional[MessageParser]) -> None:
+    writer.write(message_parser.apply(page) if message_parser is not None else page)
+
+
+def scrape(
+    log_group: str = typer.Argument(..., help="CloudWatch log group to collect"),
+    start: Optional[str] = typer.Option(None, help="Start time, e.g. 2025-01-01T00:00:00.000Z"),
+    end: Optional[str] = typer.Option(None, help="End time, e.g. 2025-01-01T06:00:00.000Z"),
+    filter_pattern: Optional[str] = typer.Option(None, "--filter", help="CloudWatch Logs filter pattern"),
+    where: Optional[str] = typer.Option(None, help="Only store events matching this filter on parsed fields, e.g. \"level in (ERROR, WARN) or latency_ms > 1000\""),
+    incremental: bool = typer.Option(False, help="Only fetch events newer than the previous scrape"),
+    store: str = typer.Option(DEFAULT_STORE_PATH, envvar="SHIROSIGHT_STORE", help="Directory of the local log store"),
+    codec: str = typer.Option("zlib", help="Segment compression: zlib, zstd or none"),
+    profile: Optional[str] = typer.Option(None, help="AWS profile name"),
+    concurrency: int = typer.Option(10, help="Maximum concurrent CloudWatch Logs requests")
+):
+    """Collect a log group from CloudWatch into the local store."""
+    events = asyncio.run(scrape_to_store(
+        LogStore(store, codec=codec),
+        log_group,
+        start,
+        end,
+        filter_pattern,
+        incremental,
+        profile,
+        concurrency,
+        MessageParser(where=where) if where else None
+    ))
+    typer.echo(f"Stored {events} events of {log_group} in {store}")
@@ -0,0 +1,92 @@
+import json
+from datetime import datetime, timezone
+from typing import List, Optional
+import typer
+
+try:
+    from store.main import DEFAULT_STORE_PATH, LogStore
+    from utilities.timestamps import parse_timestamp
+except ImportError:  # For Local Development
+    from ..store.main import DEFAULT_STORE_PATH, LogStore
+    from ..utilities.timestamps import parse_timestamp
+
+
+app = typer.Typer(help="Inspect and maintain the local log store.")
+
+
+def _iso(timestamp: Optional[int]) -> str:
+    if timestamp is None:
+        return "-"
+    return datetime.fromtimestamp(timestamp / 1000, timezone.utc).isoformat(timespec="seconds")
+
+
+@app.command("list")
+def list_log_groups(
+    store: str = typer.Option(DEFAULT_STORE_PATH, envvar="SHIROSIGHT_STORE", help="Directory of the local log store")
+):
+    """List the stored log groups with their time range and size."""
+    log_store = LogStore(store)
+    for log_group in log_store.log_groups():
+        segments = log_store.describe(log_group)
+        if not segments:
+            continue
+        typer.echo(
+            f"{log_group}: {sum(segment['events'] for segment in segments)} events in {len(segments)} segments "
+            f"({sum(segment['bytes'] for segment in segments)} bytes), "
+            f"{_iso(min(segment['min_timestamp'] for segment in segments))} to {_iso(max(segment['max_timestamp'] for segment in segments))}"
+        )
+
+
+@app.command("show")
+def show_segments(
+    log_group: str = typer.Argument(..., help="Stored log group"),
+    store: str = typer.Option(DEFAULT_STORE_PATH, envvar="SHIROSIGHT_STORE", help="Directory of the local log store")
+):
+    """Show the segments of a log group."""
+    for segment in LogStore(store).describe(log_group):
+        typer.echo(
+            f"{segment['path']}: {segment['events']} events in {segment['blocks']} blocks ({segment['bytes']} bytes, "
+            f"{segment['codec']}), {_iso(segment['min_timestamp'])} to {_iso(segment['max_timestamp'])}"
+        )
+
+
+@app.command("read")
+def read_events(
+    log_group: str = typer.Argument(..., help="Stored log group"),
+    start: Optional[str] = typer.Option(None, help="Start time, e.g. 2025-01-01T00:00:00.000Z"),
+    end: Optional[str] = typer.Option(None, help="End time, e.g. 2025-01-01T06:00:00.000Z"),
+    stream: Optional[List[str]] = typer.Option(None, help="Log stream to read. Repeat for several; all by default."),
+    store: str = typer.Option(DEFAULT_STORE_PATH, envvar="SHIROSIGHT_STORE", help="Directory of the local log store")
+):
+    """Print the stored events of a time range as JSON lines."""
+    pages = LogStore(store).read(
+        log_group,
+        parse_timestamp(start) if start else None,
+        parse_timestamp(end) if end else None,
+        stream or None
+    )
+    for page in pages:
+        for record in page.to_records():
+            record["logStreamName"] = page.log_stream_name
+            typer.echo(json.dumps(record, ensure_ascii=False))
+
+
+@app.command("prune")
+def prune_segments(
+    log_group: str = typer.Argument(..., help="Stored log group"),
+    before: str = typer.Option(..., help="Delete segments holding only events before this time"),
+    store: str = typer.Option(DEFAULT_STORE_PATH, envvar="SHIROSIGHT_STORE", help="Directory of the local log store")
+):
+    """Delete old segments of a log group."""
+    deleted = LogStore(store).prune(log_group, parse_timestamp(before))
+    typer.echo(f"Deleted {deleted} segments of {log_group}")
+
+
+@app.command("recover")
+def recover_segments(
+    log_group: str = typer.Argument(..., help="Stored log group"),
+    store: str = typer.Option(DEFAULT_STORE_PATH, envvar="SHIROSIGHT_STORE", help="Directory of the local log store")
+):
+    """Seal the segments an interrupted scrape left open."""
+    events = LogStore(store).recover(log_group)
+    typer.echo(f"Recovered {events} events of {log_group}")
@@ -1,11 +1,426 @@
+import csv
+import codecs
 import asyncio
-import aioboto3
+import logging
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, AsyncIterator, Tuple
+from urllib.parse import urlparse
+from .types import LogBatch
+
+try:
+    from utilities.timestamps import parse_timestamp
+    from utilities.circuit_breaker import circuit_breaker
+    from utilities.streaming import merge_async_iterators
+    from utilities.client_pool import ClientPool
+    from utilities.aws import get_session
+except ImportError:  # For Local Development
+    from ..utilities.timestamps import parse_timestamp
+    from ..utilities.circuit_breaker import circuit_breaker
+    from ..utilities.streaming import merge_async_iterators
+    from ..utilities.client_pool import ClientPool
+    from ..utilities.aws import get_session
+
+if TYPE_CHECKING:
+    import aioboto3
+
+# Constants
+DEFAULT_MAX_CONCURRENT_REQUESTS = 10
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_TIMEOUT = 30
+DEFAULT_DATABASE = "shirosight"
+DEFAULT_TABLE = "logs"
+DEFAULT_SOURCE = "cloudwatch"
+DEFAULT_WORKGROUP = "primary"
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_BUFFERED_BATCHES = 16
+PAGED_RESULTS_MAX_BYTES = 1024 * 1024  # Larger results are streamed from S3
+RESULTS_PAGE_SIZE = 1000  # GetQueryResults maximum
+S3_READ_CHUNK_SIZE = 1024 * 1024
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 10.0
+TERMINAL_STATES = {"SUCCEEDED", "FAILED", "CANCELLED"}
+
+# Partition columns of the collected logs table, matching the layout written by S3Uploader
+SOURCE_PARTITION = "source"
+LOG_GROUP_PARTITION = "log_group"
+DATE_PARTITION = "dt"
+HOUR_PARTITION = "hour"
+
+
+logger = logging.getLogger(__name__)
 
 
 class AthenaLogsCollector:
-    def __init__(self, profile_name: str, max_concurrent_requests: int = 10):
-        self.session = aioboto3.Session(profile_name=profile_name)
-        self.client = self.session.client("athena")
+    """A class to collect logs stored in S3 through Amazon Athena.
+
+    The time range is split into one query per day, each restricted to its
+    `dt`/`hour` partitions so Athena only scans the objects in range. Queries
+    run concurrently and their results are streamed in bounded batches, read
+    through GetQueryResults for small results and straight from the S3 result
+    object for large ones.
+    """
+
+    def __init__(
+        self,
+        profile_name: Optional[str] = None,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        s3_bucket: Optional[str] = None,
+        s3_prefix: Optional[str] = None,
+        database: str = DEFAULT_DATABASE,
+        table: str = DEFAULT_TABLE,
+        workgroup: str = DEFAULT_WORKGROUP,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_buffered_batches: int = DEFAULT_MAX_BUFFERED_BATCHES,
+        source: str = DEFAULT_SOURCE,
+        session: Optional["aioboto3.Session"] = None
+    ):
+        """Initialize the AthenaLogsCollector.
+
+        Args:
+            profile_name: AWS profile name to use for authentication.
+                          For production use, set to None, then use IAM Role or Instance Profile.
+            max_concurrent_requests: Maximum number of queries running at once
+            s3_bucket: S3 bucket for query results. Defaults to the workgroup's output location.
+            s3_prefix: S3 prefix for query results
+            database: Glue database of the logs table
+            table: Logs table, partitioned by log group, date and hour
+            workgroup: Athena workgroup to run queries in
+            batch_size: Number of rows per yielded batch
+            max_buffered_batches: Maximum number of batches buffered for a slow consumer
+            source: `source` partition to read. The table also holds what other collectors,
+                    this one included, wrote back, which must not be read as logs again.
+            session: aioboto3 session to create clients from. Defaults to the shared session of `profile_name`.
+        """
+        self.session = session or get_session(profile_name)
+        self.client_pool = ClientPool(self.session, max_pool_connections=max_concurrent_requests)
         self.semaphore = asyncio.Semaphore(max_concurrent_requests)
-        
-        
\ No newline at end of file
+        self.max_concurrent_requests = max_concurrent_requests
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = (s3_prefix or "").strip("/")
+        self.database = database
+        self.table = table
+        self.workgroup = workgroup
+        self.batch_size = batch_size
+        self.max_buffered_batches = max_buffered_batches
+        self.source = source
+
+    async def __aenter__(self) -> "AthenaLogsCollector":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the shared Athena and S3 clients."""
+        await self.client_pool.close()
+
+    def build_queries(self, log_group_name: str, start_time: str, end_time: str) -> List[str]:
+        """Build one partition-pruned query per day of the time range.
+
+        Args:
+            log_group_name: Name of the log group
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Returns:
+            SQL queries covering the time range
+        """
+        start_ms = parse_timestamp(start_time)
+        end_ms = parse_timestamp(end_time)
+        queries = []
+        for day_start, day_end in self._split_by_day(start_ms, end_ms):
+            first_hour = datetime.fromtimestamp(day_start / 1000, tz=timezone.utc)
+            last_hour = datetime.fromtimestamp((day_end - 1) / 1000, tz=timezone.utc)
+            queries.append(
+                f'SELECT "timestamp", message, event_id, log_stream '
+                f'FROM "{self.database}"."{self.table}" '
+                f"WHERE {SOURCE_PARTITION} = {self._quote(self.source)} "
+                f"AND {LOG_GROUP_PARTITION} = {self._quote(log_group_name)} "
+                f"AND {DATE_PARTITION} = '{first_hour:%Y-%m-%d}' "
+                f"AND {HOUR_PARTITION} BETWEEN '{first_hour:%H}' AND '{last_hour:%H}' "
+                f'AND "timestamp" >= {day_start} AND "timestamp" < {day_end}'
+            )
+        return queries
+
+    @staticmethod
+    def _split_by_day(start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        """Split a millisecond window at UTC midnights."""
+        windows = []
+        current = start_ms
+        while current < end_ms:
+            day = datetime.fromtimestamp(current / 1000, tz=timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+            next_day_ms = int((day + timedelta(days=1)).timestamp() * 1000)
+            windows.append((current, min(next_day_ms, end_ms)))
+            current = next_day_ms
+        return windows
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        return "'" + value.replace("'", "''") + "'"
+
+    @circuit_breaker(
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        timeout=DEFAULT_TIMEOUT,
+        error_message="Failed to start Athena query",
+        operation="StartQueryExecution"
+    )
+    async def _start_query_execution(self, client: Any, query: str) -> str:
+        """Start a query and return its execution id."""
+        params: Dict[str, Any] = {
+            "QueryString": query,
+            "QueryExecutionContext": {"Database": self.database},
+            "WorkGroup": self.workgroup,
+        }
+        if self.s3_bucket:
+            output = f"s3://{self.s3_bucket}/{self.s3_prefix}/" if self.s3_prefix else f"s3://{self.s3_bucket}/"
+            params["ResultConfiguration"] = {"OutputLocation": output}
+        response = await client.start_query_execution(**params)
+        return response["QueryExecutionId"]
+
+    @circuit_breaker(
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        timeout=DEFAULT_TIMEOUT,
+        error_message="Failed to get Athena query execution",
+        operation="GetQueryExecution"
+    )
+    async def _get_query_execution(self, client: Any, query_execution_id: str) -> Dict[str, Any]:
+        """Fetch the state of a query execution."""
+        response = await client.get_query_execution(QueryExecutionId=query_execution_id)
+        return response["QueryExecution"]
+
+    @circuit_breaker(
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        timeout=DEFAULT_TIMEOUT,
+        error_message="Failed to get Athena query results",
+        operation="GetQueryResults"
+    )
+    async def _get_query_results_page(
+        self,
+        client: Any,
+        query_execution_id: str,
+        next_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Fetch a single page of query results."""
+        params: Dict[str, Any] = {"QueryExecutionId": query_execution_id, "MaxResults": RESULTS_PAGE_SIZE}
+        if next_token:
+            params["NextToken"] = next_token
+        return await client.get_query_results(**params)
+
+    async def run_query(self, query: str) -> Dict[str, Any]:
+        """Run a query to completion, polling with exponential backoff.
+
+        Args:
+            query: SQL query
+
+        Returns:
+            The finished QueryExecution description
+
+        Raises:
+            RuntimeError: If the query failed or was cancelled
+        """
+        client = await self.client_pool.get("athena")
+        async with self.semaphore:
+            query_execution_id = await self._start_query_execution(client, query)
+            poll_interval = MIN_POLL_INTERVAL
+            try:
+                while True:
+                    await asyncio.sleep(poll_interval)
+                    execution = await self._get_query_execution(client, query_execution_id)
+                    if execution["Status"]["State"] in TERMINAL_STATES:
+                        break
+                    poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
+            except asyncio.CancelledError:
+                try:
+                    await client.stop_query_execution(QueryExecutionId=query_execution_id)
+                except Exception as e:
+                    logger.warning(f"Failed to stop Athena query {query_execution_id}: {str(e)}")
+                raise
+
+        status = execution["Status"]
+        if status["State"] != "SUCCEEDED":
+            raise RuntimeError(
+                f"Athena query {query_execution_id} {status['State'].lower()}: {status.get('StateChangeReason', '')}"
+            )
+        return execution
+
+    async def _iter_paged_results(self, query_execution_id: str) -> AsyncIterator[Dict[str, str]]:
+        """Yield result rows through paged GetQueryResults calls."""
+        client = await self.client_pool.get("athena")
+        next_token = None
+        columns: Optional[List[str]] = None
+        while True:
+            response = await self._get_query_results_page(client, query_execution_id, next_token)
+            rows = response["ResultSet"]["Rows"]
+            if columns is None:
+                columns = [column["Name"] for column in response["ResultSet"]["ResultSetMetadata"]["ColumnInfo"]]
+                rows = rows[1:]  # The first row of the first page repeats the column names
+            for row in rows:
+                yield {column: data.get("VarCharValue") for column, data in zip(columns, row["Data"])}
+            next_token = response.get("NextToken")
+            if not next_token:
+                break
+
+    async def _iter_s3_results(self, bucket: str, key: str) -> AsyncIterator[Dict[str, str]]:
+        """Yield result rows by streaming the CSV result object from S3.
+
+        Athena quotes every field and escapes quotes by doubling them, so a
+        record is complete once it contains an even number of quotes. This
+        keeps messages with embedded newlines in one row without reading the
+        whole object.
+        """
+        client = await self.client_pool.get("s3")
+        response = await client.get_object(Bucket=bucket, Key=key)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        columns: Optional[List[str]] = None
+        buffer = ""
+        record: List[str] = []
+        quote_count = 0
+
+        async def iter_lines() -> AsyncIterator[str]:
+            nonlocal buffer
+            async for chunk in response["Body"].iter_chunks(S3_READ_CHUNK_SIZE):
+                buffer += decoder.decode(chunk)
+                lines = buffer.split("\n")
+                buffer = lines.pop()
+                for line in lines:
+                    yield line
+            buffer += decoder.decode(b"", final=True)
+            if buffer:
+                yield buffer
+
+        async for line in iter_lines():
+            record.append(line)
+            quote_count += line.count('"')
+            if quote_count % 2:
+                continue
+            values = next(csv.reader(["\n".join(record)]), [])
+            record, quote_count = [], 0
+            if not values:
+                continue
+            if columns is None:
+                columns = values
+            else:
+                yield dict(zip(columns, values))
+
+    async def iter_query_results(self, query: str) -> AsyncIterator[List[Dict[str, str]]]:
+        """Run a query and yield its rows in batches of `batch_size`.
+
+        Args:
+            query: SQL query
+
+        Yields:
+            Lists of result rows as column-to-value dictionaries
+        """
+        execution = await self.run_query(query)
+        output = urlparse(execution["ResultConfiguration"]["OutputLocation"])
+        bucket, key = output.netloc, output.path.lstrip("/")
+
+        s3_client = await self.client_pool.get("s3")
+        head = await s3_client.head_object(Bucket=bucket, Key=key)
+        if head["ContentLength"] <= PAGED_RESULTS_MAX_BYTES:
+            rows = self._iter_paged_results(execution["QueryExecutionId"])
+        else:
+            rows = self._iter_s3_results(bucket, key)
+
+        batch: List[Dict[str, str]] = []
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def iter_logs(
+        self,
+        log_group_name: str,
+        start_time: str,
+        end_time: str
+    ) -> AsyncIterator[List[Dict[str, str]]]:
+        """Yield collected log rows of a log group for a time range, in batches.
+
+        Args:
+            log_group_name: Name of the log group
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Yields:
+            Lists of log rows, in arrival order
+        """
+        sources = (self.iter_query_results(query) for query in self.build_queries(log_group_name, start_time, end_time))
+        async for batch in merge_async_iterators(sources, self.max_concurrent_requests, self.max_buffered_batches):
+            yield batch
+
+    async def iter_log_pages(
+        self,
+        log_group_name: str,
+        start_time: str,
+        end_time: str
+    ) -> AsyncIterator[LogBatch]:
+        """Yield collected logs as pages grouped by log stream, like `CloudwatchCollector.stream_logs`.
+
+        Args:
+            log_group_name: Name of the log group
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Yields:
+            Pages of log events
+        """
+        async for batch in self.iter_logs(log_group_name, start_time, end_time):
+            pages: Dict[str, LogBatch] = {}
+            for row in batch:
+                page = pages.get(row["log_stream"])
+                if page is None:
+                    page = pages[row["log_stream"]] = LogBatch(log_group_name, row["log_stream"], array("q"), [], [])
+                page.timestamps.append(int(row["timestamp"]))
+                page.messages.append(row["message"])
+                page.event_ids.append(row["event_id"])
+            for page in pages.values():
+                page.validate()
+                yield page
+
+    async def query_logs(
+        self,
+        log_group_name: str,
+        start_time: str,
+        end_time: str
+    ) -> List[str]:
+        """Run the log queries of a time range and leave their results in S3 instead of reading them.
+
+        Args:
+            log_group_name: Name of the log group
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Returns:
+            S3 keys of the CSV query results, in the output location of `s3_bucket` and `s3_prefix`
+        """
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [group.create_task(self.run_query(query)) for query in self.build_queries(log_group_name, start_time, end_time)]
+        except BaseExceptionGroup as e:
+            raise e.exceptions[0] from None
+        return [urlparse(task.result()["ResultConfiguration"]["OutputLocation"]).path.lstrip("/") for task in tasks]
+
+    async def collect_logs(
+        self,
+        log_group_name: str,
+        start_time: str,
+        end_time: str
+    ) -> List[Dict[str, str]]:
+        """Main method to collect logs through Athena.
+
+        Args:
+            log_group_name: Name of the log group
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Returns:
+            List of log rows
+        """
+        all_rows: List[Dict[str, str]] = []
+        async for batch in self.iter_logs(log_group_name, start_time, end_time):
+            all_rows.extend(batch)
+        return all_rows
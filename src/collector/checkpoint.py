@@ -0,0 +1,274 @@
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from bisect import bisect_left, bisect_right
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, Optional, Dict, Iterable
+from urllib.parse import quote
+from .types import LogBatch
+
+try:
+    from utilities.aws import get_session
+except ImportError:  # For Local Development
+    from ..utilities.aws import get_session
+
+if TYPE_CHECKING:
+    import aioboto3
+
+
+# Constants
+DEFAULT_FLUSH_INTERVAL = 30  # seconds
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Checkpoint:
+    """Position up to which a log stream has been ingested."""
+    log_group_name: str
+    log_stream_name: str
+    last_timestamp: int # Milliseconds since epoch
+    last_event_id: Optional[str] = None
+    next_token: Optional[str] = None
+
+
+class CheckpointStore(ABC):
+    """Persists per-stream checkpoints so collection can be incremental and resumable."""
+
+    @abstractmethod
+    async def load(self, log_group_name: str) -> Dict[str, Checkpoint]:
+        """Load every checkpoint of a log group.
+
+        Args:
+            log_group_name: Name of the log group
+
+        Returns:
+            Checkpoints keyed by log stream name
+        """
+
+    @abstractmethod
+    async def save(self, log_group_name: str, checkpoints: Iterable[Checkpoint]) -> None:
+        """Insert or replace checkpoints of a log group.
+
+        Args:
+            log_group_name: Name of the log group
+            checkpoints: Checkpoints to store
+        """
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """Checkpoint store backed by a local SQLite file."""
+
+    def __init__(self, path: str):
+        """Initialize the SQLiteCheckpointStore.
+
+        Args:
+            path: Path of the SQLite database file. Created if it does not exist.
+        """
+        self.path = path
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    log_group_name TEXT NOT NULL,
+                    log_stream_name TEXT NOT NULL,
+                    last_timestamp INTEGER NOT NULL,
+                    last_event_id TEXT,
+                    next_token TEXT,
+                    updated_at INTEGER NOT NULL,
+                    PRIMARY KEY (log_group_name, log_stream_name)
+                )
+                """
+            )
+
+    def _load(self, log_group_name: str) -> Dict[str, Checkpoint]:
+        with sqlite3.connect(self.path) as connection:
+            rows = connection.execute(
+                "SELECT log_group_name, log_stream_name, last_timestamp, last_event_id, next_token "
+                "FROM checkpoints WHERE log_group_name = ?",
+                (log_group_name,)
+            ).fetchall()
+        return {row[1]: Checkpoint(*row) for row in rows}
+
+    def _save(self, checkpoints: Iterable[Checkpoint]) -> None:
+        now = int(time.time())
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(log_group_name, log_stream_name, last_timestamp, last_event_id, next_token, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (c.log_group_name, c.log_stream_name, c.last_timestamp, c.last_event_id, c.next_token, now)
+                    for c in checkpoints
+                ]
+            )
+
+    async def load(self, log_group_name: str) -> Dict[str, Checkpoint]:
+        return await asyncio.to_thread(self._load, log_group_name)
+
+    async def save(self, log_group_name: str, checkpoints: Iterable[Checkpoint]) -> None:
+        await asyncio.to_thread(self._save, list(checkpoints))
+
+
+class S3CheckpointStore(CheckpointStore):
+    """Checkpoint store that keeps one JSON object per log group in S3."""
+
+    def __init__(
+        self,
+        bucket_name: str,
+        prefix: str = "checkpoints",
+        profile_name: Optional[str] = None,
+        session: Optional["aioboto3.Session"] = None
+    ):
+        """Initialize the S3CheckpointStore.
+
+        Args:
+            bucket_name: S3 bucket holding the checkpoints
+            prefix: Key prefix for checkpoint objects
+            profile_name: AWS profile name. Set to None to use the IAM Role or Instance Profile.
+            session: aioboto3 session to create clients from. Defaults to the shared session of `profile_name`.
+        """
+        self.session = session or get_session(profile_name)
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip("/")
+        self._checkpoints: Dict[str, Dict[str, Checkpoint]] = {}
+
+    def _key(self, log_group_name: str) -> str:
+        return f"{self.prefix}/{quote(log_group_name, safe='')}.json"
+
+    async def load(self, log_group_name: str) -> Dict[str, Checkpoint]:
+        async with self.session.client("s3") as client:
+            try:
+                response = await client.get_object(Bucket=self.bucket_name, Key=self._key(log_group_name))
+            except client.exceptions.NoSuchKey:
+                checkpoints = {}
+            else:
+                body = json.loads(await response["Body"].read())
+                checkpoints = {name: Checkpoint(**value) for name, value in body.items()}
+        self._checkpoints[log_group_name] = checkpoints
+        return dict(checkpoints)
+
+    async def save(self, log_group_name: str, checkpoints: Iterable[Checkpoint]) -> None:
+        if log_group_name not in self._checkpoints:
+            await self.load(log_group_name)
+        stored = self._checkpoints[log_group_name]
+        for checkpoint in checkpoints:
+            stored[checkpoint.log_stream_name] = checkpoint
+        body = json.dumps({name: asdict(checkpoint) for name, checkpoint in stored.items()})
+        async with self.session.client("s3") as client:
+            await client.put_object(
+                Bucket=self.bucket_name,
+                Key=self._key(log_group_name),
+                Body=body.encode("utf-8"),
+                ContentType="application/json"
+            )
+
+
+def checkpoint_after(log_group_name: str, page: LogBatch) -> Checkpoint:
+    """Return the position of a stream just past a non-empty page of it.
+
+    Args:
+        log_group_name: Name of the log group
+        page: Page of one stream
+
+    Returns:
+        Checkpoint at the page's last event
+    """
+    return Checkpoint(log_group_name, page.log_stream_name, page.timestamps[-1], page.event_ids[-1], page.next_token)
+
+
+class CheckpointTracker:
+    """Advances checkpoints of one log group as pages are consumed and saves them periodically."""
+
+    def __init__(
+        self,
+        store: CheckpointStore,
+        log_group_name: str,
+        checkpoints: Dict[str, Checkpoint],
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL
+    ):
+        """Initialize the CheckpointTracker.
+
+        Args:
+            store: Store the checkpoints are saved to
+            log_group_name: Name of the log group
+            checkpoints: Checkpoints loaded from the store, keyed by log stream name
+            flush_interval: Minimum number of seconds between two saves
+        """
+        self.store = store
+        self.log_group_name = log_group_name
+        self.checkpoints = checkpoints
+        self.flush_interval = flush_interval
+        self._dirty: Dict[str, Checkpoint] = {}
+        self._last_flush = time.monotonic()
+
+    async def advance(self, page: LogBatch) -> None:
+        """Move the checkpoint of the page's stream past the page, once the consumer has handled it.
+
+        Args:
+            page: Page that has been consumed
+        """
+        await self.update(checkpoint_after(self.log_group_name, page))
+
+    async def update(self, checkpoint: Checkpoint) -> None:
+        """Move the checkpoint of a stream forward. Positions before the current one are ignored.
+
+        Args:
+            checkpoint: New position of the stream, e.g. from `checkpoint_after`
+        """
+        current = self.checkpoints.get(checkpoint.log_stream_name)
+        if current is not None and checkpoint.last_timestamp < current.last_timestamp:
+            return
+        self.checkpoints[checkpoint.log_stream_name] = checkpoint
+        self._dirty[checkpoint.log_stream_name] = checkpoint
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Save checkpoints that changed since the last save."""
+        self._last_flush = time.monotonic()
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            await self.store.save(self.log_group_name, dirty.values())
+        except Exception:
+            self._dirty = {**dirty, **self._dirty}
+            raise
+        logger.debug(f"Saved {len(dirty)} checkpoints for {self.log_group_name}")
+
+
+def events_after_checkpoint(page: LogBatch, checkpoint: Checkpoint) -> LogBatch:
+    """Drop events a checkpoint shows were already ingested.
+
+    Reads that restart from `last_timestamp` see the events sharing that
+    timestamp again. If the checkpointed event is among them, it and the
+    events before it are dropped. Otherwise they are all kept, since events
+    may be delivered twice but must never be lost.
+
+    Args:
+        page: Events of one stream, in timestamp order
+        checkpoint: Checkpoint of the stream
+
+    Returns:
+        The page itself if no event was dropped, otherwise a page of the events after the checkpoint
+    """
+    timestamps = page.timestamps
+    if not timestamps or timestamps[0] > checkpoint.last_timestamp:
+        return page
+    start = bisect_left(timestamps, checkpoint.last_timestamp)
+    end = bisect_right(timestamps, checkpoint.last_timestamp, start)
+    for index in range(start, end):
+        if page.event_ids[index] == checkpoint.last_event_id:
+            start = index + 1
+            break
+    if start == 0:
+        return page
+    next_token = page.next_token
+    page = page[start:]
+    page.next_token = next_token
+    return page
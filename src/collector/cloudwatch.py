@@ -1,30 +1,47 @@
 import re
+import math
+import time
 import asyncio
-from itertools import chain
-from typing import Optional, List, Dict, Any, TypedDict
-import aioboto3
-from mypy_boto3_logs.client import CloudWatchLogsClient
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, AsyncIterator, TypedDict
 import logging
-from .types import LogEvent, LogStream
+from .types import LogBatch, LogEvent, LogStream
+from .checkpoint import Checkpoint, CheckpointStore, CheckpointTracker, events_after_checkpoint
 
 try:
     from utilities.timestamps import parse_timestamp
     from utilities.circuit_breaker import circuit_breaker
+    from utilities.streaming import merge_async_iterators, concat_async_iterators
+    from utilities.client_pool import ClientPool
+    from utilities.concurrency import AdaptiveConcurrencyLimiter
+    from utilities.rate_limit import TokenBucket
+    from utilities.metrics import MetricsRegistry, get_metrics
+    from utilities.aws import get_session
 except ImportError:  # For Local Development
     from ..utilities.timestamps import parse_timestamp
     from ..utilities.circuit_breaker import circuit_breaker
+    from ..utilities.streaming import merge_async_iterators, concat_async_iterators
+    from ..utilities.client_pool import ClientPool
+    from ..utilities.concurrency import AdaptiveConcurrencyLimiter
+    from ..utilities.rate_limit import TokenBucket
+    from ..utilities.metrics import MetricsRegistry, get_metrics
+    from ..utilities.aws import get_session
+
+if TYPE_CHECKING:
+    import aioboto3
+    from mypy_boto3_logs.client import CloudWatchLogsClient
 
 # Constants
 DEFAULT_MAX_CONCURRENT_REQUESTS = 10
-DEFAULT_MAX_ATTEMPTS = 100
+DEFAULT_MAX_CONCURRENCY_LIMIT = 50
+DEFAULT_MAX_ATTEMPTS = 8
 DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_BUFFERED_PAGES = 32
+MAX_FILTER_LOG_STREAM_NAMES = 100  # FilterLogEvents limit for logStreamNames
+STREAM_LAST_EVENT_GRACE_MS = 60 * 60 * 1000
+DEFAULT_SHARD_TARGET_EVENTS = 50_000
+SHARD_PREFETCH_PAGES = 2
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
 logger = logging.getLogger(__name__)
 
 
@@ -33,28 +50,79 @@ class CloudwatchCollector:
     
     This class provides methods to fetch and process logs from CloudWatch Logs
     with support for pagination, concurrent requests, and error handling.
+
+    All requests share one long-lived client. Use the collector as an async
+    context manager, or call `close`, to release it:
+
+        async with CloudwatchCollector() as collector:
+            events = await collector.collect_logs(log_group_name)
     """
 
-    def __init__(self, profile_name: Optional[str] = None, max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS):
+    def __init__(
+        self,
+        profile_name: Optional[str] = None,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        max_buffered_pages: int = DEFAULT_MAX_BUFFERED_PAGES,
+        max_concurrency_limit: int = DEFAULT_MAX_CONCURRENCY_LIMIT,
+        max_shards_per_stream: int = 1,
+        shard_target_events: int = DEFAULT_SHARD_TARGET_EVENTS,
+        checkpoint_store: Optional[CheckpointStore] = None,
+        session: Optional["aioboto3.Session"] = None,
+        rate_limiter: Optional[TokenBucket] = None
+    ):
         """Initialize the CloudwatchCollector.
         
         Args:
             profile_name: AWS profile name to use for authentication.
                           For production use, set to None, then use IAM Role or Instance Profile.
                           Using IAM Access Key is not supported.
-            max_concurrent_requests: Maximum number of concurrent API requests
+            max_concurrent_requests: Initial number of concurrent API requests. The limit
+                                     grows on success and shrinks on throttling.
+            max_buffered_pages: Maximum number of fetched pages buffered for a
+                                slow consumer of the streaming API
+            max_concurrency_limit: Upper bound for the adaptive request concurrency
+            max_shards_per_stream: Maximum number of time shards a single stream is split
+                                   into and fetched concurrently. 1 disables sharding.
+            shard_target_events: Estimated number of events each shard should cover
+            checkpoint_store: Store that per-stream progress is recorded in. Required
+                              for incremental collection.
+            session: aioboto3 session to create clients from. Defaults to the shared session of `profile_name`.
+            rate_limiter: API rate budget shared with other collectors of the same account and region
         """
-        self.session = aioboto3.Session(profile_name=profile_name)
-        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self.session = session or get_session(profile_name)
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_buffered_pages = max_buffered_pages
+        self.max_concurrency_limit = max(max_concurrency_limit, max_concurrent_requests)
+        self.client_pool = ClientPool(self.session, max_pool_connections=self.max_concurrency_limit)
+        self.limiter = AdaptiveConcurrencyLimiter(
+            max_concurrent_requests,
+            max_limit=self.max_concurrency_limit,
+            name="cloudwatch",
+            rate_limiter=rate_limiter
+        )
+        self.max_shards_per_stream = max(max_shards_per_stream, 1)
+        self.shard_target_events = max(shard_target_events, 1)
+        self.checkpoint_store = checkpoint_store
+
+    async def __aenter__(self) -> "CloudwatchCollector":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the shared CloudWatch Logs client."""
+        await self.client_pool.close()
 
     @circuit_breaker(
         max_attempts=DEFAULT_MAX_ATTEMPTS,
         timeout=DEFAULT_TIMEOUT,
-        error_message="Failed to fetch log streams"
+        error_message="Failed to fetch log streams",
+        operation="DescribeLogStreams"
     )
     async def _fetch_log_streams_page(
         self,
-        client: CloudWatchLogsClient,
+        client: "CloudWatchLogsClient",
         log_group_name: str,
         next_token: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -76,34 +144,129 @@ class CloudwatchCollector:
         if next_token:
             params["nextToken"] = next_token
             
-        return await client.describe_log_streams(**params)
+        async with self.limiter.slot("DescribeLogStreams"):
+            return await client.describe_log_streams(**params)
+
+    async def iter_log_streams(
+        self,
+        log_group_name: str,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield log stream descriptions that may contain events in the time window.
+
+        Streams are listed by `LastEventTime` in descending order, so once a
+        stream's last event is older than `start_time` every remaining stream
+        is too and paging stops. Streams whose first event is at or after
+        `end_time`, and streams with no events, are skipped.
+
+        `lastEventTimestamp` is updated on an eventual consistency basis, so
+        it is compared with a grace period of `STREAM_LAST_EVENT_GRACE_MS`.
 
-    async def get_log_stream_names(self, log_group_name: str) -> List[str]:
+        Args:
+            log_group_name: Name of the log group to fetch streams from
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Yields:
+            Log stream descriptions as returned by DescribeLogStreams
+        """
+        start_ms = parse_timestamp(start_time) if start_time else None
+        end_ms = parse_timestamp(end_time) if end_time else None
+        next_token = None
+
+        client = await self.client_pool.get("logs")
+        while True:
+            response = await self._fetch_log_streams_page(client, log_group_name, next_token)
+            for stream in response["logStreams"]:
+                first_event = stream.get("firstEventTimestamp")
+                last_event = stream.get("lastEventTimestamp", first_event)
+                if first_event is None:
+                    continue
+                if start_ms is not None and last_event + STREAM_LAST_EVENT_GRACE_MS < start_ms:
+                    return
+                if end_ms is not None and first_event >= end_ms:
+                    continue
+                yield stream
+            next_token = response.get("nextToken")
+            if not next_token:
+                break
+
+    async def get_log_stream_names(
+        self,
+        log_group_name: str,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None
+    ) -> List[str]:
         """Get all log stream names for a given log group.
         
         Args:
             log_group_name: Name of the log group to fetch streams from
+            start_time: Start time in ISO format. Streams without events after it are skipped.
+            end_time: End time in ISO format. Streams without events before it are skipped.
             
         Returns:
             List of log stream names
         """
-        log_streams: List[str] = []
-        next_token = None
+        return [
+            stream["logStreamName"]
+            async for stream in self.iter_log_streams(log_group_name, start_time, end_time)
+        ]
+
+    @circuit_breaker(
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        timeout=DEFAULT_TIMEOUT,
+        error_message="Failed to filter log events",
+        operation="FilterLogEvents"
+    )
+    async def _fetch_filtered_events_page(
+        self,
+        client: "CloudWatchLogsClient",
+        log_group_name: str,
+        log_stream_names: List[str],
+        filter_pattern: str,
+        start_time: Optional[int] = None,
+        end_time: Optional[int] = None,
+        next_token: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Fetch a single page of server-side filtered events.
         
-        async with self.semaphore:
-            async with self.session.client("logs") as client:
-                while True:
-                    response = await self._fetch_log_streams_page(client, log_group_name, next_token)
-                    log_streams.extend([stream["logStreamName"] for stream in response["logStreams"]])
-                    next_token = response.get("nextToken")
-                    if not next_token:
-                        break
-                        
-        return log_streams
+        Args:
+            client: CloudWatch Logs client
+            log_group_name: Name of the log group
+            log_stream_names: Up to `MAX_FILTER_LOG_STREAM_NAMES` log stream names
+            filter_pattern: CloudWatch Logs filter pattern
+            start_time: Start time in milliseconds
+            end_time: End time in milliseconds
+            next_token: Token for pagination
+            
+        Returns:
+            Dictionary containing matched events and pagination token
+        """
+        params = {
+            "logGroupName": log_group_name,
+            "logStreamNames": log_stream_names,
+            "filterPattern": filter_pattern,
+        }
+        if start_time:
+            params["startTime"] = start_time
+        if end_time:
+            params["endTime"] = end_time
+        if next_token:
+            params["nextToken"] = next_token
+
+        async with self.limiter.slot("FilterLogEvents"):
+            return await client.filter_log_events(**params)
 
+    @circuit_breaker(
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        timeout=DEFAULT_TIMEOUT,
+        error_message="Failed to fetch log events",
+        operation="GetLogEvents"
+    )
     async def _fetch_log_events_page(
         self,
-        client: CloudWatchLogsClient,
+        client: "CloudWatchLogsClient",
         log_group_name: str,
         log_stream_name: str,
         start_time: Optional[int] = None,
@@ -126,6 +289,7 @@ class CloudwatchCollector:
         params = {
             "logGroupName": log_group_name,
             "logStreamName": log_stream_name,
+            "startFromHead": True,
         }
         if start_time:
             params["startTime"] = start_time
@@ -134,7 +298,235 @@ class CloudwatchCollector:
         if next_token:
             params["nextToken"] = next_token
             
-        return await client.get_log_events(**params)
+        async with self.limiter.slot("GetLogEvents"):
+            return await client.get_log_events(**params)
+
+    async def _iter_stream_window(
+        self,
+        log_stream_name: str,
+        log_group_name: str,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+        resume_token: Optional[str] = None
+    ) -> AsyncIterator[LogBatch]:
+        """Yield pages of a stream for a window given in milliseconds, following forward tokens.
+
+        Args:
+            log_stream_name: Name of the log stream
+            log_group_name: Name of the log group
+            start_ms: Start time in milliseconds, inclusive
+            end_ms: End time in milliseconds, exclusive
+            resume_token: Forward token saved by an earlier collection. If it is
+                          rejected, e.g. because it expired, reading restarts at `start_ms`.
+
+        Yields:
+            Non-empty pages of log events
+
+        Raises:
+            Exception: The error of a page that could not be fetched, after the pages before it were yielded
+        """
+        next_token = resume_token
+
+        client = await self.client_pool.get("logs")
+        while True:
+            try:
+                response = await self._fetch_log_events_page(
+                    client,
+                    log_group_name,
+                    log_stream_name,
+                    start_ms,
+                    end_ms,
+                    next_token
+                )
+            except Exception as e:
+                if next_token is not None and next_token == resume_token:
+                    logger.warning(f"Resume token for stream {log_stream_name} was rejected, restarting from timestamp: {str(e)}")
+                    next_token = resume_token = None
+                    continue
+                raise
+
+            resume_token = None
+            events = response.get("events", [])
+            forward_token = response.get("nextForwardToken")
+            if events:
+                with get_metrics().timer("collector_decode_seconds"):
+                    page = LogBatch.from_events(log_group_name, log_stream_name, events, forward_token)
+                yield page
+
+            # GetLogEvents returns the token it was given once the end of the stream is reached
+            if not forward_token or forward_token == next_token:
+                break
+            next_token = forward_token
+
+    async def iter_log_stream(
+        self,
+        log_stream_name: str,
+        log_group_name: str,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None
+    ) -> AsyncIterator[LogBatch]:
+        """Yield pages of events from a single stream as they are fetched.
+
+        Only the current page is held in memory. The next page is not
+        requested until the consumer asks for it. When `max_shards_per_stream`
+        is greater than 1 the stream is read through `iter_log_stream_sharded`.
+
+        Args:
+            log_stream_name: Name of the log stream
+            log_group_name: Name of the log group
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Yields:
+            Non-empty pages of log events
+        """
+        async for page in self._iter_stream(
+            log_stream_name,
+            log_group_name,
+            parse_timestamp(start_time) if start_time else None,
+            parse_timestamp(end_time) if end_time else None
+        ):
+            yield page
+
+    async def _iter_stream(
+        self,
+        log_stream_name: str,
+        log_group_name: str,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+        checkpoint: Optional[Checkpoint] = None
+    ) -> AsyncIterator[LogBatch]:
+        """Yield pages of a stream, sharded or not, optionally resuming from a checkpoint.
+
+        A page that cannot be fetched ends the stream, so every page yielded
+        follows all events of the stream before it and a checkpoint taken from
+        the last page never skips events. The next incremental run resumes there.
+
+        Args:
+            log_stream_name: Name of the log stream
+            log_group_name: Name of the log group
+            start_ms: Start time in milliseconds, inclusive
+            end_ms: End time in milliseconds, exclusive
+            checkpoint: Checkpoint of the stream. Only events after it are yielded.
+
+        Yields:
+            Non-empty pages of log events
+        """
+        resume_token = None
+        if checkpoint is not None:
+            start_ms = max(start_ms or 0, checkpoint.last_timestamp)
+            resume_token = checkpoint.next_token
+
+        if self.max_shards_per_stream > 1:
+            pages = self._iter_stream_sharded(log_stream_name, log_group_name, start_ms, end_ms)
+        else:
+            pages = self._iter_stream_window(log_stream_name, log_group_name, start_ms, end_ms, resume_token)
+
+        try:
+            async for page in pages:
+                if checkpoint is not None:
+                    page = events_after_checkpoint(page, checkpoint)
+                    if not page:
+                        continue
+                yield page
+        except Exception as e:
+            # Shards are yielded in time order, so the pages of later shards are dropped with the failed one
+            logger.error(f"Error fetching logs from stream {log_stream_name}, stopping at its last collected event: {str(e)}")
+
+    async def iter_log_stream_sharded(
+        self,
+        log_stream_name: str,
+        log_group_name: str,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None
+    ) -> AsyncIterator[LogBatch]:
+        """Yield pages of a single stream, fetching time shards of it concurrently.
+
+        The first page is fetched normally and its event density is used to
+        estimate how many events remain before `end_time`. The rest of the
+        window is split into one shard per `shard_target_events` estimated
+        events, up to `max_shards_per_stream`. Shards are fetched concurrently
+        and yielded in time order. Events at a shard boundary that were
+        already yielded are dropped by `eventId`.
+
+        Args:
+            log_stream_name: Name of the log stream
+            log_group_name: Name of the log group
+            start_time: Start time in ISO format
+            end_time: End time in ISO format. Defaults to now.
+
+        Yields:
+            Non-empty pages of log events, in timestamp order
+
+        Raises:
+            Exception: The error of a shard that could not be fetched. Pages of later shards are not yielded.
+        """
+        async for page in self._iter_stream_sharded(
+            log_stream_name,
+            log_group_name,
+            parse_timestamp(start_time) if start_time else None,
+            parse_timestamp(end_time) if end_time else None
+        ):
+            yield page
+
+    async def _iter_stream_sharded(
+        self,
+        log_stream_name: str,
+        log_group_name: str,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None
+    ) -> AsyncIterator[LogBatch]:
+        """Millisecond-based implementation of `iter_log_stream_sharded`."""
+        if end_ms is None:
+            end_ms = int(time.time() * 1000)
+
+        pages = self._iter_stream_window(log_stream_name, log_group_name, start_ms, end_ms)
+        first_page = await anext(pages, None)
+        if first_page is None:
+            return
+        yield first_page
+
+        first_ts = first_page.timestamps[0]
+        last_ts = first_page.timestamps[-1]
+        density = len(first_page) / max(last_ts - first_ts, 1)
+        estimated_events = density * max(end_ms - last_ts, 0)
+        shard_count = min(self.max_shards_per_stream, math.ceil(estimated_events / self.shard_target_events))
+
+        if shard_count <= 1:
+            async for page in pages:
+                yield page
+            return
+        await pages.aclose()
+
+        bounds = [last_ts + (end_ms - last_ts) * i // shard_count for i in range(shard_count + 1)]
+        shards = [
+            self._iter_stream_window(log_stream_name, log_group_name, shard_start, shard_end)
+            for shard_start, shard_end in zip(bounds, bounds[1:])
+            if shard_end > shard_start
+        ]
+        logger.debug(f"Fetching stream {log_stream_name} in {len(shards)} shards (~{int(estimated_events)} events)")
+
+        # Only events sharing the newest timestamp yielded so far can be repeated by the next shard
+        boundary_ts = last_ts
+        boundary_ids = {
+            event_id for timestamp, event_id in zip(first_page.timestamps, first_page.event_ids) if timestamp == last_ts
+        }
+        async for page in concat_async_iterators(shards, SHARD_PREFETCH_PAGES):
+            keep = []
+            for index, (timestamp, event_id) in enumerate(zip(page.timestamps, page.event_ids)):
+                if timestamp > boundary_ts:
+                    boundary_ts = timestamp
+                    boundary_ids = set()
+                elif timestamp == boundary_ts and event_id in boundary_ids:
+                    continue
+                if timestamp == boundary_ts:
+                    boundary_ids.add(event_id)
+                keep.append(index)
+            # Shard tokens cannot resume the stream as a whole
+            page = page.take(keep) if len(keep) < len(page) else page
+            page.next_token = None
+            if page:
+                yield page
 
     async def fetch_log_stream(
         self, 
@@ -154,33 +546,148 @@ class CloudwatchCollector:
         Returns:
             List of log events
         """
-        async with self.semaphore:
-            all_events: List[LogEvent] = []
-            next_token = None
-            
-            async with self.session.client("logs") as client:
-                while True:
-                    try:
-                        response = await self._fetch_log_events_page(
-                            client,
-                            log_group_name,
-                            log_stream_name,
-                            parse_timestamp(start_time) if start_time else None,
-                            parse_timestamp(end_time) if end_time else None,
-                            next_token
-                        )
-                        
-                        all_events.extend(response.get("events", []))
-                        next_token = response.get("nextForwardToken")
-
-                        if not next_token:
-                            break
-                            
-                    except Exception as e:
-                        logger.error(f"Error fetching logs from stream {log_stream_name}: {str(e)}")
-                        break
-                    
-            return all_events
+        all_events: List[LogEvent] = []
+        async for page in self.iter_log_stream(log_stream_name, log_group_name, start_time, end_time):
+            all_events.extend(page)
+        return all_events
+
+    async def iter_log_events(
+        self,
+        log_group_name: str,
+        log_stream_names: List[str],
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        checkpoints: Optional[Dict[str, Checkpoint]] = None
+    ) -> AsyncIterator[LogBatch]:
+        """Yield pages from multiple streams concurrently, in arrival order.
+
+        At most `max_concurrency_limit` streams are read at once and at most
+        `max_buffered_pages` pages wait for the consumer, so peak memory is
+        bounded by the number of in-flight pages rather than the log group size.
+        How many of those streams have a request in flight is decided per page
+        by the adaptive limiter.
+
+        Args:
+            log_group_name: Name of the log group
+            log_stream_names: List of log stream names
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+            checkpoints: Checkpoints keyed by stream name. Streams with a
+                         checkpoint are only read past it.
+
+        Yields:
+            Pages of log events from all streams
+        """
+        start_ms = parse_timestamp(start_time) if start_time else None
+        end_ms = parse_timestamp(end_time) if end_time else None
+        checkpoints = checkpoints or {}
+        sources = (
+            self._iter_stream(stream, log_group_name, start_ms, end_ms, checkpoints.get(stream))
+            for stream in log_stream_names
+        )
+        async for page in merge_async_iterators(sources, self.max_concurrency_limit, self.max_buffered_pages):
+            yield page
+
+    async def _iter_filtered_stream_batch(
+        self,
+        log_group_name: str,
+        log_stream_names: List[str],
+        filter_pattern: str,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        checkpoints: Optional[Dict[str, Checkpoint]] = None
+    ) -> AsyncIterator[LogBatch]:
+        """Yield filtered events for one batch of streams, one page per stream per response.
+
+        Args:
+            log_group_name: Name of the log group
+            log_stream_names: Up to `MAX_FILTER_LOG_STREAM_NAMES` log stream names
+            filter_pattern: CloudWatch Logs filter pattern
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+            checkpoints: Checkpoints keyed by stream name. Streams with a
+                         checkpoint are only read past it.
+
+        Yields:
+            Pages of matched log events, grouped by stream
+        """
+        start_ms = parse_timestamp(start_time) if start_time else None
+        end_ms = parse_timestamp(end_time) if end_time else None
+        checkpoints = checkpoints or {}
+        if log_stream_names and all(stream in checkpoints for stream in log_stream_names):
+            oldest_checkpoint = min(checkpoints[stream].last_timestamp for stream in log_stream_names)
+            start_ms = max(start_ms or 0, oldest_checkpoint)
+        next_token = None
+
+        client = await self.client_pool.get("logs")
+        while True:
+            try:
+                response = await self._fetch_filtered_events_page(
+                    client,
+                    log_group_name,
+                    log_stream_names,
+                    filter_pattern,
+                    start_ms,
+                    end_ms,
+                    next_token
+                )
+            except Exception as e:
+                logger.error(f"Error filtering logs from {len(log_stream_names)} streams in {log_group_name}: {str(e)}")
+                break
+
+            events_by_stream: Dict[str, List[Dict[str, Any]]] = {}
+            for event in response.get("events", []):
+                events_by_stream.setdefault(event["logStreamName"], []).append(event)
+            for stream_name, events in events_by_stream.items():
+                page = LogBatch.from_events(log_group_name, stream_name, events)
+                if stream_name in checkpoints:
+                    page = events_after_checkpoint(page, checkpoints[stream_name])
+                if page:
+                    yield page
+
+            next_token = response.get("nextToken")
+            if not next_token:
+                break
+
+    async def iter_filtered_log_events(
+        self,
+        log_group_name: str,
+        log_stream_names: List[str],
+        filter_pattern: str,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        checkpoints: Optional[Dict[str, Checkpoint]] = None
+    ) -> AsyncIterator[LogBatch]:
+        """Yield events matching `filter_pattern`, filtered on the AWS side.
+
+        Streams are queried through FilterLogEvents in batches of
+        `MAX_FILTER_LOG_STREAM_NAMES`, and batches run concurrently.
+
+        Args:
+            log_group_name: Name of the log group
+            log_stream_names: List of log stream names
+            filter_pattern: CloudWatch Logs filter pattern, e.g. `?ERROR ?WARN`
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+            checkpoints: Checkpoints keyed by stream name. Streams with a
+                         checkpoint are only read past it.
+
+        Yields:
+            Pages of matched log events, grouped by stream
+        """
+        sources = (
+            self._iter_filtered_stream_batch(
+                log_group_name,
+                log_stream_names[i:i + MAX_FILTER_LOG_STREAM_NAMES],
+                filter_pattern,
+                start_time,
+                end_time,
+                checkpoints
+            )
+            for i in range(0, len(log_stream_names), MAX_FILTER_LOG_STREAM_NAMES)
+        )
+        async for page in merge_async_iterators(sources, self.max_concurrency_limit, self.max_buffered_pages):
+            yield page
 
     async def get_log_events(
         self,
@@ -200,24 +707,117 @@ class CloudwatchCollector:
         Returns:
             List of log events from all streams
         """
-        tasks = [
-            self.fetch_log_stream(stream, log_group_name, start_time, end_time)
-            for stream in log_stream_names
-        ]
-        log_streams = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Filter out exceptions and flatten results
-        valid_results = [
-            result for result in log_streams 
-            if not isinstance(result, Exception)
-        ]
-        return list(chain.from_iterable(valid_results))
+        all_events: List[LogEvent] = []
+        async for page in self.iter_log_events(log_group_name, log_stream_names, start_time, end_time):
+            all_events.extend(page)
+        return all_events
+
+    async def stream_logs(
+        self,
+        log_group_name: str,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        filter_pattern: Optional[str] = None,
+        incremental: bool = False,
+        commit_checkpoints: bool = True
+    ) -> AsyncIterator[LogBatch]:
+        """Streaming counterpart of `collect_logs`.
+
+        When a `checkpoint_store` is configured, the position of every stream
+        is advanced once the consumer has handled a page, i.e. asks for the
+        next one, and saved periodically and when iteration completes. If the
+        consumer stops early or fails, positions not saved yet are dropped
+        and the next incremental run reads those pages again. Filtered reads
+        do not cover every event before their last one, so they never
+        advance checkpoints.
+
+        Args:
+            log_group_name: Name of the log group
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+            filter_pattern: Optional CloudWatch Logs filter pattern evaluated on the AWS side
+            incremental: Only fetch events after each stream's checkpoint
+            commit_checkpoints: Advance checkpoints as pages are consumed. Set to False when the
+                                consumer commits them itself through `checkpoint_tracker`, e.g.
+                                once the pages are stored.
+
+        Yields:
+            Pages of log events from all streams in the log group
+        """
+        if incremental and self.checkpoint_store is None:
+            raise ValueError("incremental collection requires a checkpoint_store")
+
+        checkpoints: Dict[str, Checkpoint] = {}
+        tracker: Optional[CheckpointTracker] = None
+        if self.checkpoint_store is not None:
+            stored = await self.checkpoint_store.load(log_group_name)
+            if incremental:
+                checkpoints = stored
+            if commit_checkpoints and not filter_pattern:
+                tracker = CheckpointTracker(self.checkpoint_store, log_group_name, dict(stored))
+
+        metrics = get_metrics()
+        now_ms = int(time.time() * 1000)
+        with metrics.timer("collector_list_streams_seconds"):
+            log_stream_names = [
+                stream["logStreamName"]
+                async for stream in self.iter_log_streams(log_group_name, start_time, end_time)
+                if not self._is_caught_up(stream, checkpoints.get(stream["logStreamName"]), now_ms)
+            ]
+        if filter_pattern:
+            pages = self.iter_filtered_log_events(log_group_name, log_stream_names, filter_pattern, start_time, end_time, checkpoints)
+        else:
+            pages = self.iter_log_events(log_group_name, log_stream_names, start_time, end_time, checkpoints)
+
+        async for page in pages:
+            if metrics.enabled:
+                self._record_page(metrics, page)
+            yield page
+            if tracker is not None:
+                await tracker.advance(page)
+        if tracker is not None:
+            await tracker.flush()
+
+    async def checkpoint_tracker(self, log_group_name: str) -> Optional[CheckpointTracker]:
+        """Create a tracker of the stored checkpoints of a log group, for consumers committing them.
+
+        Args:
+            log_group_name: Name of the log group
+
+        Returns:
+            The tracker, or None when no `checkpoint_store` is configured
+        """
+        if self.checkpoint_store is None:
+            return None
+        return CheckpointTracker(self.checkpoint_store, log_group_name, await self.checkpoint_store.load(log_group_name))
+
+    @staticmethod
+    def _record_page(metrics: MetricsRegistry, page: LogBatch) -> None:
+        """Count a page, its events and its message bytes. Bytes are approximated by message length."""
+        metrics.increment("collector_pages_total", log_group=page.log_group_name)
+        # Sinks aggregate log_stream out; only the run summary lists the largest streams
+        metrics.increment("collector_events_total", len(page), log_group=page.log_group_name, log_stream=page.log_stream_name)
+        metrics.increment("collector_bytes_total", sum(map(len, page.messages)), log_group=page.log_group_name, log_stream=page.log_stream_name)
+
+    @staticmethod
+    def _is_caught_up(stream: Dict[str, Any], checkpoint: Optional[Checkpoint], now_ms: int) -> bool:
+        """Check whether a stream has no events after its checkpoint.
+
+        A recent `lastEventTimestamp` may still lag behind ingestion, so it is
+        only trusted once it is older than `STREAM_LAST_EVENT_GRACE_MS`.
+        """
+        if checkpoint is None:
+            return False
+        last_event = stream.get("lastEventTimestamp", stream.get("firstEventTimestamp"))
+        return last_event <= checkpoint.last_timestamp and last_event + STREAM_LAST_EVENT_GRACE_MS < now_ms
 
     async def collect_logs(
         self, 
         log_group_name: str, 
         start_time: Optional[str] = None, 
-        end_time: Optional[str] = None
+        end_time: Optional[str] = None,
+        filter_pattern: Optional[str] = None,
+        incremental: bool = False
     ) -> List[LogEvent]:
         """Main method to collect logs from CloudWatch.
         
@@ -225,14 +825,13 @@ class CloudwatchCollector:
             log_group_name: Name of the log group
             start_time: Start time in ISO format
             end_time: End time in ISO format
+            filter_pattern: Optional CloudWatch Logs filter pattern evaluated on the AWS side
+            incremental: Only fetch events after each stream's checkpoint
             
         Returns:
             List of log events from all streams in the log group
         """
-        log_stream_names = await self.get_log_stream_names(log_group_name)
-        return await self.get_log_events(
-            log_group_name, 
-            log_stream_names, 
-            start_time, 
-            end_time
-        )
\ No newline at end of file
+        all_events: List[LogEvent] = []
+        async for page in self.stream_logs(log_group_name, start_time, end_time, filter_pattern, incremental):
+            all_events.extend(page)
+        return all_events
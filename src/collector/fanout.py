@@ -0,0 +1,327 @@
+import os
+import asyncio
+import logging
+from fnmatch import fnmatchcase
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Callable, Tuple
+from .main import ShiroSightRunner
+
+try:
+    from utilities.circuit_breaker import circuit_breaker
+    from utilities.rate_limit import TokenBucket
+    from utilities.aws import get_session
+except ImportError:  # For Local Development
+    from ..utilities.circuit_breaker import circuit_breaker
+    from ..utilities.rate_limit import TokenBucket
+    from ..utilities.aws import get_session
+
+if TYPE_CHECKING:
+    import aioboto3
+
+
+# Constants
+DEFAULT_REQUESTS_PER_SECOND = 20.0  # Below the 25 TPS GetLogEvents quota of an account and region
+DEFAULT_GROUPS_PER_PROCESS = 4
+GLOB_CHARACTERS = "*?["
+
+
+logger = logging.getLogger(__name__)
+
+SessionFactory = Callable[[Optional[str], Optional[str]], "aioboto3.Session"]
+
+
+@dataclass
+class FanoutTarget:
+    """Log groups of one account and region, and the API rate budget they share.
+
+    Attributes:
+        log_groups: Log group names or glob patterns, e.g. "/aws/lambda/orders-*".
+                    Patterns are expanded with DescribeLogGroups, listing by the
+                    prefix before the first wildcard.
+        region_name: AWS region. Defaults to the profile's or environment's region.
+        profile_name: AWS profile of the account. Defaults to the IAM Role or Instance Profile.
+        requests_per_second: CloudWatch Logs calls per second allowed across every worker
+    """
+    log_groups: List[str]
+    region_name: Optional[str] = None
+    profile_name: Optional[str] = None
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND
+
+
+@dataclass
+class FanoutJob:
+    """One log group to collect, with its target's share of the rate budget."""
+    log_group_name: str
+    region_name: Optional[str] = None
+    profile_name: Optional[str] = None
+    requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND
+
+
+@dataclass
+class FanoutResult:
+    """Outcome of collecting one log group."""
+    log_group_name: str
+    region_name: Optional[str] = None
+    profile_name: Optional[str] = None
+    cloudwatch_keys: List[str] = field(default_factory=list)
+    athena_keys: Optional[List[str]] = None
+    error: Optional[str] = None
+
+
+def default_session(profile_name: Optional[str], region_name: Optional[str]) -> "aioboto3.Session":
+    return get_session(profile_name, region_name)
+
+
+@circuit_breaker(
+    error_message="Failed to describe log groups",
+    operation="DescribeLogGroups"
+)
+async def _fetch_log_groups_page(client: Any, prefix: str, next_token: Optional[str] = None) -> Dict[str, Any]:
+    params: Dict[str, Any] = {"logGroupNamePrefix": prefix} if prefix else {}
+    if next_token:
+        params["nextToken"] = next_token
+    return await client.describe_log_groups(**params)
+
+
+async def resolve_log_groups(session: "aioboto3.Session", patterns: List[str]) -> List[str]:
+    """Expand log group names and glob patterns into the names of existing log groups.
+
+    Names without wildcards are returned as is, without an API call.
+
+    Args:
+        session: aioboto3 session of the account and region
+        patterns: Log group names or glob patterns
+
+    Returns:
+        Sorted, unique log group names
+    """
+    names = {pattern for pattern in patterns if not any(char in pattern for char in GLOB_CHARACTERS)}
+    globs = [pattern for pattern in patterns if pattern not in names]
+    if not globs:
+        return sorted(names)
+
+    async with session.client("logs") as client:
+        for pattern in globs:
+            prefix = pattern[:min((pattern.index(char) for char in GLOB_CHARACTERS if char in pattern), default=len(pattern))]
+            next_token = None
+            while True:
+                response = await _fetch_log_groups_page(client, prefix, next_token)
+                names.update(
+                    group["logGroupName"]
+                    for group in response.get("logGroups", [])
+                    if fnmatchcase(group["logGroupName"], pattern)
+                )
+                next_token = response.get("nextToken")
+                if not next_token:
+                    break
+    return sorted(names)
+
+
+def assign_jobs(jobs: List[FanoutJob], processes: int) -> List[List[FanoutJob]]:
+    """Spread jobs over processes and split each target's rate budget between them.
+
+    Jobs of each target are dealt round-robin, so a target's log groups are
+    spread over as many processes as possible. Every process that gets jobs
+    of a target receives an equal share of its `requests_per_second`, so the
+    processes together never exceed the budget.
+
+    Args:
+        jobs: Jobs with their target's full budget
+        processes: Number of worker processes
+
+    Returns:
+        One list of jobs, with their rate share, per process that has work
+    """
+    batches: List[List[FanoutJob]] = [[] for _ in range(max(processes, 1))]
+    by_target: Dict[Tuple[Optional[str], Optional[str]], List[FanoutJob]] = {}
+    for job in jobs:
+        by_target.setdefault((job.profile_name, job.region_name), []).append(job)
+
+    offset = 0
+    for target_jobs in by_target.values():
+        sharing = min(len(target_jobs), len(batches))
+        for index, job in enumerate(target_jobs):
+            share = FanoutJob(job.log_group_name, job.region_name, job.profile_name, job.requests_per_second / sharing)
+            batches[(offset + index) % len(batches)].append(share)
+        offset += len(target_jobs)
+    return [batch for batch in batches if batch]
+
+
+async def run_jobs(
+    jobs: List[FanoutJob],
+    start_time: Optional[str],
+    end_time: Optional[str],
+    incremental: bool = False,
+    runner_options: Optional[Dict[str, Any]] = None,
+    groups_per_process: int = DEFAULT_GROUPS_PER_PROCESS,
+    session_factory: SessionFactory = default_session
+) -> List[FanoutResult]:
+    """Collect several log groups in the current event loop.
+
+    Up to `groups_per_process` log groups are collected at once. Jobs of the
+    same target share one session and one `TokenBucket` with the rate of
+    their share. A failing log group is reported in its result and does
+    not stop the others.
+
+    Args:
+        jobs: Jobs from `assign_jobs`
+        start_time: Start time in ISO format
+        end_time: End time in ISO format
+        incremental: Only collect CloudWatch events after the stored checkpoints
+        runner_options: Keyword arguments of every `ShiroSightRunner`
+        groups_per_process: Maximum number of log groups collected at once
+        session_factory: Creates the session of a profile and region
+
+    Returns:
+        One result per job, in job order
+    """
+    sessions: Dict[Tuple[Optional[str], Optional[str]], "aioboto3.Session"] = {}
+    buckets: Dict[Tuple[Optional[str], Optional[str]], TokenBucket] = {}
+    semaphore = asyncio.Semaphore(max(groups_per_process, 1))
+
+    async def run_job(job: FanoutJob) -> FanoutResult:
+        key = (job.profile_name, job.region_name)
+        if key not in sessions:
+            sessions[key] = session_factory(job.profile_name, job.region_name)
+            buckets[key] = TokenBucket(job.requests_per_second)
+        result = FanoutResult(job.log_group_name, job.region_name, job.profile_name)
+        async with semaphore:
+            try:
+                runner = ShiroSightRunner(
+                    **(runner_options or {}),
+                    profile_name=job.profile_name,
+                    session=sessions[key],
+                    rate_limiter=buckets[key]
+                )
+                result.cloudwatch_keys, result.athena_keys = await runner.run(
+                    job.log_group_name, start_time, end_time, incremental=incremental
+                )
+            except Exception as e:
+                logger.error(f"Failed to collect {job.log_group_name} ({job.region_name or 'default region'}): {str(e)}")
+                result.error = f"{type(e).__name__}: {str(e)}"
+        return result
+
+    return list(await asyncio.gather(*(run_job(job) for job in jobs)))
+
+
+def _run_batch(
+    jobs: List[FanoutJob],
+    start_time: Optional[str],
+    end_time: Optional[str],
+    incremental: bool,
+    runner_options: Dict[str, Any],
+    groups_per_process: int,
+    session_factory: SessionFactory
+) -> List[FanoutResult]:
+    """Entry point of a worker process: run a batch of jobs in a new event loop."""
+    return asyncio.run(run_jobs(jobs, start_time, end_time, incremental, runner_options, groups_per_process, session_factory))
+
+
+class FanoutRunner:
+    """Collects many log groups across accounts and regions, using every CPU.
+
+    A single `ShiroSightRunner` runs in one event loop, so one core bounds
+    the JSON decoding, validation and compression of everything it
+    collects. `FanoutRunner` expands the log groups of each target, spreads
+    them over worker processes that each run their own event loop, and
+    splits each target's API rate budget between the processes statically,
+    so no coordination between processes is needed.
+
+    Usage:
+        runner = FanoutRunner(
+            [FanoutTarget(["/aws/lambda/*"], region_name="us-east-1", profile_name="prod")],
+            runner_options={"collected_logs_s3_bucket": "my-bucket", "collect_athena_logs": False}
+        )
+        results = await runner.run(start_time, end_time)
+    """
+
+    def __init__(
+        self,
+        targets: List[FanoutTarget],
+        processes: Optional[int] = None,
+        groups_per_process: int = DEFAULT_GROUPS_PER_PROCESS,
+        runner_options: Optional[Dict[str, Any]] = None,
+        session_factory: SessionFactory = default_session
+    ):
+        """Initialize the FanoutRunner.
+
+        Args:
+            targets: Log groups of each account and region
+            processes: Number of worker processes. Defaults to the number of CPUs.
+                       0 runs every job in the calling event loop, e.g. where
+                       multiprocessing is unavailable, as on AWS Lambda.
+            groups_per_process: Maximum number of log groups each process collects at once
+            runner_options: Keyword arguments of every `ShiroSightRunner`, e.g. the
+                            bucket names. They must be picklable when `processes` > 0.
+            session_factory: Module-level function creating the session of a profile
+                             and region. It must be picklable when `processes` > 0.
+        """
+        self.targets = targets
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.groups_per_process = groups_per_process
+        self.runner_options = dict(runner_options or {})
+        for reserved in ("profile_name", "session", "rate_limiter"):
+            if reserved in self.runner_options:
+                raise ValueError(f"{reserved} is set per target and cannot be a runner option")
+        self.session_factory = session_factory
+
+    async def resolve_jobs(self) -> List[FanoutJob]:
+        """Expand every target's log group patterns into one job per log group."""
+        jobs: List[FanoutJob] = []
+        for target in self.targets:
+            session = self.session_factory(target.profile_name, target.region_name)
+            names = await resolve_log_groups(session, target.log_groups)
+            if not names:
+                logger.warning(f"No log groups match {target.log_groups} in {target.region_name or 'the default region'}")
+            jobs.extend(
+                FanoutJob(name, target.region_name, target.profile_name, target.requests_per_second)
+                for name in names
+            )
+        return jobs
+
+    async def run(
+        self,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        incremental: bool = False
+    ) -> List[FanoutResult]:
+        """Collect every log group of every target.
+
+        Args:
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+            incremental: Only collect CloudWatch events after the stored checkpoints.
+                         Requires a `checkpoint_store` runner option.
+
+        Returns:
+            One result per log group. Failed log groups have `error` set.
+        """
+        jobs = await self.resolve_jobs()
+        logger.info(f"Collecting {len(jobs)} log groups from {len(self.targets)} targets with {self.processes or 'no'} worker processes")
+        if not jobs:
+            return []
+        if self.processes == 0:
+            return await run_jobs(
+                jobs, start_time, end_time, incremental,
+                self.runner_options, self.groups_per_process, self.session_factory
+            )
+
+        batches = assign_jobs(jobs, self.processes)
+        loop = asyncio.get_running_loop()
+        # Spawn rather than fork, so workers do not inherit the parent's event loop and clients
+        with ProcessPoolExecutor(max_workers=len(batches), mp_context=get_context("spawn")) as executor:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(
+                    executor, _run_batch, batch, start_time, end_time, incremental,
+                    self.runner_options, self.groups_per_process, self.session_factory
+                )
+                for batch in batches
+            ))
+        # Report in job order, as the in-process mode does
+        order = {(job.profile_name, job.region_name, job.log_group_name): index for index, job in enumerate(jobs)}
+        return sorted(
+            (result for batch_results in results for result in batch_results),
+            key=lambda result: order[(result.profile_name, result.region_name, result.log_group_name)]
+        )
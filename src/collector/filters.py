@@ -0,0 +1,239 @@
+import re
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+from .types import LogBatch
+
+
+# Constants
+KEYWORDS = frozenset({"and", "or", "not", "in", "exists"})
+COMPARISONS = frozenset({"==", "=", "!=", ">", ">=", "<", "<=", "~", "!~"})
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)(?![\w.])
+      | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<operator>==|!=|>=|<=|!~|[=<>~(),])
+      | (?P<word>[\w.\-/:*]+)
+    )""", re.VERBOSE)
+
+Column = Callable[[LogBatch], List[Any]]
+Predicate = Callable[[LogBatch], List[bool]]
+
+
+class FilterSyntaxError(ValueError):
+    """Raised when a filter expression cannot be parsed."""
+    def __init__(self, expression: str, position: int, message: str):
+        self.expression = expression
+        self.position = position
+        super().__init__(f"{message} at position {position} of filter {expression!r}")
+
+
+class _Token(NamedTuple):
+    kind: str
+    value: Any
+    position: int
+    text: str
+
+
+@dataclass
+class EventFilter:
+    """A compiled filter expression. `evaluate` returns one boolean per event of a parsed batch."""
+    expression: str
+    predicate: Predicate
+
+    def evaluate(self, batch: LogBatch) -> List[bool]:
+        return self.predicate(batch)
+
+
+def _tokenize(expression: str) -> List[_Token]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if match is None or match.end() == position:
+            raise FilterSyntaxError(expression, position, "Unexpected character")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "number":
+            value: Any = float(text)
+        elif kind == "string":
+            value = re.sub(r"\\(.)", r"\1", text[1:-1])
+        elif kind == "word" and text.lower() in KEYWORDS:
+            kind, value = "keyword", text.lower()
+        else:
+            value = text
+        tokens.append(_Token(kind, value, match.start(match.lastgroup), text))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent parser of the filter grammar, compiling it to column-wise predicates."""
+
+    def __init__(self, expression: str, fields: Dict[str, str]):
+        self.expression = expression
+        self.fields = fields
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def _peek(self) -> _Token:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return _Token("end", None, len(self.expression), "")
+
+    def _error(self, message: str) -> FilterSyntaxError:
+        return FilterSyntaxError(self.expression, self._peek().position, message)
+
+    def _accept(self, kind: str, value: Any = None) -> bool:
+        token = self._peek()
+        if token.kind == kind and (value is None or token.value == value):
+            self.position += 1
+            return True
+        return False
+
+    def parse(self) -> Predicate:
+        predicate = self._or()
+        if self._peek().kind != "end":
+            raise self._error("Unexpected token")
+        return predicate
+
+    def _or(self) -> Predicate:
+        predicates = [self._and()]
+        while self._accept("keyword", "or"):
+            predicates.append(self._and())
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda batch: [any(values) for values in zip(*(predicate(batch) for predicate in predicates))]
+
+    def _and(self) -> Predicate:
+        predicates = [self._not()]
+        while self._accept("keyword", "and"):
+            predicates.append(self._not())
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda batch: [all(values) for values in zip(*(predicate(batch) for predicate in predicates))]
+
+    def _not(self) -> Predicate:
+        if self._accept("keyword", "not"):
+            predicate = self._not()
+            return lambda batch: [not value for value in predicate(batch)]
+        if self._accept("operator", "("):
+            predicate = self._or()
+            if not self._accept("operator", ")"):
+                raise self._error("Expected ')'")
+            return predicate
+        return self._comparison()
+
+    def _field(self) -> Tuple[str, str, Column]:
+        token = self._peek()
+        name = token.value
+        if token.kind != "word":
+            raise self._error("Expected a field name")
+        if name == "message":
+            self.position += 1
+            return name, "str", lambda batch: batch.messages
+        if name not in self.fields:
+            raise self._error(f"Unknown field {name!r}, expected one of {sorted(self.fields) + ['message']}")
+        self.position += 1
+        return name, self.fields[name], lambda batch: batch.fields[name]
+
+    def _value(self, type: str) -> Any:
+        token = self._peek()
+        if token.kind not in ("number", "string", "word"):
+            raise self._error("Expected a value")
+        if type == "number":
+            if token.kind != "number":
+                raise self._error(f"Expected a number, got {token.text}")
+            self.position += 1
+            return token.value
+        self.position += 1
+        # A number compared with a string column is compared as written
+        return token.text.casefold() if token.kind == "number" else token.value.casefold()
+
+    def _comparison(self) -> Predicate:
+        name, type, column = self._field()
+        if self._accept("keyword", "exists"):
+            if type == "number":
+                return lambda batch: [not math.isnan(value) for value in column(batch)]
+            return lambda batch: [value is not None for value in column(batch)]
+
+        negate = self._accept("keyword", "not")
+        if negate or self._accept("keyword", "in"):
+            if negate and not self._accept("keyword", "in"):
+                raise self._error("Expected 'in'")
+            if not self._accept("operator", "("):
+                raise self._error("Expected '('")
+            values = {self._value(type)}
+            while self._accept("operator", ","):
+                values.add(self._value(type))
+            if not self._accept("operator", ")"):
+                raise self._error("Expected ')'")
+            if type == "number":
+                return lambda batch: [(value in values) != negate and not math.isnan(value) for value in column(batch)]
+            return lambda batch: [value is not None and (value.casefold() in values) != negate for value in column(batch)]
+
+        operator = self._peek().value
+        if self._peek().kind != "operator" or operator not in COMPARISONS:
+            raise self._error("Expected a comparison")
+        self.position += 1
+        if operator in ("~", "!~"):
+            if type == "number":
+                raise self._error(f"Field {name!r} is a number and cannot be matched with {operator}")
+            token = self._peek()
+            if token.kind not in ("string", "word"):
+                raise self._error("Expected a pattern")
+            try:
+                regex = re.compile(token.value, re.IGNORECASE)
+            except re.error as e:
+                raise self._error(f"Invalid pattern: {str(e)}") from None
+            self.position += 1
+            matches = operator == "~"
+            return lambda batch: [value is not None and (regex.search(value) is not None) == matches for value in column(batch)]
+
+        value = self._value(type)
+        if type == "number":
+            # NaN compares false with everything, so events without the field never match
+            compare = {
+                "==": lambda item: item == value, "=": lambda item: item == value,
+                "!=": lambda item: item == item and item != value,
+                ">": lambda item: item > value, ">=": lambda item: item >= value,
+                "<": lambda item: item < value, "<=": lambda item: item <= value,
+            }[operator]
+            return lambda batch: [compare(item) for item in column(batch)]
+        if operator not in ("==", "=", "!="):
+            raise self._error(f"Field {name!r} is a string and cannot be compared with {operator}")
+        equal = operator != "!="
+        return lambda batch: [item is not None and (item.casefold() == value) == equal for item in column(batch)]
+
+
+def compile_filter(expression: str, fields: Dict[str, str]) -> EventFilter:
+    """Compile a filter expression over parsed fields.
+
+    Grammar, with keywords in any case:
+
+        expression := term ("or" term)*
+        term       := factor ("and" factor)*
+        factor     := "not" factor | "(" expression ")" | comparison
+        comparison := field ("==" | "!=" | ">" | ">=" | "<" | "<=") value
+                    | field ["not"] "in" "(" value ("," value)* ")"
+                    | field ("~" | "!~") pattern
+                    | field "exists"
+
+    `message` is the raw message. Values are numbers, quoted strings or
+    bare words; string comparisons ignore case and `~` searches a regular
+    expression. Events missing a field fail every comparison on it, e.g.
+    `level in (ERROR, WARN) or latency_ms > 1000` or `status >= 500 and
+    path ~ "^/api/"`.
+
+    Args:
+        expression: Filter expression
+        fields: Type of each field that may be used, "str" or "number"
+
+    Returns:
+        The compiled filter
+
+    Raises:
+        FilterSyntaxError: If the expression is invalid or uses an unknown field
+    """
+    return EventFilter(expression, _Parser(expression, fields).parse())
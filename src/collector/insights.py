@@ -0,0 +1,298 @@
+import re
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, AsyncIterator, Tuple, Union
+
+try:
+    from utilities.timestamps import parse_timestamp
+    from utilities.circuit_breaker import circuit_breaker
+    from utilities.streaming import concat_async_iterators
+    from utilities.client_pool import ClientPool
+    from utilities.concurrency import AdaptiveConcurrencyLimiter
+    from utilities.aws import get_session
+except ImportError:  # For Local Development
+    from ..utilities.timestamps import parse_timestamp
+    from ..utilities.circuit_breaker import circuit_breaker
+    from ..utilities.streaming import concat_async_iterators
+    from ..utilities.client_pool import ClientPool
+    from ..utilities.concurrency import AdaptiveConcurrencyLimiter
+    from ..utilities.aws import get_session
+
+if TYPE_CHECKING:
+    import aioboto3
+    from mypy_boto3_logs.client import CloudWatchLogsClient
+
+# Constants
+DEFAULT_MAX_CONCURRENT_QUERIES = 10
+DEFAULT_MAX_CONCURRENT_REQUESTS = 5
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_TIMEOUT = 30
+MAX_RESULT_ROWS = 10_000  # Logs Insights caps every query at 10,000 rows
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+QUERY_TIMEOUT = 15 * 60  # Logs Insights stops queries after 15 minutes
+PREFETCH_WINDOWS = 1
+TERMINAL_STATUSES = {"Complete", "Failed", "Cancelled", "Timeout", "Unknown"}
+
+LIMIT_PATTERN = re.compile(r"\|\s*limit\s+\d+", re.IGNORECASE)
+AGGREGATION_PATTERN = re.compile(r"\|\s*stats\b", re.IGNORECASE)
+
+
+logger = logging.getLogger(__name__)
+
+
+class CloudwatchInsightsCollector:
+    """A class to query logs with CloudWatch Logs Insights.
+
+    Filtering, parsing and aggregation run on the AWS side, so only matching
+    rows are transferred. A query over a window that hits the 10,000-row
+    result cap is split in two halves that are queried concurrently, until
+    every window returns fewer rows than the cap.
+
+        async with CloudwatchInsightsCollector() as collector:
+            rows = await collector.query_logs(
+                log_group_name,
+                "fields @timestamp, @message | filter @message like /ERROR/",
+                start_time,
+                end_time
+            )
+    """
+
+    def __init__(
+        self,
+        profile_name: Optional[str] = None,
+        max_concurrent_queries: int = DEFAULT_MAX_CONCURRENT_QUERIES,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        session: Optional["aioboto3.Session"] = None
+    ):
+        """Initialize the CloudwatchInsightsCollector.
+
+        Args:
+            profile_name: AWS profile name to use for authentication.
+                          For production use, set to None, then use IAM Role or Instance Profile.
+            max_concurrent_queries: Maximum number of queries running at once. Keep it
+                                    below the account's concurrent Logs Insights query quota.
+            max_concurrent_requests: Initial number of concurrent API requests for
+                                     starting and polling queries
+            session: aioboto3 session to create clients from. Defaults to the shared session of `profile_name`.
+        """
+        self.session = session or get_session(profile_name)
+        self.client_pool = ClientPool(self.session, max_pool_connections=max_concurrent_queries)
+        self.limiter = AdaptiveConcurrencyLimiter(
+            max_concurrent_requests,
+            max_limit=max_concurrent_queries,
+            name="insights"
+        )
+        self.query_semaphore = asyncio.Semaphore(max_concurrent_queries)
+
+    async def __aenter__(self) -> "CloudwatchInsightsCollector":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the shared CloudWatch Logs client."""
+        await self.client_pool.close()
+
+    @circuit_breaker(
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        timeout=DEFAULT_TIMEOUT,
+        error_message="Failed to start Logs Insights query",
+        operation="StartQuery"
+    )
+    async def _start_query(
+        self,
+        client: "CloudWatchLogsClient",
+        log_group_names: List[str],
+        query_string: str,
+        start_s: int,
+        end_s: int
+    ) -> str:
+        """Start a query and return its id.
+
+        Args:
+            client: CloudWatch Logs client
+            log_group_names: Names of the log groups to query
+            query_string: Logs Insights query
+            start_s: Start time in seconds, inclusive
+            end_s: End time in seconds, inclusive
+
+        Returns:
+            Query id
+        """
+        async with self.limiter.slot("StartQuery"):
+            response = await client.start_query(
+                logGroupNames=log_group_names,
+                queryString=query_string,
+                startTime=start_s,
+                endTime=end_s,
+                limit=MAX_RESULT_ROWS
+            )
+        return response["queryId"]
+
+    @circuit_breaker(
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        timeout=DEFAULT_TIMEOUT,
+        error_message="Failed to get Logs Insights query results",
+        operation="GetQueryResults"
+    )
+    async def _get_query_results(self, client: "CloudWatchLogsClient", query_id: str) -> Dict[str, Any]:
+        """Fetch the status and current results of a query.
+
+        Args:
+            client: CloudWatch Logs client
+            query_id: Query id
+
+        Returns:
+            Dictionary containing the query status and result rows
+        """
+        async with self.limiter.slot("GetQueryResults"):
+            return await client.get_query_results(queryId=query_id)
+
+    async def _run_query(
+        self,
+        log_group_names: List[str],
+        query_string: str,
+        start_s: int,
+        end_s: int
+    ) -> List[Dict[str, str]]:
+        """Run one query to completion, polling with exponential backoff.
+
+        Args:
+            log_group_names: Names of the log groups to query
+            query_string: Logs Insights query
+            start_s: Start time in seconds, inclusive
+            end_s: End time in seconds, inclusive
+
+        Returns:
+            Result rows as field-to-value dictionaries
+        """
+        async with self.query_semaphore:
+            client = await self.client_pool.get("logs")
+            query_id = await self._start_query(client, log_group_names, query_string, start_s, end_s)
+            poll_interval = MIN_POLL_INTERVAL
+            try:
+                async with asyncio.timeout(QUERY_TIMEOUT):
+                    while True:
+                        await asyncio.sleep(poll_interval)
+                        response = await self._get_query_results(client, query_id)
+                        if response["status"] in TERMINAL_STATUSES:
+                            break
+                        poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
+            except (asyncio.CancelledError, TimeoutError):
+                try:
+                    await client.stop_query(queryId=query_id)
+                except Exception as e:
+                    logger.warning(f"Failed to stop Logs Insights query {query_id}: {str(e)}")
+                raise
+
+        if response["status"] != "Complete":
+            raise RuntimeError(f"Logs Insights query {query_id} ended with status {response['status']}")
+        return [
+            {field["field"]: field["value"] for field in row if field["field"] != "@ptr"}
+            for row in response.get("results", [])
+        ]
+
+    async def _iter_window(
+        self,
+        log_group_names: List[str],
+        query_string: str,
+        start_s: int,
+        end_s: int,
+        splittable: bool
+    ) -> AsyncIterator[List[Dict[str, str]]]:
+        """Yield the rows of a window, bisecting it while results are capped.
+
+        The query slot is released before the halves are queried, so nested
+        splits never wait on their own parent.
+
+        Args:
+            log_group_names: Names of the log groups to query
+            query_string: Logs Insights query
+            start_s: Start time in seconds, inclusive
+            end_s: End time in seconds, inclusive
+            splittable: Whether the query may be split. Aggregations may not.
+
+        Yields:
+            Result rows of the window, earlier sub-windows first
+        """
+        rows = await self._run_query(log_group_names, query_string, start_s, end_s)
+        if len(rows) < MAX_RESULT_ROWS:
+            yield rows
+            return
+        if not splittable or end_s <= start_s:
+            reason = "aggregation queries cannot be split" if not splittable else "window cannot be split further"
+            logger.warning(f"Logs Insights results for [{start_s}, {end_s}] are truncated to {MAX_RESULT_ROWS} rows: {reason}")
+            yield rows
+            return
+
+        del rows
+        middle_s = (start_s + end_s) // 2
+        halves = [
+            self._iter_window(log_group_names, query_string, start_s, middle_s, splittable),
+            self._iter_window(log_group_names, query_string, middle_s + 1, end_s, splittable),
+        ]
+        async for rows in concat_async_iterators(halves, PREFETCH_WINDOWS):
+            yield rows
+
+    async def iter_query(
+        self,
+        log_group_names: Union[str, List[str]],
+        query_string: str,
+        start_time: str,
+        end_time: str
+    ) -> AsyncIterator[List[Dict[str, str]]]:
+        """Yield the rows of a Logs Insights query, one window at a time.
+
+        A `| limit` command is appended when the query has none, since Logs
+        Insights otherwise returns at most 1,000 rows.
+
+        Args:
+            log_group_names: Name or names of the log groups to query
+            query_string: Logs Insights query
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Yields:
+            Lists of result rows as field-to-value dictionaries
+        """
+        if isinstance(log_group_names, str):
+            log_group_names = [log_group_names]
+        if not LIMIT_PATTERN.search(query_string):
+            query_string = f"{query_string} | limit {MAX_RESULT_ROWS}"
+        start_s, end_s = self._window_seconds(start_time, end_time)
+        splittable = not AGGREGATION_PATTERN.search(query_string)
+
+        async for rows in self._iter_window(log_group_names, query_string, start_s, end_s, splittable):
+            yield rows
+
+    async def query_logs(
+        self,
+        log_group_names: Union[str, List[str]],
+        query_string: str,
+        start_time: str,
+        end_time: str
+    ) -> List[Dict[str, str]]:
+        """Run a Logs Insights query and return every result row.
+
+        Args:
+            log_group_names: Name or names of the log groups to query
+            query_string: Logs Insights query
+            start_time: Start time in ISO format
+            end_time: End time in ISO format
+
+        Returns:
+            Result rows as field-to-value dictionaries
+        """
+        all_rows: List[Dict[str, str]] = []
+        async for rows in self.iter_query(log_group_names, query_string, start_time, end_time):
+            all_rows.extend(rows)
+        return all_rows
+
+    @staticmethod
+    def _window_seconds(start_time: str, end_time: str) -> Tuple[int, int]:
+        """Convert an ISO window to the inclusive epoch-second bounds Logs Insights expects."""
+        start_ms = parse_timestamp(start_time)
+        end_ms = parse_timestamp(end_time)
+        return start_ms // 1000, max((end_ms - 1) // 1000, start_ms // 1000)
@@ -1,22 +1,34 @@
 import logging
-import asyncio
+from contextlib import AsyncExitStack
 from .cloudwatch import CloudwatchCollector
 from .athena import AthenaLogsCollector
 from .upload import S3Uploader
-from typing import Optional
+from .pipeline import LogPipeline, DEFAULT_ENCODE_WORKERS, DEFAULT_UPLOAD_WORKERS, DEFAULT_QUEUE_SIZE, DEFAULT_PROGRESS_INTERVAL
+from .checkpoint import CheckpointStore
+from .parsing import MessageParser
+from typing import TYPE_CHECKING, Optional, List, Tuple, Dict, Any
 
+try:
+    from utilities.metrics import MetricsSink, disable_metrics, enable_metrics, format_summary, get_metrics, summarize
+    from utilities.rate_limit import TokenBucket
+    from utilities.aws import get_session
+except ImportError:  # For Local Development
+    from ..utilities.metrics import MetricsSink, disable_metrics, enable_metrics, format_summary, get_metrics, summarize
+    from ..utilities.rate_limit import TokenBucket
+    from ..utilities.aws import get_session
+
+if TYPE_CHECKING:
+    import aioboto3
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
 logger = logging.getLogger(__name__)
 
 
 class ShiroSightRunner:
     """
-    This class is used to collect logs from CloudWatch and Athena and upload them to S3.
+    This class is used to collect logs from CloudWatch and upload them to S3, then optionally query them through Athena.
+    Collection, serialization and upload run as an overlapped `LogPipeline` with bounded queues
+    between the stages, so logs never have to fit in memory. Athena reads the collected logs
+    table, so its results stay in the Athena bucket and are never uploaded as collected logs again.
     """
 
     def __init__(
@@ -27,6 +39,15 @@ class ShiroSightRunner:
             athena_s3_prefix: Optional[str] = None,
             collected_logs_s3_bucket: Optional[str] = None,
             profile_name: Optional[str] = None,
+            checkpoint_store: Optional[CheckpointStore] = None,
+            session: Optional["aioboto3.Session"] = None,
+            metrics_sinks: Optional[List[MetricsSink]] = None,
+            encode_workers: int = DEFAULT_ENCODE_WORKERS,
+            upload_workers: int = DEFAULT_UPLOAD_WORKERS,
+            queue_size: int = DEFAULT_QUEUE_SIZE,
+            progress_interval: Optional[float] = DEFAULT_PROGRESS_INTERVAL,
+            rate_limiter: Optional[TokenBucket] = None,
+            message_parser: Optional[MessageParser] = None,
             ):
         """
         Initialize the ShiroSightRunner.
@@ -38,18 +59,50 @@ class ShiroSightRunner:
             athena_s3_prefix (Optional[str], optional): S3 prefix for Athena logs. Defaults to None.
             collected_logs_s3_bucket (Optional[str], optional): S3 bucket for collected logs. Defaults to None.
             profile_name (Optional[str], optional): IAM SSO Profile name for local development. Defaults to None. Using IAM Access Key is not supported.
+            checkpoint_store (Optional[CheckpointStore], optional): Store for per-stream CloudWatch checkpoints. Required for incremental runs. Defaults to None.
+            session (Optional[aioboto3.Session], optional): aioboto3 session shared by the collectors and the uploader. Defaults to the shared session of profile_name.
+            metrics_sinks (Optional[List[MetricsSink]], optional): Sinks every run's metrics are exported to. Metrics are only recorded when this is set; pass an empty list to only compute `metrics_summary`. Defaults to None.
+            encode_workers (int, optional): Threads serializing and compressing pages. Defaults to 2.
+            upload_workers (int, optional): Tasks writing compressed chunks to S3. Defaults to 4.
+            queue_size (int, optional): Capacity of the queues between pipeline stages. Defaults to 64.
+            progress_interval (Optional[float], optional): Seconds between progress log lines. None disables them. Defaults to 10.
+            rate_limiter (Optional[TokenBucket], optional): CloudWatch Logs API rate budget shared with other runners of the same account and region. Defaults to None.
+            message_parser (Optional[MessageParser], optional): Parses messages into typed fields and drops the events its filter rejects before upload, e.g. `MessageParser(where="level in (ERROR, WARN)")`. Defaults to None.
         """
-        self.cloudwatch_collector = CloudwatchCollector(profile_name, max_concurrent_requests)
+        session = session or get_session(profile_name)
+        self.cloudwatch_collector = CloudwatchCollector(
+            profile_name,
+            max_concurrent_requests,
+            checkpoint_store=checkpoint_store,
+            session=session,
+            rate_limiter=rate_limiter
+        )
         self.collect_athena_logs = collect_athena_logs
         if collect_athena_logs:
-            self.athena_collector = AthenaLogsCollector(profile_name, max_concurrent_requests, athena_s3_bucket, athena_s3_prefix)
+            self.athena_collector = AthenaLogsCollector(
+                profile_name,
+                max_concurrent_requests,
+                athena_s3_bucket,
+                athena_s3_prefix,
+                session=session
+            )
             self.athena_s3_bucket = athena_s3_bucket
             self.athena_s3_prefix = athena_s3_prefix
         else:
             self.athena_collector = None
             self.athena_s3_bucket = None
             self.athena_s3_prefix = None
-        self.s3_uploader = S3Uploader(profile_name, collected_logs_s3_bucket)
+        self.s3_uploader = S3Uploader(profile_name, collected_logs_s3_bucket, session=session)
+        self.pipeline = LogPipeline(
+            self.s3_uploader,
+            encode_workers=encode_workers,
+            upload_workers=upload_workers,
+            queue_size=queue_size,
+            progress_interval=progress_interval,
+            parser=message_parser
+        )
+        self.metrics_sinks = metrics_sinks
+        self.metrics_summary: Optional[Dict[str, Any]] = None
         self.__post_init__()
 
     def __post_init__(self):
@@ -71,20 +124,77 @@ class ShiroSightRunner:
             self,
             log_group_name: str,
             start_time: Optional[str] = None,
-            end_time: Optional[str] = None
-            ):
-        tasks = [
-            self.cloudwatch_collector.collect_logs(log_group_name, start_time, end_time),
-        ]
-        if self.athena_collector:
-            tasks.append(self.athena_collector.collect_logs(log_group_name, start_time, end_time))
-        tasks.append(self.s3_uploader.upload_logs(log_group_name, start_time, end_time))
-        
-        results = await asyncio.gather(*tasks)
-        
-        cloudwatch_logs = results[0]
-        athena_logs = results[1] if self.athena_collector else None
-        s3_result_index = 2 if self.athena_collector else 1
-        s3_logs = results[s3_result_index]
-        
-        return cloudwatch_logs, athena_logs, s3_logs
\ No newline at end of file
+            end_time: Optional[str] = None,
+            incremental: bool = False
+            ) -> Tuple[List[str], Optional[List[str]]]:
+        """
+        Collect logs of a log group and stream them into S3 as they are fetched.
+
+        Args:
+            log_group_name (str): Name of the log group.
+            start_time (Optional[str], optional): Start time in ISO format. Defaults to None.
+            end_time (Optional[str], optional): End time in ISO format. Defaults to None.
+            incremental (bool, optional): Only collect CloudWatch events after the stored checkpoints. Defaults to False.
+
+        Returns:
+            Tuple[List[str], Optional[List[str]]]: S3 keys of the uploaded CloudWatch logs, and of the
+            Athena query results in athena_s3_bucket or None when Athena collection is disabled.
+
+        Raises:
+            ValueError: If Athena collection is enabled and start_time or end_time is missing.
+        """
+        if self.athena_collector and (start_time is None or end_time is None):
+            # Athena queries are pruned to the partitions in range, so they need both bounds
+            raise ValueError("start_time and end_time are required when collect_athena_logs is True")
+        if self.metrics_sinks is None:
+            return await self._run(log_group_name, start_time, end_time, incremental)
+
+        # Record into a registry that is already active, e.g. one shared by several runs
+        registry = get_metrics()
+        owns_registry = not registry.enabled
+        if owns_registry:
+            registry = enable_metrics()
+        try:
+            return await self._run(log_group_name, start_time, end_time, incremental)
+        finally:
+            if owns_registry:
+                disable_metrics()
+            snapshot = registry.snapshot()
+            self.metrics_summary = summarize(snapshot)
+            logger.info(f"Run summary for {log_group_name}:\n{format_summary(self.metrics_summary)}")
+            for sink in self.metrics_sinks:
+                try:
+                    sink.export(snapshot)
+                except Exception as e:
+                    logger.error(f"Failed to export metrics to {type(sink).__name__}: {str(e)}")
+
+    async def _run(
+            self,
+            log_group_name: str,
+            start_time: Optional[str],
+            end_time: Optional[str],
+            incremental: bool
+            ) -> Tuple[List[str], Optional[List[str]]]:
+        # Checkpoints advance as the pipeline uploads pages, not as the collector yields them
+        checkpoints = {}
+        tracker = await self.cloudwatch_collector.checkpoint_tracker(log_group_name)
+        if tracker is not None:
+            checkpoints["cloudwatch"] = tracker
+        sources = {
+            "cloudwatch": self.cloudwatch_collector.stream_logs(
+                log_group_name, start_time, end_time, incremental=incremental, commit_checkpoints=False
+            ),
+        }
+
+        athena_keys = None
+        async with AsyncExitStack() as stack:
+            await stack.enter_async_context(self.cloudwatch_collector)
+            if self.athena_collector:
+                await stack.enter_async_context(self.athena_collector)
+            await stack.enter_async_context(self.s3_uploader)
+            keys = await self.pipeline.run(log_group_name, sources, checkpoints)
+            if self.athena_collector:
+                # Queried after the upload, so the results include this run's logs
+                athena_keys = await self.athena_collector.query_logs(log_group_name, start_time, end_time)
+
+        return keys["cloudwatch"], athena_keys
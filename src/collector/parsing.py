@@ -0,0 +1,258 @@
+import re
+import json
+import logging
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from .types import LogBatch
+from .filters import EventFilter, compile_filter
+
+try:
+    import orjson
+except ImportError:  # The standard json module is used without orjson
+    orjson = None
+
+try:
+    from utilities.metrics import get_metrics
+except ImportError:  # For Local Development
+    from ..utilities.metrics import get_metrics
+
+
+# Constants
+DEFAULT_SAMPLE_SIZE = 16
+FORMATS = ("json", "access", "logfmt", "text")  # Detection order, which also breaks ties
+MIN_LOGFMT_PAIRS = 2
+MISSING = float("nan")
+
+# Common and combined access logs, optionally followed by the request time in seconds (nginx $request_time)
+ACCESS_PATTERN = re.compile(
+    r'(?P<remote_addr>\S+) \S+ (?P<remote_user>\S+) \[(?P<time>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<path>\S+)(?: (?P<protocol>[^"]*))?" (?P<status>\d{3}) (?P<bytes>\d+|-)'
+    r'(?: "(?P<referer>[^"]*)" "(?P<user_agent>[^"]*)")?(?: (?P<request_time>\d+(?:\.\d+)?))?'
+)
+LOGFMT_PATTERN = re.compile(r'([A-Za-z_][\w.\-]*)=("(?:[^"\\]|\\.)*"|[^\s"]*)')
+LEVEL_PATTERN = re.compile(r"\b(TRACE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR|FATAL|CRITICAL|PANIC)\b")
+NUMBER_PATTERN = re.compile(r"\s*-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+
+
+logger = logging.getLogger(__name__)
+
+
+if orjson is not None:
+    _loads: Callable[[str], Any] = orjson.loads
+else:
+    _loads = json.loads
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """A field to extract from messages into a typed column.
+
+    `keys` are tried in order. A dotted key is looked up as is first, then
+    as a path into nested JSON objects, e.g. "http.status_code".
+    """
+    name: str
+    keys: Tuple[str, ...]
+    type: str = "str"  # "str" or "number"
+
+    def __post_init__(self):
+        if self.type not in ("str", "number"):
+            raise ValueError(f"Unsupported field type: {self.type}")
+
+
+DEFAULT_FIELDS = (
+    FieldSpec("level", ("level", "severity", "lvl", "levelname", "log.level", "loglevel")),
+    FieldSpec("status", ("status", "status_code", "statusCode", "http.status_code", "http.status"), "number"),
+    FieldSpec("latency_ms", ("latency_ms", "duration_ms", "elapsed_ms", "took_ms", "response_time_ms", "took"), "number"),
+    FieldSpec("path", ("path", "url", "uri", "http.path", "request_uri")),
+)
+
+
+def _number(value: Any) -> float:
+    """Convert a field value to a number, reading the leading number of strings such as "12ms". NaN if there is none."""
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = NUMBER_PATTERN.match(value)
+        if match:
+            return float(match.group())
+    return MISSING
+
+
+def _lookup(record: Dict[str, Any], key: str) -> Any:
+    value = record.get(key)
+    if value is not None or "." not in key:
+        return value
+    for part in key.split("."):
+        if not isinstance(record, dict):
+            return None
+        record = record.get(part)
+    return record
+
+
+def parse_json(message: str) -> Optional[Dict[str, Any]]:
+    """Decode a JSON object message, with orjson when it is installed. None if it is not one."""
+    try:
+        record = _loads(message)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def parse_logfmt(message: str) -> Optional[Dict[str, Any]]:
+    """Read the key=value pairs of a message. None if it has fewer than `MIN_LOGFMT_PAIRS`."""
+    pairs = LOGFMT_PATTERN.findall(message)
+    if len(pairs) < MIN_LOGFMT_PAIRS:
+        return None
+    return {key: value[1:-1].replace('\\"', '"') if value.startswith('"') else value for key, value in pairs}
+
+
+def parse_access(message: str) -> Optional[Dict[str, Any]]:
+    """Read the fields of a common or combined access log line. None if it is not one."""
+    match = ACCESS_PATTERN.match(message)
+    if match is None:
+        return None
+    record = {key: value for key, value in match.groupdict().items() if value is not None}
+    if "request_time" in record:
+        record["latency_ms"] = float(record["request_time"]) * 1000
+    return record
+
+
+PARSERS: Dict[str, Callable[[str], Optional[Dict[str, Any]]]] = {
+    "json": parse_json,
+    "access": parse_access,
+    "logfmt": parse_logfmt,
+}
+
+
+def detect_format(messages: Sequence[str], sample_size: int = DEFAULT_SAMPLE_SIZE) -> str:
+    """Detect the format of a batch's messages from an evenly spread sample.
+
+    Args:
+        messages: Messages of the batch
+        sample_size: Number of messages to try
+
+    Returns:
+        "json", "access", "logfmt" or "text", whichever parses the most sampled messages
+    """
+    if not messages:
+        return "text"
+    step = max(len(messages) // sample_size, 1)
+    votes: Counter = Counter()
+    for message in messages[::step][:sample_size]:
+        stripped = message.strip()
+        if stripped.startswith("{") and parse_json(stripped) is not None:
+            votes["json"] += 1
+        elif parse_access(stripped) is not None:
+            votes["access"] += 1
+        elif parse_logfmt(stripped) is not None:
+            votes["logfmt"] += 1
+        else:
+            votes["text"] += 1
+    return max(FORMATS, key=lambda name: (votes[name], -FORMATS.index(name)))
+
+
+class MessageParser:
+    """Parses log messages into typed columns and drops the events a filter rejects.
+
+    The format of each batch is detected once from a sample, then every
+    message is parsed with that format's parser; messages it cannot parse,
+    such as a stack trace among JSON lines, only get their level, read from
+    a level word in the text. Configured fields are extracted into typed
+    columns on the batch (`LogBatch.fields`), where a filter expression
+    such as `level in (ERROR, WARN) and latency_ms > 1000` is evaluated
+    column by column. See `compile_filter` for its syntax.
+
+    Usage:
+        parser = MessageParser(where="level in (ERROR, WARN) or status >= 500")
+        page = parser.apply(page)
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[FieldSpec] = DEFAULT_FIELDS,
+        where: Optional[str] = None,
+        sample_size: int = DEFAULT_SAMPLE_SIZE
+    ):
+        """Initialize the MessageParser.
+
+        Args:
+            fields: Fields to extract into typed columns
+            where: Filter expression on the fields and `message`. None keeps every event.
+            sample_size: Number of messages format detection tries per batch
+        """
+        self.fields = tuple(fields)
+        self.sample_size = sample_size
+        self.filter: Optional[EventFilter] = compile_filter(where, {spec.name: spec.type for spec in self.fields}) if where else None
+
+    def parse(self, batch: LogBatch) -> LogBatch:
+        """Extract the configured fields of a batch into typed columns, in place.
+
+        Returns:
+            The batch
+        """
+        messages = batch.messages
+        format = detect_format(messages, self.sample_size)
+        parse = PARSERS.get(format)
+        records: List[Optional[Dict[str, Any]]]
+        if parse is None:
+            records = [None] * len(messages)
+        elif format == "json":
+            records = [parse(message) if message.lstrip().startswith("{") else None for message in messages]
+        else:
+            records = [parse(message) for message in messages]
+
+        columns: Dict[str, Any] = {}
+        for spec in self.fields:
+            values = [self._extract(record, spec) if record is not None else None for record in records]
+            if spec.name == "level":
+                # Unparsed messages fall back to a level word in the text, e.g. "2024-01-01 12:00:00 ERROR Timed out"
+                values = [
+                    self._level(message) if record is None else value
+                    for value, record, message in zip(values, records, messages)
+                ]
+            if spec.type == "number":
+                columns[spec.name] = array("d", (_number(value) if value is not None else MISSING for value in values))
+            else:
+                columns[spec.name] = [str(value) if value is not None else None for value in values]
+        batch.fields = columns
+
+        metrics = get_metrics()
+        if metrics.enabled:
+            metrics.increment("collector_parsed_events_total", len(batch), format=format)
+            unparsed = records.count(None) if parse is not None else 0
+            if unparsed:
+                metrics.increment("collector_unparsed_events_total", unparsed, format=format)
+        return batch
+
+    @staticmethod
+    def _extract(record: Dict[str, Any], spec: FieldSpec) -> Any:
+        for key in spec.keys:
+            value = _lookup(record, key)
+            if value is not None:
+                return value
+        return None
+
+    @staticmethod
+    def _level(message: str) -> Optional[str]:
+        match = LEVEL_PATTERN.search(message)
+        return match.group(1) if match else None
+
+    def apply(self, batch: LogBatch) -> LogBatch:
+        """Parse a batch and keep the events the filter accepts.
+
+        Returns:
+            The batch itself if every event is kept, otherwise a new batch of the kept events
+        """
+        self.parse(batch)
+        if self.filter is None:
+            return batch
+        keep = self.filter.evaluate(batch)
+        kept = [index for index, accepted in enumerate(keep) if accepted]
+        dropped = len(batch) - len(kept)
+        if dropped:
+            get_metrics().increment("collector_filtered_events_total", dropped, log_group=batch.log_group_name)
+        return batch.take(kept) if dropped else batch
@@ -0,0 +1,336 @@
+import time
+import zlib
+import asyncio
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Deque, AsyncIterable, Callable, Any, Tuple
+from .types import LogBatch
+from .parsing import MessageParser
+from .checkpoint import Checkpoint, CheckpointTracker, checkpoint_after
+from .upload import S3Uploader, PartitionedObjectWriter
+
+try:
+    from utilities.metrics import get_metrics
+except ImportError:  # For Local Development
+    from ..utilities.metrics import get_metrics
+
+
+# Constants
+DEFAULT_ENCODE_WORKERS = 2
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class PipelineProgress:
+    """End-to-end progress of a pipeline run, updated by every stage."""
+    started: float = field(default_factory=time.monotonic)
+    pages_collected: int = 0
+    events_collected: int = 0
+    events_filtered: int = 0
+    pages_encoded: int = 0
+    chunks_uploaded: int = 0
+    bytes_encoded: int = 0
+    objects_uploaded: int = 0
+    encode_queue_depth: int = 0
+    upload_queue_depth: int = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events_collected / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.events_collected} events in {self.pages_collected} pages collected, "
+            f"{self.events_filtered} filtered out, "
+            f"{self.pages_encoded} pages encoded ({self.bytes_encoded} bytes), "
+            f"{self.chunks_uploaded} chunks written to {self.objects_uploaded} finished objects, "
+            f"queues {self.encode_queue_depth}/{self.upload_queue_depth}, "
+            f"{self.events_per_second:.0f} events/s over {self.elapsed:.1f}s"
+        )
+
+
+class _PendingPage:
+    """Position past a collected page, committed once every chunk of the page is in an uploaded object."""
+    __slots__ = ("checkpoint", "chunks")
+
+    def __init__(self, checkpoint: Checkpoint):
+        self.checkpoint = checkpoint
+        self.chunks: Optional[int] = None  # Unknown until the page is encoded
+
+
+class _CheckpointCommitter:
+    """Commits the checkpoints of one source as the pages behind them are uploaded.
+
+    Chunks of a page go to several objects, finished in any order. A
+    stream's checkpoint only moves past a page once that page and every
+    page collected before it from the same stream are uploaded.
+    """
+
+    def __init__(self, tracker: CheckpointTracker):
+        self.tracker = tracker
+        self._pending: Dict[str, Deque[_PendingPage]] = defaultdict(deque)
+
+    def collected(self, page: LogBatch) -> _PendingPage:
+        pending = _PendingPage(checkpoint_after(self.tracker.log_group_name, page))
+        self._pending[page.log_stream_name].append(pending)
+        return pending
+
+    async def encoded(self, pending: _PendingPage, chunks: int) -> None:
+        pending.chunks = chunks
+        if not chunks:
+            await self._commit(pending.checkpoint.log_stream_name)
+
+    async def uploaded(self, pending: _PendingPage) -> None:
+        pending.chunks -= 1
+        if not pending.chunks:
+            await self._commit(pending.checkpoint.log_stream_name)
+
+    async def _commit(self, log_stream_name: str) -> None:
+        pending = self._pending[log_stream_name]
+        checkpoint = None
+        while pending and pending[0].chunks == 0:
+            checkpoint = pending.popleft().checkpoint
+        if checkpoint is not None:
+            await self.tracker.update(checkpoint)
+
+
+class LogPipeline:
+    """Overlaps collection, serialization and upload of log pages.
+
+    Pages flow through three stages connected by bounded queues:
+
+        collectors -> encode queue -> encode workers -> upload queues -> upload workers
+
+    Collection runs as one task per source, with its own request
+    concurrency. Encode workers serialize and compress pages in a thread
+    pool; zlib, zstandard and pyarrow release the GIL while compressing, so
+    threads run in parallel. Upload workers append chunks to S3 objects.
+    Every partition is routed to one upload worker, so each object is
+    written by a single task in the order its chunks arrive. The queues
+    apply backpressure: a slow stage pauses the stages before it instead of
+    buffering pages in memory, and wall-clock time approaches that of the
+    slowest stage. With a `parser`, encode workers also parse messages and
+    drop the events its filter rejects before serializing, so filtered
+    events cost neither upload bytes nor analysis downstream.
+
+    With a checkpoint tracker for a source, a stream's checkpoint is only
+    advanced past a page once the objects holding the page are uploaded,
+    and saved at the end of a successful run. A failed run saves nothing
+    the run did not upload, so the next incremental run collects it again.
+
+    Usage:
+        pipeline = LogPipeline(uploader, encode_workers=4, upload_workers=4)
+        keys = await pipeline.run(log_group_name, {"cloudwatch": collector.stream_logs(log_group_name)})
+    """
+
+    def __init__(
+        self,
+        uploader: S3Uploader,
+        encode_workers: int = DEFAULT_ENCODE_WORKERS,
+        upload_workers: int = DEFAULT_UPLOAD_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        progress_interval: Optional[float] = DEFAULT_PROGRESS_INTERVAL,
+        on_progress: Optional[Callable[[PipelineProgress], None]] = None,
+        parser: Optional[MessageParser] = None
+    ):
+        """Initialize the LogPipeline.
+
+        Args:
+            uploader: Uploader providing the output format and S3 client
+            encode_workers: Number of threads serializing and compressing pages
+            upload_workers: Number of tasks writing chunks to S3 objects
+            queue_size: Capacity of each queue between stages, in pages or chunks
+            progress_interval: Seconds between progress reports. None disables them.
+            on_progress: Called with the progress at every report and at the end.
+                         Defaults to logging it.
+            parser: Parses messages and filters events before they are encoded. None uploads every event as is.
+        """
+        self.uploader = uploader
+        self.encode_workers = max(encode_workers, 1)
+        self.upload_workers = max(upload_workers, 1)
+        self.queue_size = max(queue_size, 1)
+        self.progress_interval = progress_interval
+        self.on_progress = on_progress or (lambda progress: logger.info(f"Progress: {progress}"))
+        self.parser = parser
+        self.progress = PipelineProgress()
+
+    async def run(
+        self,
+        log_group_name: str,
+        sources: Dict[str, AsyncIterable[LogBatch]],
+        checkpoints: Optional[Dict[str, CheckpointTracker]] = None
+    ) -> Dict[str, List[str]]:
+        """Collect, encode and upload the pages of every source.
+
+        If any stage fails, the others are cancelled, open multipart uploads
+        are aborted and the error is raised.
+
+        Args:
+            log_group_name: Name of the log group, used in log messages
+            sources: Page iterators keyed by source name, e.g. "cloudwatch"
+            checkpoints: Trackers keyed by source name, advanced as pages are uploaded. The
+                         sources must not advance them themselves, e.g. `stream_logs` is
+                         called with `commit_checkpoints=False`.
+
+        Returns:
+            Keys of the uploaded objects, keyed by source name
+        """
+        self.progress = PipelineProgress()
+        encode_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        upload_queues: List[asyncio.Queue] = [asyncio.Queue(self.queue_size) for _ in range(self.upload_workers)]
+        object_keys = {source: self.uploader.object_keys(source) for source in sources}
+        uploaded: Dict[str, List[str]] = {source: [] for source in sources}
+        committers = {source: _CheckpointCommitter(tracker) for source, tracker in (checkpoints or {}).items()}
+
+        with ThreadPoolExecutor(self.encode_workers, thread_name_prefix="shirosight-encode") as executor:
+            reporter = asyncio.create_task(self._report(encode_queue, upload_queues)) if self.progress_interval else None
+            try:
+                async with asyncio.TaskGroup() as group:
+                    collectors = [
+                        group.create_task(self._collect(source, pages, encode_queue, committers.get(source)))
+                        for source, pages in sources.items()
+                    ]
+                    encoders = [
+                        group.create_task(self._encode(encode_queue, upload_queues, executor, committers))
+                        for _ in range(self.encode_workers)
+                    ]
+                    for queue in upload_queues:
+                        group.create_task(self._upload(queue, object_keys, uploaded, committers))
+                    group.create_task(self._close_stage(collectors, [encode_queue] * self.encode_workers))
+                    group.create_task(self._close_stage(encoders, upload_queues))
+            except BaseExceptionGroup as e:
+                # Raise the failure itself rather than the group, as a sequential run would
+                raise e.exceptions[0] from None
+            finally:
+                if reporter is not None:
+                    reporter.cancel()
+
+        for committer in committers.values():
+            await committer.tracker.flush()
+        self._update_queue_depths(encode_queue, upload_queues)
+        self.on_progress(self.progress)
+        for source, keys in uploaded.items():
+            logger.info(f"Uploaded {len(keys)} objects for {log_group_name} to s3://{self.uploader.bucket_name}/{self.uploader.prefix}/source={source}/")
+        return uploaded
+
+    async def _collect(
+        self,
+        source: str,
+        pages: AsyncIterable[LogBatch],
+        encode_queue: asyncio.Queue,
+        committer: Optional[_CheckpointCommitter]
+    ) -> None:
+        try:
+            async for page in pages:
+                self.progress.pages_collected += 1
+                self.progress.events_collected += len(page)
+                pending = committer.collected(page) if committer is not None and len(page) else None
+                await encode_queue.put((source, page, pending))
+        finally:
+            # Close the iterator now, so it releases its clients even when another stage failed
+            aclose = getattr(pages, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def _encode(
+        self,
+        encode_queue: asyncio.Queue,
+        upload_queues: List[asyncio.Queue],
+        executor: ThreadPoolExecutor,
+        committers: Dict[str, _CheckpointCommitter]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        while True:
+            item = await encode_queue.get()
+            if item is _DONE:
+                return
+            source, page, pending = item
+            with metrics.timer("upload_encode_seconds", source=source):
+                kept, chunks = await loop.run_in_executor(executor, self._prepare, page)
+            self.progress.events_filtered += len(page) - kept
+            self.progress.pages_encoded += 1
+            if pending is not None:
+                # Set before any chunk is queued, so uploads cannot count down past it
+                await committers[source].encoded(pending, len(chunks))
+            for partition, chunk in chunks.items():
+                if isinstance(chunk, bytes):
+                    self.progress.bytes_encoded += len(chunk)
+                worker = zlib.crc32(f"{source}/{partition}".encode("utf-8")) % len(upload_queues)
+                await upload_queues[worker].put((source, partition, chunk, pending))
+
+    def _prepare(self, page: LogBatch) -> Tuple[int, Dict[str, Any]]:
+        """Parse and filter a page, then encode what is left. Runs in an encode thread."""
+        if self.parser is not None:
+            page = self.parser.apply(page)
+            if not len(page):
+                return 0, {}
+        return len(page), self.uploader.prepare(page)
+
+    async def _upload(
+        self,
+        upload_queue: asyncio.Queue,
+        object_keys: Dict[str, Callable[[str], str]],
+        uploaded: Dict[str, List[str]],
+        committers: Dict[str, _CheckpointCommitter]
+    ) -> None:
+        writers: Dict[str, PartitionedObjectWriter] = {}
+        try:
+            while True:
+                item = await upload_queue.get()
+                if item is _DONE:
+                    break
+                source, partition, chunk, pending = item
+                writer = writers.get(source)
+                if writer is None:
+                    writer = writers[source] = await self.uploader.writer(source, object_keys[source])
+                finished = len(writer.uploaded)
+                await writer.write(partition, chunk, pending)
+                self.progress.chunks_uploaded += 1
+                self.progress.objects_uploaded += len(writer.uploaded) - finished
+                await self._commit(writer, committers.get(source))
+            for source, writer in writers.items():
+                finished = len(writer.uploaded)
+                uploaded[source].extend(await writer.close())
+                self.progress.objects_uploaded += len(writer.uploaded) - finished
+                await self._commit(writer, committers.get(source))
+        except BaseException:
+            await asyncio.gather(*(writer.abort() for writer in writers.values()), return_exceptions=True)
+            raise
+
+    @staticmethod
+    async def _commit(writer: PartitionedObjectWriter, committer: Optional[_CheckpointCommitter]) -> None:
+        """Count down the pages of the objects the writer finished."""
+        completed, writer.completed = writer.completed, []
+        for pending in completed:
+            await committer.uploaded(pending)
+
+    @staticmethod
+    async def _close_stage(workers: List[asyncio.Task], next_queues: List[asyncio.Queue]) -> None:
+        """Once every worker of a stage is done, tell each consumer of the next stage to stop."""
+        await asyncio.gather(*workers)
+        for queue in next_queues:
+            await queue.put(_DONE)
+
+    def _update_queue_depths(self, encode_queue: asyncio.Queue, upload_queues: List[asyncio.Queue]) -> None:
+        self.progress.encode_queue_depth = encode_queue.qsize()
+        self.progress.upload_queue_depth = sum(queue.qsize() for queue in upload_queues)
+
+    async def _report(self, encode_queue: asyncio.Queue, upload_queues: List[asyncio.Queue]) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._update_queue_depths(encode_queue, upload_queues)
+            self.on_progress(self.progress)
@@ -1,55 +1,310 @@
-from dataclasses import dataclass
-from datetime import datetime, timezone
-import re
+from array import array
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from .exceptions import CloudWatchTimestampError
 
+if TYPE_CHECKING:
+    import pyarrow as pa
 
-@dataclass
-class BaseDataclass:
-    def validate_timestamps(self, *timestamp_fields: str):
-        for field in timestamp_fields:
-            timestamp_ms = getattr(self, field)
-            if not isinstance(timestamp_ms, int):
-                raise CloudWatchTimestampError(
-                    timestamp_ms,
-                    f"Timestamp must be an integer (milliseconds since epoch)."
-                )
-            try:
-                # Convert milliseconds to seconds for fromtimestamp
-                dt = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
-                # Format to ISO 8601 with milliseconds
-                iso_format = dt.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
-                # Validate ISO 8601 format more strictly for CloudWatch timestamps (milliseconds)
-                if not re.match(
-                    r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z$',
-                    iso_format
-                ):
-                    raise CloudWatchTimestampError(
-                        getattr(self, field),
-                        f"Invalid ISO 8601 format with milliseconds: {iso_format}"
-                    )
-            except (ValueError, OSError) as e:
-                raise CloudWatchTimestampError(
-                    getattr(self, field),
-                    f"Failed to convert timestamp to ISO 8601: {str(e)}"
-                )
-
-
-# Type definitions
-@dataclass
-class LogStream(BaseDataclass):
-    logStreamName: str
-    lastEventTime: int # Milliseconds since epoch
-
-    def __post_init__(self):
-        self.validate_timestamps('lastEventTime')
-
-
-@dataclass
-class LogEvent(BaseDataclass):
-    timestamp: int # Milliseconds since epoch
-    message: str
-    eventId: str
-
-    def __post_init__(self):
-        self.validate_timestamps('timestamp')
+
+# Valid CloudWatch timestamps: milliseconds between the epoch and the end of year 9999
+MIN_TIMESTAMP_MS = 0
+MAX_TIMESTAMP_MS = 253402300799999
+
+
+def load_pyarrow(feature: str) -> Tuple[Any, Any]:
+    """Import pyarrow and pyarrow.parquet on first use.
+
+    pyarrow takes longer to import than the rest of the collector, and only
+    Arrow and Parquet output need it, so it is not imported with the module.
+
+    Args:
+        feature: What needs pyarrow, for the error message
+
+    Returns:
+        The pyarrow and pyarrow.parquet modules
+
+    Raises:
+        ImportError: If pyarrow is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(f"{feature} requires the pyarrow package") from None
+    return pyarrow, pyarrow.parquet
+
+
+def validate_timestamps(timestamps: Sequence[int], field: str = "timestamp") -> None:
+    """Check a whole column of millisecond timestamps with a single min/max range check.
+
+    Args:
+        timestamps: Timestamps in milliseconds since epoch
+        field: Name of the column, used in error messages
+
+    Raises:
+        CloudWatchTimestampError: If any timestamp is outside the valid range
+    """
+    if not timestamps:
+        return
+    lowest, highest = min(timestamps), max(timestamps)
+    if lowest < MIN_TIMESTAMP_MS:
+        raise CloudWatchTimestampError(lowest, f"{field} is before the epoch.")
+    if highest > MAX_TIMESTAMP_MS:
+        raise CloudWatchTimestampError(highest, f"{field} is after year 9999.")
+
+
+def _int64_column(values: List[Any], field: str) -> array:
+    try:
+        return array("q", values)
+    except (TypeError, OverflowError):
+        invalid = next(value for value in values if not isinstance(value, int) or not -2**63 <= value < 2**63)
+        raise CloudWatchTimestampError(
+            invalid,
+            f"{field} must be an integer (milliseconds since epoch)."
+        ) from None
+
+
+class LogBatch:
+    """A page of log events from one stream, stored as columns.
+
+    Timestamps and ingestion times are int64 arrays, and messages and event
+    ids are lists. A whole page is validated with one range check, and the
+    int64 columns can be handed to Arrow without copying. Once parsed by a
+    `MessageParser`, `fields` holds one typed column per extracted field:
+    float64 arrays for numbers, NaN where missing, and lists for strings.
+
+    Iterating or indexing a batch returns `LogEvent` views for callers that
+    want per-event objects.
+    """
+
+    __slots__ = ("log_group_name", "log_stream_name", "timestamps", "messages", "event_ids", "ingestion_times", "next_token", "fields")
+
+    def __init__(
+        self,
+        log_group_name: str,
+        log_stream_name: str,
+        timestamps: array,
+        messages: List[str],
+        event_ids: List[Optional[str]],
+        ingestion_times: Optional[array] = None,
+        next_token: Optional[str] = None,
+        fields: Optional[Dict[str, Union[array, List[Optional[str]]]]] = None
+    ):
+        """Initialize the LogBatch. Use `from_events` to build one from an API response.
+
+        Args:
+            log_group_name: Name of the log group
+            log_stream_name: Name of the log stream
+            timestamps: int64 array of event timestamps in milliseconds since epoch
+            messages: Event messages
+            event_ids: Event ids
+            ingestion_times: int64 array of ingestion times, or None when unknown
+            next_token: Forward token following this page, if it can resume the stream
+            fields: Typed columns extracted from the messages, keyed by field name
+        """
+        self.log_group_name = log_group_name
+        self.log_stream_name = log_stream_name
+        self.timestamps = timestamps
+        self.messages = messages
+        self.event_ids = event_ids
+        self.ingestion_times = ingestion_times
+        self.next_token = next_token
+        self.fields = fields
+
+    @classmethod
+    def from_events(
+        cls,
+        log_group_name: str,
+        log_stream_name: str,
+        events: List[Dict[str, Any]],
+        next_token: Optional[str] = None
+    ) -> "LogBatch":
+        """Build and validate a batch from event dictionaries as returned by CloudWatch Logs.
+
+        Args:
+            log_group_name: Name of the log group
+            log_stream_name: Name of the log stream
+            events: Events with `timestamp`, `message` and optionally `eventId` and `ingestionTime`
+            next_token: Forward token following this page
+
+        Returns:
+            The batch
+        """
+        timestamps = _int64_column([event["timestamp"] for event in events], "timestamp")
+        validate_timestamps(timestamps)
+        ingestion_times = None
+        if events and "ingestionTime" in events[0]:
+            ingestion_times = _int64_column([event.get("ingestionTime", 0) for event in events], "ingestionTime")
+        return cls(
+            log_group_name,
+            log_stream_name,
+            timestamps,
+            [event["message"] for event in events],
+            [event.get("eventId") for event in events],
+            ingestion_times,
+            next_token
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __iter__(self) -> Iterator["LogEvent"]:
+        for index in range(len(self.timestamps)):
+            yield LogEvent.view(self, index)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union["LogEvent", "LogBatch"]:
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("LogBatch index out of range")
+        return LogEvent.view(self, index)
+
+    def __repr__(self) -> str:
+        return f"LogBatch(log_group_name={self.log_group_name!r}, log_stream_name={self.log_stream_name!r}, events={len(self)})"
+
+    def validate(self) -> None:
+        """Check every timestamp of the batch is in the valid range."""
+        validate_timestamps(self.timestamps)
+
+    def take(self, indices: Iterable[int]) -> "LogBatch":
+        """Return a new batch with the events at `indices`, in that order.
+
+        The new batch has no forward token, since it no longer ends where the page did.
+        """
+        indices = list(indices)
+        return LogBatch(
+            self.log_group_name,
+            self.log_stream_name,
+            array("q", [self.timestamps[i] for i in indices]),
+            [self.messages[i] for i in indices],
+            [self.event_ids[i] for i in indices],
+            array("q", [self.ingestion_times[i] for i in indices]) if self.ingestion_times is not None else None,
+            fields={
+                name: array(column.typecode, [column[i] for i in indices]) if isinstance(column, array) else [column[i] for i in indices]
+                for name, column in self.fields.items()
+            } if self.fields is not None else None
+        )
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Convert the batch to one dictionary per event, as returned by CloudWatch Logs."""
+        ingestion_times = self.ingestion_times if self.ingestion_times is not None else [None] * len(self)
+        return [
+            {"timestamp": timestamp, "message": message, "eventId": event_id, "ingestionTime": ingestion_time}
+            for timestamp, message, event_id, ingestion_time in zip(self.timestamps, self.messages, self.event_ids, ingestion_times)
+        ]
+
+    def to_arrow(self) -> "pa.Table":
+        """Convert the batch to an Arrow table. The int64 columns share the batch's memory.
+
+        Returns:
+            Table with `timestamp`, `message`, `event_id`, `log_stream` and `ingestion_time` columns,
+            then one column per parsed field
+        """
+        pa, _ = load_pyarrow("Arrow conversion")
+        count = len(self)
+        timestamps = pa.Array.from_buffers(pa.int64(), count, [None, pa.py_buffer(self.timestamps)])
+        if self.ingestion_times is not None:
+            ingestion_times = pa.Array.from_buffers(pa.int64(), count, [None, pa.py_buffer(self.ingestion_times)])
+        else:
+            ingestion_times = pa.nulls(count, pa.int64())
+        columns = {
+            "timestamp": timestamps,
+            "message": pa.array(self.messages, pa.string()),
+            "event_id": pa.array(self.event_ids, pa.string()),
+            "log_stream": pa.repeat(self.log_stream_name, count) if count else pa.array([], pa.string()),
+            "ingestion_time": ingestion_times,
+        }
+        for name, column in (self.fields or {}).items():
+            if isinstance(column, array):
+                columns[name] = pa.array(column, pa.float64(), from_pandas=True)  # NaN becomes null
+            else:
+                columns[name] = pa.array(column, pa.string())
+        return pa.table(columns)
+
+    def write_parquet(self, where: Any, compression: str = "zstd") -> None:
+        """Write the batch as a Parquet file.
+
+        Args:
+            where: Path or writable file-like object
+            compression: Parquet compression codec
+        """
+        _, pq = load_pyarrow("Parquet conversion")
+        pq.write_table(self.to_arrow(), where, compression=compression)
+
+
+class LogEvent:
+    """A single log event, viewing one row of a `LogBatch`."""
+
+    __slots__ = ("_batch", "_index")
+
+    def __init__(self, timestamp: int, message: str, eventId: Optional[str] = None):
+        """Create a standalone event backed by a one-row batch."""
+        batch = LogBatch.from_events("", "", [{"timestamp": timestamp, "message": message, "eventId": eventId}])
+        self._batch = batch
+        self._index = 0
+
+    @classmethod
+    def view(cls, batch: LogBatch, index: int) -> "LogEvent":
+        """Create a view of row `index` of `batch` without copying or validating it."""
+        event = cls.__new__(cls)
+        event._batch = batch
+        event._index = index
+        return event
+
+    @property
+    def timestamp(self) -> int: # Milliseconds since epoch
+        return self._batch.timestamps[self._index]
+
+    @property
+    def message(self) -> str:
+        return self._batch.messages[self._index]
+
+    @property
+    def eventId(self) -> Optional[str]:
+        return self._batch.event_ids[self._index]
+
+    @property
+    def ingestionTime(self) -> Optional[int]:
+        ingestion_times = self._batch.ingestion_times
+        return ingestion_times[self._index] if ingestion_times is not None else None
+
+    @property
+    def logStreamName(self) -> str:
+        return self._batch.log_stream_name
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, LogEvent):
+            return NotImplemented
+        return (self.timestamp, self.message, self.eventId) == (other.timestamp, other.message, other.eventId)
+
+    def __repr__(self) -> str:
+        return f"LogEvent(timestamp={self.timestamp!r}, message={self.message!r}, eventId={self.eventId!r})"
+
+
+class LogStream:
+    """A log stream and the time of its last event."""
+
+    __slots__ = ("logStreamName", "lastEventTime")
+
+    def __init__(self, logStreamName: str, lastEventTime: int): # Milliseconds since epoch
+        validate_timestamps(_int64_column([lastEventTime], "lastEventTime"), "lastEventTime")
+        self.logStreamName = logStreamName
+        self.lastEventTime = lastEventTime
+
+    @classmethod
+    def from_batch(cls, batch: LogBatch) -> "LogStream":
+        """Describe the stream of a non-empty batch, up to the batch's newest event."""
+        stream = cls.__new__(cls)
+        stream.logStreamName = batch.log_stream_name
+        stream.lastEventTime = max(batch.timestamps)
+        return stream
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, LogStream):
+            return NotImplemented
+        return (self.logStreamName, self.lastEventTime) == (other.logStreamName, other.lastEventTime)
+
+    def __repr__(self) -> str:
+        return f"LogStream(logStreamName={self.logStreamName!r}, lastEventTime={self.lastEventTime!r})"
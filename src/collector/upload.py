@@ -1,20 +1,571 @@
-import boto3
+import io
+import gzip
+import json
+import uuid
+import asyncio
+import itertools
 import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, AsyncIterable, Callable, Tuple
+from urllib.parse import quote
+from .types import LogBatch, load_pyarrow
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+try:
+    from utilities.client_pool import ClientPool
+    from utilities.metrics import get_metrics
+    from utilities.aws import client_config, get_session
+except ImportError:  # For Local Development
+    from ..utilities.client_pool import ClientPool
+    from ..utilities.metrics import get_metrics
+    from ..utilities.aws import client_config, get_session
+
+if TYPE_CHECKING:
+    import aioboto3
+
+
+# Constants
+DEFAULT_COMPRESSION = "gzip"
+DEFAULT_FORMAT = "ndjson"
+DEFAULT_MAX_OBJECT_BYTES = 128 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every multipart part but the last
+DEFAULT_MAX_CONCURRENT_PARTS = 4
+DEFAULT_MAX_OPEN_OBJECTS = 16
+GZIP_COMPRESSION_LEVEL = 6
+ZSTD_COMPRESSION_LEVEL = 3
+HOUR_MS = 3_600_000
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
 logger = logging.getLogger(__name__)
 
 
+def get_compressor(compression: str) -> Tuple[Callable[[bytes], bytes], str]:
+    """Return a compression function and the file extension for a codec.
+
+    Every call of the returned function produces a complete gzip member or
+    zstd frame. Concatenated members and frames are valid gzip and zstd
+    streams, so chunks compressed independently can be appended to the same
+    object. The function may be called from several threads at once.
+
+    Args:
+        compression: "gzip", "zstd" or "none"
+
+    Returns:
+        Tuple of the compression function and the file extension
+    """
+    if compression == "gzip":
+        return (lambda data: gzip.compress(data, compresslevel=GZIP_COMPRESSION_LEVEL)), ".gz"
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        # A ZstdCompressor must not be used by two threads at once, so every encode worker gets its own
+        local = threading.local()
+
+        def compress(data: bytes) -> bytes:
+            compressor = getattr(local, "compressor", None)
+            if compressor is None:
+                compressor = local.compressor = zstandard.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL)
+            return compressor.compress(data)
+
+        return compress, ".zst"
+    if compression == "none":
+        return (lambda data: data), ""
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def partition_path(log_group_name: str, timestamp_ms: int) -> str:
+    """Build the Hive-style partition path of an event.
+
+    Args:
+        log_group_name: Name of the log group
+        timestamp_ms: Event timestamp in milliseconds since epoch
+
+    Returns:
+        Partition path such as `log_group=%2Faws%2Flambda%2Ffoo/dt=2024-01-31/hour=07`
+    """
+    dt = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+    return f"log_group={quote(log_group_name, safe='')}/dt={dt:%Y-%m-%d}/hour={dt:%H}"
+
+
+def split_by_partition(page: LogBatch) -> Dict[str, LogBatch]:
+    """Split a page by partition, bucketing events by hour with integer division.
+
+    A page within a single hour, the common case, is returned as is.
+
+    Args:
+        page: Page of log events
+
+    Returns:
+        Pages keyed by partition path
+    """
+    timestamps = page.timestamps
+    if not timestamps:
+        return {}
+    if min(timestamps) // HOUR_MS == max(timestamps) // HOUR_MS:
+        return {partition_path(page.log_group_name, timestamps[0]): page}
+
+    indices_by_hour: Dict[int, List[int]] = {}
+    for index, timestamp in enumerate(timestamps):
+        indices_by_hour.setdefault(timestamp // HOUR_MS, []).append(index)
+    return {
+        partition_path(page.log_group_name, hour * HOUR_MS): page.take(indices)
+        for hour, indices in indices_by_hour.items()
+    }
+
+
+def encode_page(page: LogBatch) -> Dict[str, bytes]:
+    """Serialize a page to NDJSON, split by partition.
+
+    Args:
+        page: Page of log events
+
+    Returns:
+        NDJSON bytes keyed by partition path
+    """
+    encoded: Dict[str, bytes] = {}
+    for partition, batch in split_by_partition(page).items():
+        log_stream = batch.log_stream_name
+        ingestion_times = batch.ingestion_times if batch.ingestion_times is not None else [None] * len(batch)
+        lines = [
+            json.dumps(
+                {
+                    "timestamp": timestamp,
+                    "message": message,
+                    "event_id": event_id,
+                    "log_stream": log_stream,
+                    "ingestion_time": ingestion_time,
+                },
+                ensure_ascii=False
+            )
+            for timestamp, message, event_id, ingestion_time in zip(batch.timestamps, batch.messages, batch.event_ids, ingestion_times)
+        ]
+        encoded[partition] = ("\n".join(lines) + "\n").encode("utf-8")
+    return encoded
+
+
+class ParquetEncoder:
+    """Encodes the pages of one partition into a single Parquet file, one row group per page.
+
+    The file is produced incrementally: each call returns the bytes written
+    since the previous one, so they can be streamed into an `S3ObjectWriter`.
+    """
+
+    def __init__(self, compression: str):
+        """Initialize the ParquetEncoder.
+
+        Args:
+            compression: Parquet compression codec: "gzip", "zstd" or "none"
+        """
+        _, self._parquet = load_pyarrow("Parquet output")
+        self.compression = compression
+        self._sink = io.BytesIO()
+        self._writer = None
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def encode(self, page: LogBatch) -> bytes:
+        """Append a page as a row group and return the newly written bytes."""
+        table = page.to_arrow()
+        if self._writer is None:
+            self._writer = self._parquet.ParquetWriter(self._sink, table.schema, compression=self.compression)
+        self._writer.write_table(table)
+        return self._drain()
+
+    def close(self) -> bytes:
+        """Finish the file and return its remaining bytes, including the footer."""
+        if self._writer is not None:
+            self._writer.close()
+        return self._drain()
+
+
+class S3ObjectWriter:
+    """Writes one S3 object, switching to a parallel multipart upload once it outgrows one part."""
+
+    def __init__(
+        self,
+        client: Any,
+        bucket_name: str,
+        key: str,
+        part_size: int,
+        part_semaphore: asyncio.Semaphore,
+        content_type: str = CONTENT_TYPES["ndjson"]
+    ):
+        """Initialize the S3ObjectWriter.
+
+        Args:
+            client: aioboto3 S3 client
+            bucket_name: Destination bucket
+            key: Destination key
+            part_size: Buffered bytes that trigger a part upload
+            part_semaphore: Semaphore bounding part uploads across writers
+            content_type: Content type of the object
+        """
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.part_semaphore = part_semaphore
+        self.content_type = content_type
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[asyncio.Task] = []
+
+    async def write(self, data: bytes) -> None:
+        """Append compressed data to the object.
+
+        Waits for a free part slot before buffering beyond `part_size`, so
+        memory stays bounded when S3 is slower than the producer.
+        """
+        self._buffer += data
+        self.bytes_written += len(data)
+        if len(self._buffer) >= self.part_size:
+            await self._upload_part()
+
+    async def _upload_part(self) -> None:
+        if self._upload_id is None:
+            response = await self.client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                ContentType=self.content_type
+            )
+            self._upload_id = response["UploadId"]
+        body, self._buffer = bytes(self._buffer), bytearray()
+        part_number = len(self._parts) + 1
+        await self.part_semaphore.acquire()
+        self._parts.append(asyncio.create_task(self._put_part(part_number, body)))
+
+    async def _put_part(self, part_number: int, body: bytes) -> Dict[str, Any]:
+        try:
+            response = await self.client.upload_part(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=body
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        finally:
+            self.part_semaphore.release()
+
+    async def close(self) -> None:
+        """Upload the remaining data and finish the object."""
+        if self._upload_id is None:
+            await self.client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                ContentType=self.content_type
+            )
+            self._buffer = bytearray()
+            return
+        try:
+            if self._buffer:
+                await self._upload_part()
+            parts = await asyncio.gather(*self._parts)
+            await self.client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": list(parts)}
+            )
+        except BaseException:
+            await self.abort()
+            raise
+
+    async def abort(self) -> None:
+        """Abandon the object, aborting its multipart upload if one was started."""
+        for task in self._parts:
+            task.cancel()
+        await asyncio.gather(*self._parts, return_exceptions=True)
+        if self._upload_id is not None:
+            try:
+                await self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                logger.warning(f"Failed to abort multipart upload of {self.key}: {str(e)}")
+
+
+class PartitionedObjectWriter:
+    """Appends prepared chunks of one source to one open object per partition.
+
+    Writes to a partition must come from one task at a time, in the order
+    its chunks should appear in the object. Created by `S3Uploader.writer`.
+
+    A chunk may be written with a `position`, e.g. the collection progress
+    it covers. Positions are moved to `completed` once the object holding
+    their chunk has been uploaded, and dropped if it is aborted.
+    """
+
+    def __init__(self, uploader: "S3Uploader", client: Any, source: str, object_keys: Callable[[str], str]):
+        """Initialize the PartitionedObjectWriter.
+
+        Args:
+            uploader: Uploader providing the bucket, format and size limits
+            client: aioboto3 S3 client
+            source: Name of the collector, used in metrics
+            object_keys: Function returning a new key for a partition
+        """
+        self.uploader = uploader
+        self.client = client
+        self.source = source
+        self.object_keys = object_keys
+        self.uploaded: List[str] = []
+        self.completed: List[Any] = []
+        self._writers: "OrderedDict[str, S3ObjectWriter]" = OrderedDict()
+        self._encoders: Dict[str, ParquetEncoder] = {}
+        self._positions: Dict[str, List[Any]] = {}
+
+    async def write(self, partition: str, chunk: Any, position: Any = None) -> None:
+        """Append a chunk from `S3Uploader.prepare` to the partition's open object, opening one if needed.
+
+        Args:
+            partition: Partition path of the chunk
+            chunk: Encoded bytes, or a page for Parquet output
+            position: Moved to `completed` once the chunk's object is uploaded. None is not tracked.
+        """
+        uploader = self.uploader
+        writer = self._writers.get(partition)
+        if writer is None:
+            if len(self._writers) >= uploader.max_open_objects:
+                await self.finish(next(iter(self._writers)))
+            writer = self._writers[partition] = S3ObjectWriter(
+                self.client,
+                uploader.bucket_name,
+                self.object_keys(partition),
+                uploader.part_size,
+                uploader.part_semaphore,
+                CONTENT_TYPES[uploader.output_format]
+            )
+            if uploader.output_format == "parquet":
+                self._encoders[partition] = ParquetEncoder(uploader.compression)
+            self._positions[partition] = []
+        self._writers.move_to_end(partition)
+        if position is not None:
+            self._positions[partition].append(position)
+        if partition in self._encoders:
+            chunk = await asyncio.to_thread(self._encoders[partition].encode, chunk)
+        await writer.write(chunk)
+        if writer.bytes_written >= uploader.max_object_bytes:
+            await self.finish(partition)
+
+    async def finish(self, partition: str) -> None:
+        """Finish the open object of a partition."""
+        writer = self._writers.pop(partition)
+        encoder = self._encoders.pop(partition, None)
+        if encoder is not None:
+            await writer.write(await asyncio.to_thread(encoder.close))
+        await writer.close()
+        self.uploaded.append(writer.key)
+        self.completed.extend(self._positions.pop(partition))
+        metrics = get_metrics()
+        metrics.increment("upload_objects_total", source=self.source)
+        metrics.increment("upload_bytes_total", writer.bytes_written, source=self.source)
+
+    async def close(self) -> List[str]:
+        """Finish every open object.
+
+        Returns:
+            Keys of every object this writer uploaded
+        """
+        while self._writers:
+            await self.finish(next(iter(self._writers)))
+        return self.uploaded
+
+    async def abort(self) -> None:
+        """Abandon every open object."""
+        writers, self._writers = list(self._writers.values()), OrderedDict()
+        self._encoders.clear()
+        self._positions.clear()
+        await asyncio.gather(*(writer.abort() for writer in writers), return_exceptions=True)
+
+
 class S3Uploader:
-    def __init__(self, profile_name: str):
-        self.session = boto3.Session(profile_name=profile_name)
-        self.client = self.session.client("s3")
+    """A class to upload collected logs to S3 as compressed NDJSON or Parquet.
+
+    Pages are serialized and compressed as they arrive and appended to one
+    open object per partition (`log_group=.../dt=.../hour=...`). An object
+    is finished once it reaches `max_object_bytes`, and the next write to
+    that partition starts a new one. Objects larger than one part are sent
+    as multipart uploads with parts uploaded in parallel.
+
+    With `output_format="parquet"` each object is one Parquet file with a row
+    group per page, built from the pages' columns without per-event objects.
+    """
+
+    def __init__(
+        self,
+        profile_name: Optional[str] = None,
+        bucket_name: Optional[str] = None,
+        prefix: str = "logs",
+        compression: str = DEFAULT_COMPRESSION,
+        output_format: str = DEFAULT_FORMAT,
+        max_object_bytes: int = DEFAULT_MAX_OBJECT_BYTES,
+        part_size: int = DEFAULT_PART_SIZE,
+        max_concurrent_parts: int = DEFAULT_MAX_CONCURRENT_PARTS,
+        max_open_objects: int = DEFAULT_MAX_OPEN_OBJECTS,
+        session: Optional["aioboto3.Session"] = None
+    ):
+        """Initialize the S3Uploader.
+
+        Args:
+            profile_name: AWS profile name. Set to None to use the IAM Role or Instance Profile.
+            bucket_name: Destination bucket for collected logs
+            prefix: Key prefix for collected logs
+            compression: "gzip", "zstd" or "none"
+            output_format: "ndjson" or "parquet". Parquet uses `compression` as its column codec.
+            max_object_bytes: Compressed size after which an object is finished
+            part_size: Compressed size of each multipart part. At least 5 MiB.
+            max_concurrent_parts: Maximum number of parts uploading at once
+            max_open_objects: Maximum number of partitions with an open object.
+                              The least recently written one is finished first.
+            session: aioboto3 session to create clients from. Defaults to the shared session of `profile_name`.
+        """
+        self.session = session or get_session(profile_name)
+        # Uploads have no retry layer of their own, so keep botocore's
+        self.client_pool = ClientPool(
+            self.session,
+            max_pool_connections=max_concurrent_parts + 1,
+            config=client_config(retries={"mode": "standard", "total_max_attempts": 5})
+        )
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip("/")
+        if output_format not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        self.compression = compression
+        self.output_format = output_format
+        if output_format == "parquet":
+            load_pyarrow("Parquet output")
+            self.compress, self.extension = None, ".parquet"
+        else:
+            self.compress, self.extension = get_compressor(compression)
+            self.extension = f".ndjson{self.extension}"
+        self.max_object_bytes = max_object_bytes
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_open_objects = max_open_objects
+        self.part_semaphore = asyncio.Semaphore(max_concurrent_parts)
+
+    async def __aenter__(self) -> "S3Uploader":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the shared S3 client."""
+        await self.client_pool.close()
+
+    def encode(self, page: LogBatch) -> Dict[str, bytes]:
+        """Serialize and compress a page as NDJSON, split by partition.
+
+        Args:
+            page: Page of log events
+
+        Returns:
+            Compressed NDJSON chunks keyed by partition path
+        """
+        return {partition: self.compress(data) for partition, data in encode_page(page).items()}
+
+    def prepare(self, page: LogBatch) -> Dict[str, Any]:
+        """Split a page by partition and serialize it as far as it can be done out of order.
+
+        NDJSON chunks are fully serialized and compressed. Parquet chunks
+        stay `LogBatch`es, because they are appended to a stateful
+        `ParquetEncoder` by the object writer that owns the partition.
+        Pure CPU work, meant to run in a worker thread.
+
+        Args:
+            page: Page of log events
+
+        Returns:
+            Chunks keyed by partition path, ready for `PartitionedObjectWriter.write`
+        """
+        if self.output_format == "parquet":
+            return split_by_partition(page)
+        return self.encode(page)
+
+    @staticmethod
+    def new_run_id() -> str:
+        """Create the id that makes object keys of one run unique."""
+        return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+    def object_key(self, source: str, partition: str, run_id: str, sequence: int) -> str:
+        """Build the key of a collected logs object."""
+        return f"{self.prefix}/source={source}/{partition}/part-{run_id}-{sequence:05d}{self.extension}"
+
+    def object_keys(self, source: str, run_id: Optional[str] = None) -> Callable[[str], str]:
+        """Return a function that builds a new object key for a partition on every call.
+
+        One function can be shared by several `PartitionedObjectWriter`s of
+        the same source and run, and never returns the same key twice.
+        """
+        run_id = run_id or self.new_run_id()
+        sequence = itertools.count(1)
+        return lambda partition: self.object_key(source, partition, run_id, next(sequence))
+
+    async def writer(self, source: str, object_keys: Optional[Callable[[str], str]] = None) -> "PartitionedObjectWriter":
+        """Create a writer for prepared chunks of one source.
+
+        Args:
+            source: Name of the collector, stored as the `source` partition
+            object_keys: Key factory from `object_keys`. Defaults to one for a new run.
+
+        Returns:
+            A writer that must be closed, or aborted on failure
+        """
+        if not self.bucket_name:
+            raise ValueError("bucket_name is required to upload logs")
+        client = await self.client_pool.get("s3")
+        return PartitionedObjectWriter(self, client, source, object_keys or self.object_keys(source))
+
+    async def upload_logs(
+        self,
+        log_group_name: str,
+        pages: AsyncIterable[LogBatch],
+        source: str = "cloudwatch"
+    ) -> List[str]:
+        """Upload a stream of pages as partitioned, compressed objects.
+
+        Serialization and compression run in a worker thread so the event
+        loop keeps fetching while pages are being compressed. See
+        `pipeline.LogPipeline` to also spread them over several threads.
+
+        Args:
+            log_group_name: Name of the log group, used in log messages
+            pages: Pages of log events, e.g. from `CloudwatchCollector.stream_logs`
+            source: Name of the collector, stored as the `source` partition
+
+        Returns:
+            Keys of the uploaded objects
+        """
+        writer = await self.writer(source)
+        metrics = get_metrics()
+        try:
+            async for page in pages:
+                with metrics.timer("upload_encode_seconds", source=source):
+                    chunks = await asyncio.to_thread(self.prepare, page)
+                for partition, chunk in chunks.items():
+                    await writer.write(partition, chunk)
+            uploaded = await writer.close()
+        except BaseException:
+            await writer.abort()
+            raise
+
+        logger.info(f"Uploaded {len(uploaded)} objects for {log_group_name} to s3://{self.bucket_name}/{self.prefix}/source={source}/")
+        return uploaded
 
-    def upload_file(self, bucket_name: str, file_path: str, key: str):
-        self.client.upload_file(file_path, bucket_name, key)
-        logger.info(f"Uploaded file to S3: {file_path} -> {bucket_name}/{key}")
\ No newline at end of file
+    async def upload_file(self, bucket_name: str, file_path: str, key: str):
+        client = await self.client_pool.get("s3")
+        await client.upload_file(file_path, bucket_name, key)
+        logger.info(f"Uploaded file to S3: {file_path} -> {bucket_name}/{key}")
@@ -0,0 +1,291 @@
+import os
+import uuid
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set
+from urllib.parse import quote, unquote
+from .segment import DEFAULT_BLOCK_EVENTS, DEFAULT_CODEC, SegmentError, SegmentFooter, SegmentReader, SegmentWriter, recover_segment
+
+try:
+    from collector.types import LogBatch
+    from utilities.metrics import get_metrics
+except ImportError:  # For Local Development
+    from ..collector.types import LogBatch
+    from ..utilities.metrics import get_metrics
+
+
+# Constants
+DEFAULT_STORE_PATH = "~/.shirosight/store"
+DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_SUFFIX = ".seg"
+OPEN_SEGMENT_SUFFIX = ".seg.open"
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SegmentInfo:
+    """A sealed segment, with the time range its file name records."""
+    path: str
+    min_timestamp: int
+    max_timestamp: int
+
+    @classmethod
+    def from_path(cls, path: str) -> Optional["SegmentInfo"]:
+        """Parse a segment file name, `{min_timestamp}-{max_timestamp}-{id}.seg`. None if it is not one."""
+        name = os.path.basename(path)
+        if not name.endswith(SEGMENT_SUFFIX):
+            return None
+        try:
+            min_timestamp, max_timestamp, _ = name[:-len(SEGMENT_SUFFIX)].split("-", 2)
+            return cls(path, int(min_timestamp), int(max_timestamp))
+        except ValueError:
+            return None
+
+    def overlaps(self, start_ms: Optional[int], end_ms: Optional[int]) -> bool:
+        return (start_ms is None or self.max_timestamp >= start_ms) and (end_ms is None or self.min_timestamp <= end_ms)
+
+
+def event_keys(batch: LogBatch) -> Iterator[Hashable]:
+    """Identify the events of a batch: by event id, or by timestamp and message for events without one."""
+    for timestamp, message, event_id in zip(batch.timestamps, batch.messages, batch.event_ids):
+        yield event_id if event_id is not None else (timestamp, message)
+
+
+class StoreWriter:
+    """Appends pages of one log group to the store, starting a new segment every `max_segment_bytes`.
+
+    A segment is written as `*.seg.open` and renamed after its time range
+    once its footer is written, so readers only ever see complete segments.
+    Events the group's segments already held when the writer was created,
+    e.g. of a scrape of an overlapping time range, are not written again.
+    Finding them only reads the blocks of the page's stream that overlap
+    its time range.
+    """
+
+    def __init__(self, store: "LogStore", log_group_name: str):
+        self.store = store
+        self.log_group_name = log_group_name
+        self.events = 0
+        self.duplicates = 0
+        self.segments: List[str] = []
+        self._segment: Optional[SegmentWriter] = None
+        self._existing = store.segments(log_group_name)
+        self._readers: Dict[str, SegmentReader] = {}
+
+    def __enter__(self) -> "StoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def write(self, batch: LogBatch) -> None:
+        """Append the events of a page that are not stored yet."""
+        if not len(batch):
+            return
+        stored = self._stored_keys(batch)
+        if stored:
+            keep = [index for index, key in enumerate(event_keys(batch)) if key not in stored]
+            if len(keep) < len(batch):
+                self.duplicates += len(batch) - len(keep)
+                get_metrics().increment("store_duplicate_events_total", len(batch) - len(keep), log_group=self.log_group_name)
+                batch = batch.take(keep)
+                if not len(batch):
+                    return
+        if self._segment is None:
+            path = os.path.join(self.store.group_path(self.log_group_name), f"{uuid.uuid4().hex}{OPEN_SEGMENT_SUFFIX}")
+            self._segment = SegmentWriter(path, self.log_group_name, self.store.codec, self.store.block_events)
+        size = self._segment.size
+        self._segment.write(batch)
+        self.events += len(batch)
+        metrics = get_metrics()
+        metrics.increment("store_events_written_total", len(batch), log_group=self.log_group_name)
+        metrics.increment("store_bytes_written_total", self._segment.size - size, log_group=self.log_group_name)
+        if self._segment.size >= self.store.max_segment_bytes:
+            self._seal()
+
+    def _stored_keys(self, batch: LogBatch) -> Set[Hashable]:
+        """Keys of the events of the page's stream and time range in the existing segments."""
+        low, high = min(batch.timestamps), max(batch.timestamps)
+        keys: Set[Hashable] = set()
+        for segment in self._existing:
+            if not segment.overlaps(low, high):
+                continue
+            reader = self._readers.get(segment.path)
+            if reader is None:
+                reader = self._readers[segment.path] = SegmentReader(segment.path)
+            for stored in reader.read(low, high, [batch.log_stream_name]):
+                keys.update(event_keys(stored))
+        return keys
+
+    def _seal(self) -> None:
+        segment, self._segment = self._segment, None
+        footer = segment.close()
+        path = self.store.seal(segment.path, footer)
+        if path is not None:
+            self.segments.append(path)
+
+    def close(self) -> None:
+        """Seal the open segment."""
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+        if self._segment is not None:
+            self._seal()
+
+
+class LogStore:
+    """Local, time-indexed store of collected log events.
+
+    Every log group has a directory of append-only segment files, named
+    after the time range they hold. A read of a time range opens only the
+    segments whose range overlaps it, and only decompresses their blocks
+    that overlap it, through a memory map, so re-analyzing hours already
+    collected needs neither CloudWatch nor a full scan. The store has a
+    single writer; segments left open by a writer that died are sealed by
+    `recover`.
+
+    Usage:
+        store = LogStore("~/.shirosight/store")
+        with store.writer("/aws/lambda/app") as writer:
+            async for page in collector.stream_logs("/aws/lambda/app", start_time, end_time):
+                writer.write(page)
+        for page in store.read("/aws/lambda/app", start_ms, end_ms):
+            ...
+    """
+
+    def __init__(
+        self,
+        root: str,
+        codec: str = DEFAULT_CODEC,
+        block_events: int = DEFAULT_BLOCK_EVENTS,
+        max_segment_bytes: int = DEFAULT_MAX_SEGMENT_BYTES
+    ):
+        """Initialize the LogStore.
+
+        Args:
+            root: Directory of the store. Created if missing.
+            codec: Block compression of new segments: "zlib", "zstd" or "none"
+            block_events: Maximum number of events per block. Smaller blocks make time range reads finer and compress worse.
+            max_segment_bytes: Size after which a writer starts a new segment
+        """
+        self.root = os.path.expanduser(root)
+        self.codec = codec
+        self.block_events = block_events
+        self.max_segment_bytes = max_segment_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def group_path(self, log_group_name: str) -> str:
+        """Directory of a log group's segments, created if missing."""
+        path = os.path.join(self.root, quote(log_group_name, safe=""))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def log_groups(self) -> List[str]:
+        """Names of the log groups in the store."""
+        return sorted(unquote(name) for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def writer(self, log_group_name: str) -> StoreWriter:
+        """Create a writer appending to a log group."""
+        return StoreWriter(self, log_group_name)
+
+    def seal(self, path: str, footer: SegmentFooter) -> Optional[str]:
+        """Rename a closed segment after its time range, or delete it if it has no events.
+
+        Returns:
+            The new path, or None if the segment was deleted
+        """
+        if not footer.blocks:
+            os.remove(path)
+            return None
+        sealed = os.path.join(
+            os.path.dirname(path),
+            f"{footer.min_timestamp:013d}-{footer.max_timestamp:013d}-{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+        )
+        os.rename(path, sealed)
+        return sealed
+
+    def recover(self, log_group_name: str) -> int:
+        """Seal the segments of a log group that a writer left open, keeping their complete blocks.
+
+        Only call it when no writer of the log group is running.
+
+        Returns:
+            Number of events recovered
+        """
+        events = 0
+        directory = self.group_path(log_group_name)
+        for name in os.listdir(directory):
+            if name.endswith(OPEN_SEGMENT_SUFFIX):
+                path = os.path.join(directory, name)
+                try:
+                    footer = recover_segment(path, log_group_name)
+                except SegmentError as e:
+                    logger.warning(f"Removing unrecoverable segment {path}: {str(e)}")
+                    os.remove(path)
+                    continue
+                events += footer.events
+                self.seal(path, footer)
+        return events
+
+    def segments(self, log_group_name: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> List[SegmentInfo]:
+        """Sealed segments of a log group overlapping a time range, oldest first, found from their file names alone."""
+        directory = self.group_path(log_group_name)
+        segments = [SegmentInfo.from_path(os.path.join(directory, name)) for name in os.listdir(directory)]
+        return sorted(
+            (segment for segment in segments if segment is not None and segment.overlaps(start_ms, end_ms)),
+            key=lambda segment: (segment.min_timestamp, segment.max_timestamp)
+        )
+
+    def read(
+        self,
+        log_group_name: str,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+        log_stream_names: Optional[List[str]] = None
+    ) -> Iterator[LogBatch]:
+        """Read the events of a log group in a time range.
+
+        Args:
+            log_group_name: Name of the log group
+            start_ms: Start of the range in milliseconds since epoch, inclusive. None reads from the first event.
+            end_ms: End of the range in milliseconds since epoch, inclusive. None reads to the last event.
+            log_stream_names: Streams to read. None reads every stream.
+
+        Yields:
+            Pages of one stream each, segment by segment in the order they were written
+        """
+        metrics = get_metrics()
+        for segment in self.segments(log_group_name, start_ms, end_ms):
+            with SegmentReader(segment.path) as reader:
+                blocks = 0
+                for page in reader.read(start_ms, end_ms, log_stream_names):
+                    blocks += 1
+                    if len(page):
+                        yield page
+                metrics.increment("store_blocks_read_total", blocks, log_group=log_group_name)
+                metrics.increment("store_blocks_skipped_total", len(reader.footer.blocks) - blocks, log_group=log_group_name)
+
+    def describe(self, log_group_name: str) -> List[Dict[str, Any]]:
+        """Footer summary of every sealed segment of a log group, oldest first."""
+        summaries = []
+        for segment in self.segments(log_group_name):
+            with SegmentReader(segment.path) as reader:
+                summary = reader.footer.to_dict()
+            summary.update(path=segment.path, bytes=os.path.getsize(segment.path))
+            summaries.append(summary)
+        return summaries
+
+    def prune(self, log_group_name: str, before_ms: int) -> int:
+        """Delete the segments of a log group that only hold events before a time.
+
+        Returns:
+            Number of segments deleted
+        """
+        deleted = 0
+        for segment in self.segments(log_group_name, end_ms=before_ms - 1):
+            if segment.max_timestamp < before_ms:
+                os.remove(segment.path)
+                deleted += 1
+        return deleted
@@ -0,0 +1,370 @@
+import os
+import mmap
+import json
+import zlib
+import struct
+import logging
+from array import array
+from dataclasses import dataclass, asdict
+from itertools import accumulate
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+try:
+    from collector.types import LogBatch
+except ImportError:  # For Local Development
+    from ..collector.types import LogBatch
+
+
+# Constants
+DEFAULT_CODEC = "zlib"
+DEFAULT_BLOCK_EVENTS = 1000
+ZLIB_COMPRESSION_LEVEL = 6
+ZSTD_COMPRESSION_LEVEL = 3
+SEGMENT_MAGIC = b"SHSEG001"
+FOOTER_MAGIC = b"SHSEGEND"
+HEADER = struct.Struct("<8s8s")  # Magic, codec name
+FRAME = struct.Struct("<II")  # Compressed length, CRC32 of the compressed bytes
+BLOCK = struct.Struct("<IHB")  # Events, length of the stream name, flags
+TRAILER = struct.Struct("<Q8s")  # Footer length, magic
+HAS_INGESTION_TIMES = 1
+NO_EVENT_ID = 0xFFFFFFFF
+
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentError(Exception):
+    """Raised when a segment file is truncated or corrupt."""
+
+
+def get_codec(codec: str) -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    """Return the compression and decompression functions of a block codec.
+
+    Args:
+        codec: "zlib", "zstd" or "none"
+
+    Returns:
+        Tuple of the compression and decompression functions
+    """
+    if codec == "zlib":
+        return (lambda data: zlib.compress(data, ZLIB_COMPRESSION_LEVEL)), zlib.decompress
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL).compress, zstandard.ZstdDecompressor().decompress
+    if codec == "none":
+        return bytes, bytes
+    raise ValueError(f"Unsupported codec: {codec}")
+
+
+def encode_block(batch: LogBatch) -> bytes:
+    """Serialize a batch as columns: timestamps, ingestion times, then length-prefixed strings."""
+    stream = batch.log_stream_name.encode("utf-8")
+    messages = [message.encode("utf-8") for message in batch.messages]
+    event_ids = [event_id.encode("utf-8") if event_id is not None else None for event_id in batch.event_ids]
+    flags = HAS_INGESTION_TIMES if batch.ingestion_times is not None else 0
+    parts = [BLOCK.pack(len(batch), len(stream), flags), stream, array("q", batch.timestamps).tobytes()]
+    if flags & HAS_INGESTION_TIMES:
+        parts.append(array("q", batch.ingestion_times).tobytes())
+    parts.append(array("I", map(len, messages)).tobytes())
+    parts.append(array("I", (len(event_id) if event_id is not None else NO_EVENT_ID for event_id in event_ids)).tobytes())
+    parts.extend(messages)
+    parts.extend(event_id for event_id in event_ids if event_id is not None)
+    return b"".join(parts)
+
+
+def decode_block(data: bytes, log_group_name: str) -> LogBatch:
+    """Deserialize a block written by `encode_block`."""
+    view = memoryview(data)
+    count, stream_length, flags = BLOCK.unpack_from(view)
+    position = BLOCK.size
+    stream = bytes(view[position:position + stream_length]).decode("utf-8")
+    position += stream_length
+
+    def column(typecode: str) -> array:
+        nonlocal position
+        values = array(typecode)
+        values.frombytes(view[position:position + count * values.itemsize])
+        position += count * values.itemsize
+        return values
+
+    timestamps = column("q")
+    ingestion_times = column("q") if flags & HAS_INGESTION_TIMES else None
+    message_lengths = column("I")
+    event_id_lengths = column("I")
+
+    offsets = list(accumulate(message_lengths, initial=position))
+    messages = [str(view[begin:end], "utf-8") for begin, end in zip(offsets, offsets[1:])]
+    position = offsets[-1]
+    event_ids: List[Optional[str]] = []
+    for length in event_id_lengths:
+        if length == NO_EVENT_ID:
+            event_ids.append(None)
+            continue
+        event_ids.append(str(view[position:position + length], "utf-8"))
+        position += length
+    return LogBatch(log_group_name, stream, timestamps, messages, event_ids, ingestion_times)
+
+
+@dataclass
+class BlockInfo:
+    """Where a block is in its segment, and the events it holds."""
+    offset: int
+    length: int
+    log_stream_name: str
+    min_timestamp: int
+    max_timestamp: int
+    events: int
+
+    def overlaps(self, start_ms: Optional[int], end_ms: Optional[int]) -> bool:
+        return (start_ms is None or self.max_timestamp >= start_ms) and (end_ms is None or self.min_timestamp <= end_ms)
+
+
+@dataclass
+class SegmentFooter:
+    """Sparse index of a segment: one entry per block, with the segment's time range."""
+    log_group_name: str
+    codec: str
+    blocks: List[BlockInfo]
+
+    @property
+    def min_timestamp(self) -> Optional[int]:
+        return min((block.min_timestamp for block in self.blocks), default=None)
+
+    @property
+    def max_timestamp(self) -> Optional[int]:
+        return max((block.max_timestamp for block in self.blocks), default=None)
+
+    @property
+    def events(self) -> int:
+        return sum(block.events for block in self.blocks)
+
+    def to_bytes(self) -> bytes:
+        streams = sorted({block.log_stream_name for block in self.blocks})
+        index = {name: position for position, name in enumerate(streams)}
+        return json.dumps({
+            "log_group_name": self.log_group_name,
+            "codec": self.codec,
+            "min_timestamp": self.min_timestamp,
+            "max_timestamp": self.max_timestamp,
+            "events": self.events,
+            "streams": streams,
+            # Stream names are stored once, blocks refer to them by position
+            "blocks": [
+                [block.offset, block.length, index[block.log_stream_name], block.min_timestamp, block.max_timestamp, block.events]
+                for block in self.blocks
+            ],
+        }, separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SegmentFooter":
+        document = json.loads(data)
+        streams = document["streams"]
+        return cls(document["log_group_name"], document["codec"], [
+            BlockInfo(offset, length, streams[stream], min_timestamp, max_timestamp, events)
+            for offset, length, stream, min_timestamp, max_timestamp, events in document["blocks"]
+        ])
+
+    def to_dict(self) -> Dict[str, Any]:
+        summary = asdict(self)
+        del summary["blocks"]
+        summary.update(min_timestamp=self.min_timestamp, max_timestamp=self.max_timestamp, events=self.events, blocks=len(self.blocks))
+        return summary
+
+
+class SegmentWriter:
+    """Writes one segment file: a header, compressed blocks of events, then the footer.
+
+    Each block holds up to `block_events` events of one stream, stored as
+    columns and compressed on its own, behind a frame with its length and
+    CRC32. The footer lists every block with its stream and min/max
+    timestamp, so readers can skip blocks outside a time range without
+    decompressing them. Frames also let `recover_segment` rebuild the
+    footer of a segment whose writer died before closing it.
+
+    Usage:
+        writer = SegmentWriter("segment.seg", "/aws/app")
+        writer.write(page)
+        footer = writer.close()
+    """
+
+    def __init__(self, path: str, log_group_name: str, codec: str = DEFAULT_CODEC, block_events: int = DEFAULT_BLOCK_EVENTS):
+        """Initialize the SegmentWriter and create the file.
+
+        Args:
+            path: Path of the segment file
+            log_group_name: Name of the log group of every event in the segment
+            codec: Block compression: "zlib", "zstd" or "none"
+            block_events: Maximum number of events per block
+        """
+        self.path = path
+        self.block_events = max(block_events, 1)
+        self.footer = SegmentFooter(log_group_name, codec, [])
+        self._compress, _ = get_codec(codec)
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(SEGMENT_MAGIC, codec.encode("ascii")))
+        self.size = HEADER.size
+
+    def write(self, batch: LogBatch) -> None:
+        """Append the events of a batch, in blocks of at most `block_events`."""
+        for offset in range(0, len(batch), self.block_events):
+            block = batch if len(batch) <= self.block_events else batch[offset:offset + self.block_events]
+            data = self._compress(encode_block(block))
+            self._file.write(FRAME.pack(len(data), zlib.crc32(data)))
+            self._file.write(data)
+            self.footer.blocks.append(BlockInfo(
+                self.size, FRAME.size + len(data), block.log_stream_name, min(block.timestamps), max(block.timestamps), len(block)
+            ))
+            self.size += FRAME.size + len(data)
+
+    def close(self) -> SegmentFooter:
+        """Write the footer and close the file.
+
+        Returns:
+            The footer of the segment
+        """
+        footer = self.footer.to_bytes()
+        self._file.write(footer)
+        self._file.write(TRAILER.pack(len(footer), FOOTER_MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self.size += len(footer) + TRAILER.size
+        return self.footer
+
+
+class SegmentReader:
+    """Reads a segment file through a read-only memory map.
+
+    Only the footer and the blocks overlapping a query's time range are
+    paged in; the rest of the file is never read.
+
+    Usage:
+        with SegmentReader("segment.seg") as reader:
+            for page in reader.read(start_ms, end_ms):
+                ...
+    """
+
+    def __init__(self, path: str):
+        """Initialize the SegmentReader and read the footer.
+
+        Args:
+            path: Path of the segment file
+
+        Raises:
+            SegmentError: If the file is not a complete segment
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._file.close()
+            raise SegmentError(f"{path} is empty") from None
+        try:
+            self.footer = self._read_footer()
+        except Exception:
+            self.close()
+            raise
+        _, self._decompress = get_codec(self.footer.codec)
+
+    def _read_footer(self) -> SegmentFooter:
+        size = len(self._map)
+        if size < HEADER.size + TRAILER.size or self._map[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise SegmentError(f"{self.path} is not a segment")
+        footer_length, magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+        if magic != FOOTER_MAGIC or footer_length > size - HEADER.size - TRAILER.size:
+            raise SegmentError(f"{self.path} has no footer, its writer did not close it")
+        return SegmentFooter.from_bytes(self._map[size - TRAILER.size - footer_length:size - TRAILER.size])
+
+    def __enter__(self) -> "SegmentReader":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def read_block(self, block: BlockInfo) -> LogBatch:
+        """Decompress one block."""
+        length, checksum = FRAME.unpack_from(self._map, block.offset)
+        data = self._map[block.offset + FRAME.size:block.offset + FRAME.size + length]
+        if zlib.crc32(data) != checksum:
+            raise SegmentError(f"Block at {block.offset} of {self.path} is corrupt")
+        return decode_block(self._decompress(data), self.footer.log_group_name)
+
+    def read(
+        self,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+        log_stream_names: Optional[List[str]] = None
+    ) -> Iterator[LogBatch]:
+        """Read the events of a time range, one batch per block.
+
+        Args:
+            start_ms: Start of the range in milliseconds since epoch, inclusive. None reads from the first event.
+            end_ms: End of the range in milliseconds since epoch, inclusive. None reads to the last event.
+            log_stream_names: Streams to read. None reads every stream.
+
+        Yields:
+            Batches of the events in the range, in the order they were written
+        """
+        streams = set(log_stream_names) if log_stream_names is not None else None
+        for block in self.footer.blocks:
+            if not block.overlaps(start_ms, end_ms) or (streams is not None and block.log_stream_name not in streams):
+                continue
+            batch = self.read_block(block)
+            if (start_ms is None or block.min_timestamp >= start_ms) and (end_ms is None or block.max_timestamp <= end_ms):
+                yield batch
+                continue
+            low = start_ms if start_ms is not None else block.min_timestamp
+            high = end_ms if end_ms is not None else block.max_timestamp
+            yield batch.take(index for index, timestamp in enumerate(batch.timestamps) if low <= timestamp <= high)
+
+
+def recover_segment(path: str, log_group_name: str) -> SegmentFooter:
+    """Close a segment whose writer died: keep every complete block and write its footer.
+
+    Blocks are found by walking their frames from the header. The file is
+    truncated after the last block whose frame and checksum are intact.
+
+    Args:
+        path: Path of the unfinished segment file
+        log_group_name: Name of the log group of the segment
+
+    Returns:
+        The footer written
+    """
+    with open(path, "r+b") as file:
+        data = file.read()
+        if len(data) < HEADER.size or data[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise SegmentError(f"{path} is not a segment")
+        codec = HEADER.unpack_from(data)[1].rstrip(b"\0").decode("ascii")
+        _, decompress = get_codec(codec)
+        footer = SegmentFooter(log_group_name, codec, [])
+        position = HEADER.size
+        while position + FRAME.size <= len(data):
+            length, checksum = FRAME.unpack_from(data, position)
+            block_data = data[position + FRAME.size:position + FRAME.size + length]
+            if len(block_data) < length or zlib.crc32(block_data) != checksum:
+                break
+            block = decode_block(decompress(block_data), log_group_name)
+            footer.blocks.append(BlockInfo(
+                position, FRAME.size + length, block.log_stream_name, min(block.timestamps), max(block.timestamps), len(block)
+            ))
+            position += FRAME.size + length
+        logger.warning(f"Recovered {footer.events} events in {len(footer.blocks)} blocks of {path}, dropped {len(data) - position} bytes")
+
+        encoded = footer.to_bytes()
+        file.seek(position)
+        file.truncate()
+        file.write(encoded)
+        file.write(TRAILER.pack(len(encoded), FOOTER_MAGIC))
+    return footer
@@ -0,0 +1,50 @@
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import aioboto3
+    from botocore.config import Config
+
+
+_sessions: Dict[Tuple[Optional[str], Optional[str]], "aioboto3.Session"] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(profile_name: Optional[str] = None, region_name: Optional[str] = None) -> "aioboto3.Session":
+    """Return the process-wide aioboto3 session of a profile and region, creating it on first use.
+
+    aioboto3 is imported here rather than at module level: with botocore it
+    takes about half a second to import, which every Lambda cold start
+    would pay even on code paths that never reach AWS. The session is kept
+    for the life of the process, so warm invocations reuse its loaded
+    service models and resolved credentials. Sessions are not tied to an
+    event loop; the clients created from them are, and are not cached here.
+
+    Args:
+        profile_name: AWS profile name. None uses the IAM Role or Instance Profile.
+        region_name: AWS region. None uses the profile's or the environment's.
+
+    Returns:
+        The shared session
+    """
+    key = (profile_name, region_name)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                import aioboto3
+                session = _sessions[key] = aioboto3.Session(profile_name=profile_name, region_name=region_name)
+    return session
+
+
+def clear_sessions() -> None:
+    """Forget every shared session, e.g. after credentials change."""
+    with _sessions_lock:
+        _sessions.clear()
+
+
+def client_config(**kwargs: Any) -> "Config":
+    """Create a botocore `Config`, importing botocore's configuration module on first use."""
+    from botocore.config import Config
+    return Config(**kwargs)
@@ -1,43 +1,293 @@
+import time
+import random
 import asyncio
+import logging
 from functools import wraps
-from typing import Optional, List, Dict, Any, AsyncGenerator, Callable, TypeVar, Awaitable
+from typing import Optional, Dict, Any, Callable, TypeVar, Awaitable
+
+from .errors import get_error_code, is_retryable_error, is_throttling_error
+from .metrics import get_metrics
 
 
 T = TypeVar('T')
 
+# Constants
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_TIMEOUT = 30
+DEFAULT_BASE_DELAY = 0.2
+DEFAULT_MAX_DELAY = 20.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RECOVERY_TIMEOUT = 2.0
+DEFAULT_MAX_OPEN_WAIT = 300.0
+DEFAULT_HALF_OPEN_MAX_CALLS = 1
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its circuit is open."""
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.2f} seconds")
+
+
+class CircuitBreaker:
+    """Circuit breaker shared by every call to one endpoint and operation.
+
+    The circuit starts closed. After `failure_threshold` consecutive
+    retryable failures it opens, and calls are rejected with
+    `CircuitOpenError` for `recovery_timeout` seconds instead of adding load
+    to a service that is already throttling. It then turns half-open and
+    lets up to `half_open_max_calls` probe calls through. A successful probe
+    closes the circuit and a failed one opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT,
+        half_open_max_calls: int = DEFAULT_HALF_OPEN_MAX_CALLS
+    ):
+        """Initialize the CircuitBreaker.
+
+        Args:
+            name: Name of the circuit, usually the endpoint and operation
+            failure_threshold: Consecutive retryable failures that open the circuit
+            recovery_timeout: Seconds the circuit stays open before a probe is allowed
+            half_open_max_calls: Maximum number of concurrent probe calls while half-open
+        """
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(half_open_max_calls, 1)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        self._half_open_calls = 0
+        self.trip_count = 0
+        self.retry_count = 0
+        self.failure_count = 0
+        self.rejected_count = 0
+
+    @property
+    def state(self) -> str:
+        """Current state: "closed", "open" or "half-open"."""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets calls through again, 0 if it does now."""
+        if self.state != OPEN:
+            return 0.0
+        return max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def before_call(self) -> None:
+        """Admit a call, or raise `CircuitOpenError` if the circuit rejects it."""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return
+        self.rejected_count += 1
+        get_metrics().increment("circuit_rejections_total", circuit=self.name)
+        # Rejected probes wait for the running probe, which settles the state within one call
+        raise CircuitOpenError(self.name, self.retry_after() or self.recovery_timeout / 10)
+
+    def record_success(self) -> None:
+        """Record a successful call, closing the circuit if it was half-open."""
+        if self._state == HALF_OPEN:
+            logger.info(f"Circuit '{self.name}' closed")
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        """Record a retryable failure, opening the circuit once failures reach the threshold."""
+        self.failure_count += 1
+        self._consecutive_failures += 1
+        if self._state == HALF_OPEN or (self._state == CLOSED and self._consecutive_failures >= self.failure_threshold):
+            self._trip()
+
+    def cancel_call(self) -> None:
+        """Forget an admitted call that was cancelled before it had an outcome."""
+        if self._state == HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_calls = 0
+        self.trip_count += 1
+        get_metrics().increment("circuit_trips_total", circuit=self.name)
+        logger.warning(
+            f"Circuit '{self.name}' opened after {self._consecutive_failures} consecutive failures "
+            f"(trip {self.trip_count})"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the state and counters of the circuit."""
+        return {
+            "state": self.state,
+            "trips": self.trip_count,
+            "retries": self.retry_count,
+            "failures": self.failure_count,
+            "rejected": self.rejected_count,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str, **kwargs: Any) -> CircuitBreaker:
+    """Return the shared breaker called `name`, creating it with `kwargs` on first use."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name, **kwargs)
+    return breaker
+
+
+def circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """Return the state and counters of every shared breaker, keyed by name."""
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+
+def reset_circuit_breakers() -> None:
+    """Forget every shared breaker."""
+    _breakers.clear()
+
+
+def backoff_delay(attempt: int, base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY) -> float:
+    """Exponential backoff with full jitter: a random delay up to `base_delay * 2 ** attempt`.
+
+    Args:
+        attempt: Number of failed attempts so far, starting at 0
+        base_delay: Upper bound of the first delay, in seconds
+        max_delay: Cap on the upper bound, in seconds
+
+    Returns:
+        Delay in seconds
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def _endpoint(args: tuple) -> str:
+    """Return the endpoint of the first boto client among the call's arguments."""
+    for arg in args:
+        meta = getattr(arg, "meta", None)
+        endpoint_url = getattr(meta, "endpoint_url", None)
+        if isinstance(endpoint_url, str):
+            return endpoint_url
+    return "default"
+
 
 def circuit_breaker(
-    max_attempts: int = 100,
-    timeout: int = 30,
-    error_message: str = "Operation failed"
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    timeout: int = DEFAULT_TIMEOUT,
+    error_message: str = "Operation failed",
+    operation: Optional[str] = None,
+    base_delay: float = DEFAULT_BASE_DELAY,
+    max_delay: float = DEFAULT_MAX_DELAY,
+    failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+    recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT,
+    max_open_wait: float = DEFAULT_MAX_OPEN_WAIT
 ) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
-    """Circuit breaker decorator for async functions with pagination.
-    
+    """Circuit breaker and retry decorator for async AWS calls.
+
+    Calls share one `CircuitBreaker` per endpoint and operation. The
+    endpoint is taken from the first boto client passed to the decorated
+    function. Retryable failures (see `is_retryable_error`) are retried with
+    exponential backoff and full jitter, and calls rejected by an open
+    circuit wait until it lets calls through again. Other errors are raised
+    at once. Once attempts run out, the last error is raised as is, so its
+    error code stays visible to the caller. While metrics are enabled,
+    errors, throttles and retries are counted per operation.
+
     Args:
-        max_attempts: Maximum number of pagination attempts
-        timeout: Timeout in seconds for each operation
-        error_message: Custom error message for failures
-        
+        max_attempts: Maximum number of attempts per call
+        timeout: Timeout in seconds for each attempt
+        error_message: Message logged with each retried failure
+        operation: Name of the operation. Defaults to the function name.
+        base_delay: Upper bound of the first backoff delay, in seconds
+        max_delay: Cap on backoff delays, in seconds
+        failure_threshold: Consecutive retryable failures that open the circuit
+        recovery_timeout: Seconds the circuit stays open before a probe is allowed
+        max_open_wait: Total seconds a call may wait for an open circuit before
+                       `CircuitOpenError` is raised. Waiting uses no attempts.
+
     Returns:
         Decorated function with circuit breaker functionality
     """
     def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        operation_name = operation or func.__name__
+
         @wraps(func)
         async def wrapper(*args, **kwargs) -> T:
-            attempts = 0
-            while attempts < max_attempts:
+            breaker = get_circuit_breaker(
+                f"{_endpoint(args)}:{operation_name}",
+                failure_threshold=failure_threshold,
+                recovery_timeout=recovery_timeout
+            )
+            attempt = 0
+            waited = 0.0
+            while True:
+                try:
+                    breaker.before_call()
+                except CircuitOpenError as e:
+                    delay = e.retry_after + backoff_delay(0, base_delay, max_delay)
+                    if waited + delay > max_open_wait:
+                        raise
+                    waited += delay
+                    await asyncio.sleep(delay)
+                    continue
+
                 try:
                     async with asyncio.timeout(timeout):
                         result = await func(*args, **kwargs)
-                    return result
-                except asyncio.TimeoutError:
-                    raise TimeoutError(f"Operation timed out after {timeout} seconds")
+                except asyncio.CancelledError:
+                    breaker.cancel_call()
+                    raise
                 except Exception as e:
-                    attempts += 1
-                    if attempts >= max_attempts:
-                        raise Exception(f"{error_message}: {str(e)}")
+                    metrics = get_metrics()
+                    if metrics.enabled:
+                        metrics.increment(
+                            "api_errors_total",
+                            operation=operation_name,
+                            code=get_error_code(e) or type(e).__name__
+                        )
+                        if is_throttling_error(e):
+                            metrics.increment("api_throttles_total", operation=operation_name)
+                    if not is_retryable_error(e):
+                        # The request was answered, so the endpoint itself is healthy
+                        breaker.record_success()
+                        raise
+                    breaker.record_failure()
+                    attempt += 1
+                    if attempt >= max_attempts:
+                        logger.error(f"{error_message} after {attempt} attempts: {str(e)}")
+                        if isinstance(e, TimeoutError):
+                            raise TimeoutError(f"Operation timed out after {timeout} seconds") from e
+                        raise
+                    delay = backoff_delay(attempt - 1, base_delay, max_delay)
+                    breaker.retry_count += 1
+                    metrics.increment("api_retries_total", operation=operation_name)
+                    logger.debug(
+                        f"{error_message} ({get_error_code(e) or type(e).__name__}), "
+                        f"retrying in {delay:.2f}s (attempt {attempt}/{max_attempts})"
+                    )
+                    await asyncio.sleep(delay)
                     continue
-            raise Exception(f"Maximum number of attempts ({max_attempts}) exceeded")
+
+                breaker.record_success()
+                return result
         return wrapper
     return decorator
-
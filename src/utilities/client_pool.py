@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import AsyncExitStack
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from .aws import client_config
+
+if TYPE_CHECKING:
+    from botocore.config import Config
+
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+
+
+class ClientPool:
+    """Long-lived aioboto3 clients shared by every call of an owner.
+
+    Each service gets one client, created on first use and kept open until
+    `close` is called, so its HTTP connection pool and TLS sessions are
+    reused across requests. Clients are created with botocore retries
+    disabled so throttling reaches the caller's own limiter and retry logic.
+
+    The pool can be used as an async context manager, and can be reopened
+    after it has been closed.
+    """
+
+    def __init__(self, session: Any, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS, config: Optional["Config"] = None):
+        """Initialize the ClientPool.
+
+        Args:
+            session: aioboto3 session used to create clients
+            max_pool_connections: Maximum number of open HTTP connections per client
+            config: Extra botocore configuration merged over the pool defaults
+        """
+        self.session = session
+        self.config = client_config(
+            max_pool_connections=max_pool_connections,
+            retries={"total_max_attempts": 1},
+        )
+        if config is not None:
+            self.config = self.config.merge(config)
+        self._clients: Dict[str, Any] = {}
+        self._exit_stack = AsyncExitStack()
+        self._lock = asyncio.Lock()
+
+    async def get(self, service_name: str) -> Any:
+        """Return the shared client for a service, creating it on first use.
+
+        Args:
+            service_name: AWS service name, e.g. "logs"
+
+        Returns:
+            An open aioboto3 client
+        """
+        client = self._clients.get(service_name)
+        if client is not None:
+            return client
+        async with self._lock:
+            if service_name not in self._clients:
+                self._clients[service_name] = await self._exit_stack.enter_async_context(
+                    self.session.client(service_name, config=self.config)
+                )
+            return self._clients[service_name]
+
+    async def close(self) -> None:
+        """Close every client in the pool."""
+        exit_stack, self._exit_stack = self._exit_stack, AsyncExitStack()
+        self._clients = {}
+        await exit_stack.aclose()
+
+    async def __aenter__(self) -> "ClientPool":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
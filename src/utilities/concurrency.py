@@ -0,0 +1,138 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from .errors import is_throttling_error
+from .metrics import get_metrics
+from .rate_limit import TokenBucket
+
+
+class AdaptiveConcurrencyLimiter:
+    """Concurrency limit that adapts to throttling with AIMD.
+
+    Every successful call raises the limit by `increase_step / limit`, which
+    adds `increase_step` once a full window of calls has succeeded. A
+    throttled call multiplies the limit by `decrease_factor`. Calls that were
+    already in flight when the limit was decreased belong to the same burst,
+    so their throttles do not shrink the limit again.
+
+    Acquire one slot around each API call:
+
+        async with limiter.slot("GetLogEvents"):
+            await client.get_log_events(...)
+
+    While metrics are enabled, the time spent waiting for a slot, the
+    limit and the peak number of calls in flight are recorded under the
+    limiter's `name`, and the time spent inside named slots as API latency.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: Optional[int] = None,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        name: str = "default",
+        rate_limiter: Optional[TokenBucket] = None
+    ):
+        """Initialize the limiter.
+
+        Args:
+            initial_limit: Number of concurrent calls allowed at start
+            min_limit: Lower bound for the limit
+            max_limit: Upper bound for the limit. Defaults to `initial_limit`.
+            increase_step: Additive increase applied per window of successful calls
+            decrease_factor: Multiplicative decrease applied on throttling
+            name: Name the limiter's metrics are recorded under
+            rate_limiter: Rate budget every call made in a slot also takes a token from,
+                          e.g. one shared by all collectors of an account and region
+        """
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1")
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit or initial_limit, self.min_limit)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._epoch = 0
+        self._condition = asyncio.Condition()
+        self.throttle_count = 0
+        self.name = name
+        self.peak_in_flight = 0
+        self.rate_limiter = rate_limiter
+
+    @property
+    def limit(self) -> int:
+        """Current number of concurrent calls allowed."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of calls currently holding a slot."""
+        return self._in_flight
+
+    async def acquire(self) -> int:
+        """Wait for a free slot.
+
+        Returns:
+            The limiter epoch the slot was acquired in, to pass to `release`
+        """
+        metrics = get_metrics()
+        started = time.perf_counter() if metrics.enabled else 0.0
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+            if self._in_flight > self.peak_in_flight:
+                self.peak_in_flight = self._in_flight
+            if metrics.enabled:
+                metrics.observe("limiter_wait_seconds", time.perf_counter() - started, limiter=self.name)
+                metrics.set_gauge("limiter_peak_in_flight", self.peak_in_flight, limiter=self.name)
+            return self._epoch
+
+    async def release(self, epoch: int, throttled: bool = False, succeeded: bool = True) -> None:
+        """Release a slot and adjust the limit from the call's outcome.
+
+        Args:
+            epoch: Value returned by the matching `acquire`
+            throttled: Whether the call was rejected for exceeding a rate limit
+            succeeded: Whether the call succeeded. Failures that are not
+                       throttles leave the limit unchanged.
+        """
+        async with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self.throttle_count += 1
+                if epoch == self._epoch:
+                    self._epoch += 1
+                    self._limit = max(self._limit * self.decrease_factor, float(self.min_limit))
+            elif succeeded:
+                self._limit = min(self._limit + self.increase_step / self._limit, float(self.max_limit))
+            get_metrics().set_gauge("limiter_limit", self.limit, limiter=self.name)
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, operation: Optional[str] = None) -> AsyncIterator[None]:
+        """Hold one slot for the duration of the block, feeding its outcome back into the limit.
+
+        Args:
+            operation: Name of the API call made in the block, used to record its latency
+        """
+        epoch = await self.acquire()
+        metrics = get_metrics()
+        started = 0.0
+        try:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            started = time.perf_counter()
+            yield
+        except BaseException as e:
+            if operation and metrics.enabled and started:
+                metrics.observe("api_call_seconds", time.perf_counter() - started, operation=operation)
+            await self.release(epoch, throttled=is_throttling_error(e), succeeded=False)
+            raise
+        if operation and metrics.enabled:
+            metrics.observe("api_call_seconds", time.perf_counter() - started, operation=operation)
+        await self.release(epoch)
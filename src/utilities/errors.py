@@ -0,0 +1,67 @@
+from typing import Optional
+
+try:
+    from botocore.exceptions import ConnectionError as BotocoreConnectionError, HTTPClientError
+    CONNECTION_ERRORS = (TimeoutError, ConnectionError, BotocoreConnectionError, HTTPClientError)
+except ImportError:  # botocore is only needed to classify its connection errors
+    CONNECTION_ERRORS = (TimeoutError, ConnectionError)
+
+
+# Error codes AWS returns when a caller exceeds its request rate or quota
+THROTTLING_ERROR_CODES = frozenset({
+    "ThrottlingException",
+    "Throttling",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "LimitExceededException",
+    "SlowDown",
+})
+
+
+def get_error_code(error: BaseException) -> Optional[str]:
+    """Return the AWS error code of a botocore `ClientError`, or None for other exceptions."""
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return None
+    return response.get("Error", {}).get("Code")
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """Check whether an exception means the request was throttled."""
+    return get_error_code(error) in THROTTLING_ERROR_CODES
+
+# Error codes of transient server-side failures that succeed when retried
+TRANSIENT_ERROR_CODES = frozenset({
+    "RequestTimeout",
+    "RequestTimeoutException",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "InternalFailure",
+    "InternalError",
+    "InternalServerError",
+    "InternalServerException",
+    "ServiceException",
+    "OperationAbortedException",
+})
+
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | TRANSIENT_ERROR_CODES
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Check whether a failed request is worth retrying.
+
+    Throttling, transient server errors, HTTP 5xx responses, connection
+    failures and timeouts are retryable. Client errors such as a missing
+    log group or an invalid parameter are not, since they fail the same
+    way every time.
+    """
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    code = get_error_code(error)
+    if code is not None:
+        if code in RETRYABLE_ERROR_CODES:
+            return True
+        status = getattr(error, "response", {}).get("ResponseMetadata", {}).get("HTTPStatusCode")
+        return isinstance(status, int) and status >= 500
+    return False
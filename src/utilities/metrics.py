@@ -0,0 +1,519 @@
+import os
+import sys
+import json
+import time
+import logging
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+
+# Constants
+DEFAULT_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf")
+)
+SIZE_BUCKETS = (
+    10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000, float("inf")
+)
+DEFAULT_NAMESPACE = "ShiroSight"
+CLOUDWATCH_OPERATIONS = ("DescribeLogStreams", "GetLogEvents", "FilterLogEvents")
+# Labels with a value per log stream. Sinks aggregate them out, as every label value becomes a
+# Prometheus series or a custom CloudWatch metric; only run summaries break figures down by them.
+SUMMARY_ONLY_LABELS = ("log_stream",)
+
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+@dataclass
+class Histogram:
+    """Bucketed distribution of observed values."""
+    buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS
+    counts: List[int] = field(default_factory=list)
+    count: int = 0
+    sum: float = 0.0
+    min: float = float("inf")
+    max: float = float("-inf")
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket that holds it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, bucket_count in zip(self.buckets, self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                upper = min(upper, self.max)
+                lower = max(lower, self.min)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = upper
+        return self.max
+
+    def merge(self, other: "Histogram") -> None:
+        """Add the observations of a histogram with the same buckets."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+@dataclass
+class MetricsSnapshot:
+    """Point-in-time copy of every metric of a registry."""
+    timestamp: float
+    counters: Dict[Tuple[str, Labels], float]
+    gauges: Dict[Tuple[str, Labels], float]
+    histograms: Dict[Tuple[str, Labels], Histogram]
+    started: float = 0.0
+
+    def label_values(self, name: str, label: str) -> List[str]:
+        """Return every value of `label` used by a counter, gauge or histogram called `name`."""
+        values = set()
+        for metrics in (self.counters, self.gauges, self.histograms):
+            for metric, key in metrics:
+                if metric == name:
+                    values.update(value for item, value in key if item == label)
+        return sorted(values)
+
+    def counter_total(self, name: str, **labels: Any) -> float:
+        """Sum a counter over every label set that includes `labels`."""
+        wanted = set(_labels(labels))
+        return sum(value for (metric, key), value in self.counters.items() if metric == name and wanted <= set(key))
+
+    def merged_histogram(self, name: str, **labels: Any) -> Optional[Histogram]:
+        """Merge a histogram over every label set that includes `labels`."""
+        wanted = set(_labels(labels))
+        merged = None
+        for (metric, key), histogram in self.histograms.items():
+            if metric != name or not wanted <= set(key):
+                continue
+            if merged is None:
+                merged = Histogram(histogram.buckets)
+            merged.merge(histogram)
+        return merged
+
+    def without_labels(self, labels: Iterable[str]) -> "MetricsSnapshot":
+        """Aggregate `labels` out of every metric: counters are summed, histograms merged and gauges take the largest value."""
+        dropped = set(labels)
+
+        def key(metric: Tuple[str, Labels]) -> Tuple[str, Labels]:
+            name, items = metric
+            return name, tuple(item for item in items if item[0] not in dropped)
+
+        counters: Dict[Tuple[str, Labels], float] = {}
+        for metric, value in self.counters.items():
+            counters[key(metric)] = counters.get(key(metric), 0) + value
+        gauges: Dict[Tuple[str, Labels], float] = {}
+        for metric, value in self.gauges.items():
+            gauges[key(metric)] = max(gauges.get(key(metric), value), value)
+        histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        for metric, histogram in self.histograms.items():
+            merged = histograms.get(key(metric))
+            if merged is None:
+                merged = histograms[key(metric)] = Histogram(histogram.buckets)
+            merged.merge(histogram)
+        return MetricsSnapshot(self.timestamp, counters, gauges, histograms, self.started)
+
+
+class MetricsRegistry:
+    """Collects counters, gauges and histograms, keyed by name and labels.
+
+    Recording is plain dictionary updates on the event loop thread, so it
+    needs no locking. Use `NullMetrics` to turn recording off.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.started = time.time()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add `value` to a counter."""
+        key = (name, _labels(labels))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """Set a gauge to `value`."""
+        self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS, **labels: Any) -> None:
+        """Record a value in a histogram."""
+        key = (name, _labels(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Record the duration of the block in seconds, in a latency histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> MetricsSnapshot:
+        """Copy the current values of every metric."""
+        return MetricsSnapshot(
+            time.time(),
+            dict(self._counters),
+            dict(self._gauges),
+            {
+                key: Histogram(h.buckets, list(h.counts), h.count, h.sum, h.min, h.max)
+                for key, h in self._histograms.items()
+            },
+            self.started
+        )
+
+
+class NullMetrics(MetricsRegistry):
+    """Registry that records nothing, used while metrics are disabled."""
+
+    enabled = False
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        pass
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        pass
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS, **labels: Any) -> None:
+        pass
+
+    def timer(self, name: str, **labels: Any):
+        return _NULL_TIMER
+
+
+_NULL_TIMER = nullcontext()
+_NULL_METRICS = NullMetrics()
+_metrics: MetricsRegistry = _NULL_METRICS
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the active registry. It records nothing unless metrics were enabled."""
+    return _metrics
+
+
+def enable_metrics(registry: Optional[MetricsRegistry] = None) -> MetricsRegistry:
+    """Start recording into `registry`, or into a new registry, and return it."""
+    global _metrics
+    _metrics = registry or MetricsRegistry()
+    return _metrics
+
+
+def disable_metrics() -> None:
+    """Stop recording metrics."""
+    global _metrics
+    _metrics = _NULL_METRICS
+
+
+class MetricsSink(ABC):
+    """Destination metrics snapshots are exported to."""
+
+    @abstractmethod
+    def export(self, snapshot: MetricsSnapshot) -> None:
+        """Export a snapshot."""
+
+
+class InMemorySink(MetricsSink):
+    """Keeps exported snapshots in memory, e.g. for tests and benchmarks."""
+
+    def __init__(self):
+        self.snapshots: List[MetricsSnapshot] = []
+
+    def export(self, snapshot: MetricsSnapshot) -> None:
+        self.snapshots.append(snapshot)
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+def render_prometheus(snapshot: MetricsSnapshot, prefix: str = "shirosight_") -> str:
+    """Render a snapshot in the Prometheus text exposition format."""
+    lines: List[str] = []
+    declared = set()
+
+    def declare(name: str, kind: str) -> None:
+        if name not in declared:
+            declared.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(snapshot.counters.items()):
+        metric = f"{prefix}{name}"
+        declare(metric, "counter")
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(snapshot.gauges.items()):
+        metric = f"{prefix}{name}"
+        declare(metric, "gauge")
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for (name, labels), histogram in sorted(snapshot.histograms.items(), key=lambda item: item[0]):
+        metric = f"{prefix}{name}"
+        declare(metric, "histogram")
+        cumulative = 0
+        for upper, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            bound = "+Inf" if upper == float("inf") else repr(upper)
+            lines.append(f"{metric}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusTextSink(MetricsSink):
+    """Writes snapshots in the Prometheus text format, e.g. for the node exporter textfile collector."""
+
+    def __init__(self, path: Optional[str] = None, prefix: str = "shirosight_", dropped_labels: Tuple[str, ...] = SUMMARY_ONLY_LABELS):
+        """Initialize the PrometheusTextSink.
+
+        Args:
+            path: File the latest snapshot is written to. When None, the text is only kept in `last_text`.
+            prefix: Prefix of every metric name
+            dropped_labels: Labels aggregated out before rendering. Defaults to the per-stream labels.
+        """
+        self.path = path
+        self.prefix = prefix
+        self.dropped_labels = dropped_labels
+        self.last_text = ""
+
+    def export(self, snapshot: MetricsSnapshot) -> None:
+        self.last_text = render_prometheus(snapshot.without_labels(self.dropped_labels), self.prefix)
+        if self.path:
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                file.write(self.last_text)
+            # Replace atomically so scrapers never read a partial file
+            os.replace(temporary_path, self.path)
+
+
+class EMFSink(MetricsSink):
+    """Prints snapshots as CloudWatch Embedded Metric Format log lines.
+
+    Lambda and the CloudWatch agent turn these lines into CloudWatch
+    metrics without any PutMetricData calls. Labels become dimensions, and
+    every combination of dimension values is a custom metric, so
+    `dropped_labels` are aggregated out first. Histograms are published as
+    statistic sets.
+    """
+
+    def __init__(
+            self,
+            namespace: str = DEFAULT_NAMESPACE,
+            stream: Optional[TextIO] = None,
+            dimensions: Optional[Dict[str, str]] = None,
+            dropped_labels: Tuple[str, ...] = SUMMARY_ONLY_LABELS
+            ):
+        """Initialize the EMFSink.
+
+        Args:
+            namespace: CloudWatch metric namespace
+            stream: Stream the lines are written to. Defaults to stdout.
+            dimensions: Dimensions added to every metric, e.g. the log group
+            dropped_labels: Labels aggregated out before export. Defaults to the per-stream labels.
+        """
+        self.namespace = namespace
+        self.stream = stream
+        self.dimensions = dimensions or {}
+        self.dropped_labels = dropped_labels
+
+    def _line(self, timestamp_ms: int, labels: Labels, name: str, value: Any, unit: str) -> str:
+        dimensions = {**self.dimensions, **dict(labels)}
+        document = {
+            "_aws": {
+                "Timestamp": timestamp_ms,
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [sorted(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": unit}],
+                }],
+            },
+            **dimensions,
+            name: value,
+        }
+        return json.dumps(document, separators=(",", ":"))
+
+    @staticmethod
+    def _unit(name: str, default: str) -> str:
+        if name.endswith("_seconds"):
+            return "Seconds"
+        if "bytes" in name:
+            return "Bytes"
+        return default
+
+    def export(self, snapshot: MetricsSnapshot) -> None:
+        stream = self.stream or sys.stdout
+        snapshot = snapshot.without_labels(self.dropped_labels)
+        timestamp_ms = int(snapshot.timestamp * 1000)
+        for (name, labels), value in sorted(snapshot.counters.items()):
+            stream.write(self._line(timestamp_ms, labels, name, value, self._unit(name, "Count")) + "\n")
+        for (name, labels), value in sorted(snapshot.gauges.items()):
+            stream.write(self._line(timestamp_ms, labels, name, value, "None") + "\n")
+        for (name, labels), histogram in sorted(snapshot.histograms.items(), key=lambda item: item[0]):
+            if not histogram.count:
+                continue
+            statistics = {"Max": histogram.max, "Min": histogram.min, "SampleCount": histogram.count, "Sum": histogram.sum}
+            stream.write(self._line(timestamp_ms, labels, name, statistics, self._unit(name, "None")) + "\n")
+        stream.flush()
+
+
+def summarize(snapshot: MetricsSnapshot, top_streams: int = 5) -> Dict[str, Any]:
+    """Summarize a run: throughput, API latency per operation and limiter pressure.
+
+    The summary ends with a suggested `max_concurrent_requests`. When calls
+    were throttled it is the limit the adaptive limiter settled at. When
+    calls spent longer queued for a slot than in flight, the limit was the
+    bottleneck and the suggestion doubles the peak concurrency. Otherwise
+    the peak concurrency was enough.
+
+    Args:
+        snapshot: Snapshot of the run's registry
+        top_streams: Number of largest streams to list
+
+    Returns:
+        The summary, as a JSON-serializable dictionary
+    """
+    seconds = max(snapshot.timestamp - snapshot.started, 1e-9) if snapshot.started else 0.0
+    events = snapshot.counter_total("collector_events_total")
+    stream_events = {
+        stream: snapshot.counter_total("collector_events_total", log_stream=stream)
+        for stream in snapshot.label_values("collector_events_total", "log_stream")
+    }
+
+    operations = {}
+    for operation in snapshot.label_values("api_call_seconds", "operation"):
+        latency = snapshot.merged_histogram("api_call_seconds", operation=operation)
+        operations[operation] = {
+            "calls": latency.count,
+            "p50_ms": round(latency.quantile(0.5) * 1000, 2),
+            "p99_ms": round(latency.quantile(0.99) * 1000, 2),
+            "max_ms": round(latency.max * 1000, 2),
+            "throttles": int(snapshot.counter_total("api_throttles_total", operation=operation)),
+            "retries": int(snapshot.counter_total("api_retries_total", operation=operation)),
+        }
+
+    limiters = {}
+    for name in snapshot.label_values("limiter_wait_seconds", "limiter"):
+        wait = snapshot.merged_histogram("limiter_wait_seconds", limiter=name)
+        limiters[name] = {
+            "acquired": wait.count,
+            "wait_p50_ms": round(wait.quantile(0.5) * 1000, 2),
+            "wait_p99_ms": round(wait.quantile(0.99) * 1000, 2),
+            "wait_seconds": round(wait.sum, 3),
+            "final_limit": int(snapshot.gauges.get(("limiter_limit", (("limiter", name),)), 0)),
+            "peak_in_flight": int(snapshot.gauges.get(("limiter_peak_in_flight", (("limiter", name),)), 0)),
+        }
+
+    summary: Dict[str, Any] = {
+        "seconds": round(seconds, 3),
+        "events": int(events),
+        "message_bytes": int(snapshot.counter_total("collector_bytes_total")),
+        "pages": int(snapshot.counter_total("collector_pages_total")),
+        "events_per_second": round(events / seconds, 1) if seconds else 0.0,
+        "streams": len(stream_events),
+        "top_streams": dict(sorted(stream_events.items(), key=lambda item: -item[1])[:top_streams]),
+        "operations": operations,
+        "limiters": limiters,
+        "circuit_trips": int(snapshot.counter_total("circuit_trips_total")),
+    }
+
+    llm_calls = snapshot.merged_histogram("llm_call_seconds") or Histogram()
+    batches = snapshot.merged_histogram("llm_batch_chunks") or Histogram()
+    lookups = {
+        result: int(snapshot.counter_total("analyzer_cache_requests_total", result=result))
+        for result in ("hit", "miss")
+    }
+    if llm_calls.count or any(lookups.values()):
+        summary["analyzer"] = {
+            "llm_calls": llm_calls.count,
+            "llm_p50_ms": round(llm_calls.quantile(0.5) * 1000, 2),
+            "llm_p99_ms": round(llm_calls.quantile(0.99) * 1000, 2),
+            "llm_seconds": round(llm_calls.sum, 3),
+            "input_tokens": int(snapshot.counter_total("llm_tokens_total", direction="input")),
+            "output_tokens": int(snapshot.counter_total("llm_tokens_total", direction="output")),
+            "llm_throttles": int(snapshot.counter_total("llm_throttles_total")),
+            "llm_batch_chunks_mean": round(batches.sum / batches.count, 2) if batches.count else 0.0,
+            "cache_hits": lookups["hit"],
+            "cache_misses": lookups["miss"],
+            "cache_hit_ratio": round(lookups["hit"] / (lookups["hit"] + lookups["miss"]), 4) if any(lookups.values()) else 0.0,
+            "cache_saved_seconds": round(snapshot.counter_total("analyzer_cache_saved_seconds_total"), 3),
+            "cache_saved_tokens": int(snapshot.counter_total("analyzer_cache_saved_tokens_total")),
+        }
+
+    cloudwatch = limiters.get("cloudwatch")
+    if cloudwatch:
+        cloudwatch_operations = [operations[name] for name in CLOUDWATCH_OPERATIONS if name in operations]
+        throttles = sum(stats["throttles"] for stats in cloudwatch_operations)
+        api_seconds = sum(
+            snapshot.merged_histogram("api_call_seconds", operation=name).sum
+            for name in CLOUDWATCH_OPERATIONS if name in operations
+        )
+        if throttles:
+            suggestion = cloudwatch["final_limit"]
+        elif cloudwatch_operations and cloudwatch["wait_seconds"] > api_seconds:
+            suggestion = 2 * cloudwatch["peak_in_flight"]
+        else:
+            suggestion = cloudwatch["peak_in_flight"]
+        summary["suggested_max_concurrent_requests"] = max(int(suggestion), 1)
+    return summary
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Format a summary from `summarize` as a few human-readable lines."""
+    lines = [
+        f"{summary['events']} events ({summary['message_bytes']} message bytes) in {summary['pages']} pages "
+        f"from {summary['streams']} streams in {summary['seconds']}s ({summary['events_per_second']} events/s)"
+    ]
+    for operation, stats in summary["operations"].items():
+        lines.append(
+            f"  {operation}: {stats['calls']} calls, p50 {stats['p50_ms']}ms, p99 {stats['p99_ms']}ms, "
+            f"{stats['throttles']} throttled, {stats['retries']} retried"
+        )
+    for name, stats in summary["limiters"].items():
+        lines.append(
+            f"  limiter {name}: waited {stats['wait_seconds']}s in total (p99 {stats['wait_p99_ms']}ms), "
+            f"peak {stats['peak_in_flight']} in flight, final limit {stats['final_limit']}"
+        )
+    if "analyzer" in summary:
+        stats = summary["analyzer"]
+        lines.append(
+            f"  analyzer: {stats['llm_calls']} LLM calls (p50 {stats['llm_p50_ms']}ms, p99 {stats['llm_p99_ms']}ms, "
+            f"{stats['input_tokens']} input and {stats['output_tokens']} output tokens, "
+            f"{stats['llm_batch_chunks_mean']} chunks per call, {stats['llm_throttles']} throttled), "
+            f"cache {stats['cache_hits']} hits / {stats['cache_misses']} misses, "
+            f"saved {stats['cache_saved_seconds']}s and {stats['cache_saved_tokens']} tokens"
+        )
+    if "suggested_max_concurrent_requests" in summary:
+        lines.append(f"  suggested max_concurrent_requests: {summary['suggested_max_concurrent_requests']}")
+    return "\n".join(lines)
@@ -0,0 +1,63 @@
+import time
+import asyncio
+from typing import Optional
+
+
+class TokenBucket:
+    """Rate limiter allowing `rate` operations per second on average, with bursts of up to `burst`.
+
+    Waiters are served in arrival order, so a large request cannot be
+    starved by a stream of small ones.
+
+    Usage:
+        bucket = TokenBucket(rate=20)
+        await bucket.acquire()
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """Initialize the TokenBucket.
+
+        Args:
+            rate: Tokens added per second
+            burst: Capacity of the bucket. Defaults to one second of tokens, and at least 1.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(burst if burst is not None else rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._updated) * self.rate, self.burst)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until `tokens` tokens are available and take them.
+
+        Args:
+            tokens: Number of tokens to take. At most `burst`.
+        """
+        if tokens > self.burst:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of {self.burst}")
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+    def adjust(self, tokens: float) -> None:
+        """Return unused tokens to the bucket, or take extra ones without waiting.
+
+        Lets a caller reserve an estimate up front and settle the difference
+        once the actual cost is known. Taking more than is available leaves
+        the bucket in debt, which later callers wait out.
+
+        Args:
+            tokens: Tokens to add, or to take when negative
+        """
+        self._refill()
+        self._tokens = min(self._tokens + tokens, self.burst)
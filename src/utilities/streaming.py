@@ -0,0 +1,129 @@
+import asyncio
+from typing import AsyncIterator, Iterable, List, TypeVar
+
+
+T = TypeVar('T')
+
+_DONE = object()
+
+
+class _SourceFailure:
+    """Wraps an exception raised by a source so it can travel through the queue."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def merge_async_iterators(
+    sources: Iterable[AsyncIterator[T]],
+    concurrency: int,
+    queue_size: int
+) -> AsyncIterator[T]:
+    """Merge many async iterators into one with bounded concurrency and buffering.
+
+    At most `concurrency` sources are iterated at the same time and at most
+    `queue_size` items are buffered between the sources and the consumer.
+    Producers block on a full queue, so a slow consumer throttles the sources
+    instead of letting items pile up in memory.
+
+    Sources are pulled lazily from `sources`, so passing a generator of async
+    generators only starts each one when a worker slot frees up.
+
+    The merge fails fast: the first exception raised by a source cancels
+    the other sources, closes them and is raised to the consumer, so a
+    failure is never mistaken for the end of the data. Sources whose
+    errors should not stop the others, such as the per-stream readers of
+    `CloudwatchCollector`, handle those errors themselves.
+
+    Args:
+        sources: Async iterators to merge
+        concurrency: Maximum number of sources consumed concurrently
+        queue_size: Maximum number of items buffered for the consumer
+
+    Yields:
+        Items from all sources, in arrival order
+
+    Raises:
+        Exception: The first exception raised by a source
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(queue_size, 1))
+    source_iter = iter(sources)
+
+    async def worker() -> None:
+        try:
+            for source in source_iter:
+                try:
+                    async for item in source:
+                        await queue.put(item)
+                finally:
+                    aclose = getattr(source, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(_SourceFailure(e))
+            return
+        await queue.put(_DONE)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(concurrency, 1))]
+    remaining = len(workers)
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            if isinstance(item, _SourceFailure):
+                raise item.error
+            yield item
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def concat_async_iterators(
+    sources: List[AsyncIterator[T]],
+    queue_size: int
+) -> AsyncIterator[T]:
+    """Chain async iterators in order while prefetching all of them concurrently.
+
+    Every source runs in its own task and fills its own queue of at most
+    `queue_size` items, so later sources make progress while earlier ones
+    are being consumed, but nothing is buffered beyond those queues.
+
+    Args:
+        sources: Async iterators to chain, in output order
+        queue_size: Maximum number of items buffered per source
+
+    Yields:
+        All items of the first source, then all items of the second, and so on
+    """
+    queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=max(queue_size, 1)) for _ in sources]
+
+    async def worker(source: AsyncIterator[T], queue: asyncio.Queue) -> None:
+        try:
+            async for item in source:
+                await queue.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(_SourceFailure(e))
+            return
+        await queue.put(_DONE)
+
+    workers = [asyncio.create_task(worker(source, queue)) for source, queue in zip(sources, queues)]
+    try:
+        for queue in queues:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _SourceFailure):
+                    raise item.error
+                yield item
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,530 @@
+import io
+import re
+import csv
+import time
+import random
+import asyncio
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from botocore.exceptions import ClientError
+
+try:
+    from .generators import SyntheticLogGroup
+except ImportError:  # Run as a script
+    from generators import SyntheticLogGroup
+
+
+# Constants
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_STREAMS_PAGE_SIZE = 50
+ATHENA_RESULTS_PAGE_SIZE = 1000
+ATHENA_COLUMNS = ("timestamp", "message", "event_id", "log_stream")
+
+ATHENA_QUERY_PATTERN = re.compile(
+    r"log_group = '(?P<group>(?:[^']|'')*)'.*\"timestamp\" >= (?P<start>\d+) AND \"timestamp\" < (?P<end>\d+)",
+    re.DOTALL
+)
+ATHENA_SOURCE_PATTERN = re.compile(r"source = '(?P<source>[^']*)'")
+INSIGHTS_FILTER_PATTERN = re.compile(r"filter @message like /(?P<term>[^/]*)/")
+INSIGHTS_SORT_PATTERN = re.compile(r"sort @timestamp (?P<order>asc|desc)")
+INSIGHTS_LIMIT_PATTERN = re.compile(r"limit (?P<limit>\d+)")
+
+
+@dataclass
+class FakeAWSConfig:
+    """Behaviour of the fake AWS services.
+
+    Attributes:
+        latency: Mean latency of every call, in seconds
+        latency_jitter: Latencies are uniform in `latency * (1 ± latency_jitter)`
+        throttle_rate: Probability that a CloudWatch Logs call fails with ThrottlingException
+        max_requests_per_second: CloudWatch Logs calls above this rate are throttled. None for no limit.
+        page_size: Events per GetLogEvents and FilterLogEvents page
+        streams_page_size: Streams per DescribeLogStreams page
+        seed: Random seed for latencies and throttling
+    """
+    latency: float = 0.005
+    latency_jitter: float = 0.5
+    throttle_rate: float = 0.0
+    max_requests_per_second: Optional[float] = None
+    page_size: int = DEFAULT_PAGE_SIZE
+    streams_page_size: int = DEFAULT_STREAMS_PAGE_SIZE
+    seed: Optional[int] = 0
+
+
+@dataclass
+class CallStats:
+    """API calls made against the fake services."""
+    calls: Dict[str, int] = field(default_factory=dict)
+    throttled: Dict[str, int] = field(default_factory=dict)
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    @property
+    def total_throttled(self) -> int:
+        return sum(self.throttled.values())
+
+
+def client_error(code: str, message: str, operation: str, status: int = 400) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        operation
+    )
+
+
+class FakeClient:
+    """Base class of the fake clients: latency, throttling and call accounting."""
+
+    service_name = "fake"
+    throttled_operations: Tuple[str, ...] = ()
+
+    def __init__(self, config: FakeAWSConfig, stats: CallStats, rng: random.Random):
+        self.config = config
+        self.stats = stats
+        self.rng = rng
+        self.meta = SimpleNamespace(endpoint_url=f"https://{self.service_name}.fake.amazonaws.com")
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+
+    async def __aenter__(self) -> "FakeClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    async def _call(self, operation: str) -> None:
+        """Account for a call, wait for its latency and throttle it if configured to."""
+        started = time.perf_counter()
+        self.stats.calls[operation] = self.stats.calls.get(operation, 0) + 1
+        jitter = self.config.latency * self.config.latency_jitter
+        await asyncio.sleep(max(self.rng.uniform(self.config.latency - jitter, self.config.latency + jitter), 0))
+        try:
+            if operation in self.throttled_operations and self._should_throttle():
+                self.stats.throttled[operation] = self.stats.throttled.get(operation, 0) + 1
+                raise client_error("ThrottlingException", "Rate exceeded", operation)
+        finally:
+            self.stats.latencies.setdefault(operation, []).append(time.perf_counter() - started)
+
+    def _should_throttle(self) -> bool:
+        if self.config.max_requests_per_second is not None:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_calls = now, 0
+            self._window_calls += 1
+            if self._window_calls > self.config.max_requests_per_second:
+                return True
+        return self.rng.random() < self.config.throttle_rate
+
+
+class FakeLogsClient(FakeClient):
+    """In-process stand-in for the CloudWatch Logs API, serving synthetic log groups.
+
+    Logs Insights queries complete at once. They support one
+    `filter @message like /term/`, `sort @timestamp asc|desc` and `limit`;
+    like the real service, rows are newest first unless sorted otherwise.
+    """
+
+    service_name = "logs"
+    throttled_operations = ("DescribeLogStreams", "GetLogEvents", "FilterLogEvents")
+
+    def __init__(self, groups: Dict[str, SyntheticLogGroup], config: FakeAWSConfig, stats: CallStats, rng: random.Random):
+        super().__init__(config, stats, rng)
+        self.groups = groups
+        self._filter_results: Dict[Tuple, List[Tuple[int, str, int]]] = {}
+        self._queries: Dict[str, List[List[Dict[str, str]]]] = {}
+
+    def _group(self, log_group_name: str, operation: str) -> SyntheticLogGroup:
+        group = self.groups.get(log_group_name)
+        if group is None:
+            raise client_error("ResourceNotFoundException", "The specified log group does not exist.", operation)
+        return group
+
+    async def describe_log_groups(self, logGroupNamePrefix: str = "", nextToken: Optional[str] = None, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("DescribeLogGroups")
+        names = sorted(name for name in self.groups if name.startswith(logGroupNamePrefix))
+        offset = int(nextToken) if nextToken else 0
+        page = names[offset:offset + self.config.streams_page_size]
+        response: Dict[str, Any] = {"logGroups": [{"logGroupName": name} for name in page]}
+        if offset + len(page) < len(names):
+            response["nextToken"] = str(offset + len(page))
+        return response
+
+    async def describe_log_streams(
+        self,
+        logGroupName: str,
+        orderBy: str = "LogStreamName",
+        descending: bool = False,
+        nextToken: Optional[str] = None,
+        limit: Optional[int] = None,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        await self._call("DescribeLogStreams")
+        group = self._group(logGroupName, "DescribeLogStreams")
+        streams = [stream for stream in group.streams.values() if len(stream)]
+        if orderBy == "LastEventTime":
+            streams.sort(key=lambda stream: stream.timestamps[-1], reverse=descending)
+        else:
+            streams.sort(key=lambda stream: stream.name, reverse=descending)
+        offset = int(nextToken or 0)
+        page_size = min(limit or self.config.streams_page_size, self.config.streams_page_size)
+        response: Dict[str, Any] = {
+            "logStreams": [
+                {
+                    "logStreamName": stream.name,
+                    "firstEventTimestamp": stream.timestamps[0],
+                    "lastEventTimestamp": stream.timestamps[-1],
+                    "lastIngestionTime": stream.timestamps[-1] + 200,
+                }
+                for stream in streams[offset:offset + page_size]
+            ]
+        }
+        if offset + page_size < len(streams):
+            response["nextToken"] = str(offset + page_size)
+        return response
+
+    async def get_log_events(
+        self,
+        logGroupName: str,
+        logStreamName: str,
+        startTime: Optional[int] = None,
+        endTime: Optional[int] = None,
+        nextToken: Optional[str] = None,
+        limit: Optional[int] = None,
+        startFromHead: bool = False,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        await self._call("GetLogEvents")
+        stream = self._group(logGroupName, "GetLogEvents").streams.get(logStreamName)
+        if stream is None:
+            raise client_error("ResourceNotFoundException", "The specified log stream does not exist.", "GetLogEvents")
+        timestamps = stream.timestamps
+        first = bisect_left(timestamps, startTime) if startTime is not None else 0
+        last = bisect_left(timestamps, endTime) if endTime is not None else len(timestamps)
+        if nextToken is not None:
+            if not nextToken.startswith("f/"):
+                raise client_error("InvalidParameterException", "The specified nextToken is invalid.", "GetLogEvents")
+            first = max(first, int(nextToken[2:]))
+        page_end = min(first + min(limit or self.config.page_size, self.config.page_size), last)
+        events = [stream.event(index) for index in range(first, page_end)]
+        # Like the real API, the token stays the same once the end of the stream is reached
+        forward_token = f"f/{page_end}" if events else (nextToken or f"f/{first}")
+        return {"events": events, "nextForwardToken": forward_token, "nextBackwardToken": f"b/{first}"}
+
+    async def filter_log_events(
+        self,
+        logGroupName: str,
+        logStreamNames: Optional[List[str]] = None,
+        filterPattern: str = "",
+        startTime: Optional[int] = None,
+        endTime: Optional[int] = None,
+        nextToken: Optional[str] = None,
+        limit: Optional[int] = None,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        await self._call("FilterLogEvents")
+        if logStreamNames is not None and len(logStreamNames) > 100:
+            raise client_error("InvalidParameterException", "logStreamNames has more than 100 items.", "FilterLogEvents")
+        group = self._group(logGroupName, "FilterLogEvents")
+        names = tuple(logStreamNames or group.streams)
+        key = (logGroupName, names, filterPattern, startTime, endTime)
+        matches = self._filter_results.get(key)
+        if matches is None:
+            matches = self._filter_results[key] = self._filter(group, names, filterPattern, startTime, endTime)
+        offset = int(nextToken or 0)
+        page_end = min(offset + min(limit or self.config.page_size, self.config.page_size), len(matches))
+        events = []
+        for timestamp, stream_name, index in matches[offset:page_end]:
+            event = group.streams[stream_name].event(index)
+            event["logStreamName"] = stream_name
+            events.append(event)
+        response: Dict[str, Any] = {"events": events, "searchedLogStreams": []}
+        if page_end < len(matches):
+            response["nextToken"] = str(page_end)
+        return response
+
+    async def start_query(
+        self,
+        queryString: str,
+        startTime: int,
+        endTime: int,
+        logGroupNames: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        await self._call("StartQuery")
+        groups = [self._group(name, "StartQuery") for name in logGroupNames or []]
+        term = INSIGHTS_FILTER_PATTERN.search(queryString)
+        sort = INSIGHTS_SORT_PATTERN.search(queryString)
+        limits = [int(match["limit"]) for match in INSIGHTS_LIMIT_PATTERN.finditer(queryString)]
+        if limit is not None:
+            limits.append(limit)
+        # Both bounds are whole seconds and inclusive
+        start_ms, end_ms = startTime * 1000, (endTime + 1) * 1000
+        matches = []
+        for group in groups:
+            for name, stream in group.streams.items():
+                for index in range(bisect_left(stream.timestamps, start_ms), bisect_left(stream.timestamps, end_ms)):
+                    if term is None or term["term"] in stream.message(index):
+                        matches.append((stream.timestamps[index], name, index, stream))
+        matches.sort(key=lambda match: match[:3], reverse=sort is None or sort["order"] == "desc")
+        if limits:
+            matches = matches[:min(limits)]
+
+        query_id = f"insights-{len(self._queries) + 1}"
+        self._queries[query_id] = [
+            [
+                {"field": "@timestamp", "value": datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]},
+                {"field": "@message", "value": stream.message(index)},
+                {"field": "@logStream", "value": name},
+                {"field": "@ptr", "value": f"{name}/{index}"},
+            ]
+            for timestamp, name, index, stream in matches
+        ]
+        return {"queryId": query_id}
+
+    async def get_query_results(self, queryId: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("GetQueryResults")
+        results = self._queries[queryId]
+        return {"status": "Complete", "results": results, "statistics": {"recordsMatched": float(len(results))}}
+
+    async def stop_query(self, queryId: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("StopQuery")
+        return {"success": False}
+
+    @staticmethod
+    def _filter(
+        group: SyntheticLogGroup,
+        names: Tuple[str, ...],
+        filter_pattern: str,
+        start_ms: Optional[int],
+        end_ms: Optional[int]
+    ) -> List[Tuple[int, str, int]]:
+        """Match events of streams against a filter pattern, as case-sensitive terms that must all appear."""
+        terms = [term.strip('"') for term in filter_pattern.split()]
+        matches = []
+        for name in names:
+            stream = group.streams[name]
+            first = bisect_left(stream.timestamps, start_ms) if start_ms is not None else 0
+            last = bisect_left(stream.timestamps, end_ms) if end_ms is not None else len(stream)
+            for index in range(first, last):
+                message = stream.message(index)
+                if all(term in message for term in terms):
+                    matches.append((stream.timestamps[index], name, index))
+        matches.sort()
+        return matches
+
+
+class FakeBody:
+    """Streaming body of a fake S3 object."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def read(self) -> bytes:
+        return self.data
+
+    async def iter_chunks(self, chunk_size: int = 1024) -> AsyncIterator[bytes]:
+        for offset in range(0, len(self.data), chunk_size):
+            await asyncio.sleep(0)
+            yield self.data[offset:offset + chunk_size]
+
+
+class FakeS3Client(FakeClient):
+    """In-process stand-in for the S3 API, keeping objects in memory.
+
+    With `keep_bodies=False` only object sizes are kept, so large upload
+    benchmarks do not hold every uploaded byte.
+    """
+
+    service_name = "s3"
+
+    def __init__(self, config: FakeAWSConfig, stats: CallStats, rng: random.Random, keep_bodies: bool = True):
+        super().__init__(config, stats, rng)
+        self.keep_bodies = keep_bodies
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.object_sizes: Dict[Tuple[str, str], int] = {}
+        self._uploads: Dict[str, Dict[int, Any]] = {}
+        self.exceptions = SimpleNamespace(NoSuchKey=type("NoSuchKey", (ClientError,), {}))
+
+    def _store(self, bucket: str, key: str, body: bytes) -> None:
+        self.object_sizes[(bucket, key)] = len(body)
+        if self.keep_bodies:
+            self.objects[(bucket, key)] = body
+
+    async def put_object(self, Bucket: str, Key: str, Body: bytes = b"", **kwargs: Any) -> Dict[str, Any]:
+        await self._call("PutObject")
+        self._store(Bucket, Key, bytes(Body))
+        return {"ETag": '"fake"'}
+
+    async def get_object(self, Bucket: str, Key: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("GetObject")
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.NoSuchKey(
+                {"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."}}, "GetObject"
+            )
+        data = self.objects[(Bucket, Key)]
+        return {"Body": FakeBody(data), "ContentLength": len(data)}
+
+    async def head_object(self, Bucket: str, Key: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("HeadObject")
+        if (Bucket, Key) not in self.object_sizes:
+            raise client_error("404", "Not Found", "HeadObject", 404)
+        return {"ContentLength": self.object_sizes[(Bucket, Key)]}
+
+    async def create_multipart_upload(self, Bucket: str, Key: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("CreateMultipartUpload")
+        upload_id = f"upload-{len(self._uploads) + 1}"
+        self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    async def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("UploadPart")
+        self._uploads[UploadId][PartNumber] = bytes(Body) if self.keep_bodies else len(Body)
+        return {"ETag": f'"part-{PartNumber}"'}
+
+    async def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        await self._call("CompleteMultipartUpload")
+        parts = self._uploads.pop(UploadId)
+        if self.keep_bodies:
+            self._store(Bucket, Key, b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"]))
+        else:
+            self.object_sizes[(Bucket, Key)] = sum(parts.values())
+        return {"Bucket": Bucket, "Key": Key}
+
+    async def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("AbortMultipartUpload")
+        self._uploads.pop(UploadId, None)
+        return {}
+
+
+class FakeAthenaClient(FakeClient):
+    """In-process stand-in for Athena, answering the collector's log queries from synthetic log groups.
+
+    Queries succeed at once. Their CSV results are written to the fake S3
+    client, where `AthenaLogsCollector` either pages or streams them. The
+    synthetic log groups stand for the `source=cloudwatch` partition; any
+    other source has no rows.
+    """
+
+    service_name = "athena"
+
+    def __init__(self, groups: Dict[str, SyntheticLogGroup], s3: FakeS3Client, config: FakeAWSConfig, stats: CallStats, rng: random.Random):
+        super().__init__(config, stats, rng)
+        self.groups = groups
+        self.s3 = s3
+        self._executions: Dict[str, Dict[str, Any]] = {}
+
+    async def start_query_execution(
+        self,
+        QueryString: str,
+        ResultConfiguration: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        await self._call("StartQueryExecution")
+        match = ATHENA_QUERY_PATTERN.search(QueryString)
+        if match is None:
+            raise client_error("InvalidRequestException", "Unsupported query", "StartQueryExecution")
+        group = self.groups.get(match["group"].replace("''", "'"))
+        source = ATHENA_SOURCE_PATTERN.search(QueryString)
+        if source is not None and source["source"] != "cloudwatch":
+            group = None
+        start_ms, end_ms = int(match["start"]), int(match["end"])
+        rows = []
+        for stream in (group.streams.values() if group else []):
+            for index in range(bisect_left(stream.timestamps, start_ms), bisect_left(stream.timestamps, end_ms)):
+                event = stream.event(index)
+                rows.append((str(event["timestamp"]), event["message"], event["eventId"], stream.name))
+        rows.sort()
+
+        query_execution_id = f"query-{len(self._executions) + 1}"
+        output = (ResultConfiguration or {}).get("OutputLocation", "s3://athena-results/")
+        location = f"{output.rstrip('/')}/{query_execution_id}.csv"
+        bucket, key = location[len("s3://"):].split("/", 1)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        writer.writerow(ATHENA_COLUMNS)
+        writer.writerows(rows)
+        data = buffer.getvalue().encode("utf-8")
+        self.s3.objects[(bucket, key)] = data
+        self.s3.object_sizes[(bucket, key)] = len(data)
+        self._executions[query_execution_id] = {"location": location, "rows": rows}
+        return {"QueryExecutionId": query_execution_id}
+
+    async def get_query_execution(self, QueryExecutionId: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("GetQueryExecution")
+        execution = self._executions[QueryExecutionId]
+        return {
+            "QueryExecution": {
+                "QueryExecutionId": QueryExecutionId,
+                "ResultConfiguration": {"OutputLocation": execution["location"]},
+                "Status": {"State": "SUCCEEDED"},
+            }
+        }
+
+    async def get_query_results(
+        self,
+        QueryExecutionId: str,
+        NextToken: Optional[str] = None,
+        MaxResults: int = ATHENA_RESULTS_PAGE_SIZE,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        await self._call("GetQueryResults")
+        rows = self._executions[QueryExecutionId]["rows"]
+        offset = int(NextToken or 0)
+        page_end = min(offset + MaxResults, len(rows))
+        page = [{"Data": [{"VarCharValue": value} for value in row]} for row in rows[offset:page_end]]
+        if offset == 0:
+            page.insert(0, {"Data": [{"VarCharValue": column} for column in ATHENA_COLUMNS]})
+        response: Dict[str, Any] = {
+            "ResultSet": {
+                "Rows": page,
+                "ResultSetMetadata": {"ColumnInfo": [{"Name": column, "Type": "varchar"} for column in ATHENA_COLUMNS]},
+            }
+        }
+        if page_end < len(rows):
+            response["NextToken"] = str(page_end)
+        return response
+
+    async def stop_query_execution(self, QueryExecutionId: str, **kwargs: Any) -> Dict[str, Any]:
+        await self._call("StopQueryExecution")
+        return {}
+
+
+class FakeSession:
+    """Stand-in for `aioboto3.Session` whose clients are the fakes above.
+
+    Every client of a service is the same object, so call statistics cover
+    every component sharing the session.
+
+        session = FakeSession({group.name: group}, FakeAWSConfig(throttle_rate=0.05))
+        collector = CloudwatchCollector(session=session)
+    """
+
+    def __init__(
+        self,
+        groups: Dict[str, SyntheticLogGroup],
+        config: Optional[FakeAWSConfig] = None,
+        keep_bodies: bool = True
+    ):
+        """Initialize the FakeSession.
+
+        Args:
+            groups: Synthetic log groups keyed by name
+            config: Behaviour of the fake services
+            keep_bodies: Whether the fake S3 keeps uploaded bytes or only their sizes
+        """
+        self.config = config or FakeAWSConfig()
+        self.stats = CallStats()
+        rng = random.Random(self.config.seed)
+        self.logs = FakeLogsClient(groups, self.config, self.stats, rng)
+        self.s3 = FakeS3Client(self.config, self.stats, rng, keep_bodies)
+        self.athena = FakeAthenaClient(groups, self.s3, self.config, self.stats, rng)
+
+    def client(self, service_name: str, **kwargs: Any) -> FakeClient:
+        return {"logs": self.logs, "s3": self.s3, "athena": self.athena}[service_name]
@@ -0,0 +1,146 @@
+import random
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+
+# Constants
+DEFAULT_START_MS = 1_700_000_000_000
+DEFAULT_DURATION_MS = 6 * 60 * 60 * 1000
+DEFAULT_MESSAGE_SIZE = 160
+
+LEVELS = ["INFO"] * 16 + ["WARN"] * 3 + ["ERROR"]
+TEMPLATES = [
+    "GET /api/items/{id} 200 {ms}ms",
+    "POST /api/orders/{id} 201 {ms}ms",
+    "User {id} logged in from 10.0.{a}.{b}",
+    "Cache miss for key item:{id}, loaded in {ms}ms",
+    "Timeout calling payments-service after {ms}ms (attempt {a})",
+    "Exception in worker-{a}: NullPointerException at OrderService.java:{b}",
+    "Retrying message {id} from queue orders-{a}",
+    "Connection pool exhausted: {a} active, {b} idle",
+]
+
+
+@dataclass
+class SyntheticStream:
+    """A log stream whose events are rendered on demand from their index.
+
+    Only the timestamps are stored, so groups with millions of events stay
+    small and the memory measured by a benchmark is the collector's.
+    """
+    name: str
+    seed: int
+    timestamps: array = field(default_factory=lambda: array("q"))
+    message_size: int = DEFAULT_MESSAGE_SIZE
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def message(self, index: int) -> str:
+        """Render the message of an event."""
+        value = hash((self.seed, index)) & 0xFFFFFFFF
+        level = LEVELS[value % len(LEVELS)]
+        template = TEMPLATES[(value >> 5) % len(TEMPLATES)]
+        text = template.format(id=value % 100_000, ms=value % 3000, a=(value >> 8) % 16, b=(value >> 12) % 256)
+        line = f"{level} [req-{value:08x}] {text}"
+        if len(line) < self.message_size:
+            line += " " + "x" * (self.message_size - len(line) - 1)
+        return line
+
+    def event(self, index: int) -> Dict[str, Any]:
+        """Render an event as returned by GetLogEvents."""
+        timestamp = self.timestamps[index]
+        return {
+            "timestamp": timestamp,
+            "message": self.message(index),
+            "eventId": f"{self.seed:04d}{index:012d}",
+            "ingestionTime": timestamp + 200,
+        }
+
+
+@dataclass
+class SyntheticLogGroup:
+    """A log group made of synthetic streams."""
+    name: str
+    streams: Dict[str, SyntheticStream]
+    start_ms: int
+    end_ms: int
+
+    @property
+    def total_events(self) -> int:
+        return sum(len(stream) for stream in self.streams.values())
+
+
+def to_iso(timestamp_ms: int) -> str:
+    """Format a timestamp the way `utilities.timestamps.parse_timestamp` reads it back."""
+    return datetime.fromtimestamp(timestamp_ms / 1000).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def stream_sizes(stream_count: int, events_per_stream: int, skew: float = 0.0) -> List[int]:
+    """Split `stream_count * events_per_stream` events across streams.
+
+    Args:
+        stream_count: Number of streams
+        events_per_stream: Average number of events per stream
+        skew: Zipf exponent of stream sizes. 0 gives every stream the same
+              size, 1 or more puts most events in a few hot streams.
+
+    Returns:
+        Number of events of each stream, largest first
+    """
+    total = stream_count * events_per_stream
+    weights = [1 / (rank + 1) ** skew for rank in range(stream_count)]
+    scale = total / sum(weights)
+    sizes = [int(weight * scale) for weight in weights]
+    sizes[0] += total - sum(sizes)
+    return sizes
+
+
+def generate_log_group(
+    name: str = "/benchmark/app",
+    stream_count: int = 10,
+    events_per_stream: int = 1000,
+    skew: float = 0.0,
+    start_ms: int = DEFAULT_START_MS,
+    duration_ms: int = DEFAULT_DURATION_MS,
+    message_size: int = DEFAULT_MESSAGE_SIZE,
+    seed: Optional[int] = 0
+) -> SyntheticLogGroup:
+    """Generate a log group of `stream_count` streams with `events_per_stream` events on average.
+
+    Each stream's events are spread over the whole window in timestamp
+    order, with bursts of events sharing the same millisecond, as real
+    streams have.
+
+    Args:
+        name: Name of the log group
+        stream_count: Number of streams
+        events_per_stream: Average number of events per stream
+        skew: Zipf exponent of stream sizes, see `stream_sizes`
+        start_ms: Timestamp of the first events, in milliseconds since epoch
+        duration_ms: Length of the window the events are spread over
+        message_size: Minimum length of messages
+        seed: Random seed
+
+    Returns:
+        The log group
+    """
+    rng = random.Random(seed)
+    streams = {}
+    for index, size in enumerate(stream_sizes(stream_count, events_per_stream, skew)):
+        timestamps = array("q")
+        if size:
+            step = duration_ms / size
+            current = start_ms
+            for position in range(size):
+                # One event in ten shares the previous event's millisecond
+                if position and rng.random() < 0.1:
+                    timestamps.append(timestamps[-1])
+                    continue
+                current = max(current, int(start_ms + position * step + rng.random() * step))
+                timestamps.append(current)
+        stream_name = f"{start_ms // 86_400_000}/[$LATEST]{index:06d}"
+        streams[stream_name] = SyntheticStream(stream_name, index, timestamps, message_size)
+    return SyntheticLogGroup(name, streams, start_ms, start_ms + duration_ms)
@@ -0,0 +1,280 @@
+"""Offline benchmarks of the collector, the uploader, the runner and the analyzer.
+
+Every scenario runs in a fresh process against the in-process fakes in
+`fake_aws.py`, so results do not depend on AWS and peak RSS belongs to
+one scenario only.
+
+    python test/benchmark/main.py --streams 50 --events 20000 --skew 1.2 --throttle-rate 0.05
+    python test/benchmark/main.py --output baseline.json
+    python test/benchmark/main.py --baseline baseline.json  # Fails on a throughput regression
+    python test/benchmark/main.py --scenario analyze --llm-latency 0.5 --llm-rpm 600  # Against a mock model
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_aws import FakeAWSConfig, FakeSession
+from generators import SyntheticLogGroup, generate_log_group, to_iso
+
+
+# Constants
+SCENARIOS = ("collect", "filter", "upload", "runner", "analyze")
+PAGE_OPERATIONS = {
+    "collect": ("GetLogEvents",),
+    "filter": ("FilterLogEvents",),
+    "upload": ("PutObject", "UploadPart"),
+    "runner": ("GetLogEvents", "GetQueryResults"),
+    "analyze": (),
+}
+DEFAULT_TOLERANCE = 0.2
+BUCKET = "benchmark-bucket"
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(fraction * 100) - 1]
+
+
+async def run_collect(group: SyntheticLogGroup, session: FakeSession, options: Dict[str, Any], filter_pattern: Optional[str] = None) -> int:
+    from collector.cloudwatch import CloudwatchCollector
+
+    events = 0
+    async with CloudwatchCollector(
+        max_concurrent_requests=options["concurrency"],
+        max_shards_per_stream=options["shards"],
+        session=session
+    ) as collector:
+        async for page in collector.stream_logs(group.name, filter_pattern=filter_pattern):
+            events += len(page)
+    return events
+
+
+async def run_upload(group: SyntheticLogGroup, session: FakeSession, options: Dict[str, Any]) -> int:
+    from collector.types import LogBatch
+    from collector.upload import S3Uploader
+
+    page_size = options["page_size"]
+
+    async def pages():
+        for stream in group.streams.values():
+            for offset in range(0, len(stream), page_size):
+                events = [stream.event(index) for index in range(offset, min(offset + page_size, len(stream)))]
+                yield LogBatch.from_events(group.name, stream.name, events)
+
+    async with S3Uploader(bucket_name=BUCKET, compression=options["compression"], session=session) as uploader:
+        await uploader.upload_logs(group.name, pages())
+    return group.total_events
+
+
+async def run_runner(group: SyntheticLogGroup, session: FakeSession, options: Dict[str, Any]) -> int:
+    from collector.main import ShiroSightRunner
+
+    runner = ShiroSightRunner(
+        max_concurrent_requests=options["concurrency"],
+        athena_s3_bucket="athena-results",
+        athena_s3_prefix="benchmark",
+        collected_logs_s3_bucket=BUCKET,
+        session=session
+    )
+    await runner.run(group.name, to_iso(group.start_ms), to_iso(group.end_ms))
+    # CloudWatch and Athena each deliver every event once
+    return 2 * group.total_events
+
+
+async def run_analyze(group: SyntheticLogGroup, session: FakeSession, options: Dict[str, Any]) -> int:
+    from analyzer.main import ShiroSightAnalyzer
+    from analyzer.providers import MockProvider
+
+    provider = MockProvider(
+        latency=options["llm_latency"],
+        jitter=options["llm_latency"] / 2,
+        requests_per_minute=options["llm_rpm"],
+        tokens_per_minute=options["llm_tpm"],
+        seed=options["seed"]
+    )
+    # Without limits on the mock, do not let the scheduler's defaults be the bottleneck
+    analyzer = ShiroSightAnalyzer(
+        provider=provider,
+        max_concurrent_requests=options["concurrency"],
+        requests_per_minute=options["llm_rpm"] or 1e6,
+        tokens_per_minute=options["llm_tpm"] or 1e9,
+        session=session
+    )
+    chunk_events = options["chunk_events"]
+    chunks = [
+        {
+            "chunk_id": f"{stream.name}-{offset}",
+            "kind": "events",
+            "log_group": group.name,
+            "log_stream": stream.name,
+            "events": [[stream.timestamps[index], stream.message(index)] for index in range(offset, min(offset + chunk_events, len(stream)))],
+        }
+        for stream in group.streams.values()
+        for offset in range(0, len(stream), chunk_events)
+    ]
+    await analyzer.analyze_chunks(chunks)
+    return group.total_events
+
+
+def run_scenario(scenario: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one scenario and measure it. Meant to run in its own process."""
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    group = generate_log_group(
+        stream_count=options["streams"],
+        events_per_stream=options["events"],
+        skew=options["skew"],
+        message_size=options["message_size"],
+        seed=options["seed"]
+    )
+    config = FakeAWSConfig(
+        latency=options["latency"],
+        throttle_rate=options["throttle_rate"],
+        max_requests_per_second=options["max_rps"],
+        page_size=options["page_size"],
+        seed=options["seed"]
+    )
+    session = FakeSession({group.name: group}, config, keep_bodies=False)
+
+    started = time.perf_counter()
+    if scenario == "collect":
+        events = asyncio.run(run_collect(group, session, options))
+    elif scenario == "filter":
+        events = asyncio.run(run_collect(group, session, options, filter_pattern="ERROR"))
+    elif scenario == "upload":
+        events = asyncio.run(run_upload(group, session, options))
+    elif scenario == "runner":
+        events = asyncio.run(run_runner(group, session, options))
+    elif scenario == "analyze":
+        events = asyncio.run(run_analyze(group, session, options))
+    else:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    elapsed = time.perf_counter() - started
+
+    from utilities.circuit_breaker import circuit_breaker_stats
+
+    page_latencies = [
+        latency
+        for operation in PAGE_OPERATIONS[scenario]
+        for latency in session.stats.latencies.get(operation, [])
+    ]
+    return {
+        "scenario": scenario,
+        "events": events,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(events / elapsed, 1) if elapsed else 0.0,
+        "api_calls": session.stats.total_calls,
+        "api_calls_by_operation": dict(session.stats.calls),
+        "throttled": session.stats.total_throttled,
+        "retries": sum(stats["retries"] for stats in circuit_breaker_stats().values()),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "page_latency_p50_ms": round(percentile(page_latencies, 0.5) * 1000, 2),
+        "page_latency_p99_ms": round(percentile(page_latencies, 0.99) * 1000, 2),
+        "total_group_events": group.total_events,
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Return a description of every scenario that is slower than its baseline by more than `tolerance`."""
+    regressions = []
+    for result in results:
+        reference = baseline.get(result["scenario"])
+        if not reference:
+            continue
+        floor = reference["events_per_second"] * (1 - tolerance)
+        if result["events_per_second"] < floor:
+            regressions.append(
+                f"{result['scenario']}: {result['events_per_second']} events/s, "
+                f"baseline {reference['events_per_second']} events/s"
+            )
+    return regressions
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    columns = [
+        ("scenario", "scenario"),
+        ("events", "events"),
+        ("seconds", "seconds"),
+        ("events/s", "events_per_second"),
+        ("api calls", "api_calls"),
+        ("throttled", "throttled"),
+        ("retries", "retries"),
+        ("peak RSS MB", "peak_rss_mb"),
+        ("p50 ms", "page_latency_p50_ms"),
+        ("p99 ms", "page_latency_p99_ms"),
+    ]
+    rows = [[title for title, _ in columns]] + [[str(result[key]) for _, key in columns] for result in results]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark ShiroSight collection against local AWS fakes")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--streams", type=int, default=20, help="Number of log streams")
+    parser.add_argument("--events", type=int, default=5000, help="Average number of events per stream")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of stream sizes")
+    parser.add_argument("--message-size", type=int, default=160, help="Minimum message length")
+    parser.add_argument("--latency", type=float, default=0.005, help="Mean API latency in seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Probability of a ThrottlingException per call")
+    parser.add_argument("--max-rps", type=float, default=None, help="CloudWatch Logs calls per second before throttling")
+    parser.add_argument("--page-size", type=int, default=1000, help="Events per page")
+    parser.add_argument("--concurrency", type=int, default=10, help="max_concurrent_requests of the collectors")
+    parser.add_argument("--shards", type=int, default=1, help="max_shards_per_stream of the CloudWatch collector")
+    parser.add_argument("--compression", default="gzip", help="Upload compression")
+    parser.add_argument("--chunk-events", type=int, default=50, help="Events per chunk of the analyze scenario")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Mean latency of the mock model in seconds")
+    parser.add_argument("--llm-rpm", type=float, default=None, help="Requests per minute of the mock model")
+    parser.add_argument("--llm-tpm", type=float, default=None, help="Tokens per minute of the mock model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write results as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", type=Path, help="Fail if events/s drops below a previous run's results")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative throughput drop")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    options = {
+        key: getattr(args, key)
+        for key in ("streams", "events", "skew", "message_size", "latency", "throttle_rate", "max_rps",
+                    "page_size", "concurrency", "shards", "compression", "chunk_events", "llm_latency", "llm_rpm",
+                    "llm_tpm", "seed")
+    }
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    results = []
+    for scenario in scenarios:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results.append(executor.submit(run_scenario, scenario, options).result())
+    print_table(results)
+
+    if args.output:
+        args.output.write_text(json.dumps({"options": options, "results": results}, indent=2))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, {result["scenario"]: result for result in baseline["results"]}, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
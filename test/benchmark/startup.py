@@ -0,0 +1,210 @@
+"""Cold start benchmark of the Lambda and container entry points.
+
+Every measurement runs in a fresh interpreter, as a cold start does. It
+times the import of the entry point, then the time until its first AWS
+API call is ready to leave the process, which includes creating the
+session and client, loading the service model and signing the request,
+and then the same call in a warm invocation. A before-send hook stops
+each call before it reaches the network, so no AWS account is needed.
+
+    python test/benchmark/startup.py
+    python test/benchmark/startup.py --output startup.json
+    python test/benchmark/startup.py --baseline startup.json  # Fails on a startup regression
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+# Constants
+ROOT = Path(__file__).resolve().parents[2]
+ENTRY_POINTS = ("collector", "process-chunks", "notify")
+HEAVY_MODULES = ("aioboto3", "boto3", "botocore.session", "pyarrow", "numpy", "tiktoken", "mypy_boto3_logs")
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.2
+BUCKET = "startup-benchmark"
+# Credentials to sign requests with, so no profile or instance metadata is looked up
+BENCHMARK_ENVIRONMENT = {
+    "AWS_ACCESS_KEY_ID": "startup-benchmark",
+    "AWS_SECRET_ACCESS_KEY": "startup-benchmark",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_EC2_METADATA_DISABLED": "true",
+}
+
+
+class FirstCall(Exception):
+    """Raised by the before-send hook to stop an API call before it leaves the process."""
+
+
+def stop_request(**kwargs) -> None:
+    raise FirstCall()
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def measure_collector() -> Dict[str, Any]:
+    sys.path.insert(0, str(ROOT / "src"))
+    started = time.perf_counter()
+    from collector.main import ShiroSightRunner
+    result: Dict[str, Any] = {"import_ms": elapsed_ms(started), "modules": loaded_heavy_modules()}
+    import asyncio  # Imported after the measurement, which it is part of
+
+    async def invocation() -> None:
+        # A container runs every invocation in a new event loop, with a new runner and new clients
+        runner = ShiroSightRunner(collect_athena_logs=False, collected_logs_s3_bucket=BUCKET, progress_interval=None)
+        collector = runner.cloudwatch_collector
+        collector.session._session.register("before-send", stop_request, unique_id="startup-benchmark")
+        client = await collector.client_pool.get("logs")
+        try:
+            await client.describe_log_groups(limit=1)
+        except FirstCall:
+            pass
+        finally:
+            await collector.client_pool.close()
+
+    for name in ("first_call_ms", "warm_call_ms"):
+        started = time.perf_counter()
+        asyncio.run(invocation())
+        result[name] = elapsed_ms(started)
+    return result
+
+
+def measure_process_chunks() -> Dict[str, Any]:
+    sys.path.insert(0, str(ROOT / "functions" / "process-chunks"))
+    started = time.perf_counter()
+    import app
+    result: Dict[str, Any] = {"import_ms": elapsed_ms(started), "modules": loaded_heavy_modules()}
+
+    # With no input objects, the first call is the manifest upload
+    event = {"bucket": BUCKET, "keys": [], "output_prefix": "startup-benchmark"}
+    for name in ("first_call_ms", "warm_call_ms"):
+        started = time.perf_counter()
+        import boto3
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+            boto3.DEFAULT_SESSION.events.register("before-send", stop_request)
+        try:
+            app.lambda_handler(event, None)
+        except FirstCall:
+            pass
+        result[name] = elapsed_ms(started)
+    return result
+
+
+def measure_notify() -> Dict[str, Any]:
+    sys.path.insert(0, str(ROOT / "functions" / "notify"))
+    started = time.perf_counter()
+    import app
+    result: Dict[str, Any] = {"import_ms": elapsed_ms(started), "modules": loaded_heavy_modules()}
+    # It makes no API call; the handler's own time is reported instead
+    for name in ("first_call_ms", "warm_call_ms"):
+        started = time.perf_counter()
+        app.lambda_handler({}, None)
+        result[name] = elapsed_ms(started)
+    return result
+
+
+MEASUREMENTS = {
+    "collector": measure_collector,
+    "process-chunks": measure_process_chunks,
+    "notify": measure_notify,
+}
+
+
+def loaded_heavy_modules() -> List[str]:
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def run_entry_point(entry_point: str, repeat: int) -> Dict[str, Any]:
+    """Measure an entry point in `repeat` fresh interpreters and keep the median of each timing."""
+    environment = {key: value for key, value in os.environ.items() if key not in ("AWS_PROFILE", "AWS_SESSION_TOKEN")}
+    environment.update(BENCHMARK_ENVIRONMENT)
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, __file__, "--child", entry_point],
+            capture_output=True, text=True, check=True, env=environment, cwd=ROOT
+        )
+        # The handlers may print; the measurement is the last line
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return {
+        "entry_point": entry_point,
+        "import_ms": statistics.median(run["import_ms"] for run in runs),
+        "first_call_ms": statistics.median(run["first_call_ms"] for run in runs),
+        "warm_call_ms": statistics.median(run["warm_call_ms"] for run in runs),
+        "modules": runs[0]["modules"],
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Return a description of every entry point that starts slower than its baseline by more than `tolerance`."""
+    regressions = []
+    for result in results:
+        reference = baseline.get(result["entry_point"])
+        if not reference:
+            continue
+        for key in ("import_ms", "first_call_ms"):
+            if result[key] > reference[key] * (1 + tolerance):
+                regressions.append(f"{result['entry_point']}: {key} {result[key]}, baseline {reference[key]}")
+    return regressions
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    columns = [
+        ("entry point", "entry_point"),
+        ("import ms", "import_ms"),
+        ("first call ms", "first_call_ms"),
+        ("warm call ms", "warm_call_ms"),
+        ("heavy modules at import", "modules"),
+    ]
+    rows = [[title for title, _ in columns]] + [
+        [", ".join(result[key]) or "-" if key == "modules" else str(result[key]) for _, key in columns]
+        for result in results
+    ]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of ShiroSight entry points")
+    parser.add_argument("--entry-point", choices=ENTRY_POINTS + ("all",), default="all")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Fresh interpreters per entry point")
+    parser.add_argument("--output", type=Path, help="Write results as JSON, e.g. to use as a baseline")
+    parser.add_argument("--baseline", type=Path, help="Fail if an entry point starts slower than in a previous run's results")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative startup time increase")
+    parser.add_argument("--child", choices=ENTRY_POINTS, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(MEASUREMENTS[args.child]()))
+        return 0
+
+    entry_points = ENTRY_POINTS if args.entry_point == "all" else (args.entry_point,)
+    results = [run_entry_point(entry_point, max(args.repeat, 1)) for entry_point in entry_points]
+    print_table(results)
+
+    if args.output:
+        args.output.write_text(json.dumps({"repeat": args.repeat, "results": results}, indent=2))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, {result["entry_point"]: result for result in baseline["results"]}, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import json
+import time
+import asyncio
+import pytest
+from analyzer.aggregate import ResultAggregator
+from analyzer.main import ShiroSightAnalyzer, render_prompt
+from analyzer.cache import CacheEntry, LRUResultCache, S3ResultCache, SQLiteResultCache, content_key
+from analyzer.providers import Completion, LLMProvider, MockProvider
+from analyzer.scheduler import LLMScheduler, severity_score
+from utilities.metrics import enable_metrics, disable_metrics, summarize
+from benchmark.fake_aws import FakeAWSConfig, FakeSession
+
+
+class EchoProvider(LLMProvider):
+    model = "test-model"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.prompts = []
+
+    async def complete(self, system, prompt):
+        self.prompts.append(prompt)
+        await asyncio.sleep(self.delay)
+        return Completion(json.dumps({"summary": f"{len(prompt)} characters", "severity": "info", "findings": []}), 100, 20)
+
+
+def event_chunk(index, message="GET /health 200 took 2ms"):
+    return {
+        "chunk_id": f"abc-{index:06d}",
+        "kind": "events",
+        "log_group": "/aws/app",
+        "log_stream": "stream-1",
+        "events": [[1_700_000_000_000 + index, f"{message} request={index}"]],
+    }
+
+
+def template_chunk(count=1000, chunk_id="abc-t000001", status=500):
+    return {
+        "chunk_id": chunk_id,
+        "kind": "templates",
+        "log_group": "/aws/app",
+        "start": 1_700_000_000_000,
+        "end": 1_700_000_900_000,
+        "event_count": count,
+        "templates": [{
+            "template_id": 1,
+            "template": f"GET /orders/<*> {status} took <*>",
+            "count": count,
+            "first_seen": 1_700_000_000_000,
+            "last_seen": 1_700_000_900_000,
+            "parameters": [["17", "18"], ["12ms"]],
+            "log_streams": ["stream-1"],
+        }],
+    }
+
+
+def test_content_key_ignores_volatile_fields():
+    key = content_key(template_chunk(), "1", "test-model")
+    assert content_key(template_chunk(count=1010, chunk_id="def-t000002"), "1", "test-model") == key
+    assert content_key(template_chunk(status=200), "1", "test-model") != key
+    assert content_key(template_chunk(), "2", "test-model") != key
+    assert content_key(template_chunk(), "1", "other-model") != key
+    assert "1000x" in render_prompt(template_chunk())
+
+
+@pytest.mark.asyncio
+async def test_analyzer_reuses_cached_results():
+    provider = EchoProvider(delay=0.01)
+    cache = LRUResultCache()
+    analyzer = ShiroSightAnalyzer(provider=provider, cache=cache, session=FakeSession({}))
+    registry = enable_metrics()
+    try:
+        first = await analyzer.analyze_chunks([template_chunk(), template_chunk(chunk_id="same-content")])
+        second = await analyzer.analyze_chunk(template_chunk(count=1010, chunk_id="next-run"))
+    finally:
+        disable_metrics()
+
+    assert len(provider.prompts) == 1  # The duplicate shared the call, the next run hit the cache
+    assert [result.cached for result in first] == [False, True]
+    assert second.cached and second.analysis == first[0].analysis
+    assert cache.stats.hits == 1 and cache.stats.saved_input_tokens == 100
+    analyzer_summary = summarize(registry.snapshot())["analyzer"]
+    assert analyzer_summary["llm_calls"] == 1 and analyzer_summary["cache_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_lru_cache_evicts_and_expires():
+    cache = LRUResultCache(max_entries=2, ttl=60)
+    for key in ("a", "b", "c"):
+        await cache.set(key, CacheEntry({"key": key}, "test-model"))
+    await cache.set("old", CacheEntry({}, "test-model", created_at=time.time() - 120))
+
+    assert await cache.get("a") is None and await cache.get("b") is None  # Evicted
+    assert await cache.get("old") is None  # Expired
+    assert (await cache.get("c")).value == {"key": "c"}
+    assert cache.stats.evictions == 2 and cache.stats.expirations == 1
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_evicts_by_size(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteResultCache(path, max_bytes=1000)
+    for index in range(5):
+        await cache.set(f"key-{index}", CacheEntry({"text": "x" * 200}, "test-model"))
+
+    reopened = SQLiteResultCache(path, max_bytes=1000)
+    assert await reopened.get("key-4") is not None
+    assert await reopened.get("key-0") is None
+    assert cache.stats.evictions >= 1
+
+
+@pytest.mark.asyncio
+async def test_s3_cache_round_trip():
+    session = FakeSession({}, FakeAWSConfig(latency=0))
+    cache = S3ResultCache("cache-bucket", session=session)
+    await cache.set("abcdef", CacheEntry({"summary": "ok"}, "test-model", latency=2.5))
+
+    assert ("cache-bucket", "analysis-cache/ab/abcdef.json") in session.s3.objects
+    assert (await cache.get("abcdef")).value == {"summary": "ok"}
+    assert await cache.get("missing") is None
+    assert cache.stats.saved_seconds == 2.5
+
+
+@pytest.mark.asyncio
+async def test_s3_cache_shares_one_client_and_bounds_lookups():
+    session = FakeSession({}, FakeAWSConfig(latency=0.01))
+    created, in_flight, peak = [], 0, 0
+    client, get_object = session.client, session.s3.get_object
+
+    def counting_client(service_name, **kwargs):
+        created.append(service_name)
+        return client(service_name, **kwargs)
+
+    async def tracked_get_object(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await get_object(**kwargs)
+        finally:
+            in_flight -= 1
+
+    session.client = counting_client
+    session.s3.get_object = tracked_get_object
+    async with S3ResultCache("cache-bucket", session=session, max_concurrent_requests=4) as cache:
+        await cache.set("abcdef", CacheEntry({"summary": "ok"}, "test-model"))
+        entries = await asyncio.gather(*(cache.get("abcdef" if index % 2 else f"{index:06x}") for index in range(200)))
+
+    assert created == ["s3"]
+    assert peak == 4
+    assert sum(entry is not None for entry in entries) == 100
+
+
+@pytest.mark.asyncio
+async def test_scheduler_packs_small_chunks():
+    provider = MockProvider(latency=0.01)
+    analyzer = ShiroSightAnalyzer(provider=provider, max_batch_chunks=4, session=FakeSession({}))
+    results = await analyzer.analyze_chunks([event_chunk(index) for index in range(10)])
+
+    assert provider.calls == 3  # 4 + 4 + 2 sections
+    assert all(result.analysis["summary"].startswith("Mock analysis") for result in results)
+    assert sum(result.input_tokens for result in results) == provider.input_tokens
+
+
+@pytest.mark.asyncio
+async def test_scheduler_retries_rate_limited_requests():
+    provider = MockProvider(latency=0, requests_per_minute=600, burst_seconds=0.2)  # 2 requests at once, then 10/s
+    scheduler = LLMScheduler(provider, requests_per_minute=6000, max_batch_tokens=0, base_delay=0.01)
+    registry = enable_metrics()
+    try:
+        results = await scheduler.run([(f"prompt {index}", 0.0) for index in range(6)])
+    finally:
+        disable_metrics()
+
+    assert len(results) == 6 and provider.calls == 6
+    assert provider.rate_limited > 0
+    assert summarize(registry.snapshot())["analyzer"]["llm_throttles"] == provider.rate_limited
+
+
+@pytest.mark.asyncio
+async def test_scheduler_sends_errors_first():
+    provider = EchoProvider()
+    chunks = [event_chunk(0), event_chunk(1, "ERROR payment failed"), event_chunk(2, "WARN retrying upstream")]
+    analyzer = ShiroSightAnalyzer(provider=provider, max_concurrent_requests=1, max_batch_tokens=0, session=FakeSession({}))
+    await analyzer.analyze_chunks(chunks)
+
+    assert severity_score(chunks[1]) > severity_score(chunks[2]) > severity_score(chunks[0]) == 0
+    assert ["ERROR" in prompt for prompt in provider.prompts] == [True, False, False]
+    assert "WARN" in provider.prompts[1]
+
+
+@pytest.mark.asyncio
+async def test_aggregator_recomputes_changed_branches_only():
+    provider = EchoProvider()
+    analyzer = ShiroSightAnalyzer(provider=provider, cache=LRUResultCache(), max_batch_tokens=0, session=FakeSession({}))
+    aggregator = ResultAggregator(analyzer, fan_in=4)
+    chunks = [event_chunk(index) for index in range(20)]
+    report = await aggregator.aggregate(await analyzer.analyze_chunks(chunks))
+
+    assert report.levels == 3 and report.merges == 8 and report.cached_merges == 0  # Groups of 2 to 4 nodes, ended by their keys
+    assert report.chunk_count == 20 and report.analysis["severity"] == "info"
+
+    provider.prompts.clear()
+    chunks[0] = event_chunk(0, "ERROR payment failed")
+    rerun = await aggregator.aggregate(await analyzer.analyze_chunks(chunks))
+
+    assert len(provider.prompts) == 4  # The changed chunk, and one merge per level above it
+    assert rerun.merges == 8 and rerun.cached_merges == 5
+    assert rerun.cache_key != report.cache_key
+
+    # An inserted chunk only regroups its neighbours, instead of every group after it
+    chunks = [event_chunk(index) for index in range(64)]
+    await aggregator.aggregate(await analyzer.analyze_chunks(chunks))
+    provider.prompts.clear()
+    chunks.insert(32, event_chunk(1000, "WARN disk almost full"))
+    inserted = await aggregator.aggregate(await analyzer.analyze_chunks(chunks))
+
+    recomputed = inserted.merges - inserted.cached_merges
+    assert len(provider.prompts) == 1 + recomputed
+    assert recomputed <= 2 * inserted.levels and recomputed < inserted.merges / 3
@@ -1,59 +1,503 @@
-import pytest
+import re
+import gzip
+import json
+import random
 import asyncio
-from datetime import datetime, timedelta
-from ShiroSightCollector.main import ShiroSightRunner
+import threading
+import pytest
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from collector.main import ShiroSightRunner
+from collector import insights, upload
+from collector.athena import AthenaLogsCollector
+from collector.cloudwatch import CloudwatchCollector
+from collector.checkpoint import Checkpoint, CheckpointTracker, S3CheckpointStore, SQLiteCheckpointStore
+from collector.exceptions import CloudWatchTimestampError
+from collector.filters import FilterSyntaxError
+from collector.parsing import MessageParser, detect_format
+from collector.pipeline import LogPipeline
+from collector.types import LogBatch
+from collector.fanout import FanoutJob, FanoutRunner, FanoutTarget, assign_jobs
+from collector.upload import S3ObjectWriter, S3Uploader, get_compressor
+from utilities.metrics import InMemorySink
+from benchmark.fake_aws import FakeAWSConfig, FakeSession
+from benchmark.generators import SyntheticLogGroup, SyntheticStream, generate_log_group, to_iso
+
+
+def make_session(**config):
+    group = generate_log_group(name="/test/log/group", stream_count=5, events_per_stream=400, skew=1.0)
+    session = FakeSession({group.name: group}, FakeAWSConfig(latency=0, page_size=100, **config))
+    return group, session
+
+
+def uploaded_lines(session, keys):
+    return sum(gzip.decompress(session.s3.objects[("test-bucket", key)]).count(b"\n") for key in keys)
+
+
+def uploaded_events(session):
+    return {line for body in session.s3.objects.values() for line in gzip.decompress(body).splitlines()}
+
 
 @pytest.mark.asyncio
 async def test_shiro_sight_runner():
-    # Initialize the runner with test parameters
+    group, session = make_session()
     runner = ShiroSightRunner(
         max_concurrent_requests=5,
         collect_athena_logs=False,  # Disable Athena for simple test
-        collected_logs_s3_bucket="test-bucket"
+        collected_logs_s3_bucket="test-bucket",
+        session=session
     )
-    
-    # Set time range for last 24 hours
-    end_time = datetime.utcnow()
-    start_time = end_time - timedelta(hours=24)
-    
-    # Test log collection
-    cloudwatch_logs, athena_logs, s3_logs = await runner.run(
-        log_group_name="/test/log/group",
-        start_time=start_time.isoformat(),
-        end_time=end_time.isoformat()
+
+    cloudwatch_keys, athena_keys = await runner.run(
+        log_group_name=group.name,
+        start_time=to_iso(group.start_ms),
+        end_time=to_iso(group.end_ms)
     )
-    
-    # Basic assertions
-    assert isinstance(cloudwatch_logs, list)
-    assert athena_logs is None  # Since we disabled Athena
-    assert isinstance(s3_logs, list)
+
+    assert athena_keys is None  # Since we disabled Athena
+    assert uploaded_lines(session, cloudwatch_keys) == group.total_events
 
 @pytest.mark.asyncio
 async def test_shiro_sight_runner_with_athena():
-    # Initialize the runner with Athena enabled
+    group, session = make_session()
     runner = ShiroSightRunner(
         max_concurrent_requests=5,
         collect_athena_logs=True,
         athena_s3_bucket="test-athena-bucket",
         athena_s3_prefix="test/prefix",
-        collected_logs_s3_bucket="test-bucket"
+        collected_logs_s3_bucket="test-bucket",
+        session=session
+    )
+
+    cloudwatch_keys, athena_keys = await runner.run(
+        log_group_name=group.name,
+        start_time=to_iso(group.start_ms),
+        end_time=to_iso(group.end_ms)
+    )
+
+    assert uploaded_lines(session, cloudwatch_keys) == group.total_events
+    # The Athena results stay in the Athena bucket; nothing is uploaded as collected logs again
+    assert {bucket for bucket, key in session.s3.objects if key in athena_keys} == {"test-athena-bucket"}
+    assert sum(session.s3.objects[("test-athena-bucket", key)].count(b"\n") - 1 for key in athena_keys) == group.total_events
+    assert sorted(key for bucket, key in session.s3.objects if bucket == "test-bucket") == sorted(cloudwatch_keys)
+
+@pytest.mark.asyncio
+async def test_shiro_sight_runner_with_athena_requires_time_range():
+    group, session = make_session()
+    runner = ShiroSightRunner(
+        collect_athena_logs=True,
+        athena_s3_bucket="test-athena-bucket",
+        athena_s3_prefix="test/prefix",
+        collected_logs_s3_bucket="test-bucket",
+        session=session
     )
-    
-    # Set time range for last 24 hours
-    end_time = datetime.utcnow()
-    start_time = end_time - timedelta(hours=24)
-    
-    # Test log collection
-    cloudwatch_logs, athena_logs, s3_logs = await runner.run(
-        log_group_name="/test/log/group",
-        start_time=start_time.isoformat(),
-        end_time=end_time.isoformat()
+
+    with pytest.raises(ValueError, match="start_time and end_time"):
+        await runner.run(log_group_name=group.name, start_time=to_iso(group.start_ms))
+    assert session.stats.total_calls == 0
+
+def test_athena_queries_read_only_collected_cloudwatch_logs():
+    collector = AthenaLogsCollector(s3_bucket="test-athena-bucket", session=FakeSession({}))
+    queries = collector.build_queries("/test/log/group", "2024-01-30T22:00:00.000Z", "2024-01-31T02:00:00.000Z")
+
+    assert len(queries) == 2
+    assert all("WHERE source = 'cloudwatch' AND log_group = '/test/log/group'" in query for query in queries)
+    assert "dt = '2024-01-31' AND hour BETWEEN '00' AND '01'" in queries[1]
+
+@pytest.mark.asyncio
+async def test_insights_bisects_capped_windows(monkeypatch, caplog):
+    monkeypatch.setattr(insights, "MAX_RESULT_ROWS", 150)
+    monkeypatch.setattr(insights, "MIN_POLL_INTERVAL", 0)
+    group = generate_log_group(name="/test/insights", stream_count=3, events_per_stream=400, duration_ms=600_000)
+    burst = generate_log_group(name="/test/burst", stream_count=1, events_per_stream=400, duration_ms=900)
+    session = FakeSession({group.name: group, burst.name: burst}, FakeAWSConfig(latency=0))
+    query = "fields @timestamp, @message, @logStream | sort @timestamp asc"
+
+    async with insights.CloudwatchInsightsCollector(session=session) as collector:
+        rows = await collector.query_logs(group.name, query, to_iso(group.start_ms), to_iso(group.end_ms))
+        assert session.stats.calls["StartQuery"] > 2
+        # Sub-windows never overlap, and earlier ones are yielded first
+        events = [(row["@timestamp"], row["@logStream"], row["@message"]) for row in rows]
+        assert len(events) == len(set(events)) == group.total_events
+        assert [event[0] for event in events] == sorted(event[0] for event in events)
+
+        # A single second over the cap cannot be split, so its rows are truncated
+        rows = await collector.query_logs(burst.name, query, to_iso(burst.start_ms), to_iso(burst.end_ms))
+    assert len(rows) == insights.MAX_RESULT_ROWS < burst.total_events
+    assert "truncated" in caplog.text
+
+@pytest.mark.asyncio
+async def test_collector_survives_throttling():
+    group, session = make_session(throttle_rate=0.2)
+    async with CloudwatchCollector(max_concurrent_requests=5, session=session) as collector:
+        events = await collector.collect_logs(group.name)
+
+    assert session.stats.total_throttled > 0
+    assert len(events) == group.total_events
+
+@pytest.mark.asyncio
+async def test_log_streams_are_pruned_by_last_event_with_grace():
+    start_ms, minute = 1_700_000_000_000, 60_000
+    end_ms = start_ms + 120 * minute
+    bounds = {
+        "future": (end_ms, end_ms + 10 * minute),
+        "current": (start_ms + 10 * minute, start_ms + 60 * minute),
+        "lagging": (start_ms - 180 * minute, start_ms - 30 * minute),  # Within the grace period of the start
+        "stale": (start_ms - 300 * minute, start_ms - 61 * minute),
+        "older": (start_ms - 360 * minute, start_ms - 300 * minute),
+    }
+    streams = {name: SyntheticStream(name, seed, array("q", bounds[name])) for seed, name in enumerate(bounds)}
+    group = SyntheticLogGroup("/test/streams", streams, start_ms, end_ms)
+    session = FakeSession({group.name: group}, FakeAWSConfig(latency=0, streams_page_size=1))
+
+    async with CloudwatchCollector(session=session) as collector:
+        names = [stream["logStreamName"] async for stream in collector.iter_log_streams(group.name, to_iso(start_ms), to_iso(end_ms))]
+
+    assert names == ["current", "lagging"]
+    # Listing stops at the first stream past the grace period
+    assert session.stats.calls["DescribeLogStreams"] == 4
+
+@pytest.mark.asyncio
+async def test_filtered_collection_batches_stream_names():
+    group = generate_log_group(name="/test/many-streams", stream_count=250, events_per_stream=4)
+    session = FakeSession({group.name: group}, FakeAWSConfig(latency=0, page_size=100))
+    wanted = sum("ERROR" in stream.message(index) for stream in group.streams.values() for index in range(len(stream)))
+
+    async with CloudwatchCollector(session=session) as collector:
+        events = await collector.collect_logs(group.name, filter_pattern="ERROR")
+
+    assert 0 < len(events) == wanted
+    assert session.stats.calls["FilterLogEvents"] >= 3
+
+@pytest.mark.asyncio
+async def test_sharded_stream_has_no_gaps_or_duplicates(tmp_path, monkeypatch, caplog):
+    group = generate_log_group(name="/test/sharded", stream_count=1, events_per_stream=3000, duration_ms=60_000)
+    session = FakeSession({group.name: group}, FakeAWSConfig(latency=0, page_size=100))
+    name, stream = next(iter(group.streams.items()))
+    event_ids = [stream.event(index)["eventId"] for index in range(len(stream))]
+    caplog.set_level("DEBUG", logger="collector.cloudwatch")
+
+    async with CloudwatchCollector(session=session, max_shards_per_stream=8, shard_target_events=200) as collector:
+        pages = [page async for page in collector.iter_log_stream_sharded(name, group.name, to_iso(group.start_ms), to_iso(group.end_ms))]
+
+    assert "in 8 shards" in caplog.text
+    assert [event_id for page in pages for event_id in page.event_ids] == event_ids
+    assert all(page.next_token is None for page in pages[1:])
+
+    # The second page of the fourth shard fails, while the later shards succeed
+    end_ms = group.end_ms
+    last_ts = stream.event(99)["timestamp"]
+    failing_start = last_ts + (end_ms - last_ts) * 3 // 8
+    get_log_events = session.logs.get_log_events
+
+    async def failing_get_log_events(**kwargs):
+        if kwargs.get("startTime") == failing_start and "nextToken" in kwargs:
+            raise RuntimeError("shard unavailable")
+        return await get_log_events(**kwargs)
+
+    store = SQLiteCheckpointStore(str(tmp_path / "checkpoints.db"))
+    async with CloudwatchCollector(session=session, checkpoint_store=store, max_shards_per_stream=8, shard_target_events=200) as collector:
+        monkeypatch.setattr(session.logs, "get_log_events", failing_get_log_events)
+        first = await collector.collect_logs(group.name, to_iso(group.start_ms), to_iso(end_ms), incremental=True)
+        monkeypatch.setattr(session.logs, "get_log_events", get_log_events)
+        second = await collector.collect_logs(group.name, to_iso(group.start_ms), to_iso(end_ms), incremental=True)
+
+    # The stream stops before the failed shard, so its checkpoint never skips the missing events
+    assert "shard unavailable" in caplog.text
+    assert [event.eventId for event in first] == event_ids[:len(first)] and len(first) < len(event_ids)
+    assert [event.eventId for event in first + second] == event_ids
+
+@pytest.mark.asyncio
+async def test_failing_stream_does_not_stop_the_others(monkeypatch, caplog):
+    group, session = make_session()
+    failing, *others = group.streams
+    get_log_events = session.logs.get_log_events
+
+    async def flaky_get_log_events(**kwargs):
+        if kwargs["logStreamName"] == failing:
+            raise RuntimeError("stream unavailable")
+        return await get_log_events(**kwargs)
+
+    monkeypatch.setattr(session.logs, "get_log_events", flaky_get_log_events)
+    async with CloudwatchCollector(session=session) as collector:
+        events = await collector.collect_logs(group.name)
+
+    # Stream readers handle their own API errors, so the merge only fails on unexpected ones
+    assert len(events) == sum(len(group.streams[name]) for name in others)
+    assert "stream unavailable" in caplog.text
+
+@pytest.mark.asyncio
+async def test_shiro_sight_runner_metrics():
+    group, session = make_session(throttle_rate=0.1)
+    sink = InMemorySink()
+    runner = ShiroSightRunner(
+        max_concurrent_requests=5,
+        collect_athena_logs=False,
+        collected_logs_s3_bucket="test-bucket",
+        session=session,
+        metrics_sinks=[sink]
     )
-    
-    # Basic assertions
-    assert isinstance(cloudwatch_logs, list)
-    assert isinstance(athena_logs, list)
-    assert isinstance(s3_logs, list)
+    await runner.run(group.name, to_iso(group.start_ms), to_iso(group.end_ms))
+
+    summary = runner.metrics_summary
+    assert summary["events"] == group.total_events
+    assert summary["streams"] == len(group.streams)
+    assert summary["operations"]["GetLogEvents"]["calls"] >= summary["pages"]
+    assert summary["operations"]["GetLogEvents"]["throttles"] > 0
+    assert summary["suggested_max_concurrent_requests"] >= 1
+    assert len(sink.snapshots) == 1
+
+@pytest.mark.asyncio
+async def test_pipeline_stops_on_source_failure():
+    group, session = make_session()
+
+    async def failing_pages(collector):
+        async for page in collector.stream_logs(group.name):
+            yield page
+        raise RuntimeError("collection failed")
+
+    async with CloudwatchCollector(session=session) as collector, S3Uploader(bucket_name="test-bucket", session=session) as uploader:
+        pipeline = LogPipeline(uploader, encode_workers=2, upload_workers=2, queue_size=2, progress_interval=None)
+        with pytest.raises(RuntimeError, match="collection failed"):
+            await pipeline.run(group.name, {"cloudwatch": failing_pages(collector)})
+
+    assert pipeline.progress.events_collected == group.total_events
+    assert not session.s3.objects
+
+@pytest.mark.asyncio
+async def test_failed_upload_does_not_advance_checkpoints(tmp_path, monkeypatch):
+    group, session = make_session()
+    store = SQLiteCheckpointStore(str(tmp_path / "checkpoints.db"))
+    put_object = session.s3.put_object
+    calls = 0
+
+    async def failing_put_object(**kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 5:
+            raise RuntimeError("upload failed")
+        return await put_object(**kwargs)
+
+    async def run():
+        async with CloudwatchCollector(session=session, checkpoint_store=store) as collector, S3Uploader(bucket_name="test-bucket", session=session, max_object_bytes=2048) as uploader:
+            tracker = await collector.checkpoint_tracker(group.name)
+            tracker.flush_interval = 0  # Save every commit, so a partial run leaves checkpoints behind
+            pipeline = LogPipeline(uploader, upload_workers=2, progress_interval=None)
+            pages = collector.stream_logs(group.name, incremental=True, commit_checkpoints=False)
+            await pipeline.run(group.name, {"cloudwatch": pages}, {"cloudwatch": tracker})
+
+    monkeypatch.setattr(session.s3, "put_object", failing_put_object)
+    with pytest.raises(RuntimeError, match="upload failed"):
+        await run()
+    assert 0 < len(session.s3.objects) and len(uploaded_events(session)) < group.total_events
+
+    # The rerun collects every event the failed run did not upload
+    monkeypatch.setattr(session.s3, "put_object", put_object)
+    await run()
+    assert len(uploaded_events(session)) == group.total_events
+
+@pytest.mark.asyncio
+async def test_checkpoints_resume_incremental_collection(tmp_path, caplog):
+    group, session = make_session()
+    store = SQLiteCheckpointStore(str(tmp_path / "checkpoints.db"))
+
+    # An interrupted run that saved the position of the pages it handled
+    async with CloudwatchCollector(session=session, checkpoint_store=store) as collector:
+        tracker = CheckpointTracker(store, group.name, {})
+        first = []
+        async for page in collector.stream_logs(group.name, incremental=True, commit_checkpoints=False):
+            first.extend(page)
+            await tracker.advance(page)
+            if len(first) >= 700:
+                break
+        await tracker.flush()
+
+        second = await collector.collect_logs(group.name, incremental=True)
+        ids = [event.eventId for event in first + second]
+        assert len(ids) == len(set(ids)) == group.total_events
+
+        # Every stream is caught up, so a rerun lists the streams and reads nothing
+        reads = session.stats.calls["GetLogEvents"]
+        assert await collector.collect_logs(group.name, incremental=True) == []
+        assert session.stats.calls["GetLogEvents"] == reads
+
+        # A stored forward token that is rejected falls back to the stored timestamp
+        name, stream = next(iter(group.streams.items()))
+        event = stream.event(len(stream) // 2)
+        await store.save(group.name, [Checkpoint(group.name, name, event["timestamp"], event["eventId"], "expired")])
+        events = await collector.collect_logs(group.name, incremental=True)
+    assert len(events) == len(stream) - len(stream) // 2 - 1
+    assert events[0].eventId == stream.event(len(stream) // 2 + 1)["eventId"]
+    assert "was rejected" in caplog.text
+
+@pytest.mark.asyncio
+async def test_s3_checkpoint_store_round_trip():
+    session = FakeSession({})
+    store = S3CheckpointStore("test-bucket", prefix="checkpoints/", session=session)
+    assert await store.load("/aws/lambda/a'b") == {}
+
+    checkpoints = [Checkpoint("/aws/lambda/a'b", f"stream-{index}", 1000 + index, f"id-{index}", f"f/{index}") for index in range(2)]
+    await store.save("/aws/lambda/a'b", checkpoints)
+    await store.save("/aws/lambda/a'b", [Checkpoint("/aws/lambda/a'b", "stream-1", 2000, "id-9", None)])
+
+    loaded = await S3CheckpointStore("test-bucket", prefix="checkpoints", session=session).load("/aws/lambda/a'b")
+    assert loaded == {"stream-0": checkpoints[0], "stream-1": Checkpoint("/aws/lambda/a'b", "stream-1", 2000, "id-9", None)}
+    assert [key for _, key in session.s3.objects] == ["checkpoints/%2Faws%2Flambda%2Fa%27b.json"]
+
+@pytest.mark.asyncio
+async def test_object_writer_uploads_parts_and_aborts_on_error(monkeypatch):
+    session = FakeSession({}, FakeAWSConfig(latency=0))
+    s3 = session.s3
+    data = random.Random(0).randbytes(12 * 1024 * 1024)
+
+    async def write(key):
+        writer = S3ObjectWriter(s3, "test-bucket", key, part_size=0, part_semaphore=asyncio.Semaphore(2))
+        for offset in range(0, len(data), 1024 * 1024):
+            await writer.write(data[offset:offset + 1024 * 1024])
+        await writer.close()
+
+    await write("complete")
+    assert s3.objects[("test-bucket", "complete")] == data
+    assert session.stats.calls["UploadPart"] == 3  # Two parts of the 5 MiB minimum, then the rest
+
+    upload_part = s3.upload_part
+
+    async def failing_upload_part(**kwargs):
+        if kwargs["PartNumber"] == 2:
+            raise RuntimeError("part failed")
+        return await upload_part(**kwargs)
+
+    monkeypatch.setattr(s3, "upload_part", failing_upload_part)
+    with pytest.raises(RuntimeError, match="part failed"):
+        await write("failed")
+    assert ("test-bucket", "failed") not in s3.objects
+    assert session.stats.calls["AbortMultipartUpload"] == 1 and not s3._uploads
+
+@pytest.mark.asyncio
+async def test_uploader_partitions_by_log_group_and_hour():
+    hour_ms = 3_600_000
+    base_ms = 1_699_999_200_000  # 2023-11-14T22:00:00Z
+    timestamps = [base_ms, base_ms + hour_ms - 1, base_ms + hour_ms, base_ms + 2 * hour_ms + 5]
+    page = LogBatch.from_events("/test/group", "stream", [{"timestamp": ts, "message": str(ts)} for ts in timestamps])
+
+    async def pages():
+        yield page
+
+    session = FakeSession({}, FakeAWSConfig(latency=0))
+    async with S3Uploader(bucket_name="test-bucket", session=session) as uploader:
+        keys = await uploader.upload_logs("/test/group", pages())
+
+    layout = re.compile(r"logs/source=cloudwatch/log_group=%2Ftest%2Fgroup/dt=(\d{4}-\d{2}-\d{2})/hour=(\d{2})/part-[^/]+-\d{5}\.ndjson\.gz")
+    partitions = {}
+    for key in keys:
+        match = layout.fullmatch(key)
+        assert match is not None, key
+        lines = gzip.decompress(session.s3.objects[("test-bucket", key)]).splitlines()
+        partitions[match.groups()] = [json.loads(line)["timestamp"] for line in lines]
+    assert partitions == {
+        ("2023-11-14", "22"): timestamps[:2],
+        ("2023-11-14", "23"): timestamps[2:3],
+        ("2023-11-15", "00"): timestamps[3:],
+    }
+
+def test_message_parser_extracts_typed_fields_and_filters():
+    def batch(messages):
+        return LogBatch.from_events("/test", "stream", [{"timestamp": index, "message": message} for index, message in enumerate(messages)])
+
+    json_batch = batch([
+        '{"level": "error", "http": {"status_code": 503}, "duration_ms": 1500, "path": "/api/orders"}',
+        '{"level": "info", "status": 200, "duration_ms": "12ms"}',
+        'Traceback (most recent call last): ERROR in worker',
+    ])
+    assert detect_format(json_batch.messages) == "json"
+    fields = MessageParser().parse(json_batch).fields
+    assert fields["level"] == ["error", "info", "ERROR"]  # The traceback falls back to its level word
+    assert list(fields["status"])[:2] == [503.0, 200.0] and fields["latency_ms"][1] == 12.0
+
+    access = batch(['10.0.0.1 - - [10/Oct/2024:13:55:36 +0000] "GET /health HTTP/1.1" 200 2 "-" "curl/8" 0.004'] * 3)
+    logfmt = batch(['time=2024-10-10 level=warn msg="slow query" took=1200ms'] * 3)
+    assert detect_format(access.messages) == "access" and detect_format(logfmt.messages) == "logfmt"
+    assert MessageParser().parse(logfmt).fields["latency_ms"][0] == 1200.0
+
+    parser = MessageParser(where='level in (ERROR, WARN) and not (path ~ "^/health" or latency_ms < 1000)')
+    # Comparisons on missing fields are false, so `not` keeps the traceback, which has no path or latency
+    assert parser.apply(json_batch).messages == [json_batch.messages[0], json_batch.messages[2]]
+    assert len(MessageParser(where="status >= 500 or message ~ traceback").apply(json_batch)) == 2
+    assert len(MessageParser(where="status not in (200, 204)").apply(access)) == 0
+    with pytest.raises(FilterSyntaxError, match="Unknown field"):
+        MessageParser(where="colour == red")
+    with pytest.raises(FilterSyntaxError, match="Expected a number"):
+        MessageParser(where="latency_ms > slow")
+
+
+def test_log_batch_validates_takes_and_converts_to_arrow():
+    for timestamp, reason in ((-1, "before the epoch"), (253402300800000, "after year 9999"), ("12:00", "must be an integer"), (2**63, "must be an integer")):
+        with pytest.raises(CloudWatchTimestampError, match=reason):
+            LogBatch.from_events("/test", "stream", [{"timestamp": 1000, "message": "ok"}, {"timestamp": timestamp, "message": "bad"}])
+
+    events = [
+        {"timestamp": 1000 + index, "message": message, "eventId": str(index), "ingestionTime": 2000 + index}
+        for index, message in enumerate(['{"level": "error", "status": 503}', '{"level": "info"}', '{"status": 200}'])
+    ]
+    batch = MessageParser().parse(LogBatch.from_events("/test", "stream", events, next_token="f/3"))
+    taken = batch.take([2, 0])
+    assert taken.next_token is None and taken.event_ids == ["2", "0"]
+    assert list(taken.fields["status"]) == [200.0, 503.0] and taken.fields["level"] == [None, "error"]
+
+    table = batch.to_arrow()
+    # The int64 columns are views of the batch's arrays, not copies
+    assert table.column("timestamp").chunk(0).buffers()[1].address == batch.timestamps.buffer_info()[0]
+    assert table.column("ingestion_time").chunk(0).buffers()[1].address == batch.ingestion_times.buffer_info()[0]
+    assert table.column("timestamp").to_pylist() == [1000, 1001, 1002]
+    assert table.column("status").to_pylist() == [503.0, None, 200.0]  # NaN becomes null
+    assert table.column("level").to_pylist() == ["error", "info", None]
+    assert table.column("log_stream").to_pylist() == ["stream"] * 3
+
+@pytest.mark.asyncio
+async def test_pipeline_filters_events_before_upload():
+    group, session = make_session()
+    wanted = sum(
+        stream.message(index).startswith(("ERROR", "WARN"))
+        for stream in group.streams.values() for index in range(len(stream))
+    )
+    async with CloudwatchCollector(session=session) as collector, S3Uploader(bucket_name="test-bucket", session=session) as uploader:
+        pipeline = LogPipeline(uploader, progress_interval=None, parser=MessageParser(where="level in (ERROR, WARN)"))
+        keys = await pipeline.run(group.name, {"cloudwatch": collector.stream_logs(group.name)})
+
+    assert 0 < wanted < group.total_events
+    assert uploaded_lines(session, keys["cloudwatch"]) == wanted
+    assert pipeline.progress.events_filtered == group.total_events - wanted
+
+@pytest.mark.asyncio
+async def test_fanout_runner_expands_globs():
+    groups = {
+        name: generate_log_group(name=name, stream_count=2, events_per_stream=100, seed=index)
+        for index, name in enumerate(["/aws/lambda/a", "/aws/lambda/b", "/ecs/c"])
+    }
+    session = FakeSession(groups, FakeAWSConfig(latency=0, page_size=50))
+    runner = FanoutRunner(
+        [FanoutTarget(["/aws/lambda/*"], region_name="us-east-1", requests_per_second=100)],
+        processes=0,
+        runner_options={"collect_athena_logs": False, "collected_logs_s3_bucket": "test-bucket", "progress_interval": None},
+        session_factory=lambda profile_name, region_name: session
+    )
+    group = groups["/aws/lambda/a"]
+    results = await runner.run(to_iso(group.start_ms), to_iso(group.end_ms))
+
+    assert [result.log_group_name for result in results] == ["/aws/lambda/a", "/aws/lambda/b"]
+    assert all(result.error is None for result in results)
+    assert uploaded_lines(session, [key for result in results for key in result.cloudwatch_keys]) == 400
+
+def test_assign_jobs_splits_rate_budget():
+    jobs = [FanoutJob(f"/group/{index}", "us-east-1", requests_per_second=20) for index in range(5)]
+    jobs.append(FanoutJob("/other", "eu-west-1", requests_per_second=10))
+    batches = assign_jobs(jobs, 4)
+
+    assert len(batches) == 4
+    assert sum(len(batch) for batch in batches) == 6
+    for region, budget in (("us-east-1", 20), ("eu-west-1", 10)):
+        shares = {id(batch): job.requests_per_second for batch in batches for job in batch if job.region_name == region}
+        assert sum(shares.values()) == pytest.approx(budget)
 
 def test_shiro_sight_runner_initialization():
     # Test initialization with invalid parameters
@@ -62,3 +506,20 @@ def test_shiro_sight_runner_initialization():
             collect_athena_logs=True,
             # Missing required Athena parameters
         )
+
+def test_zstd_compressor_is_not_shared_between_encode_threads(monkeypatch):
+    class ZstdCompressor:
+        def __init__(self, level):
+            self.thread = None
+
+        def compress(self, data):
+            # zstandard compressors are not thread-safe
+            assert self.thread in (None, threading.get_ident())
+            self.thread = threading.get_ident()
+            return data
+
+    monkeypatch.setattr(upload, "zstandard", type("zstandard", (), {"ZstdCompressor": ZstdCompressor}))
+    compress, extension = get_compressor("zstd")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(compress, [b"%d" % index for index in range(200)])) == [b"%d" % index for index in range(200)]
+    assert extension == ".zst"
@@ -0,0 +1,219 @@
+import io
+import sys
+import gzip
+import json
+import hashlib
+from pathlib import Path
+from unittest import mock
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "functions" / "process-chunks"))
+
+import app
+from chunker import Chunker, LogRecord, TemplateChunker, TokenEstimator, log_group_from_key, process_objects
+from drain import TemplateMiner
+from scoring import AnomalyScorer, S3ScorerStateStore
+
+
+class MemoryS3:
+    """Minimal synchronous S3 client over a dictionary."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def etag(self, Bucket, Key):
+        return hashlib.md5(self.objects[(Bucket, Key)]).hexdigest()
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kwargs):
+        exists = (Bucket, Key) in self.objects
+        if (IfNoneMatch and exists) or (IfMatch and (not exists or self.etag(Bucket, Key) != IfMatch)):
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key, Range=None):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body = self.objects[(Bucket, Key)]
+        if Range:
+            start, end = map(int, Range[len("bytes="):].split("-"))
+            body = body[start:end + 1]
+        return {"Body": io.BytesIO(body), "ETag": self.etag(Bucket, Key)}
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+
+def ndjson_gzip(records):
+    # Collected objects are concatenated gzip members, one per page
+    members = []
+    for start in range(0, len(records), 50):
+        lines = "".join(
+            json.dumps({"timestamp": ts, "message": message, "event_id": str(ts), "log_stream": stream}) + "\n"
+            for ts, message, stream in records[start:start + 50]
+        )
+        members.append(gzip.compress(lines.encode("utf-8")))
+    return b"".join(members)
+
+
+def test_chunks_respect_budget_streams_and_windows():
+    chunker = Chunker("/app", "key", token_budget=200, overlap_events=2, overlap_tokens=60, window_ms=60_000)
+    records = [LogRecord(index * 1000, f"event {index} " + "x" * 60, f"stream-{index % 2}") for index in range(200)]
+    chunks = [chunk for record in records for chunk in chunker.add(record)] + chunker.flush()
+
+    assert sum(len(chunk.events) for chunk in chunks) == len(records)
+    for chunk in chunks:
+        assert chunk.tokens <= 200
+        assert {record.log_stream for record in chunk.events + chunk.context} == {chunk.log_stream}
+        assert chunk.start // 60_000 == chunk.end // 60_000
+    assert any(chunk.context for chunk in chunks)
+
+
+def test_oversized_event_is_truncated():
+    chunker = Chunker("/app", "key", token_budget=100, overlap_tokens=10)
+    chunker.add(LogRecord(0, "y" * 10_000, "stream"))
+    [chunk] = chunker.flush()
+    assert chunk.tokens <= 100
+    assert chunk.events[0].message.endswith("[truncated]")
+    assert TokenEstimator()(chunk.events[0].message) <= 100
+
+
+def test_process_objects_writes_manifest():
+    s3 = MemoryS3()
+    keys = []
+    for hour in range(2):
+        key = f"logs/source=cloudwatch/log_group=%2Faws%2Fapp/dt=2024-01-01/hour={hour:02d}/part-1.ndjson.gz"
+        records = [(hour * 3_600_000 + index * 500, f"GET /items/{index} 200", f"s{index % 3}") for index in range(300)]
+        s3.put_object(Bucket="logs", Key=key, Body=ndjson_gzip(records))
+        keys.append(key)
+
+    manifest = process_objects(s3, "logs", keys, "out", "chunks/run=1", max_parallel_objects=2)
+
+    assert log_group_from_key(keys[0]) == "/aws/app"
+    assert manifest["event_count"] == 600
+    assert sum(entry["events"] for entry in manifest["chunks"]) == 600
+    assert json.loads(s3.objects[("out", "chunks/run=1/manifest.json")])["chunk_count"] == manifest["chunk_count"]
+    chunk = json.loads(s3.objects[("out", manifest["chunks"][0]["key"])])
+    assert chunk["log_group"] == "/aws/app" and chunk["events"]
+
+
+def test_template_miner_collapses_parameters():
+    miner = TemplateMiner()
+    for index in range(100):
+        miner.add(f"GET /orders/{index} took {index * 3}ms user=u{index % 7}", index, f"stream-{index % 2}")
+        miner.add(f"Connection to 10.0.0.{index % 4}:5432 timed out after {index} retries", index, "stream-0")
+
+    templates = sorted(miner.templates(), key=lambda template: template.text)
+    assert [template.text for template in templates] == [
+        "Connection to <*> timed out after <*> retries",
+        "GET <*> took <*> user=<*>",
+    ]
+    assert [template.count for template in templates] == [100, 100]
+    request = templates[1]
+    assert (request.first_seen, request.last_seen) == (0, 99)
+    assert request.parameters[0] == ["/orders/0", "/orders/1", "/orders/2"]
+    assert request.parameters[2] == ["u0", "u1", "u2"]
+    assert request.log_streams == ["stream-0", "stream-1"]
+
+
+def test_template_chunker_compresses_repetitive_logs():
+    chunker = TemplateChunker("/app", "key", token_budget=2000, window_ms=60_000)
+    records = [
+        LogRecord(index * 100, f"INFO request {index:08x} completed in {index % 250}ms status=200", f"s{index % 3}")
+        for index in range(5000)
+    ]
+    records.append(LogRecord(1000, "ERROR payment provider unavailable", "s0"))
+    chunks = [chunk for record in records for chunk in chunker.add(record)] + chunker.flush()
+
+    assert sum(chunk.event_count for chunk in chunks) == len(records)
+    assert all(chunk.tokens <= 2000 for chunk in chunks)
+    assert sum(chunk.raw_tokens for chunk in chunks) > 10 * sum(chunk.tokens for chunk in chunks)
+    assert any(template["template"] == "ERROR payment provider unavailable" for chunk in chunks for template in chunk.templates)
+
+
+def test_scorer_selects_anomalous_windows():
+    s3 = MemoryS3()
+    key = "logs/source=cloudwatch/log_group=%2Faws%2Fapp/dt=2024-01-01/hour=00/part-1.ndjson.gz"
+    # Two hours of steady traffic, then a burst of a new error in one five minute window
+    records = [(index * 6000, f"GET /items/{index} 200 in {index % 50}ms", f"s{index % 3}") for index in range(1200)]
+    records += [(4_500_000 + index * 500, f"ERROR Timed out connecting to db-{index % 4}", "s0") for index in range(120)]
+    records.sort()
+    s3.put_object(Bucket="logs", Key=key, Body=ndjson_gzip(records))
+    window_ms = 5 * 60_000
+
+    scorer = AnomalyScorer(window_ms, top_k=1, sample_rate=0.0)
+    manifest = process_objects(
+        s3, "logs", [key], "out", "chunks/run=1",
+        chunker_factory=lambda log_group, source_key: TemplateChunker(log_group, source_key, window_ms=window_ms),
+        scorer=scorer
+    )
+
+    [top] = [window for window in manifest["windows"] if window["selected_by"]]
+    assert top["window"] == 4_500_000 // window_ms
+    assert top["spikes"] > 0 and any("Timed out" in template for template in top["novel_templates"])
+    assert manifest["chunk_count"] == len(manifest["chunks"]) >= 1
+    assert manifest["skipped_chunk_count"] == len(manifest["skipped_chunks"]) > 0
+    for entry in manifest["chunks"]:
+        assert entry["start"] // window_ms == top["window"]
+        assert entry["score"]["selected_by"] == "top_k"
+    assert manifest["event_count"] == len(records)
+
+
+def test_scorer_keeps_state_across_single_object_invocations():
+    s3 = MemoryS3()
+    store = S3ScorerStateStore(s3, "out", "chunks/scorer-state")
+    hour_ms = 3_600_000
+
+    def invoke(hour, records, scorer=None):
+        # The S3 trigger invokes the function once per collected hourly object
+        key = f"logs/source=cloudwatch/log_group=%2Faws%2Fapp/dt=2024-01-01/hour={hour:02d}/part-1.ndjson.gz"
+        s3.put_object(Bucket="logs", Key=key, Body=ndjson_gzip(sorted(records)))
+        scorer = scorer or AnomalyScorer(15 * 60_000, top_k=1, sample_rate=0.0, state_store=store)
+        return process_objects(s3, "logs", [key], "out", f"chunks/run={hour}", chunker_factory=TemplateChunker, scorer=scorer)
+
+    def hour_of_traffic(hour):
+        records = [(hour * hour_ms + index * 6000, f"GET /items/{index} 200 in {index % 50}ms", f"s{index % 3}") for index in range(600)]
+        # A job that runs ten minutes into every hour
+        records.append((hour * hour_ms + 600_000, "INFO nightly report finished", "s0"))
+        return records
+
+    manifests = [invoke(hour, hour_of_traffic(hour)) for hour in range(3)]
+    # A new error two minutes into the hour, before an object alone would have a baseline
+    burst = [(3 * hour_ms + 120_000 + index * 500, f"ERROR Timed out connecting to db-{index % 4}", "s0") for index in range(120)]
+    manifests.append(invoke(3, hour_of_traffic(3) + burst))
+
+    later = [window for manifest in manifests[1:] for window in manifest["windows"]]
+    assert not any("nightly report" in template for window in later for template in window["novel_templates"])
+    [top] = [window for window in manifests[3]["windows"] if window["selected_by"]]
+    assert top["window"] == (3 * hour_ms + 120_000) // (15 * 60_000)
+    assert top["spikes"] > 0 and any("Timed out" in template for template in top["novel_templates"])
+    # top_k applies to the log group's recent windows, not to every object
+    assert sum(window["selected_by"] is not None for manifest in manifests for window in manifest["windows"]) < 16
+
+    # Concurrent invocations of one log group both land in the state
+    first, second = (AnomalyScorer(15 * 60_000, top_k=1, sample_rate=0.0, state_store=store) for _ in range(2))
+    first.add("/aws/app", LogRecord(4 * hour_ms, "GET /items/0 200 in 0ms", "s0"))  # Reads the state
+    invoke(5, hour_of_traffic(5), second)
+    manifest = invoke(4, hour_of_traffic(4), first)
+    state, _ = store.load("/aws/app")
+    assert manifest["windows"] and {window for window, _ in state["scores"]} >= {4 * 4, 5 * 4 + 3}
+    assert len(state["sources"]) == 6
+
+    # A redelivered object is not counted twice
+    counts = state["counts"]
+    invoke(5, hour_of_traffic(5))
+    assert store.load("/aws/app")[0]["counts"] == counts
+
+
+def test_concurrent_invocations_write_separate_manifests():
+    s3 = MemoryS3()
+    keys = [f"logs/source=cloudwatch/log_group=%2Faws%2Fapp/dt=2024-01-01/hour={hour:02d}/part-1.ndjson.gz" for hour in range(2)]
+    for hour, key in enumerate(keys):
+        s3.put_object(Bucket="logs", Key=key, Body=ndjson_gzip([(hour * 3_600_000, "GET /items/1 200", "s0")]))
+
+    # Invocations started in the same second, one per object
+    with mock.patch.dict(app._clients, {"s3": s3}):
+        results = [app.lambda_handler({"bucket": "logs", "keys": [key], "score_windows": False}, None) for key in keys]
+
+    manifest_keys = {result["body"]["manifest_key"] for result in results}
+    assert len(manifest_keys) == 2
+    assert all(("logs", key) in s3.objects for key in manifest_keys)
@@ -0,0 +1,289 @@
+import io
+import sys
+import json
+import subprocess
+from pathlib import Path
+import pytest
+import asyncio
+from botocore.exceptions import ClientError
+from utilities.aws import clear_sessions, get_session
+from utilities.client_pool import ClientPool
+from utilities.concurrency import AdaptiveConcurrencyLimiter
+from utilities.streaming import merge_async_iterators
+from utilities.errors import is_retryable_error
+from utilities.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    circuit_breaker,
+    circuit_breaker_stats,
+    reset_circuit_breakers,
+)
+from utilities.metrics import EMFSink, MetricsRegistry, NullMetrics, PrometheusTextSink, disable_metrics, enable_metrics, render_prometheus
+
+
+def client_error(code: str, status: int = 400) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "Test")
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    reset_circuit_breakers()
+    yield
+    reset_circuit_breakers()
+
+
+def test_retryable_error_classification():
+    assert is_retryable_error(client_error("ThrottlingException"))
+    assert is_retryable_error(client_error("ServiceUnavailableException", 503))
+    assert is_retryable_error(client_error("SomethingNew", 500))
+    assert is_retryable_error(TimeoutError())
+    assert not is_retryable_error(client_error("ResourceNotFoundException"))
+    assert not is_retryable_error(ValueError("bad input"))
+
+
+def test_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trip_count == 1
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.state == "half-open"
+    breaker.before_call()
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_retries_throttling_then_succeeds():
+    calls = []
+
+    @circuit_breaker(max_attempts=5, base_delay=0.001, failure_threshold=10, operation="Test")
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise client_error("ThrottlingException")
+        return "ok"
+
+    assert await flaky() == "ok"
+    assert len(calls) == 3
+    assert circuit_breaker_stats()["default:Test"]["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_client_errors():
+    calls = []
+
+    @circuit_breaker(max_attempts=5, base_delay=0.001, operation="Test")
+    async def missing():
+        calls.append(1)
+        raise client_error("ResourceNotFoundException")
+
+    with pytest.raises(ClientError) as error:
+        await missing()
+    assert error.value.response["Error"]["Code"] == "ResourceNotFoundException"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_sheds_load():
+    calls = []
+
+    @circuit_breaker(max_attempts=3, base_delay=0.001, failure_threshold=2, recovery_timeout=60, max_open_wait=0, operation="Test")
+    async def throttled():
+        calls.append(1)
+        raise client_error("ThrottlingException")
+
+    results = await asyncio.gather(*(throttled() for _ in range(20)), return_exceptions=True)
+    assert any(isinstance(result, CircuitOpenError) for result in results)
+    # Retries stop reaching the service once the circuit opens
+    assert len(calls) < 20
+    assert circuit_breaker_stats()["default:Test"]["trips"] == 1
+
+
+@pytest.mark.asyncio
+async def test_waits_for_open_circuit_without_using_attempts():
+    calls = []
+
+    @circuit_breaker(max_attempts=2, base_delay=0.001, failure_threshold=1, recovery_timeout=0.05, operation="Test")
+    async def recovering():
+        calls.append(1)
+        if len(calls) == 1:
+            raise client_error("ThrottlingException")
+        return "ok"
+
+    assert await recovering() == "ok"
+    stats = circuit_breaker_stats()["default:Test"]
+    assert stats["trips"] == 1
+    assert stats["rejected"] >= 1
+
+
+def test_null_metrics_record_nothing():
+    metrics = NullMetrics()
+    metrics.increment("events_total", 10)
+    with metrics.timer("call_seconds"):
+        pass
+    snapshot = metrics.snapshot()
+    assert not snapshot.counters and not snapshot.histograms
+
+
+def test_metrics_exports():
+    metrics = MetricsRegistry()
+    metrics.increment("events_total", 3, log_stream="a")
+    metrics.increment("events_total", 2, log_stream="b")
+    for value in (0.002, 0.004, 0.2):
+        metrics.observe("call_seconds", value, operation="GetLogEvents")
+    snapshot = metrics.snapshot()
+
+    assert snapshot.counter_total("events_total") == 5
+    assert 0.002 <= snapshot.merged_histogram("call_seconds").quantile(0.5) <= 0.005
+
+    text = render_prometheus(snapshot)
+    assert 'shirosight_events_total{log_stream="a"} 3' in text
+    assert 'shirosight_call_seconds_bucket{operation="GetLogEvents",le="+Inf"} 3' in text
+
+    stream = io.StringIO()
+    EMFSink(stream=stream).export(snapshot)
+    documents = [json.loads(line) for line in stream.getvalue().splitlines()]
+    latency = next(document for document in documents if "call_seconds" in document)
+    assert latency["operation"] == "GetLogEvents"
+    assert latency["call_seconds"]["SampleCount"] == 3
+    assert latency["_aws"]["CloudWatchMetrics"][0]["Metrics"][0]["Unit"] == "Seconds"
+
+    # Sinks aggregate per-stream labels out, so streams do not become series or custom metrics
+    [events] = [document for document in documents if "events_total" in document]
+    assert events["events_total"] == 5 and events["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [[]]
+    sink = PrometheusTextSink()
+    sink.export(snapshot)
+    assert "shirosight_events_total 5" in sink.last_text and "log_stream" not in sink.last_text
+    assert snapshot.counter_total("events_total", log_stream="a") == 3
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_records_throttles():
+    metrics = enable_metrics()
+    calls = []
+
+    @circuit_breaker(max_attempts=5, base_delay=0.001, failure_threshold=10, operation="Test")
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise client_error("ThrottlingException")
+        return "ok"
+
+    try:
+        await flaky()
+    finally:
+        disable_metrics()
+    snapshot = metrics.snapshot()
+    assert snapshot.counter_total("api_throttles_total", operation="Test") == 2
+    assert snapshot.counter_total("api_retries_total", operation="Test") == 2
+
+
+@pytest.mark.asyncio
+async def test_limiter_shrinks_on_throttling_and_grows_back_to_cap():
+    limiter = AdaptiveConcurrencyLimiter(8, max_limit=8)
+    # Throttles of calls that were in flight together shrink the limit once
+    epochs = [await limiter.acquire() for _ in range(4)]
+    for epoch in epochs:
+        await limiter.release(epoch, throttled=True, succeeded=False)
+    assert limiter.limit == 4 and limiter.throttle_count == 4
+
+    with pytest.raises(ClientError):
+        async with limiter.slot("Test"):
+            raise client_error("ThrottlingException")
+    assert limiter.limit == 2
+    with pytest.raises(ValueError):
+        async with limiter.slot("Test"):
+            raise ValueError("not a throttle")
+    assert limiter.limit == 2
+
+    # Each success adds 1/limit, so about a window of `limit` successes adds one slot
+    for _ in range(3):
+        async with limiter.slot("Test"):
+            pass
+    assert limiter.limit == 3
+    for _ in range(100):
+        async with limiter.slot("Test"):
+            pass
+    assert limiter.limit == 8 and limiter.peak_in_flight == 4
+
+
+@pytest.mark.asyncio
+async def test_client_pool_shares_one_client_per_service():
+    class Client:
+        def __init__(self, service_name, config):
+            self.service_name, self.config, self.closed = service_name, config, False
+
+        async def __aenter__(self):
+            await asyncio.sleep(0)
+            return self
+
+        async def __aexit__(self, *exc_info):
+            self.closed = True
+
+    class Session:
+        def __init__(self):
+            self.clients = []
+
+        def client(self, service_name, config):
+            self.clients.append(Client(service_name, config))
+            return self.clients[-1]
+
+    session = Session()
+    async with ClientPool(session, max_pool_connections=7) as pool:
+        logs = await asyncio.gather(*(pool.get("logs") for _ in range(5)))
+        s3 = await pool.get("s3")
+        assert len({id(client) for client in logs}) == 1 and s3 is not logs[0]
+        assert [client.service_name for client in session.clients] == ["logs", "s3"]
+        assert logs[0].config.max_pool_connections == 7
+        # Throttles reach the caller's limiter instead of botocore's retries
+        assert logs[0].config.retries == {"total_max_attempts": 1}
+    assert all(client.closed for client in session.clients)
+
+    # A closed pool creates new clients on next use
+    assert await pool.get("logs") is not logs[0]
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_merge_fails_fast_and_closes_other_sources():
+    closed = []
+
+    async def source(name, fail_after=None):
+        try:
+            for index in range(1000):
+                if index == fail_after:
+                    raise RuntimeError(f"{name} failed")
+                yield name, index
+                await asyncio.sleep(0.001)
+        finally:
+            closed.append(name)
+
+    items = []
+    with pytest.raises(RuntimeError, match="b failed"):
+        async for item in merge_async_iterators([source("a"), source("b", fail_after=3), source("c")], concurrency=3, queue_size=1):
+            items.append(item)
+    # The other sources are cancelled long before they are exhausted
+    assert ("b", 2) in items and len(items) < 1000
+    assert sorted(closed) == ["a", "b", "c"]
+
+
+def test_sessions_are_shared_and_aws_is_imported_lazily():
+    clear_sessions()
+    assert get_session(None, "us-east-1") is get_session(None, "us-east-1")
+    assert get_session(None, "us-east-1") is not get_session(None, "eu-west-1")
+    clear_sessions()
+
+    # Importing an entry point must not import the AWS SDK or pyarrow
+    code = "import sys, collector.main; print([name for name in ('aioboto3', 'boto3', 'pyarrow') if name in sys.modules])"
+    src = Path(__file__).resolve().parents[3] / "src"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=src).stdout
+    assert output.strip() == "[]"